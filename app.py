@@ -8,10 +8,20 @@ Email: mcardle-j9@ulster.ac.uk
 B-No: B00733578
 """
 
+import time
+
+# taken before the remaining imports so startup time includes them
+STARTED_AT = time.perf_counter()
+
 from flask import Flask
 from blueprints.reports.reports import reports_bp
+from blueprints.authorities.authorities import authorities_bp
+from blueprints.admin.admin import admin_bp
 from flask_cors import CORS
 from config import FLASK_DEBUG, FLASK_HOST, FLASK_PORT
+import change_watcher
+import metrics
+import profiling
 import logging
 
 logging.basicConfig(level=logging.INFO)
@@ -22,6 +32,14 @@ def create_app():
     app = Flask(__name__)
     CORS(app)
     app.register_blueprint(reports_bp)
+    app.register_blueprint(authorities_bp)
+    app.register_blueprint(admin_bp)
+    metrics.init_app(app)
+    profiling.init_app(app)
+    change_watcher.init_app(app)
+    # clients are created lazily, so this measures imports and app setup only
+    app.config["STARTUP_SECONDS"] = time.perf_counter() - STARTED_AT
+    logger.info(f"App ready in {app.config['STARTUP_SECONDS'] * 1000:.1f} ms")
     return app
 
 
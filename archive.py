@@ -0,0 +1,281 @@
+"""
+File: archive.py
+Author: Jack McArdle
+
+This file is part of CommunityEye.
+
+Email: mcardle-j9@ulster.ac.uk
+B-No: B00733578
+"""
+
+import glob
+import gzip
+import logging
+import os
+import time
+from contextlib import ExitStack
+from typing import Any, Dict, Iterable, Iterator, List, Optional
+from bson import json_util
+from pymongo import ReplaceOne
+from config import (
+    ARCHIVE_AFTER_DAYS,
+    ARCHIVE_BATCH_SIZE,
+    ARCHIVE_DIR,
+    ARCHIVE_TARGET,
+    ARCHIVE_TRANSACTIONS,
+    MONGO_COLLECTION_REPORTS,
+    MONGO_COLLECTION_REPORTS_ARCHIVE,
+)
+from batch_operations import unclaimed_query
+from clients import DB, get_mongo_client
+from user_feed import FEED_INDEX, FEED_SORT
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+reports = DB[MONGO_COLLECTION_REPORTS]
+reports_archive = DB[MONGO_COLLECTION_REPORTS_ARCHIVE]
+
+ARCHIVE_TARGETS = ("collection", "files")
+ARCHIVE_FILE_PATTERN = "reports-*.ndjson.gz"
+# the read endpoints' queries, kept fast on the archive collection as well
+ARCHIVE_INDEXES = {"user_feed": FEED_INDEX, "user_id": [("user_id", 1)]}
+
+
+def include_archived(args: Any) -> bool:
+    """
+    Whether a read should also return archived reports.
+
+    Args:
+        args (Any): The request's query parameters.
+
+    Returns:
+        bool: True if include_archived=true was passed.
+    """
+    return str(args.get("include_archived", "false")).lower() == "true"
+
+
+def archivable_query(older_than_days: int, now: Optional[float] = None) -> Dict:
+    """
+    Build the query for resolved reports old enough to archive.
+
+    Reports resolved before resolved_at was recorded are aged by when they were created.
+    Reports claimed by a batch delete are left to it.
+
+    Args:
+        older_than_days (int): How long a report must have been resolved.
+        now (Optional[float]): The current time, defaulting to now.
+
+    Returns:
+        Dict: The query.
+    """
+    now = int(time.time() if now is None else now)
+    cutoff = now - older_than_days * 86400
+    return {
+        "resolved": True,
+        **unclaimed_query(now),
+        "$or": [
+            {"resolved_at": {"$lte": cutoff}},
+            {"resolved_at": None, "created_at": {"$lte": cutoff}},
+        ],
+    }
+
+
+def ensure_archive_indexes(collection: Any = None) -> None:
+    """
+    Create the indexes the read endpoints use on the archive collection.
+
+    Args:
+        collection (Any): The archive collection, defaulting to MONGO_COLLECTION_REPORTS_ARCHIVE.
+    """
+    collection = reports_archive if collection is None else collection
+    for name, keys in ARCHIVE_INDEXES.items():
+        collection.create_index(keys, name=name)
+
+
+def _write_archive_file(batch: List[Dict], directory: str) -> str:
+    """
+    Write a batch of reports to a new gzipped NDJSON file, renamed into place once complete
+    so that readers never see a partial file.
+
+    Returns:
+        str: The path of the file.
+    """
+    os.makedirs(directory, exist_ok=True)
+    path = os.path.join(directory, f"reports-{int(time.time())}-{batch[0]['_id']}.ndjson.gz")
+    with gzip.open(f"{path}.tmp", "wt", encoding="utf-8") as f:
+        for report in batch:
+            f.write(json_util.dumps(report, json_options=json_util.RELAXED_JSON_OPTIONS))
+            f.write("\n")
+    os.replace(f"{path}.tmp", path)
+    return path
+
+
+def archive_resolved_reports(
+    older_than_days: int = ARCHIVE_AFTER_DAYS,
+    batch_size: int = ARCHIVE_BATCH_SIZE,
+    target: str = ARCHIVE_TARGET,
+    directory: str = ARCHIVE_DIR,
+    use_transactions: bool = ARCHIVE_TRANSACTIONS,
+    pause: float = 0.0,
+) -> Dict[str, int]:
+    """
+    Move resolved reports older than older_than_days out of the reports collection, one
+    batch at a time.
+
+    Each batch is copied to the archive and then deleted from the reports collection. With
+    the collection target and transactions, both happen in one transaction; otherwise a
+    failure between them leaves the batch in both places, and the next run archives it again
+    over the first copy. Reads that include the archive skip reports found in both.
+
+    Args:
+        older_than_days (int): How long a report must have been resolved.
+        batch_size (int): The reports moved at a time.
+        target (str): "collection" for MONGO_COLLECTION_REPORTS_ARCHIVE or "files" for
+            gzipped NDJSON files in directory.
+        directory (str): Where archive files are written.
+        use_transactions (bool): Move each batch to the archive collection in a transaction.
+        pause (float): Seconds to sleep between batches, to leave capacity for requests.
+
+    Returns:
+        Dict[str, int]: The number of reports archived and batches moved.
+
+    Raises:
+        ValueError: If the target is unknown.
+    """
+    if target not in ARCHIVE_TARGETS:
+        raise ValueError(f"Unknown archive target: {target}")
+    if target == "collection":
+        ensure_archive_indexes()
+
+    query = archivable_query(older_than_days)
+    summary = {"reports": 0, "batches": 0}
+    last_id = None
+    while True:
+        batch_query = dict(query)
+        if last_id is not None:
+            batch_query["_id"] = {"$gt": last_id}
+        with ExitStack() as stack:
+            session = None
+            if target == "collection" and use_transactions:
+                session = stack.enter_context(get_mongo_client().start_session())
+                stack.enter_context(session.start_transaction())
+            batch = list(reports.find(batch_query, session=session).sort("_id", 1).limit(batch_size))
+            if not batch:
+                break
+            ids = [report["_id"] for report in batch]
+            if target == "collection":
+                reports_archive.bulk_write(
+                    [ReplaceOne({"_id": report["_id"]}, report, upsert=True) for report in batch],
+                    ordered=False,
+                    session=session,
+                )
+            else:
+                _write_archive_file(batch, directory)
+            reports.delete_many({"_id": {"$in": ids}, "resolved": True, **unclaimed_query()}, session=session)
+
+        last_id = ids[-1]
+        summary["reports"] += len(batch)
+        summary["batches"] += 1
+        logger.info(f"Archived {summary['reports']} resolved reports to {target}.")
+        if pause:
+            time.sleep(pause)
+    return summary
+
+
+def read_archive_files(directory: str = ARCHIVE_DIR) -> Iterator[Dict]:
+    """
+    Read back the reports archived to files.
+
+    Args:
+        directory (str): The directory archive files were written to.
+
+    Yields:
+        Dict: Each archived report, with its ObjectId and other BSON types restored.
+    """
+    for path in sorted(glob.glob(os.path.join(directory, ARCHIVE_FILE_PATTERN))):
+        with gzip.open(path, "rt", encoding="utf-8") as f:
+            for line in f:
+                if line.strip():
+                    yield json_util.loads(line)
+
+
+def archived_image_names(directory: str = ARCHIVE_DIR, collection: Any = None) -> Iterator[str]:
+    """
+    List the blob names referenced by archived reports, so their images are kept.
+
+    Args:
+        directory (str): The directory archive files were written to.
+        collection (Any): The archive collection, defaulting to MONGO_COLLECTION_REPORTS_ARCHIVE.
+
+    Yields:
+        str: Each referenced blob name.
+    """
+    collection = reports_archive if collection is None else collection
+    query = {"image.image_name": {"$ne": None}}
+    for report in collection.find(query, {"_id": 0, "image.image_name": 1}, batch_size=10000):
+        yield report["image"]["image_name"]
+    for report in read_archive_files(directory):
+        name = report.get("image", {}).get("image_name")
+        if name:
+            yield name
+
+
+def count_archived_reports(directory: str = ARCHIVE_DIR, collection: Any = None) -> int:
+    """
+    Count the archived reports with an image, counting the lines of archive files without
+    parsing them, so the names archived_image_names yields can be sized for up front.
+
+    Args:
+        directory (str): The directory archive files were written to.
+        collection (Any): The archive collection, defaulting to MONGO_COLLECTION_REPORTS_ARCHIVE.
+
+    Returns:
+        int: At least the number of names archived_image_names yields.
+    """
+    collection = reports_archive if collection is None else collection
+    count = collection.count_documents({"image.image_name": {"$ne": None}})
+    for path in glob.glob(os.path.join(directory, ARCHIVE_FILE_PATTERN)):
+        with gzip.open(path, "rt", encoding="utf-8") as f:
+            count += sum(1 for line in f if line.strip())
+    return count
+
+
+def merge_reports(*sources: Iterable[Dict]) -> List[Dict]:
+    """
+    Combine reports read from the reports and archive collections, keeping the first copy
+    of a report found in both while it is being archived.
+
+    Args:
+        *sources (Iterable[Dict]): The reports read from each collection, hot first.
+
+    Returns:
+        List[Dict]: The reports.
+    """
+    seen = set()
+    merged = []
+    for source in sources:
+        for report in source:
+            if report["_id"] not in seen:
+                seen.add(report["_id"])
+                merged.append(report)
+    return merged
+
+
+def merge_feed_pages(hot: List[Dict], archived: List[Dict], limit: int) -> List[Dict]:
+    """
+    Combine a page of a user's feed read from each collection into one page in feed order.
+
+    Args:
+        hot (List[Dict]): Up to limit + 1 reports from the reports collection.
+        archived (List[Dict]): Up to limit + 1 reports from the archive collection.
+        limit (int): The page size.
+
+    Returns:
+        List[Dict]: Up to limit + 1 reports, newest first.
+    """
+    fields = [field for field, _ in FEED_SORT]
+    merged = sorted(
+        merge_reports(hot, archived), key=lambda report: tuple(report[field] for field in fields), reverse=True
+    )
+    return merged[:limit + 1]
@@ -0,0 +1,46 @@
+"""
+File: asgi.py
+Author: Jack McArdle
+
+This file is part of CommunityEye.
+
+Email: mcardle-j9@ulster.ac.uk
+B-No: B00733578
+"""
+
+import time
+
+# taken before the remaining imports so startup time includes them
+STARTED_AT = time.perf_counter()
+
+from quart import Quart
+from quart_cors import cors
+from blueprints.reports.async_reports import async_reports_bp
+from blueprints.authorities.async_authorities import async_authorities_bp
+from config import FLASK_HOST, FLASK_PORT
+import change_watcher
+import metrics
+import logging
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+
+def create_async_app():
+    app = Quart(__name__)
+    app = cors(app)
+    app.register_blueprint(async_reports_bp)
+    app.register_blueprint(async_authorities_bp)
+    metrics.init_async_app(app)
+    change_watcher.init_app(app)
+    app.config["STARTUP_SECONDS"] = time.perf_counter() - STARTED_AT
+    logger.info(f"Async app ready in {app.config['STARTUP_SECONDS'] * 1000:.1f} ms")
+    return app
+
+
+app = create_async_app()
+
+if __name__ == "__main__":
+    # for production run under an ASGI server, e.g. hypercorn asgi:app
+    logger.info(f"Starting Quart app on {FLASK_HOST}:{FLASK_PORT}")
+    app.run(host=FLASK_HOST, port=FLASK_PORT)
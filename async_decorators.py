@@ -0,0 +1,235 @@
+"""
+File: async_decorators.py
+Author: Jack McArdle
+
+This file is part of CommunityEye.
+
+Email: mcardle-j9@ulster.ac.uk
+B-No: B00733578
+"""
+
+import asyncio
+import logging
+from functools import wraps
+from quart import request, jsonify, make_response, g
+from typing import Awaitable, Callable, Any, Dict, Optional
+import httpx
+import jwt
+from config import ADMIN_TOKEN, AUTH_SERVICE_URL, FLASK_SECRET_KEY, RATE_LIMIT_BACKEND
+from clients import get_async_http_client
+from decorators import is_admin_token
+from idempotency import (
+    COMPLETED,
+    IDEMPOTENCY_HEADER,
+    MAX_KEY_LENGTH,
+    claim,
+    finish,
+    release,
+    request_fingerprint,
+    scoped_key,
+)
+from metrics import REJECTED_REQUESTS, timed
+from rate_limit import check_rate_limit, client_ip
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+
+def async_auth_required(func: Callable[..., Awaitable]) -> Callable[..., Awaitable]:
+    """
+    Async counterpart of auth_required for Quart routes.
+
+    The token is validated locally and then by the external auth service through a
+    shared asynchronous HTTP client, so waiting on the auth service does not hold a
+    worker thread.
+
+    Args:
+        func (Callable[..., Awaitable]): The Quart route coroutine to be decorated.
+
+    Returns:
+        Callable[..., Awaitable]: The decorated coroutine with authentication checks.
+    """
+    @wraps(func)
+    async def async_auth_required_wrapper(*args: Any, **kwargs: Any) -> Any:
+        error_response = await _validate_request_token()
+        if error_response is not None:
+            return error_response
+        return await func(*args, **kwargs)
+
+    return async_auth_required_wrapper
+
+
+def async_admin_required(func: Callable[..., Awaitable]) -> Callable[..., Awaitable]:
+    """
+    Async counterpart of admin_required for Quart routes.
+
+    Args:
+        func (Callable[..., Awaitable]): The Quart route coroutine to be decorated.
+
+    Returns:
+        Callable[..., Awaitable]: The decorated coroutine with the admin token check.
+    """
+    @wraps(func)
+    async def async_admin_required_wrapper(*args: Any, **kwargs: Any) -> Any:
+        if not ADMIN_TOKEN:
+            logger.warning("Admin access attempt while admin routes are disabled.")
+            return await make_response(
+                jsonify({"Forbidden": "Admin routes are disabled."}), 403
+            )
+
+        if not is_admin_token(request.headers.get("x-admin-token", "")):
+            logger.warning("Unauthorized admin access attempt.")
+            return await make_response(
+                jsonify({"Unauthorized": "Admin token is invalid."}), 401
+            )
+
+        return await func(*args, **kwargs)
+
+    return async_admin_required_wrapper
+
+
+def async_rate_limited(scope: str) -> Callable[[Callable[..., Awaitable]], Callable[..., Awaitable]]:
+    """
+    Async counterpart of rate_limited for Quart routes.
+
+    With the shared backend the check is a blocking Mongo call, so it runs in a thread.
+
+    Args:
+        scope (str): The limited scope, a key of RATE_LIMITS.
+
+    Returns:
+        Callable[[Callable[..., Awaitable]], Callable[..., Awaitable]]: The decorator.
+    """
+    def decorator(func: Callable[..., Awaitable]) -> Callable[..., Awaitable]:
+        @wraps(func)
+        async def async_rate_limited_wrapper(*args: Any, **kwargs: Any) -> Any:
+            ip = client_ip(request.remote_addr, request.headers.get("X-Forwarded-For"))
+            if RATE_LIMIT_BACKEND == "mongo":
+                retry_after = await asyncio.to_thread(check_rate_limit, scope, g.get("user_id"), ip)
+            else:
+                retry_after = check_rate_limit(scope, g.get("user_id"), ip)
+            if retry_after is not None:
+                response = await make_response(
+                    jsonify({"Too Many Requests": "Rate limit exceeded, try again later."}), 429
+                )
+                response.headers["Retry-After"] = str(retry_after)
+                return response
+            return await func(*args, **kwargs)
+
+        return async_rate_limited_wrapper
+
+    return decorator
+
+
+def async_idempotent(scope: str) -> Callable[[Callable[..., Awaitable]], Callable[..., Awaitable]]:
+    """
+    Async counterpart of idempotent for Quart routes.
+
+    Claiming a key may wait on another request or a Mongo call, so it runs in a thread.
+
+    Args:
+        scope (str): The route, qualifying its keys.
+
+    Returns:
+        Callable[[Callable[..., Awaitable]], Callable[..., Awaitable]]: The decorator.
+    """
+    def decorator(func: Callable[..., Awaitable]) -> Callable[..., Awaitable]:
+        @wraps(func)
+        async def async_idempotent_wrapper(*args: Any, **kwargs: Any) -> Any:
+            client_key = request.headers.get(IDEMPOTENCY_HEADER)
+            if client_key is None:
+                return await func(*args, **kwargs)
+            if not client_key or len(client_key) > MAX_KEY_LENGTH:
+                return await make_response(
+                    jsonify({"Bad Request": f"{IDEMPOTENCY_HEADER} must be 1 to {MAX_KEY_LENGTH} characters."}),
+                    400,
+                )
+
+            key = scoped_key(scope, g.get("user_id"), client_key)
+            fingerprint = request_fingerprint(await request.form, await request.files)
+            record = await asyncio.to_thread(claim, key, fingerprint)
+            if record is not None:
+                return await _idempotent_replay(scope, record, fingerprint)
+
+            try:
+                response = await make_response(await func(*args, **kwargs))
+            except Exception:
+                await asyncio.to_thread(release, key)
+                raise
+            body = await response.get_data(as_text=True)
+            await asyncio.to_thread(finish, key, response.status_code, body, list(response.headers.items()))
+            return response
+
+        return async_idempotent_wrapper
+
+    return decorator
+
+
+async def _idempotent_replay(scope: str, record: Dict[str, Any], fingerprint: str) -> Any:
+    """
+    Respond to a request whose Idempotency-Key has already been used.
+
+    Returns:
+        Any: The stored response, or an error if the key belongs to a different request
+        or its request is still running.
+    """
+    if record["fingerprint"] != fingerprint:
+        logger.warning(f"{IDEMPOTENCY_HEADER} reused for a different {scope} request.")
+        return await make_response(
+            jsonify({"Unprocessable Entity": f"{IDEMPOTENCY_HEADER} was already used for a different request."}),
+            422,
+        )
+    if record["state"] != COMPLETED:
+        REJECTED_REQUESTS.labels(scope=scope, reason="idempotency_conflict").inc()
+        response = await make_response(
+            jsonify({"Conflict": f"A request with this {IDEMPOTENCY_HEADER} is still in progress."}), 409
+        )
+        response.headers["Retry-After"] = "1"
+        return response
+
+    stored = record["response"]
+    logger.info(f"Replaying {scope} response for a retried request.")
+    response = await make_response(stored["body"], stored["status"])
+    response.headers.update(stored["headers"])
+    response.headers["Idempotent-Replayed"] = "true"
+    return response
+
+
+@timed("auth_required")
+async def _validate_request_token() -> Optional[Any]:
+    """
+    Validate the JWT token of the current request locally and with the auth service.
+
+    Returns:
+        Optional[Any]: An error response if the token is missing or invalid, otherwise None.
+    """
+    token = request.headers.get("x-access-token")
+    if not token:
+        logger.warning("Unauthorized access attempt: Token is missing.")
+        return await make_response(
+            jsonify({"Unauthorized": "Token is missing."}), 401
+        )
+
+    try:
+        data = jwt.decode(token, FLASK_SECRET_KEY, algorithms=["HS256"])
+        g.user_id = data["user_id"]
+    except jwt.InvalidTokenError as e:
+        logger.warning(
+            f"Unauthorized access attempt: Invalid token. Error: {str(e)}"
+        )
+        return await make_response(
+            jsonify({"Unauthorized": "Token is invalid."}), 401
+        )
+
+    try:
+        response = await get_async_http_client().post(
+            AUTH_SERVICE_URL, json={"token": token}
+        )
+        response.raise_for_status()
+    except httpx.HTTPError as e:
+        logger.error(f"Error validating token: {str(e)}")
+        return await make_response(
+            jsonify({"Unauthorized": "Error validating token."}), 500
+        )
+
+    return None
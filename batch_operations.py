@@ -0,0 +1,370 @@
+"""
+File: batch_operations.py
+Author: Jack McArdle
+
+This file is part of CommunityEye.
+
+Email: mcardle-j9@ulster.ac.uk
+B-No: B00733578
+"""
+
+import asyncio
+import logging
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, List, Optional, Tuple
+from bson import ObjectId
+from bson.errors import InvalidId
+from config import BATCH_BLOB_DELETE_WORKERS, BATCH_DELETE_CLAIM_SECONDS, BATCH_MAX_IDS
+from duplicate_utils import recent_reports
+from events import publish_report_event
+from image_index import similar_images
+from image_utils import delete_image, delete_image_async
+from metrics import stage_timer
+from stats_utils import record_reports_deleted, record_reports_resolved
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# the fields needed to update stats, find each report's blob and publish its event
+BATCH_PROJECTION = {
+    "user_id": 1,
+    "authority": 1,
+    "category": 1,
+    "created_at": 1,
+    "resolved": 1,
+    "resolved_at": 1,
+    "upvote_count": 1,
+    "image.image_name": 1,
+    "geolocation.geometry.coordinates": 1,
+}
+RELEASE_CLAIM = {"deleting": "", "deleting_until": ""}
+
+
+def unclaimed_query(now: Optional[int] = None) -> Dict:
+    """
+    Build the condition matching reports no batch delete has claimed.
+
+    Deletes of single reports and archiving add it to their filters, so a report claimed
+    by a batch delete is only removed, and counted, by that batch. Claims lapse after
+    BATCH_DELETE_CLAIM_SECONDS in case the batch never finished.
+
+    Args:
+        now (Optional[int]): The current Unix timestamp, defaulting to now.
+
+    Returns:
+        Dict: The condition.
+    """
+    return {"deleting_until": {"$not": {"$gt": int(time.time()) if now is None else now}}}
+
+
+def _claim(object_ids: Dict[str, ObjectId]) -> Tuple[Dict, Dict, Dict]:
+    """
+    Build the updates with which a batch delete claims its reports.
+
+    Returns:
+        Tuple[Dict, Dict, Dict]: The filter and update claiming every unclaimed report,
+        and the condition matching the reports this batch claimed.
+    """
+    token, now = uuid.uuid4().hex, int(time.time())
+    return (
+        {"_id": {"$in": list(object_ids.values())}, **unclaimed_query(now)},
+        {"$set": {"deleting": token, "deleting_until": now + BATCH_DELETE_CLAIM_SECONDS}},
+        {"_id": {"$in": list(object_ids.values())}, "deleting": token},
+    )
+
+
+def parse_report_ids(body: Any) -> Tuple[Optional[str], List[str], Dict[str, ObjectId], Dict[str, Dict]]:
+    """
+    Validate the body of a batch request.
+
+    Args:
+        body (Any): The decoded JSON body, expected to be {"report_ids": [...]}.
+
+    Returns:
+        Tuple: An error message if the body is unusable, the requested IDs in order
+        without repeats, the valid IDs mapped to their ObjectIds, and the results of
+        IDs that are not valid ObjectIds.
+    """
+    report_ids = body.get("report_ids") if isinstance(body, dict) else None
+    if not isinstance(report_ids, list) or not report_ids:
+        return "report_ids must be a non-empty list", [], {}, {}
+    if not all(isinstance(report_id, str) for report_id in report_ids):
+        return "report_ids must be strings", [], {}, {}
+
+    report_ids = list(dict.fromkeys(report_ids))
+    if len(report_ids) > BATCH_MAX_IDS:
+        return f"At most {BATCH_MAX_IDS} report_ids may be given", [], {}, {}
+
+    object_ids, results = {}, {}
+    for report_id in report_ids:
+        try:
+            object_ids[report_id] = ObjectId(report_id)
+        except (InvalidId, TypeError):
+            results[report_id] = {"status": "invalid_id"}
+    return None, report_ids, object_ids, results
+
+
+def summarise(report_ids: List[str], results: Dict[str, Dict]) -> Dict:
+    """
+    Order the per-ID results as requested and count each status.
+
+    Args:
+        report_ids (List[str]): The requested IDs.
+        results (Dict[str, Dict]): The result of each ID.
+
+    Returns:
+        Dict: The results and a summary of how many IDs ended in each status.
+    """
+    summary: Dict[str, int] = {}
+    for report_id in report_ids:
+        status = results[report_id]["status"]
+        summary[status] = summary.get(status, 0) + 1
+    return {"results": {report_id: results[report_id] for report_id in report_ids}, "summary": summary}
+
+
+def _plan_resolve(
+    object_ids: Dict[str, ObjectId], found: List[Dict], results: Dict[str, Dict]
+) -> Dict[str, Dict]:
+    """
+    Record the result of IDs that are missing or already resolved.
+
+    Returns:
+        Dict[str, Dict]: The open reports to resolve, keyed by ID.
+    """
+    by_id = {str(report["_id"]): report for report in found}
+    open_reports = {}
+    for report_id in object_ids:
+        report = by_id.get(report_id)
+        if report is None:
+            results[report_id] = {"status": "not_found"}
+        elif report.get("resolved"):
+            results[report_id] = {"status": "already_resolved", "resolved_at": report.get("resolved_at")}
+        else:
+            open_reports[report_id] = report
+    return open_reports
+
+
+def _finish_resolve(
+    open_reports: Dict[str, Dict], resolved_ids: set, resolved_at: int, results: Dict[str, Dict]
+) -> None:
+    resolved = []
+    for report_id, report in open_reports.items():
+        if report["_id"] in resolved_ids:
+            results[report_id] = {"status": "resolved", "resolved_at": resolved_at}
+            resolved.append(report)
+            recent_reports.discard(report_id)
+            publish_report_event("resolved", report, resolved=True, resolved_at=resolved_at)
+        else:
+            # resolved by another request between the read and the update
+            results[report_id] = {"status": "already_resolved"}
+    record_reports_resolved(resolved, resolved_at)
+
+
+def resolve_reports(collection: Any, object_ids: Dict[str, ObjectId], results: Dict[str, Dict]) -> None:
+    """
+    Resolve a batch of reports with a single update_many.
+
+    Args:
+        collection (Any): The reports collection.
+        object_ids (Dict[str, ObjectId]): The valid IDs to resolve.
+        results (Dict[str, Dict]): Filled with the result of each ID.
+    """
+    found = list(collection.find({"_id": {"$in": list(object_ids.values())}}, BATCH_PROJECTION))
+    open_reports = _plan_resolve(object_ids, found, results)
+    if not open_reports:
+        return
+
+    resolved_at = int(time.time())
+    open_ids = [report["_id"] for report in open_reports.values()]
+    with stage_timer("batch.resolve"):
+        result = collection.update_many(
+            {"_id": {"$in": open_ids}, "resolved": False},
+            {"$set": {"resolved": True, "resolved_at": resolved_at}},
+        )
+    resolved_ids = set(open_ids)
+    if result.modified_count != len(open_ids):
+        resolved_ids = {
+            report["_id"]
+            for report in collection.find({"_id": {"$in": open_ids}, "resolved_at": resolved_at}, {"_id": 1})
+        }
+    _finish_resolve(open_reports, resolved_ids, resolved_at, results)
+
+
+async def resolve_reports_async(
+    collection: Any, object_ids: Dict[str, ObjectId], results: Dict[str, Dict]
+) -> None:
+    """
+    Resolve a batch of reports with a single update_many, using the asynchronous driver.
+
+    Args:
+        collection (Any): The asynchronous reports collection.
+        object_ids (Dict[str, ObjectId]): The valid IDs to resolve.
+        results (Dict[str, Dict]): Filled with the result of each ID.
+    """
+    found = await collection.find({"_id": {"$in": list(object_ids.values())}}, BATCH_PROJECTION).to_list(None)
+    open_reports = _plan_resolve(object_ids, found, results)
+    if not open_reports:
+        return
+
+    resolved_at = int(time.time())
+    open_ids = [report["_id"] for report in open_reports.values()]
+    with stage_timer("batch.resolve"):
+        result = await collection.update_many(
+            {"_id": {"$in": open_ids}, "resolved": False},
+            {"$set": {"resolved": True, "resolved_at": resolved_at}},
+        )
+    resolved_ids = set(open_ids)
+    if result.modified_count != len(open_ids):
+        cursor = collection.find({"_id": {"$in": open_ids}, "resolved_at": resolved_at}, {"_id": 1})
+        resolved_ids = {report["_id"] async for report in cursor}
+    await asyncio.to_thread(_finish_resolve, open_reports, resolved_ids, resolved_at, results)
+
+
+def _unclaimed_ids(object_ids: Dict[str, ObjectId], found: List[Dict]) -> List[ObjectId]:
+    """
+    List the requested IDs this batch did not claim, which are missing or claimed by another
+    batch delete.
+    """
+    claimed = {str(report["_id"]) for report in found}
+    return [object_id for report_id, object_id in object_ids.items() if report_id not in claimed]
+
+
+def _plan_delete(
+    object_ids: Dict[str, ObjectId], found: List[Dict], in_progress: List[Dict], results: Dict[str, Dict]
+) -> Tuple[Dict[str, Dict], Dict[str, str]]:
+    """
+    Record the result of IDs this batch did not claim and list the blobs to delete.
+
+    Args:
+        object_ids (Dict[str, ObjectId]): The valid IDs to delete.
+        found (List[Dict]): The reports this batch claimed.
+        in_progress (List[Dict]): The unclaimed reports that exist, being deleted by another batch.
+        results (Dict[str, Dict]): Filled with the result of each ID that is not deleted.
+
+    Returns:
+        Tuple: The reports to delete keyed by ID, and the blob name of each report that has one.
+    """
+    by_id = {str(report["_id"]): report for report in found}
+    elsewhere = {str(report["_id"]) for report in in_progress}
+    to_delete, image_names = {}, {}
+    for report_id in object_ids:
+        report = by_id.get(report_id)
+        if report is None:
+            results[report_id] = {"status": "in_progress" if report_id in elsewhere else "not_found"}
+            continue
+        to_delete[report_id] = report
+        # reports imported with an external image URL have no blob of their own
+        image_name = report.get("image", {}).get("image_name")
+        if image_name is not None:
+            image_names[report_id] = image_name
+    return to_delete, image_names
+
+
+def _keep_failed_blobs(
+    to_delete: Dict[str, Dict], blobs_deleted: Dict[str, bool], results: Dict[str, Dict]
+) -> List[ObjectId]:
+    """
+    Keep the reports whose image could not be deleted.
+
+    Returns:
+        List[ObjectId]: The IDs of the kept reports, whose claims are to be released.
+    """
+    kept = []
+    for report_id, deleted in blobs_deleted.items():
+        if not deleted:
+            # the report is kept so its image is not orphaned
+            results[report_id] = {"status": "error", "error": "Failed to delete image from Azure Blob Storage"}
+            kept.append(to_delete.pop(report_id)["_id"])
+    return kept
+
+
+def _finish_delete(to_delete: Dict[str, Dict], deleted_count: int, results: Dict[str, Dict]) -> None:
+    if deleted_count != len(to_delete):
+        # only if a claim lapsed and another request deleted the report
+        logger.warning(f"Batch delete removed {deleted_count} of {len(to_delete)} claimed reports")
+    for report_id in to_delete:
+        results[report_id] = {"status": "deleted"}
+        recent_reports.discard(report_id)
+        similar_images.discard(report_id)
+        publish_report_event("deleted", to_delete[report_id])
+    record_reports_deleted(list(to_delete.values()))
+
+
+def delete_reports(collection: Any, object_ids: Dict[str, ObjectId], results: Dict[str, Dict]) -> None:
+    """
+    Delete a batch of reports, their images concurrently and the documents with one delete_many.
+
+    Args:
+        collection (Any): The reports collection.
+        object_ids (Dict[str, ObjectId]): The valid IDs to delete.
+        results (Dict[str, Dict]): Filled with the result of each ID.
+    """
+    claim_filter, claim_update, claimed = _claim(object_ids)
+    collection.update_many(claim_filter, claim_update)
+    # reports claimed by another batch delete are left to it
+    found = list(collection.find(claimed, BATCH_PROJECTION))
+    unclaimed = _unclaimed_ids(object_ids, found)
+    in_progress = list(collection.find({"_id": {"$in": unclaimed}}, {"_id": 1})) if unclaimed else []
+    to_delete, image_names = _plan_delete(object_ids, found, in_progress, results)
+
+    if image_names:
+        with stage_timer("batch.delete_blobs"), ThreadPoolExecutor(
+            max_workers=min(BATCH_BLOB_DELETE_WORKERS, len(image_names))
+        ) as pool:
+            blobs_deleted = dict(zip(image_names, pool.map(delete_image, image_names.values())))
+        kept = _keep_failed_blobs(to_delete, blobs_deleted, results)
+        if kept:
+            collection.update_many({**claimed, "_id": {"$in": kept}}, {"$unset": RELEASE_CLAIM})
+
+    if not to_delete:
+        return
+    with stage_timer("batch.delete"):
+        result = collection.delete_many(
+            {**claimed, "_id": {"$in": [report["_id"] for report in to_delete.values()]}}
+        )
+    _finish_delete(to_delete, result.deleted_count, results)
+
+
+async def delete_reports_async(
+    collection: Any, object_ids: Dict[str, ObjectId], results: Dict[str, Dict]
+) -> None:
+    """
+    Delete a batch of reports using the asynchronous driver and blob client.
+
+    Args:
+        collection (Any): The asynchronous reports collection.
+        object_ids (Dict[str, ObjectId]): The valid IDs to delete.
+        results (Dict[str, Dict]): Filled with the result of each ID.
+    """
+    claim_filter, claim_update, claimed = _claim(object_ids)
+    await collection.update_many(claim_filter, claim_update)
+    # reports claimed by another batch delete are left to it
+    found = await collection.find(claimed, BATCH_PROJECTION).to_list(None)
+    unclaimed = _unclaimed_ids(object_ids, found)
+    in_progress = []
+    if unclaimed:
+        in_progress = await collection.find({"_id": {"$in": unclaimed}}, {"_id": 1}).to_list(None)
+    to_delete, image_names = _plan_delete(object_ids, found, in_progress, results)
+
+    if image_names:
+        limit = asyncio.Semaphore(BATCH_BLOB_DELETE_WORKERS)
+
+        async def delete_blob(image_name: str) -> bool:
+            async with limit:
+                return await delete_image_async(image_name)
+
+        with stage_timer("batch.delete_blobs"):
+            deleted = await asyncio.gather(*(delete_blob(name) for name in image_names.values()))
+        kept = _keep_failed_blobs(to_delete, dict(zip(image_names, deleted)), results)
+        if kept:
+            await collection.update_many({**claimed, "_id": {"$in": kept}}, {"$unset": RELEASE_CLAIM})
+
+    if not to_delete:
+        return
+    with stage_timer("batch.delete"):
+        result = await collection.delete_many(
+            {**claimed, "_id": {"$in": [report["_id"] for report in to_delete.values()]}}
+        )
+    await asyncio.to_thread(_finish_delete, to_delete, result.deleted_count, results)
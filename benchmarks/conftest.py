@@ -0,0 +1,176 @@
+"""
+File: conftest.py
+Author: Jack McArdle
+
+This file is part of CommunityEye.
+
+Email: mcardle-j9@ulster.ac.uk
+B-No: B00733578
+"""
+
+import glob
+import json
+import os
+import time
+from unittest.mock import MagicMock, patch
+import mongomock
+import pytest
+from shapely.geometry import shape
+from config import MONGO_COLLECTION_AUTHORITIES, MONGO_COLLECTION_REPORTS
+from benchmarks.photos import BELFAST, IMAGE_SIZE
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+AUTHORITY_FILES = sorted(glob.glob(os.path.join(REPO_ROOT, "data", "geojsons", "*", "*.json")))
+NI_OUTLINE_PATH = os.path.join(
+    "data", "geojsons", "OSNI_Open_Data_-_Largescale_Boundaries_-_NI_Outline.geojson"
+)
+
+
+def pytest_benchmark_update_json(config, benchmarks, output_json):
+    """
+    Drop each benchmark's per-round timings from --benchmark-json reports. Only the summary
+    statistics are compared, and the raw samples would make the committed baseline huge.
+    """
+    for benchmark in output_json["benchmarks"]:
+        benchmark["stats"].pop("data", None)
+
+
+def load_authority_documents():
+    """
+    Load every authority shipped in data/geojsons.
+
+    Returns:
+        list: The authority documents, as seeded into the authorities collection.
+    """
+    documents = []
+    for path in AUTHORITY_FILES:
+        with open(path) as f:
+            documents.extend(json.load(f))
+    return documents
+
+
+def make_report(index, geolocation=BELFAST):
+    """
+    Build a stored report document of realistic size.
+
+    Args:
+        index (int): Used to vary the report's fields.
+        geolocation (dict): The report's 'Lat' and 'Lon'.
+
+    Returns:
+        dict: The report document.
+    """
+    return {
+        "_id": f"{index:024x}",
+        "user_id": index % 500,
+        "description": f"Report {index}: large pothole on the inside lane near the junction.",
+        "category": "Potholes",
+        "geolocation": {
+            "type": "Feature",
+            "geometry": {"type": "Point", "coordinates": [geolocation["Lat"], geolocation["Lon"]]},
+        },
+        "authority": "Department for Infrastructure - Eastern Division",
+        "image": {
+            "url": f"https://communityeye.blob.core.windows.net/images/report-{index}.jpg",
+            "image_name": f"report-{index}.jpg",
+            "dimensions": list(IMAGE_SIZE),
+            "geolocation": geolocation,
+            "file_size": 1843200,
+            "dhash": f"{index * 2654435761 % 2 ** 64:016x}",
+        },
+        "similar_reports": [],
+        "resolved": index % 3 == 0,
+        "upvote_count": index % 17,
+        "created_at": int(time.time()) - index * 60,
+    }
+
+
+@pytest.fixture(scope="session")
+def authority_documents():
+    return load_authority_documents()
+
+
+@pytest.fixture(scope="session")
+def authority_points(authority_documents):
+    """
+    One point inside each authority's area, keyed by authority name.
+    """
+    points = {}
+    for authority in authority_documents:
+        point = shape(authority["area"]).representative_point()
+        points[authority["authority_name"]] = {"Lat": point.y, "Lon": point.x}
+    return points
+
+
+@pytest.fixture
+def ni_outline(tmp_path, monkeypatch, authority_documents):
+    """
+    Run from a directory holding an NI outline built from the shipped council areas.
+
+    The OSNI outline that is_within_boundaries reads is not distributed with the repo.
+    """
+    features = [
+        {"type": "Feature", "properties": {}, "geometry": authority["area"]}
+        for authority in authority_documents
+        if authority["authority_type"] == "Council"
+    ]
+    outline_path = tmp_path / NI_OUTLINE_PATH
+    outline_path.parent.mkdir(parents=True)
+    outline_path.write_text(json.dumps({"type": "FeatureCollection", "features": features}))
+    monkeypatch.chdir(tmp_path)
+
+
+@pytest.fixture
+def mongo_db(authority_documents, tmp_path_factory):
+    """
+    A mongomock database seeded with the shipped authorities, used by every module.
+
+    The boundary store is rebuilt from it in a temporary directory.
+    """
+    from boundary_store import boundary_store
+
+    db = mongomock.MongoClient()["communityeye"]
+    db[MONGO_COLLECTION_AUTHORITIES].insert_many(
+        [dict(authority) for authority in authority_documents]
+    )
+    with patch("clients.get_db", return_value=db), \
+            patch.object(boundary_store, "directory", str(tmp_path_factory.mktemp("boundary-store"))):
+        boundary_store.invalidate()
+        yield db
+    boundary_store.invalidate()
+
+
+@pytest.fixture
+def api_client(mongo_db, ni_outline):
+    """
+    A Flask test client with the auth service and blob storage replaced.
+    """
+    import jwt
+    from app import create_app
+    from config import FLASK_SECRET_KEY
+    from duplicate_utils import recent_reports
+    from image_index import similar_images
+
+    container = MagicMock()
+    container.get_blob_client.return_value.url = "https://communityeye.blob.core.windows.net/images/photo.jpg"
+    auth_response = MagicMock(status_code=200)
+    token = jwt.encode({"user_id": 1}, FLASK_SECRET_KEY, algorithm="HS256")
+
+    recent_reports.invalidate()
+    similar_images.invalidate()
+    # mongomock has no change streams, and the benchmarks write through this process only;
+    # one user submitting in a loop would otherwise be rate limited
+    with patch("decorators.requests.post", return_value=auth_response), \
+            patch("image_utils.get_container_client", return_value=container), \
+            patch("change_watcher.CHANGE_WATCHER_ENABLED", False), \
+            patch("rate_limit.RATE_LIMIT_ENABLED", False):
+        client = create_app().test_client()
+        client.environ_base["HTTP_X_ACCESS_TOKEN"] = token
+        yield client
+    recent_reports.invalidate()
+    similar_images.invalidate()
+
+
+@pytest.fixture
+def reports_collection(mongo_db):
+    return mongo_db[MONGO_COLLECTION_REPORTS]
@@ -0,0 +1,74 @@
+"""
+File: photos.py
+Author: Jack McArdle
+
+This file is part of CommunityEye.
+
+Email: mcardle-j9@ulster.ac.uk
+B-No: B00733578
+"""
+
+import io
+import numpy as np
+import piexif
+from PIL import Image
+from pillow_heif import register_heif_opener
+
+# a typical phone photo after the app has resized it
+IMAGE_SIZE = (1600, 1200)
+BELFAST = {"Lat": 54.597285, "Lon": -5.930120}
+
+
+def _dms(value):
+    value = abs(value)
+    degrees = int(value)
+    minutes = int((value - degrees) * 60)
+    seconds = round(((value - degrees) * 60 - minutes) * 60 * 10000)
+    return ((degrees, 1), (minutes, 1), (seconds, 10000))
+
+
+def gps_exif(geolocation):
+    """
+    Build an EXIF block holding a GPS position.
+
+    Args:
+        geolocation (dict): The 'Lat' and 'Lon' to embed.
+
+    Returns:
+        bytes: The EXIF block, for piexif.insert or Image.save.
+    """
+    return piexif.dump({
+        "GPS": {
+            piexif.GPSIFD.GPSLatitudeRef: "N" if geolocation["Lat"] >= 0 else "S",
+            piexif.GPSIFD.GPSLatitude: _dms(geolocation["Lat"]),
+            piexif.GPSIFD.GPSLongitudeRef: "E" if geolocation["Lon"] >= 0 else "W",
+            piexif.GPSIFD.GPSLongitude: _dms(geolocation["Lon"]),
+        }
+    })
+
+
+def make_photo(geolocation=BELFAST, format="JPEG", seed=0, size=IMAGE_SIZE):
+    """
+    Build a photo carrying GPS EXIF data, like the ones the mobile app uploads.
+
+    Args:
+        geolocation (dict): The 'Lat' and 'Lon' to embed.
+        format (str): "JPEG" or "HEIF".
+        seed (int): Seed for the image content.
+        size (tuple): Width and height in pixels.
+
+    Returns:
+        bytes: The encoded image.
+    """
+    register_heif_opener()
+    rng = np.random.default_rng(seed)
+    # smooth gradients with noise compress like a real photo rather than a flat fill
+    x = np.linspace(0, 255, size[0], dtype=np.float32)
+    y = np.linspace(0, 255, size[1], dtype=np.float32)[:, None]
+    pixels = np.stack([x + 0 * y, y + 0 * x, (x + y) / 2], axis=-1)
+    pixels += rng.normal(0, 12, pixels.shape)
+    image = Image.fromarray(np.clip(pixels, 0, 255).astype(np.uint8))
+
+    output = io.BytesIO()
+    image.save(output, format, quality=90, exif=gps_exif(geolocation))
+    return output.getvalue()
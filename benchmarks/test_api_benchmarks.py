@@ -0,0 +1,76 @@
+"""
+File: test_api_benchmarks.py
+Author: Jack McArdle
+
+This file is part of CommunityEye.
+
+Email: mcardle-j9@ulster.ac.uk
+B-No: B00733578
+"""
+
+import io
+import time
+import pytest
+import pyarrow.parquet as pq
+from flask import Flask, jsonify
+from config import MONGO_COLLECTION_REPORTS
+from duplicate_utils import recent_reports
+from image_index import similar_images
+from benchmarks.conftest import make_report
+from benchmarks.photos import make_photo
+
+
+@pytest.mark.parametrize("count", [100, 1000, 10000])
+def test_serialize_reports(benchmark, count):
+    app = Flask(__name__)
+    data = [make_report(index) for index in range(count)]
+
+    def serialize():
+        with app.app_context():
+            return jsonify(data).get_data()
+
+    assert benchmark(serialize).startswith(b"[")
+
+
+def test_create_report(benchmark, api_client, mongo_db):
+    photo = make_photo()
+
+    def reset():
+        # an identical submission would otherwise be merged as a duplicate
+        mongo_db[MONGO_COLLECTION_REPORTS].delete_many({})
+        recent_reports.invalidate()
+        similar_images.invalidate()
+
+    def create():
+        return api_client.post(
+            "/api/v1/reports",
+            data={
+                "userID": "1",
+                "description": "Large pothole on the inside lane",
+                "category": "Potholes",
+                "image": (io.BytesIO(photo), "photo.jpg", "image/jpeg"),
+            },
+            content_type="multipart/form-data",
+        )
+
+    response = benchmark.pedantic(create, setup=reset, rounds=10, warmup_rounds=1)
+    assert response.status_code == 201, response.json
+
+
+@pytest.mark.parametrize("count", [100, 1000])
+def test_list_reports(benchmark, api_client, reports_collection, count):
+    reports_collection.insert_many([make_report(index) for index in range(count)])
+
+    response = benchmark(api_client.get, "/api/v1/reports")
+    assert response.status_code == 200
+    assert len(response.json) == count
+
+
+@pytest.mark.parametrize("count", [100, 1000])
+def test_export_reports(benchmark, api_client, reports_collection, count):
+    reports_collection.insert_many([make_report(index) for index in range(count)])
+
+    # the newest reports would otherwise be left for the next incremental export
+    response = benchmark(api_client.get, f"/api/v1/reports/export?until={int(time.time())}")
+    assert response.status_code == 200
+    assert pq.read_metadata(io.BytesIO(response.data)).num_rows == count
@@ -0,0 +1,38 @@
+"""
+File: test_geo_benchmarks.py
+Author: Jack McArdle
+
+This file is part of CommunityEye.
+
+Email: mcardle-j9@ulster.ac.uk
+B-No: B00733578
+"""
+
+import pytest
+from report_utils import determine_report_authority, is_within_boundaries
+from benchmarks.conftest import load_authority_documents
+from benchmarks.photos import BELFAST
+
+COUNCIL_CATEGORY = "Missed bin collection"
+DFI_CATEGORY = "Potholes"
+AUTHORITIES = [
+    (authority["authority_name"], authority["authority_type"])
+    for authority in load_authority_documents()
+]
+
+
+def test_is_within_boundaries_inside(benchmark, ni_outline):
+    assert benchmark(is_within_boundaries, BELFAST)
+
+
+def test_is_within_boundaries_outside(benchmark, ni_outline):
+    # Dublin, so every polygon is tested before giving up
+    assert not benchmark(is_within_boundaries, {"Lat": 53.349805, "Lon": -6.26031})
+
+
+@pytest.mark.parametrize("authority_name,authority_type", AUTHORITIES)
+def test_determine_report_authority(benchmark, mongo_db, authority_points, authority_name, authority_type):
+    category = COUNCIL_CATEGORY if authority_type == "Council" else DFI_CATEGORY
+    geolocation = authority_points[authority_name]
+
+    assert benchmark(determine_report_authority, geolocation, category) == authority_name
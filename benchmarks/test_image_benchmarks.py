@@ -0,0 +1,51 @@
+"""
+File: test_image_benchmarks.py
+Author: Jack McArdle
+
+This file is part of CommunityEye.
+
+Email: mcardle-j9@ulster.ac.uk
+B-No: B00733578
+"""
+
+import io
+import pytest
+from PIL import Image
+from image_utils import _read_gps_info_pil, compute_dhash, convert_image_heic, get_image_geolocation
+from benchmarks.photos import BELFAST, make_photo
+
+
+@pytest.fixture(scope="module")
+def jpeg_photo():
+    return make_photo()
+
+
+@pytest.fixture(scope="module")
+def heic_photo():
+    return make_photo(format="HEIF")
+
+
+def test_get_image_geolocation(benchmark, jpeg_photo):
+    geolocation = benchmark(lambda: get_image_geolocation(io.BytesIO(jpeg_photo)))
+    assert geolocation == pytest.approx(BELFAST, abs=1e-5)
+
+
+def test_get_image_geolocation_heic(benchmark, heic_photo):
+    geolocation = benchmark(lambda: get_image_geolocation(io.BytesIO(heic_photo)))
+    assert geolocation == pytest.approx(BELFAST, abs=1e-5)
+
+
+# the Pillow path that JPEG and HEIF uploads no longer take, for comparison
+def test_read_gps_info_pil(benchmark, jpeg_photo):
+    assert benchmark(lambda: _read_gps_info_pil(io.BytesIO(jpeg_photo)))
+
+
+def test_convert_image_heic(benchmark, heic_photo):
+    converted = benchmark(lambda: convert_image_heic(io.BytesIO(heic_photo)))
+    assert get_image_geolocation(converted) == pytest.approx(BELFAST, abs=1e-5)
+
+
+def test_compute_dhash(benchmark, jpeg_photo):
+    image = Image.open(io.BytesIO(jpeg_photo))
+    image.load()
+    assert len(benchmark(compute_dhash, image)) == 16
@@ -0,0 +1,212 @@
+"""
+File: blob_gc.py
+Author: Jack McArdle
+
+This file is part of CommunityEye.
+
+Email: mcardle-j9@ulster.ac.uk
+B-No: B00733578
+"""
+
+import hashlib
+import logging
+import math
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+from typing import Any, Callable, Container, Dict, Iterable, Iterator, List, Optional, Tuple
+import numpy as np
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# the most sub-requests Blob Storage accepts in one batch
+MAX_BATCH_SIZE = 256
+
+
+class BloomFilter:
+    """
+    Fixed-size set membership with no false negatives.
+
+    Used in place of a set when the reports collection holds too many image names to keep
+    in memory. A false positive only keeps an orphan for another run; a referenced blob is
+    never reported as an orphan.
+    """
+
+    def __init__(self, capacity: int, error_rate: float = 0.001):
+        capacity = max(1, capacity)
+        self.size = max(8, int(-capacity * math.log(error_rate) / math.log(2) ** 2))
+        self.hash_count = max(1, round(self.size / capacity * math.log(2)))
+        self.bits = np.zeros((self.size + 7) // 8, dtype=np.uint8)
+
+    def _positions(self, item: str) -> List[int]:
+        digest = hashlib.blake2b(item.encode(), digest_size=16).digest()
+        first, second = int.from_bytes(digest[:8], "little"), int.from_bytes(digest[8:], "little")
+        return [(first + i * second) % self.size for i in range(self.hash_count)]
+
+    def add(self, item: str) -> None:
+        for position in self._positions(item):
+            self.bits[position >> 3] |= 1 << (position & 7)
+
+    def __contains__(self, item: str) -> bool:
+        return all(self.bits[position >> 3] & (1 << (position & 7)) for position in self._positions(item))
+
+
+def load_referenced_names(
+    collection: Any,
+    use_bloom: bool = False,
+    error_rate: float = 0.001,
+    extra_names: Iterable[str] = (),
+    extra_count: Optional[int] = None,
+) -> Container[str]:
+    """
+    Collect the blob names referenced by reports.
+
+    Args:
+        collection (Any): The reports collection.
+        use_bloom (bool): Hold the names in a bloom filter rather than a set.
+        error_rate (float): The bloom filter's false positive rate.
+        extra_names (Iterable[str]): Names referenced outside the collection, e.g. by archived
+            reports. They are streamed into the result, so they may come from a generator.
+        extra_count (Optional[int]): At least how many extra names there are, to size the bloom
+            filter. Needed with use_bloom when extra_names has no length.
+
+    Returns:
+        Container[str]: The referenced names.
+    """
+    query = {"image.image_name": {"$ne": None}}
+    referenced: Any = set()
+    if use_bloom:
+        expected = len(extra_names) if extra_count is None else extra_count
+        referenced = BloomFilter(collection.count_documents(query) + expected, error_rate)
+    for report in collection.find(query, {"_id": 0, "image.image_name": 1}, batch_size=10000):
+        referenced.add(report["image"]["image_name"])
+    for name in extra_names:
+        referenced.add(name)
+    return referenced
+
+
+def find_orphans(
+    container: Any,
+    referenced: Container[str],
+    min_age_seconds: float,
+    page_size: int = 5000,
+    prefix: Optional[str] = None,
+) -> Iterator[Dict]:
+    """
+    List the container page by page and yield the blobs no report references.
+
+    Blobs younger than min_age_seconds are skipped: a report's image is uploaded before
+    the report is inserted, and bulk imports may reference blobs uploaded earlier.
+
+    Args:
+        container (Any): The container client.
+        referenced (Container[str]): The referenced blob names.
+        min_age_seconds (float): The minimum age of a blob to be considered.
+        page_size (int): Blobs listed per request.
+        prefix (Optional[str]): Only consider blobs whose names start with this.
+
+    Yields:
+        Dict: The name, size and last modified time of each orphan.
+    """
+    cutoff = datetime.fromtimestamp(time.time() - min_age_seconds, tz=timezone.utc)
+    for page in container.list_blobs(name_starts_with=prefix, results_per_page=page_size).by_page():
+        for blob in page:
+            if blob.name in referenced or blob.last_modified > cutoff:
+                continue
+            yield {"name": blob.name, "size": blob.size, "last_modified": blob.last_modified}
+
+
+def _delete_batch(container: Any, names: List[str]) -> Tuple[int, int, List[str]]:
+    """
+    Delete up to MAX_BATCH_SIZE blobs with one batch request.
+
+    Returns:
+        Tuple[int, int, List[str]]: How many were deleted and already gone, and the names
+        that failed.
+    """
+    try:
+        responses = list(container.delete_blobs(*names, raise_on_any_failure=False))
+    except Exception as e:
+        logger.error(f"Batch delete of {len(names)} blobs failed: {e}")
+        return 0, 0, list(names)
+    deleted = missing = 0
+    failed = []
+    for name, response in zip(names, responses):
+        if response.status_code == 202:
+            deleted += 1
+        elif response.status_code == 404:
+            missing += 1
+        else:
+            failed.append(name)
+    return deleted, missing, failed
+
+
+def collect_garbage(
+    container: Any,
+    referenced: Container[str],
+    min_age_seconds: float,
+    dry_run: bool = True,
+    page_size: int = 5000,
+    batch_size: int = MAX_BATCH_SIZE,
+    workers: int = 4,
+    prefix: Optional[str] = None,
+    on_orphan: Optional[Callable[[Dict], None]] = None,
+) -> Dict:
+    """
+    Find orphaned blobs and, unless dry_run, delete them in batches with bounded concurrency.
+
+    Batches are deleted while the listing continues; at most `workers` batch requests are
+    in flight at once.
+
+    Args:
+        container (Any): The container client.
+        referenced (Container[str]): The referenced blob names.
+        min_age_seconds (float): The minimum age of a blob to be considered.
+        dry_run (bool): Only report the orphans.
+        page_size (int): Blobs listed per request.
+        batch_size (int): Blobs deleted per batch request, at most MAX_BATCH_SIZE.
+        workers (int): Batch requests in flight at once.
+        prefix (Optional[str]): Only consider blobs whose names start with this.
+        on_orphan (Optional[Callable[[Dict], None]]): Called with each orphan found.
+
+    Returns:
+        Dict: The number and total size of orphans found, and how many were deleted,
+        already gone or failed.
+    """
+    batch_size = min(batch_size, MAX_BATCH_SIZE)
+    summary = {"orphans": 0, "orphan_bytes": 0, "deleted": 0, "missing": 0, "failed": 0, "dry_run": dry_run}
+    failed_names: List[str] = []
+    in_flight: List[Any] = []
+
+    def collect(future: Any) -> None:
+        deleted, missing, failed = future.result()
+        summary["deleted"] += deleted
+        summary["missing"] += missing
+        summary["failed"] += len(failed)
+        failed_names.extend(failed)
+
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        batch: List[str] = []
+        for orphan in find_orphans(container, referenced, min_age_seconds, page_size, prefix):
+            summary["orphans"] += 1
+            summary["orphan_bytes"] += orphan["size"] or 0
+            if on_orphan is not None:
+                on_orphan(orphan)
+            if dry_run:
+                continue
+            batch.append(orphan["name"])
+            if len(batch) == batch_size:
+                if len(in_flight) >= workers:
+                    collect(in_flight.pop(0))
+                in_flight.append(pool.submit(_delete_batch, container, batch))
+                batch = []
+        if batch:
+            in_flight.append(pool.submit(_delete_batch, container, batch))
+        for future in in_flight:
+            collect(future)
+
+    if failed_names:
+        logger.warning(f"Failed to delete {len(failed_names)} orphaned blobs, e.g. {failed_names[:5]}")
+    logger.info(f"Blob garbage collection finished: {summary}")
+    return summary
@@ -0,0 +1,76 @@
+"""
+File: admin.py
+Author: Jack McArdle
+
+This file is part of CommunityEye.
+
+Email: mcardle-j9@ulster.ac.uk
+B-No: B00733578
+"""
+
+import logging
+import os
+from flask import Blueprint, jsonify, make_response, send_from_directory
+from config import PROFILE_DIR
+from profiling import list_profiles
+from change_watcher import watcher
+from decorators import admin_required
+
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+
+admin_bp = Blueprint("admin_bp", __name__)
+
+
+@admin_bp.route("/api/v1/admin/profiles", methods=["GET"])
+@admin_required
+def get_profiles() -> make_response:
+    """
+    Retrieve the summaries of stored request profiles, newest first.
+
+    Returns:
+        make_response: JSON response containing each profile's request, duration,
+        Mongo command count and time, and profile file name.
+    """
+    try:
+        return make_response(jsonify(list_profiles()), 200)
+    except Exception as e:
+        logger.error(f"Error listing profiles: {e}")
+        return make_response(jsonify({"Error": "Failed to list profiles"}), 500)
+
+
+@admin_bp.route("/api/v1/admin/profiles/<string:file_name>", methods=["GET"])
+@admin_required
+def get_profile(file_name: str) -> make_response:
+    """
+    Download a stored profile.
+
+    Collapsed stack files (.folded) can be passed straight to flamegraph.pl or opened in
+    speedscope; cProfile dumps (.prof) can be opened with snakeviz or flameprof.
+
+    Args:
+        file_name (str): The name of the profile file.
+
+    Returns:
+        make_response: The profile file, or an error message.
+    """
+    if not file_name.endswith((".folded", ".prof", ".json")):
+        return make_response(jsonify({"Not Found": "Profile not found"}), 404)
+    return send_from_directory(
+        os.path.abspath(PROFILE_DIR), file_name, as_attachment=True
+    )
+
+
+@admin_bp.route("/api/v1/admin/change-watcher", methods=["GET"])
+@admin_required
+def get_change_watcher() -> make_response:
+    """
+    Retrieve the state of the change watcher that keeps in-process caches current.
+
+    Returns:
+        make_response: JSON response containing whether the watcher is running, whether
+        it is following a change stream or polling, and its event and error counts.
+    """
+    return make_response(jsonify(watcher.get_stats()), 200)
@@ -0,0 +1,62 @@
+"""
+File: async_authorities.py
+Author: Jack McArdle
+
+This file is part of CommunityEye.
+
+Email: mcardle-j9@ulster.ac.uk
+B-No: B00733578
+"""
+
+import logging
+from quart import Blueprint, jsonify, make_response
+from config import MONGO_COLLECTION_AUTHORITIES, MONGO_COLLECTION_STATS
+from clients import ASYNC_DB
+from stats_utils import format_authority_stats
+from async_decorators import async_auth_required
+
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+
+async_authorities_bp = Blueprint("async_authorities_bp", __name__)
+authorities = ASYNC_DB[MONGO_COLLECTION_AUTHORITIES]
+stats = ASYNC_DB[MONGO_COLLECTION_STATS]
+
+
+@async_authorities_bp.route(
+    "/api/v1/authorities/<string:authority_name>/stats", methods=["GET"]
+)
+@async_auth_required
+async def get_stats(authority_name: str):
+    """
+    Retrieve the precomputed report stats for an authority.
+
+    Args:
+        authority_name (str): The name of the authority.
+
+    Returns:
+        Response: JSON response containing per-category counts, mean time-to-resolve
+        and the top-upvoted reports, or an error message.
+    """
+    try:
+        document = await stats.find_one({"_id": authority_name})
+        if document is None:
+            if not await authorities.find_one(
+                {"authority_name": authority_name}, {"_id": 1}
+            ):
+                logger.warning(f"Authority not found: {authority_name}")
+                return await make_response(
+                    jsonify({"Not Found": "Authority not found"}), 404
+                )
+            document = {}
+        logger.info(f"Successfully retrieved stats for authority: {authority_name}")
+        return await make_response(
+            jsonify(format_authority_stats(authority_name, document)), 200
+        )
+    except Exception as e:
+        logger.error(f"Error retrieving stats for authority {authority_name}: {e}")
+        return await make_response(
+            jsonify({"Error": "Failed to retrieve authority stats"}), 500
+        )
@@ -0,0 +1,59 @@
+"""
+File: authorities.py
+Author: Jack McArdle
+
+This file is part of CommunityEye.
+
+Email: mcardle-j9@ulster.ac.uk
+B-No: B00733578
+"""
+
+import logging
+from flask import Blueprint, jsonify, make_response
+from config import MONGO_COLLECTION_AUTHORITIES
+from clients import DB
+from stats_utils import format_authority_stats, get_authority_stats
+from decorators import auth_required
+
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+
+authorities_bp = Blueprint("authorities_bp", __name__)
+authorities = DB[MONGO_COLLECTION_AUTHORITIES]
+
+
+@authorities_bp.route(
+    "/api/v1/authorities/<string:authority_name>/stats", methods=["GET"]
+)
+@auth_required
+def get_stats(authority_name: str) -> make_response:
+    """
+    Retrieve the precomputed report stats for an authority.
+
+    Args:
+        authority_name (str): The name of the authority.
+
+    Returns:
+        make_response: JSON response containing per-category counts, mean time-to-resolve
+        and the top-upvoted reports, or an error message.
+    """
+    try:
+        authority_stats = get_authority_stats(authority_name)
+        if authority_stats is None:
+            if not authorities.find_one(
+                {"authority_name": authority_name}, {"_id": 1}
+            ):
+                logger.warning(f"Authority not found: {authority_name}")
+                return make_response(
+                    jsonify({"Not Found": "Authority not found"}), 404
+                )
+            authority_stats = format_authority_stats(authority_name, {})
+        logger.info(f"Successfully retrieved stats for authority: {authority_name}")
+        return make_response(jsonify(authority_stats), 200)
+    except Exception as e:
+        logger.error(f"Error retrieving stats for authority {authority_name}: {e}")
+        return make_response(
+            jsonify({"Error": "Failed to retrieve authority stats"}), 500
+        )
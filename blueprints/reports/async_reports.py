@@ -0,0 +1,703 @@
+"""
+File: async_reports.py
+Author: Jack McArdle
+
+This file is part of CommunityEye.
+
+Email: mcardle-j9@ulster.ac.uk
+B-No: B00733578
+"""
+
+import asyncio
+import json
+import logging
+import time
+from bson import ObjectId
+from pymongo import ReturnDocument
+from quart import Blueprint, jsonify, make_response, request, g
+from config import (
+    MONGO_COLLECTION_REPORTS,
+    MONGO_COLLECTION_REPORTS_ARCHIVE,
+    MONGO_COLLECTION_UPVOTES,
+    MONGO_COLLECTION_HOTSPOTS,
+    IMAGE_SIMILARITY_MAX_DISTANCE,
+)
+from clients import ASYNC_DB
+from batch_operations import (
+    delete_reports_async,
+    parse_report_ids,
+    resolve_reports_async,
+    summarise,
+    unclaimed_query,
+)
+from bulk_import import BulkImport, run_bulk_import_async
+from geocoding import find_localities
+from hotspots import find_hotspots_async, parse_hotspot_args
+from image_utils import delete_image_async, upload_image_async
+from duplicate_utils import find_duplicate_report, recent_reports
+from events import event_stream_async, parse_stream_args, publish_report_event, report_events
+from export import FILE_EXTENSIONS, MEDIA_TYPES, parse_export_args, stream_export_async
+from archive import include_archived, merge_feed_pages, merge_reports
+from image_index import archived_similar_images, find_similar_images, similar_images
+from report_utils import (
+    build_new_report,
+    is_within_boundaries,
+    determine_report_authority,
+    send_email,
+)
+from stats_utils import (
+    record_report_created,
+    record_report_deleted,
+    record_report_resolved,
+    record_report_upvoted,
+    get_user_stats,
+)
+from async_decorators import async_admin_required, async_auth_required, async_idempotent, async_rate_limited
+from user_feed import build_page, fetch_feed_page_async, parse_feed_args
+from metrics import stage_timer
+from rate_limit import async_image_processing
+
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+
+async_reports_bp = Blueprint("async_reports_bp", __name__)
+reports = ASYNC_DB[MONGO_COLLECTION_REPORTS]
+reports_archive = ASYNC_DB[MONGO_COLLECTION_REPORTS_ARCHIVE]
+upvotes = ASYNC_DB[MONGO_COLLECTION_UPVOTES]
+hotspots = ASYNC_DB[MONGO_COLLECTION_HOTSPOTS]
+
+
+async def _merge_duplicate_report(report_id: str, user_id: int) -> bool:
+    """
+    Group a duplicate submission into an existing report by upvoting it on the submitter's behalf.
+
+    Args:
+        report_id (str): The ID of the existing report.
+        user_id (int): The ID of the user submitting the duplicate.
+
+    Returns:
+        bool: True if the submission was merged, False if the existing report is no longer open.
+    """
+    already_upvoted = await upvotes.find_one({"user_id": user_id, "report_id": report_id})
+    increments = {"duplicate_count": 1}
+    if not already_upvoted:
+        increments["upvote_count"] = 1
+
+    report = await reports.find_one_and_update(
+        {"_id": ObjectId(report_id), "resolved": False},
+        {"$inc": increments},
+        projection={
+            "user_id": 1,
+            "authority": 1,
+            "category": 1,
+            "resolved": 1,
+            "upvote_count": 1,
+            "geolocation.geometry.coordinates": 1,
+        },
+        return_document=ReturnDocument.AFTER,
+    )
+    if report is None:
+        recent_reports.record_stale_hit(report_id)
+        return False
+
+    if not already_upvoted:
+        await upvotes.insert_one({
+            "user_id": user_id,
+            "report_id": report_id,
+            "timestamp": int(time.time())
+        })
+        await asyncio.to_thread(record_report_upvoted, report)
+        publish_report_event("upvoted", report)
+    return True
+
+
+@async_reports_bp.route("/api/v1/reports", methods=["GET"])
+@async_auth_required
+async def get_reports():
+    """
+    Retrieve all reports, including archived reports if include_archived=true.
+
+    Returns:
+        Response: JSON response containing all reports.
+    """
+    try:
+        data = [report async for report in reports.find()]
+        if include_archived(request.args):
+            data = merge_reports(data, [report async for report in reports_archive.find()])
+        for report in data:
+            report["_id"] = str(report["_id"])
+        logger.info("Successfully retrieved all reports.")
+        return await make_response(jsonify(data), 200)
+    except Exception as e:
+        logger.error(f"Error retrieving reports: {e}")
+        return await make_response(
+            jsonify({"Error": "Failed to retrieve reports"}), 500
+        )
+
+
+@async_reports_bp.route("/api/v1/reports", methods=["POST"])
+@async_auth_required
+@async_idempotent("create_report")
+@async_rate_limited("create_report")
+async def create_report():
+    """
+    Create a new report.
+
+    Returns:
+        Response: JSON response with the URL of the created report or an error message.
+    """
+    form = await request.form
+    files = await request.files
+
+    required_fields = ["description", "category"]
+    missing_fields = [field for field in required_fields if field not in form]
+    if missing_fields:
+        logger.warning(f"Missing fields in report data: {missing_fields}")
+        return await make_response(
+            jsonify(
+                {
+                    "Unprocessable Entity": "Missing fields in JSON data.",
+                    "missing_fields": missing_fields,
+                }
+            ),
+            422,
+        )
+
+    if "image" not in files:
+        logger.warning("No image provided in the report.")
+        return await make_response(
+            jsonify({"Unprocessable Entity": "No image was provided"}), 422
+        )
+
+    async with async_image_processing.admit() as admitted:
+        if not admitted:
+            response = await make_response(
+                jsonify({"Service Unavailable": "Too many reports are being processed, try again shortly."}),
+                503,
+            )
+            response.headers["Retry-After"] = "1"
+            return response
+        image_data = await upload_image_async(files["image"])
+
+    if image_data.get("geolocation") is None:
+        await delete_image_async(image_data["image_name"])
+        logger.warning("Geolocation could not be determined.")
+        return await make_response(
+            jsonify({"Bad Request": "Geolocation could not be determined"}),
+            400,
+        )
+
+    if not await asyncio.to_thread(is_within_boundaries, image_data["geolocation"]):
+        await delete_image_async(image_data["image_name"])
+        logger.warning("Geolocation is outside Northern Ireland.")
+        return await make_response(
+            jsonify(
+                {"Bad Request": "Geolocation is outside Northern Ireland"}
+            ),
+            400,
+        )
+
+    with stage_timer("create_report.duplicate_check"):
+        duplicate_id = await asyncio.to_thread(
+            find_duplicate_report, form["category"], image_data["geolocation"]
+        )
+    if duplicate_id and await _merge_duplicate_report(duplicate_id, g.user_id):
+        await delete_image_async(image_data["image_name"])
+        url = f"http://localhost:5000/api/v1/reports/{duplicate_id}"
+        logger.info(f"Submission merged into existing report with ID: {duplicate_id}")
+        return await make_response(jsonify({"url": url, "duplicate_of": duplicate_id}), 200)
+
+    authority = await asyncio.to_thread(
+        determine_report_authority, image_data["geolocation"], form["category"]
+    )
+    with stage_timer("create_report.similar_images"):
+        similar_reports = await asyncio.to_thread(
+            find_similar_images, image_data.get("dhash")
+        )
+    new_report = build_new_report(form, image_data, authority, similar_reports)
+    (locality,) = await asyncio.to_thread(find_localities, [image_data["geolocation"]])
+    if locality is not None:
+        new_report["locality"] = locality
+
+    with stage_timer("create_report.insert"):
+        new_report_id = (await reports.insert_one(new_report)).inserted_id
+    url = f"http://localhost:5000/api/v1/reports/{str(new_report_id)}"
+    await asyncio.to_thread(record_report_created, new_report)
+    publish_report_event("created", {**new_report, "_id": new_report_id})
+    recent_reports.add(new_report)
+    if image_data.get("dhash"):
+        similar_images.add(image_data["dhash"], str(new_report_id))
+
+    with stage_timer("create_report.email"):
+        await asyncio.to_thread(
+            send_email,
+            authority_name=authority,
+            report_id=str(new_report_id),
+            description=form["description"],
+            image_url=url,
+        )
+
+    logger.info(f"Report created successfully with ID: {new_report_id}")
+    return await make_response(jsonify({"url": url}), 201)
+
+
+@async_reports_bp.route("/api/v1/reports/user/<int:user_id>", methods=["GET"])
+@async_auth_required
+async def get_reports_by_user(user_id: int):
+    """
+    Retrieve reports for a specific user, including archived reports if include_archived=true.
+
+    Args:
+        user_id (int): The ID of the user.
+
+    Returns:
+        Response: JSON response containing the user's reports.
+    """
+    try:
+        data = [report async for report in reports.find({"user_id": user_id})]
+        if include_archived(request.args):
+            data = merge_reports(data, [report async for report in reports_archive.find({"user_id": user_id})])
+        for report in data:
+            report["_id"] = str(report["_id"])
+        logger.info(f"Successfully retrieved reports for user ID: {user_id}")
+        return await make_response(jsonify(data), 200)
+    except Exception as e:
+        logger.error(f"Error retrieving reports for user ID {user_id}: {e}")
+        return await make_response(
+            jsonify({"Error": "Failed to retrieve reports for the user"}), 500
+        )
+
+
+@async_reports_bp.route("/api/v1/reports/export", methods=["GET"])
+@async_auth_required
+async def export_reports():
+    """
+    Export reports with typed columns for analysis, as a Parquet file or an Arrow IPC stream.
+
+    Returns:
+        Response: The streamed file, with the until used in the X-Export-Watermark header.
+    """
+    error, options = parse_export_args(request.args)
+    if error:
+        return await make_response(jsonify({"Bad Request": error}), 400)
+    collections = [reports, reports_archive] if include_archived(request.args) else [reports]
+    chunks = stream_export_async(collections, options["format"], options["since"], options["until"])
+    try:
+        # read the first row group before responding, so a failed query is still a 500
+        first = await chunks.__anext__()
+    except Exception as e:
+        logger.error(f"Error exporting reports: {e}")
+        return await make_response(jsonify({"Error": "Failed to export reports"}), 500)
+
+    async def stream():
+        yield first
+        try:
+            async for chunk in chunks:
+                yield chunk
+        except Exception as e:
+            # the truncated file fails to parse, so the client knows to retry
+            logger.error(f"Error exporting reports: {e}")
+
+    extension = FILE_EXTENSIONS[options["format"]]
+    return stream(), 200, {
+        "Content-Type": MEDIA_TYPES[options["format"]],
+        "Content-Disposition": f"attachment; filename=reports.{extension}",
+        "X-Export-Watermark": str(options["until"]),
+    }
+
+
+@async_reports_bp.route("/api/v1/reports/stream", methods=["GET"])
+@async_auth_required
+async def stream_reports():
+    """
+    Push report changes to the client as Server-Sent Events, waiting on the event loop so
+    idle streams hold no thread.
+
+    Returns:
+        Response: The event stream.
+    """
+    error, filters = parse_stream_args(request.args)
+    if error:
+        return await make_response(jsonify({"Bad Request": error}), 400)
+    subscription, opening = report_events.open(
+        filters, request.headers.get("Last-Event-ID"), asyncio.get_running_loop()
+    )
+    if subscription is None:
+        logger.warning("Refused a report stream, too many are open")
+        return await make_response(jsonify({"Service Unavailable": "Too many open streams"}), 503)
+
+    response = await make_response(event_stream_async(subscription, opening, report_events), 200, {
+        "Content-Type": "text/event-stream",
+        "Cache-Control": "no-cache",
+        # stop nginx buffering the events
+        "X-Accel-Buffering": "no",
+    })
+    # Quart would otherwise end the stream after RESPONSE_TIMEOUT
+    response.timeout = None
+    return response
+
+
+@async_reports_bp.route("/api/v1/reports/hotspots", methods=["GET"])
+@async_auth_required
+async def get_hotspots():
+    """
+    Retrieve the hotspots of a time window, largest rise over the baseline first.
+
+    Query parameters: window_start (defaults to the latest window with hotspots),
+    authority, category and limit.
+
+    Returns:
+        Response: JSON response containing the window and its hotspots.
+    """
+    error, filters = parse_hotspot_args(request.args)
+    if error:
+        return await make_response(jsonify({"Bad Request": error}), 400)
+    try:
+        data = await find_hotspots_async(hotspots, filters)
+        logger.info(f"Successfully retrieved {len(data['hotspots'])} hotspots")
+        return await make_response(jsonify(data), 200)
+    except Exception as e:
+        logger.error(f"Error retrieving hotspots: {e}")
+        return await make_response(jsonify({"Error": "Failed to retrieve hotspots"}), 500)
+
+
+@async_reports_bp.route("/api/v1/reports/user/<int:user_id>/feed", methods=["GET"])
+@async_auth_required
+async def get_user_feed(user_id: int):
+    """
+    Retrieve a page of a user's reports, newest first, with the user's report counts.
+
+    Archived reports are included if include_archived=true; the counts always include them.
+
+    Args:
+        user_id (int): The ID of the user.
+
+    Returns:
+        Response: JSON response containing the counts, report summaries and next page cursor.
+    """
+    error, limit, cursor = parse_feed_args(request.args)
+    if error:
+        return await make_response(jsonify({"Bad Request": error}), 400)
+    try:
+        with stage_timer("feed.query"):
+            documents = await fetch_feed_page_async(reports, user_id, limit, cursor)
+            if include_archived(request.args):
+                archived = await fetch_feed_page_async(reports_archive, user_id, limit, cursor)
+                documents = merge_feed_pages(documents, archived, limit)
+        counts = await asyncio.to_thread(get_user_stats, user_id)
+        logger.info(f"Successfully retrieved the feed for user ID: {user_id}")
+        return await make_response(jsonify(build_page(documents, limit, counts)), 200)
+    except Exception as e:
+        logger.error(f"Error retrieving the feed for user ID {user_id}: {e}")
+        return await make_response(
+            jsonify({"Error": "Failed to retrieve the user's feed"}), 500
+        )
+
+
+@async_reports_bp.route("/api/v1/reports/<string:report_id>", methods=["DELETE"])
+@async_auth_required
+async def delete_report(report_id: str):
+    """
+    Delete a report by its ID.
+
+    Args:
+        report_id (str): The ID of the report to delete.
+
+    Returns:
+        Response: JSON response indicating success or failure.
+    """
+    try:
+        report_object_id = ObjectId(report_id)
+        report = await reports.find_one({"_id": report_object_id})
+        if not report:
+            logger.warning(f"Report not found for ID: {report_id}")
+            return await make_response(
+                jsonify({"Not Found": "Report not found"}), 404
+            )
+
+        # reports imported with an external image URL have no blob of their own
+        image_name = report["image"].get("image_name")
+        if image_name is None or await delete_image_async(image_name):
+            # a report claimed by a batch delete is removed and counted by that batch
+            result = await reports.delete_one({"_id": report_object_id, **unclaimed_query()})
+            if result.deleted_count == 1:
+                await asyncio.to_thread(record_report_deleted, report)
+                publish_report_event("deleted", report)
+            recent_reports.discard(report_id)
+            similar_images.discard(report_id)
+            logger.info(f"Report deleted successfully with ID: {report_id}")
+            return await make_response(
+                jsonify({"Success": "Report deleted successfully"}), 204
+            )
+        else:
+            logger.error(
+                f"Failed to delete image from Azure Blob Storage for report ID: {report_id}"
+            )
+            return await make_response(
+                jsonify(
+                    {"Error": "Failed to delete image from Azure Blob Storage"}
+                ),
+                500,
+            )
+    except Exception as e:
+        logger.error(f"Error deleting report with ID {report_id}: {e}")
+        return await make_response(jsonify({"Error": "Internal Server Error"}), 500)
+
+
+@async_reports_bp.route(
+    "/api/v1/reports/<string:report_id>/resolve", methods=["POST"])
+async def resolve_report(report_id: str):
+    """
+    Mark a report as resolved by its ID.
+
+    Args:
+        report_id (str): The ID of the report to resolve.
+
+    Returns:
+        Response: JSON response indicating success or failure.
+    """
+    try:
+        report_object_id = ObjectId(report_id)
+        report = await reports.find_one({"_id": report_object_id})
+        if not report:
+            logger.warning(f"Report not found for ID: {report_id}")
+            return await make_response(
+                jsonify({"Not Found": "Report not found"}), 404
+            )
+
+        resolved_at = int(time.time())
+        result = await reports.update_one(
+            {"_id": report_object_id, "resolved": False},
+            {"$set": {"resolved": True, "resolved_at": resolved_at}},
+        )
+        if result.modified_count == 1:
+            await asyncio.to_thread(record_report_resolved, report, resolved_at)
+            publish_report_event("resolved", report, resolved=True, resolved_at=resolved_at)
+        recent_reports.discard(report_id)
+        logger.info(f"Report marked as resolved with ID: {report_id}")
+        return await make_response(
+            jsonify({"Success": "Report marked as resolved"}), 200
+        )
+    except Exception as e:
+        logger.error(f"Error resolving report with ID {report_id}: {e}")
+        return await make_response(jsonify({"Error": "Internal server error"}), 500)
+
+
+@async_reports_bp.route("/api/v1/reports/batch/resolve", methods=["POST"])
+@async_auth_required
+async def resolve_reports_batch():
+    """
+    Mark many reports as resolved with a single update.
+
+    The body is {"report_ids": [...]}. Each report's resolved_at is recorded for stats.
+
+    Returns:
+        Response: JSON response with a result per ID (resolved, already_resolved,
+        not_found or invalid_id) and a count of each.
+    """
+    error, report_ids, object_ids, results = parse_report_ids(await request.get_json(silent=True))
+    if error:
+        return await make_response(jsonify({"Bad Request": error}), 400)
+
+    try:
+        await resolve_reports_async(reports, object_ids, results)
+        logger.info(f"Batch resolve of {len(report_ids)} reports finished")
+        return await make_response(jsonify(summarise(report_ids, results)), 200)
+    except Exception as e:
+        logger.error(f"Error resolving reports in batch: {e}")
+        return await make_response(jsonify({"Error": "Internal server error"}), 500)
+
+
+@async_reports_bp.route("/api/v1/reports/batch/delete", methods=["POST"])
+@async_auth_required
+async def delete_reports_batch():
+    """
+    Delete many reports, removing their images concurrently and the reports with a single delete.
+
+    The body is {"report_ids": [...]}. A report whose image cannot be deleted is kept.
+
+    Returns:
+        Response: JSON response with a result per ID (deleted, not_found, invalid_id
+        or error) and a count of each.
+    """
+    error, report_ids, object_ids, results = parse_report_ids(await request.get_json(silent=True))
+    if error:
+        return await make_response(jsonify({"Bad Request": error}), 400)
+
+    try:
+        await delete_reports_async(reports, object_ids, results)
+        logger.info(f"Batch delete of {len(report_ids)} reports finished")
+        return await make_response(jsonify(summarise(report_ids, results)), 200)
+    except Exception as e:
+        logger.error(f"Error deleting reports in batch: {e}")
+        return await make_response(jsonify({"Error": "Internal Server Error"}), 500)
+
+
+@async_reports_bp.route("/api/v1/reports/<report_id>/upvote", methods=["POST"])
+@async_auth_required
+@async_rate_limited("upvote_report")
+async def upvote_report(report_id):
+    """
+    Upvote a report.
+
+    Args:
+        report_id (str): The ID of the report to upvote.
+
+    Returns:
+        Response: JSON response indicating success or failure.
+    """
+    user_id = g.user_id
+
+    if await upvotes.find_one({"user_id": user_id, "report_id": report_id}):
+        return await make_response(
+            jsonify({"Conflict": "User has already upvoted this report"}),
+            409,
+        )
+
+    await upvotes.insert_one({
+        "user_id": user_id,
+        "report_id": report_id,
+        "timestamp": int(time.time())
+    })
+
+    report = await reports.find_one_and_update(
+        {"_id": ObjectId(report_id)},
+        {"$inc": {"upvote_count": 1}},
+        projection={
+            "user_id": 1,
+            "authority": 1,
+            "category": 1,
+            "resolved": 1,
+            "upvote_count": 1,
+            "geolocation.geometry.coordinates": 1,
+        },
+        return_document=ReturnDocument.AFTER,
+    )
+
+    if report is not None:
+        await asyncio.to_thread(record_report_upvoted, report)
+        publish_report_event("upvoted", report)
+        logger.info(f"Successfully incremented upvote count for report ID: {report_id}")
+        return await make_response(
+            jsonify({"Success": "Report upvoted successfully"}),
+            200,
+        )
+    else:
+        logger.error(f"Failed to increment upvote count for report ID: {report_id}")
+        return await make_response(
+            jsonify({"Error": "Failed to update upvote count"}),
+            500,
+        )
+
+
+@async_reports_bp.route(
+    "/api/v1/reports/<string:report_id>/similar-images", methods=["GET"])
+@async_auth_required
+async def get_similar_images(report_id: str):
+    """
+    Retrieve reports whose images are visually near-identical to a report's image.
+
+    Archived reports are compared against, and matched, only if include_archived=true.
+
+    Args:
+        report_id (str): The ID of the report to compare against.
+
+    Returns:
+        Response: JSON response containing matching report IDs and their Hamming distances.
+    """
+    try:
+        archived = include_archived(request.args)
+        report = await reports.find_one({"_id": ObjectId(report_id)}, {"image.dhash": 1})
+        if not report and archived:
+            report = await reports_archive.find_one({"_id": ObjectId(report_id)}, {"image.dhash": 1})
+        if not report:
+            logger.warning(f"Report not found for ID: {report_id}")
+            return await make_response(
+                jsonify({"Not Found": "Report not found"}), 404
+            )
+
+        image_hash = report.get("image", {}).get("dhash")
+        if not image_hash:
+            return await make_response(
+                jsonify({"Unprocessable Entity": "Report image has no perceptual hash"}),
+                422,
+            )
+
+        max_distance = request.args.get(
+            "max_distance", IMAGE_SIMILARITY_MAX_DISTANCE, type=int
+        )
+        matches = await asyncio.to_thread(
+            similar_images.find_similar, image_hash, max_distance
+        )
+        if archived:
+            archived_matches = await asyncio.to_thread(
+                archived_similar_images.find_similar, image_hash, max_distance
+            )
+            matches = sorted(matches + archived_matches, key=lambda match: match["distance"])
+        return await make_response(
+            jsonify([match for match in matches if match["report_id"] != report_id]),
+            200,
+        )
+    except Exception as e:
+        logger.error(f"Error finding similar images for report ID {report_id}: {e}")
+        return await make_response(jsonify({"Error": "Internal server error"}), 500)
+
+
+@async_reports_bp.route("/api/v1/reports/duplicates/stats", methods=["GET"])
+@async_auth_required
+async def get_duplicate_stats():
+    """
+    Retrieve the thresholds and hit rate of near-duplicate detection.
+
+    Returns:
+        Response: JSON response containing the duplicate detection stats.
+    """
+    return await make_response(jsonify(recent_reports.get_stats()), 200)
+
+
+@async_reports_bp.route("/api/v1/reports/bulk", methods=["POST"])
+@async_auth_required
+@async_admin_required
+async def bulk_import_reports():
+    """
+    Import many reports from an NDJSON body, one report per line.
+
+    Returns:
+        Response: JSON response with per-line results and a summary, or an NDJSON stream
+        when ?stream=true.
+    """
+    if request.mimetype not in ("application/x-ndjson", "application/jsonl"):
+        return await make_response(
+            jsonify({"Unsupported Media Type": "Body must be application/x-ndjson"}),
+            415,
+        )
+
+    importer = BulkImport(g.user_id)
+    events = run_bulk_import_async(request.body, importer, reports)
+
+    if request.args.get("stream", "false").lower() == "true":
+        async def stream():
+            try:
+                async for event in events:
+                    yield (json.dumps(event) + "\n").encode()
+            except Exception as e:
+                logger.error(f"Error during bulk import: {e}")
+                yield (json.dumps({"Error": "Bulk import failed", **importer.progress()}) + "\n").encode()
+
+        return stream(), 200, {"Content-Type": "application/x-ndjson"}
+
+    try:
+        results, summary = [], {}
+        async for event in events:
+            if "line" in event:
+                results.append(event)
+            elif "summary" in event:
+                summary = event["summary"]
+        return await make_response(jsonify({"results": results, "summary": summary}), 200)
+    except Exception as e:
+        logger.error(f"Error during bulk import: {e}")
+        return await make_response(
+            jsonify({"Error": "Bulk import failed", **importer.progress()}), 500
+        )
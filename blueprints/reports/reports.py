@@ -8,24 +8,49 @@ Email: mcardle-j9@ulster.ac.uk
 B-No: B00733578
 """
 
+import json
 import logging
 from bson import ObjectId
-from flask import Blueprint, jsonify, make_response, request, g
+from pymongo import ReturnDocument
+from flask import Blueprint, Response, jsonify, make_response, request, g, stream_with_context
 from config import (
     MONGO_COLLECTION_REPORTS,
+    MONGO_COLLECTION_REPORTS_ARCHIVE,
     MONGO_COLLECTION_AUTHORITIES,
     MONGO_COLLECTION_UPVOTES,
-    DB
+    MONGO_COLLECTION_HOTSPOTS,
+    IMAGE_SIMILARITY_MAX_DISTANCE,
 )
+from clients import DB
+from batch_operations import delete_reports, parse_report_ids, resolve_reports, summarise, unclaimed_query
+from bulk_import import BulkImport, run_bulk_import
+from geocoding import find_localities
+from hotspots import find_hotspots, parse_hotspot_args
 from image_utils import delete_image, upload_image
+from duplicate_utils import find_duplicate_report, recent_reports
+from events import event_stream, parse_stream_args, publish_report_event, report_events
+from export import FILE_EXTENSIONS, MEDIA_TYPES, parse_export_args, stream_export
+from archive import include_archived, merge_feed_pages, merge_reports
+from image_index import archived_similar_images, find_similar_images, similar_images
 import time
 from report_utils import (
+    build_new_report,
     is_within_boundaries,
     determine_report_authority,
     send_email,
 )
+from stats_utils import (
+    record_report_created,
+    record_report_deleted,
+    record_report_resolved,
+    record_report_upvoted,
+    get_user_stats,
+)
 from validations import validate_fields
-from decorators import auth_required
+from decorators import admin_required, auth_required, idempotent, rate_limited
+from metrics import stage_timer
+from rate_limit import image_processing
+from user_feed import build_page, fetch_feed_page, parse_feed_args
 
 
 logging.basicConfig(level=logging.INFO)
@@ -34,24 +59,71 @@ logger = logging.getLogger(__name__)
 
 reports_bp = Blueprint("reports_bp", __name__)
 reports = DB[MONGO_COLLECTION_REPORTS]
+reports_archive = DB[MONGO_COLLECTION_REPORTS_ARCHIVE]
 authorities = DB[MONGO_COLLECTION_AUTHORITIES]
 upvotes = DB[MONGO_COLLECTION_UPVOTES]
+hotspots = DB[MONGO_COLLECTION_HOTSPOTS]
+
+
+def _merge_duplicate_report(report_id: str, user_id: int) -> bool:
+    """
+    Group a duplicate submission into an existing report by upvoting it on the submitter's behalf.
+
+    Args:
+        report_id (str): The ID of the existing report.
+        user_id (int): The ID of the user submitting the duplicate.
+
+    Returns:
+        bool: True if the submission was merged, False if the existing report is no longer open.
+    """
+    already_upvoted = upvotes.find_one({"user_id": user_id, "report_id": report_id})
+    increments = {"duplicate_count": 1}
+    if not already_upvoted:
+        increments["upvote_count"] = 1
+
+    report = reports.find_one_and_update(
+        {"_id": ObjectId(report_id), "resolved": False},
+        {"$inc": increments},
+        projection={
+            "user_id": 1,
+            "authority": 1,
+            "category": 1,
+            "resolved": 1,
+            "upvote_count": 1,
+            "geolocation.geometry.coordinates": 1,
+        },
+        return_document=ReturnDocument.AFTER,
+    )
+    if report is None:
+        recent_reports.record_stale_hit(report_id)
+        return False
+
+    if not already_upvoted:
+        upvotes.insert_one({
+            "user_id": user_id,
+            "report_id": report_id,
+            "timestamp": int(time.time())
+        })
+        record_report_upvoted(report)
+        publish_report_event("upvoted", report)
+    return True
 
 
 @reports_bp.route("/api/v1/reports", methods=["GET"])
 @auth_required
 def get_reports() -> make_response:
     """
-    Retrieve all reports.
+    Retrieve all reports, including archived reports if include_archived=true.
 
     Returns:
         make_response: JSON response containing all reports.
     """
     try:
-        data = []
-        for report in reports.find():
+        data = list(reports.find())
+        if include_archived(request.args):
+            data = merge_reports(data, reports_archive.find())
+        for report in data:
             report["_id"] = str(report["_id"])
-            data.append(report)
         logger.info("Successfully retrieved all reports.")
         return make_response(jsonify(data), 200)
     except Exception as e:
@@ -63,6 +135,8 @@ def get_reports() -> make_response:
 
 @reports_bp.route("/api/v1/reports", methods=["POST"])
 @auth_required
+@idempotent("create_report")
+@rate_limited("create_report")
 def create_report() -> make_response:
     """
     Create a new report.
@@ -91,7 +165,15 @@ def create_report() -> make_response:
         )
 
     image = request.files["image"]
-    image_data = upload_image(image)
+    with image_processing.admit() as admitted:
+        if not admitted:
+            response = make_response(
+                jsonify({"Service Unavailable": "Too many reports are being processed, try again shortly."}),
+                503,
+            )
+            response.headers["Retry-After"] = "1"
+            return response
+        image_data = upload_image(image)
 
     if image_data.get("geolocation") is None:
         delete_image(image_data["image_name"])
@@ -111,39 +193,44 @@ def create_report() -> make_response:
             400,
         )
 
+    with stage_timer("create_report.duplicate_check"):
+        duplicate_id = find_duplicate_report(
+            request.form["category"], image_data["geolocation"]
+        )
+    if duplicate_id and _merge_duplicate_report(duplicate_id, g.user_id):
+        delete_image(image_data["image_name"])
+        url = f"http://localhost:5000/api/v1/reports/{duplicate_id}"
+        logger.info(f"Submission merged into existing report with ID: {duplicate_id}")
+        return make_response(jsonify({"url": url, "duplicate_of": duplicate_id}), 200)
+
     authority = determine_report_authority(
         image_data["geolocation"], request.form["category"]
     )
-    new_report = {
-        "user_id": int(request.form["userID"]),
-        "description": request.form["description"],
-        "category": request.form["category"],
-        "geolocation": {
-            "type": "Feature",
-            "geometry": {
-                "type": "Point",
-                "coordinates": [
-                    image_data["geolocation"]["Lat"],
-                    image_data["geolocation"]["Lon"],
-                ],
-            },
-        },
-        "authority": authority,
-        "image": image_data,
-        "resolved": False,
-        "upvote_count": 0,
-        "created_at": int(time.time()),
-    }
-
-    new_report_id = reports.insert_one(new_report).inserted_id
-    url = f"http://localhost:5000/api/v1/reports/{str(new_report_id)}"
-
-    send_email(
-        authority_name=authority,
-        report_id=str(new_report_id),
-        description=request.form["description"],
-        image_url=url,
+    with stage_timer("create_report.similar_images"):
+        similar_reports = find_similar_images(image_data.get("dhash"))
+    new_report = build_new_report(
+        request.form, image_data, authority, similar_reports
     )
+    (locality,) = find_localities([image_data["geolocation"]])
+    if locality is not None:
+        new_report["locality"] = locality
+
+    with stage_timer("create_report.insert"):
+        new_report_id = reports.insert_one(new_report).inserted_id
+    url = f"http://localhost:5000/api/v1/reports/{str(new_report_id)}"
+    record_report_created(new_report)
+    publish_report_event("created", {**new_report, "_id": new_report_id})
+    recent_reports.add(new_report)
+    if image_data.get("dhash"):
+        similar_images.add(image_data["dhash"], str(new_report_id))
+
+    with stage_timer("create_report.email"):
+        send_email(
+            authority_name=authority,
+            report_id=str(new_report_id),
+            description=request.form["description"],
+            image_url=url,
+        )
 
     logger.info(f"Report created successfully with ID: {new_report_id}")
     return make_response(jsonify({"url": url}), 201)
@@ -153,7 +240,7 @@ def create_report() -> make_response:
 @auth_required
 def get_reports_by_user(user_id: int) -> make_response:
     """
-    Retrieve reports for a specific user.
+    Retrieve reports for a specific user, including archived reports if include_archived=true.
 
     Args:
         user_id (int): The ID of the user.
@@ -162,10 +249,11 @@ def get_reports_by_user(user_id: int) -> make_response:
         make_response: JSON response containing the user's reports.
     """
     try:
-        data = []
-        for report in reports.find({"user_id": user_id}):
+        data = list(reports.find({"user_id": user_id}))
+        if include_archived(request.args):
+            data = merge_reports(data, reports_archive.find({"user_id": user_id}))
+        for report in data:
             report["_id"] = str(report["_id"])
-            data.append(report)
         logger.info(f"Successfully retrieved reports for user ID: {user_id}")
         return make_response(jsonify(data), 200)
     except Exception as e:
@@ -175,6 +263,134 @@ def get_reports_by_user(user_id: int) -> make_response:
         )
 
 
+@reports_bp.route("/api/v1/reports/export", methods=["GET"])
+@auth_required
+def export_reports() -> make_response:
+    """
+    Export reports with typed columns for analysis, as a Parquet file or an Arrow IPC stream.
+
+    Query parameters: format (parquet or arrow), since and until (the created_at range
+    (since, until] to export) and include_archived. The output is streamed a row group at
+    a time. The X-Export-Watermark header holds the until used, to pass as since next time.
+
+    Returns:
+        make_response: The streamed file.
+    """
+    error, options = parse_export_args(request.args)
+    if error:
+        return make_response(jsonify({"Bad Request": error}), 400)
+    collections = [reports, reports_archive] if include_archived(request.args) else [reports]
+    chunks = stream_export(collections, options["format"], options["since"], options["until"])
+    try:
+        # read the first row group before responding, so a failed query is still a 500
+        first = next(chunks)
+    except Exception as e:
+        logger.error(f"Error exporting reports: {e}")
+        return make_response(jsonify({"Error": "Failed to export reports"}), 500)
+
+    @stream_with_context
+    def stream():
+        yield first
+        try:
+            yield from chunks
+        except Exception as e:
+            # the truncated file fails to parse, so the client knows to retry
+            logger.error(f"Error exporting reports: {e}")
+
+    extension = FILE_EXTENSIONS[options["format"]]
+    return Response(stream(), mimetype=MEDIA_TYPES[options["format"]], headers={
+        "Content-Disposition": f"attachment; filename=reports.{extension}",
+        "X-Export-Watermark": str(options["until"]),
+    })
+
+
+@reports_bp.route("/api/v1/reports/stream", methods=["GET"])
+@auth_required
+def stream_reports() -> make_response:
+    """
+    Push report changes to the client as Server-Sent Events.
+
+    Query parameters: authority, and bbox as min_lon,min_lat,max_lon,max_lat. Each event is
+    created, resolved, upvoted or deleted, with a summary of the report as its data. A
+    client reconnecting with Last-Event-ID is sent the events it missed, or a reset event
+    if they are no longer kept. Each open stream holds a worker thread; the ASGI app holds none.
+
+    Returns:
+        make_response: The event stream.
+    """
+    error, filters = parse_stream_args(request.args)
+    if error:
+        return make_response(jsonify({"Bad Request": error}), 400)
+    subscription, opening = report_events.open(filters, request.headers.get("Last-Event-ID"))
+    if subscription is None:
+        logger.warning("Refused a report stream, too many are open")
+        return make_response(jsonify({"Service Unavailable": "Too many open streams"}), 503)
+
+    events = stream_with_context(event_stream(subscription, opening, report_events))
+    return Response(events, mimetype="text/event-stream", headers={
+        "Cache-Control": "no-cache",
+        # stop nginx buffering the events
+        "X-Accel-Buffering": "no",
+    })
+
+
+@reports_bp.route("/api/v1/reports/hotspots", methods=["GET"])
+@auth_required
+def get_hotspots() -> make_response:
+    """
+    Retrieve the hotspots of a time window, largest rise over the baseline first.
+
+    Query parameters: window_start (defaults to the latest window with hotspots),
+    authority, category and limit.
+
+    Returns:
+        make_response: JSON response containing the window and its hotspots.
+    """
+    error, filters = parse_hotspot_args(request.args)
+    if error:
+        return make_response(jsonify({"Bad Request": error}), 400)
+    try:
+        data = find_hotspots(hotspots, filters)
+        logger.info(f"Successfully retrieved {len(data['hotspots'])} hotspots")
+        return make_response(jsonify(data), 200)
+    except Exception as e:
+        logger.error(f"Error retrieving hotspots: {e}")
+        return make_response(jsonify({"Error": "Failed to retrieve hotspots"}), 500)
+
+
+@reports_bp.route("/api/v1/reports/user/<int:user_id>/feed", methods=["GET"])
+@auth_required
+def get_user_feed(user_id: int) -> make_response:
+    """
+    Retrieve a page of a user's reports, newest first, with the user's report counts.
+
+    Archived reports are included if include_archived=true; the counts always include them.
+
+    Args:
+        user_id (int): The ID of the user.
+
+    Returns:
+        make_response: JSON response containing the counts, report summaries and next page cursor.
+    """
+    error, limit, cursor = parse_feed_args(request.args)
+    if error:
+        return make_response(jsonify({"Bad Request": error}), 400)
+    try:
+        with stage_timer("feed.query"):
+            documents = fetch_feed_page(reports, user_id, limit, cursor)
+            if include_archived(request.args):
+                archived = fetch_feed_page(reports_archive, user_id, limit, cursor)
+                documents = merge_feed_pages(documents, archived, limit)
+        counts = get_user_stats(user_id)
+        logger.info(f"Successfully retrieved the feed for user ID: {user_id}")
+        return make_response(jsonify(build_page(documents, limit, counts)), 200)
+    except Exception as e:
+        logger.error(f"Error retrieving the feed for user ID {user_id}: {e}")
+        return make_response(
+            jsonify({"Error": "Failed to retrieve the user's feed"}), 500
+        )
+
+
 @reports_bp.route("/api/v1/reports/<string:report_id>", methods=["DELETE"])
 @auth_required
 def delete_report(report_id: str) -> make_response:
@@ -196,9 +412,16 @@ def delete_report(report_id: str) -> make_response:
                 jsonify({"Not Found": "Report not found"}), 404
             )
 
-        image_name = report["image"]["image_name"]
-        if delete_image(image_name):
-            reports.delete_one({"_id": report_object_id})
+        # reports imported with an external image URL have no blob of their own
+        image_name = report["image"].get("image_name")
+        if image_name is None or delete_image(image_name):
+            # a report claimed by a batch delete is removed and counted by that batch
+            result = reports.delete_one({"_id": report_object_id, **unclaimed_query()})
+            if result.deleted_count == 1:
+                record_report_deleted(report)
+                publish_report_event("deleted", report)
+            recent_reports.discard(report_id)
+            similar_images.discard(report_id)
             logger.info(f"Report deleted successfully with ID: {report_id}")
             return make_response(
                 jsonify({"Success": "Report deleted successfully"}), 204
@@ -239,9 +462,15 @@ def resolve_report(report_id: str) -> make_response:
                 jsonify({"Not Found": "Report not found"}), 404
             )
 
-        reports.update_one(
-            {"_id": report_object_id}, {"$set": {"resolved": True}}
+        resolved_at = int(time.time())
+        result = reports.update_one(
+            {"_id": report_object_id, "resolved": False},
+            {"$set": {"resolved": True, "resolved_at": resolved_at}},
         )
+        if result.modified_count == 1:
+            record_report_resolved(report, resolved_at)
+            publish_report_event("resolved", report, resolved=True, resolved_at=resolved_at)
+        recent_reports.discard(report_id)
         logger.info(f"Report marked as resolved with ID: {report_id}")
         return make_response(
             jsonify({"Success": "Report marked as resolved"}), 200
@@ -251,8 +480,59 @@ def resolve_report(report_id: str) -> make_response:
         return make_response(jsonify({"Error": "Internal server error"}), 500)
 
 
+@reports_bp.route("/api/v1/reports/batch/resolve", methods=["POST"])
+@auth_required
+def resolve_reports_batch() -> make_response:
+    """
+    Mark many reports as resolved with a single update.
+
+    The body is {"report_ids": [...]}. Each report's resolved_at is recorded for stats.
+
+    Returns:
+        make_response: JSON response with a result per ID (resolved, already_resolved,
+        not_found or invalid_id) and a count of each.
+    """
+    error, report_ids, object_ids, results = parse_report_ids(request.get_json(silent=True))
+    if error:
+        return make_response(jsonify({"Bad Request": error}), 400)
+
+    try:
+        resolve_reports(reports, object_ids, results)
+        logger.info(f"Batch resolve of {len(report_ids)} reports finished")
+        return make_response(jsonify(summarise(report_ids, results)), 200)
+    except Exception as e:
+        logger.error(f"Error resolving reports in batch: {e}")
+        return make_response(jsonify({"Error": "Internal server error"}), 500)
+
+
+@reports_bp.route("/api/v1/reports/batch/delete", methods=["POST"])
+@auth_required
+def delete_reports_batch() -> make_response:
+    """
+    Delete many reports, removing their images concurrently and the reports with a single delete.
+
+    The body is {"report_ids": [...]}. A report whose image cannot be deleted is kept.
+
+    Returns:
+        make_response: JSON response with a result per ID (deleted, not_found,
+        invalid_id or error) and a count of each.
+    """
+    error, report_ids, object_ids, results = parse_report_ids(request.get_json(silent=True))
+    if error:
+        return make_response(jsonify({"Bad Request": error}), 400)
+
+    try:
+        delete_reports(reports, object_ids, results)
+        logger.info(f"Batch delete of {len(report_ids)} reports finished")
+        return make_response(jsonify(summarise(report_ids, results)), 200)
+    except Exception as e:
+        logger.error(f"Error deleting reports in batch: {e}")
+        return make_response(jsonify({"Error": "Internal Server Error"}), 500)
+
+
 @reports_bp.route("/api/v1/reports/<report_id>/upvote", methods=["POST"])
 @auth_required
+@rate_limited("upvote_report")
 def upvote_report(report_id) -> make_response:
     """
     Upvote a report.
@@ -277,12 +557,23 @@ def upvote_report(report_id) -> make_response:
         "timestamp": int(time.time())
     })
 
-    result = reports.update_one(
+    report = reports.find_one_and_update(
         {"_id": ObjectId(report_id)},
-        {"$inc": {"upvote_count": 1}}
+        {"$inc": {"upvote_count": 1}},
+        projection={
+            "user_id": 1,
+            "authority": 1,
+            "category": 1,
+            "resolved": 1,
+            "upvote_count": 1,
+            "geolocation.geometry.coordinates": 1,
+        },
+        return_document=ReturnDocument.AFTER,
     )
 
-    if result.modified_count == 1:
+    if report is not None:
+            record_report_upvoted(report)
+            publish_report_event("upvoted", report)
             logging.info(f"Successfully incremented upvote count for report ID: {report_id}")
             return make_response(
                 jsonify({"Success": "Report upvoted successfully"}),
@@ -293,4 +584,118 @@ def upvote_report(report_id) -> make_response:
         return make_response(
             jsonify({"Error": "Failed to update upvote count"}),
             500,
-        )
\ No newline at end of file
+        )
+
+
+@reports_bp.route(
+    "/api/v1/reports/<string:report_id>/similar-images", methods=["GET"])
+@auth_required
+def get_similar_images(report_id: str) -> make_response:
+    """
+    Retrieve reports whose images are visually near-identical to a report's image.
+
+    Archived reports are compared against, and matched, only if include_archived=true.
+
+    Args:
+        report_id (str): The ID of the report to compare against.
+
+    Returns:
+        make_response: JSON response containing matching report IDs and their Hamming distances.
+    """
+    try:
+        archived = include_archived(request.args)
+        report = reports.find_one({"_id": ObjectId(report_id)}, {"image.dhash": 1})
+        if not report and archived:
+            report = reports_archive.find_one({"_id": ObjectId(report_id)}, {"image.dhash": 1})
+        if not report:
+            logger.warning(f"Report not found for ID: {report_id}")
+            return make_response(
+                jsonify({"Not Found": "Report not found"}), 404
+            )
+
+        image_hash = report.get("image", {}).get("dhash")
+        if not image_hash:
+            return make_response(
+                jsonify({"Unprocessable Entity": "Report image has no perceptual hash"}),
+                422,
+            )
+
+        max_distance = request.args.get(
+            "max_distance", IMAGE_SIMILARITY_MAX_DISTANCE, type=int
+        )
+        matches = similar_images.find_similar(image_hash, max_distance)
+        if archived:
+            matches = sorted(
+                matches + archived_similar_images.find_similar(image_hash, max_distance),
+                key=lambda match: match["distance"],
+            )
+        matches = [match for match in matches if match["report_id"] != report_id]
+        return make_response(jsonify(matches), 200)
+    except Exception as e:
+        logger.error(f"Error finding similar images for report ID {report_id}: {e}")
+        return make_response(jsonify({"Error": "Internal server error"}), 500)
+
+
+@reports_bp.route("/api/v1/reports/duplicates/stats", methods=["GET"])
+@auth_required
+def get_duplicate_stats() -> make_response:
+    """
+    Retrieve the thresholds and hit rate of near-duplicate detection.
+
+    Returns:
+        make_response: JSON response containing the duplicate detection stats.
+    """
+    return make_response(jsonify(recent_reports.get_stats()), 200)
+
+
+@reports_bp.route("/api/v1/reports/bulk", methods=["POST"])
+@auth_required
+@admin_required
+def bulk_import_reports() -> make_response:
+    """
+    Import many reports from an NDJSON body, one report per line.
+
+    Bulk imports are for migrating a council's existing reports, so they need the admin
+    token as well as a user token. Each line holds the report's description, category,
+    geolocation and either an image URL or the name of a pre-uploaded blob. Lines are
+    validated, routed and written in batches, and every line gets its own result. With
+    ?stream=true the results, progress after each batch and the final summary are streamed
+    back as NDJSON.
+
+    Returns:
+        make_response: JSON response with per-line results and a summary, or an NDJSON stream.
+    """
+    if request.mimetype not in ("application/x-ndjson", "application/jsonl"):
+        return make_response(
+            jsonify({"Unsupported Media Type": "Body must be application/x-ndjson"}),
+            415,
+        )
+
+    importer = BulkImport(g.user_id)
+    events = run_bulk_import(request.stream, importer, reports)
+
+    if request.args.get("stream", "false").lower() == "true":
+        @stream_with_context
+        def stream():
+            try:
+                for event in events:
+                    yield json.dumps(event) + "\n"
+            except Exception as e:
+                logger.error(f"Error during bulk import: {e}")
+                yield json.dumps({"Error": "Bulk import failed", **importer.progress()}) + "\n"
+
+        return Response(stream(), mimetype="application/x-ndjson")
+
+    try:
+        results, summary = [], {}
+        for event in events:
+            if "line" in event:
+                results.append(event)
+            elif "summary" in event:
+                summary = event["summary"]
+        return make_response(jsonify({"results": results, "summary": summary}), 200)
+    except Exception as e:
+        logger.error(f"Error during bulk import: {e}")
+        return make_response(
+            jsonify({"Error": "Bulk import failed", **importer.progress()}), 500
+        )
@@ -0,0 +1,472 @@
+"""
+File: boundary_store.py
+Author: Jack McArdle
+
+This file is part of CommunityEye.
+
+Email: mcardle-j9@ulster.ac.uk
+B-No: B00733578
+"""
+
+import glob
+import hashlib
+import json
+import logging
+import os
+import shutil
+import tempfile
+import threading
+from functools import partial
+from typing import Callable, Dict, Iterable, List, Optional, Sequence
+import numpy as np
+from config import BOUNDARY_SOURCE, BOUNDARY_STORE_DIR, MONGO_COLLECTION_AUTHORITIES
+from clients import DB
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+authorities_collection = DB[MONGO_COLLECTION_AUTHORITIES]
+
+AUTHORITY_FILES = os.path.join("data", "geojsons", "*", "*.json")
+ARRAY_NAMES = ("coords", "ring_offsets", "polygon_offsets", "authority_offsets", "bounds")
+# versions kept on disk; older ones may still be mapped by running workers
+KEEP_VERSIONS = 2
+# upper bound on the point/edge pairs compared at once when routing a batch
+MAX_PAIRS = 2_000_000
+
+
+class BoundarySet:
+    """
+    Authority areas held as flat coordinate arrays with offsets, in the layout GeoArrow uses
+    for multipolygons:
+
+        coords             (N, 2) float64  every ring vertex as (lon, lat)
+        ring_offsets       (R + 1,) int64  ring i is coords[ring_offsets[i]:ring_offsets[i + 1]]
+        polygon_offsets    (P + 1,) int64  polygon j is rings polygon_offsets[j] to polygon_offsets[j + 1]
+                                           (the exterior first, then holes)
+        authority_offsets  (A + 1,) int64  authority k is polygons authority_offsets[k] to
+                                           authority_offsets[k + 1]
+        bounds             (A, 4) float64  min lon, min lat, max lon, max lat of each authority
+
+    Loaded from a store directory the arrays are memory-mapped read-only, so every worker
+    process on a host shares one copy through the page cache.
+    """
+
+    def __init__(self, arrays: Dict[str, np.ndarray], authorities: List[Dict], version: str):
+        self.coords = arrays["coords"]
+        self.ring_offsets = arrays["ring_offsets"]
+        self.polygon_offsets = arrays["polygon_offsets"]
+        self.authority_offsets = arrays["authority_offsets"]
+        self.bounds = arrays["bounds"]
+        self.authorities = authorities
+        self.version = version
+        self.names = [authority["authority_name"] for authority in authorities]
+        self.types = np.array([authority["authority_type"] for authority in authorities], dtype=object)
+        # the authorities of each type, so a lookup only visits the types it was asked for
+        self.type_indexes: Dict[str, List[int]] = {}
+        for index, authority_type in enumerate(self.types):
+            self.type_indexes.setdefault(authority_type, []).append(index)
+
+    def __len__(self) -> int:
+        return len(self.authorities)
+
+    @property
+    def arrays(self) -> Dict[str, np.ndarray]:
+        return {name: getattr(self, name) for name in ARRAY_NAMES}
+
+    def _contains(self, authority: int, lons: np.ndarray, lats: np.ndarray) -> np.ndarray:
+        """
+        Test points against one authority's area with the even-odd rule.
+        """
+        inside = np.zeros(len(lons), dtype=bool)
+        for polygon in range(self.authority_offsets[authority], self.authority_offsets[authority + 1]):
+            crossings = np.zeros(len(lons), dtype=np.int64)
+            for ring in range(self.polygon_offsets[polygon], self.polygon_offsets[polygon + 1]):
+                vertices = self.coords[self.ring_offsets[ring]:self.ring_offsets[ring + 1]]
+                crossings += _ring_crossings(vertices, lons, lats)
+            inside |= crossings % 2 == 1
+        return inside
+
+    def locate(
+        self,
+        lons: Sequence[float],
+        lats: Sequence[float],
+        authority_types: Sequence[Optional[str]],
+    ) -> List[Optional[str]]:
+        """
+        Find the authority of the given type whose area contains each point.
+
+        Args:
+            lons (Sequence[float]): The longitude of each point.
+            lats (Sequence[float]): The latitude of each point.
+            authority_types (Sequence[Optional[str]]): The authority type wanted for each
+                point, or None to leave the point unassigned.
+
+        Returns:
+            List[Optional[str]]: The first matching authority's name for each point, or None.
+        """
+        lons = np.asarray(lons, dtype=np.float64)
+        lats = np.asarray(lats, dtype=np.float64)
+        wanted = np.asarray(authority_types, dtype=object)
+        assigned = np.full(len(lons), None, dtype=object)
+        for authority_type in set(authority_types) - {None}:
+            of_type = wanted == authority_type
+            for authority in self.type_indexes.get(authority_type, ()):
+                min_lon, min_lat, max_lon, max_lat = self.bounds[authority]
+                candidates = np.flatnonzero(
+                    of_type
+                    & (assigned == None)  # noqa: E711
+                    & (lons >= min_lon) & (lons <= max_lon)
+                    & (lats >= min_lat) & (lats <= max_lat)
+                )
+                if len(candidates):
+                    matched = candidates[self._contains(authority, lons[candidates], lats[candidates])]
+                    assigned[matched] = self.names[authority]
+        return assigned.tolist()
+
+
+def _ring_crossings(vertices: np.ndarray, lons: np.ndarray, lats: np.ndarray) -> np.ndarray:
+    """
+    Count, for each point, the ring edges crossed by a ray cast east from it.
+
+    Only edges spanning a point's latitude can be crossed, so intersections are computed
+    for those pairs alone.
+    """
+    x1, y1 = vertices[:-1, 0], vertices[:-1, 1]
+    x2, y2 = vertices[1:, 0], vertices[1:, 1]
+    counts = np.zeros(len(lons), dtype=np.int64)
+    chunk = max(1, MAX_PAIRS // max(1, len(x1)))
+    for start in range(0, len(lons), chunk):
+        px, py = lons[start:start + chunk], lats[start:start + chunk]
+        points, edges = np.nonzero((y1 > py[:, None]) != (y2 > py[:, None]))
+        crossing_lons = x1[edges] + (py[points] - y1[edges]) * (x2[edges] - x1[edges]) / (y2[edges] - y1[edges])
+        counts[start:start + chunk] = np.bincount(points[px[points] < crossing_lons], minlength=len(px))
+    return counts
+
+
+def build_boundary_set(authorities: Iterable[Dict]) -> BoundarySet:
+    """
+    Flatten authority documents into a boundary set.
+
+    Authorities are ordered by name so the same areas always produce the same arrays and
+    version, whatever order the source returns them in.
+
+    Args:
+        authorities (Iterable[Dict]): Authority documents with authority_name,
+            authority_type and a Polygon or MultiPolygon area.
+
+    Returns:
+        BoundarySet: The boundary set, held in memory.
+    """
+    authorities = sorted(authorities, key=lambda authority: authority["authority_name"])
+    coords: List[np.ndarray] = []
+    ring_offsets, polygon_offsets, authority_offsets = [0], [0], [0]
+    bounds = []
+    for authority in authorities:
+        area = authority["area"]
+        polygons = area["coordinates"] if area["type"] == "MultiPolygon" else [area["coordinates"]]
+        for polygon in polygons:
+            for ring in polygon:
+                ring = np.asarray(ring, dtype=np.float64)[:, :2]
+                coords.append(ring)
+                ring_offsets.append(ring_offsets[-1] + len(ring))
+            polygon_offsets.append(len(ring_offsets) - 1)
+        authority_offsets.append(len(polygon_offsets) - 1)
+        exteriors = np.concatenate([np.asarray(polygon[0], dtype=np.float64)[:, :2] for polygon in polygons])
+        bounds.append([*exteriors.min(axis=0), *exteriors.max(axis=0)])
+
+    arrays = {
+        "coords": np.concatenate(coords) if coords else np.empty((0, 2)),
+        "ring_offsets": np.array(ring_offsets, dtype=np.int64),
+        "polygon_offsets": np.array(polygon_offsets, dtype=np.int64),
+        "authority_offsets": np.array(authority_offsets, dtype=np.int64),
+        "bounds": np.array(bounds, dtype=np.float64).reshape(-1, 4),
+    }
+    metadata = [
+        {key: authority[key] for key in ("authority_name", "authority_type")}
+        for authority in authorities
+    ]
+    return BoundarySet(arrays, metadata, _content_version(arrays, metadata))
+
+
+def _content_version(arrays: Dict[str, np.ndarray], authorities: List[Dict]) -> str:
+    digest = hashlib.sha256(json.dumps(authorities, sort_keys=True).encode())
+    for name in ARRAY_NAMES:
+        digest.update(np.ascontiguousarray(arrays[name]).tobytes())
+    return digest.hexdigest()[:16]
+
+
+def load_authorities_from_files(pattern: str = AUTHORITY_FILES) -> List[Dict]:
+    """
+    Read the authority documents shipped in data/geojsons.
+
+    Args:
+        pattern (str): Glob matching the authority JSON files.
+
+    Returns:
+        List[Dict]: The authority documents.
+    """
+    authorities = []
+    for path in sorted(glob.glob(pattern)):
+        with open(path) as f:
+            authorities.extend(json.load(f))
+    return authorities
+
+
+def load_authorities_from_mongo() -> Iterable[Dict]:
+    """
+    Stream the authority documents from the authorities collection.
+
+    Returns:
+        Iterable[Dict]: The authority documents, without email addresses.
+    """
+    return authorities_collection.find(
+        {}, {"_id": 0, "authority_name": 1, "authority_type": 1, "area": 1}
+    )
+
+
+def files_fingerprint(*patterns: str) -> str:
+    """
+    Hash the files matching the given globs, so a store built from them can tell when they
+    were edited.
+
+    Args:
+        *patterns (str): Globs matching the source files.
+
+    Returns:
+        str: A hash of the files' names and contents.
+    """
+    digest = hashlib.sha256()
+    for pattern in patterns:
+        for path in sorted(glob.glob(pattern)):
+            digest.update(f"{path}\n".encode())
+            with open(path, "rb") as f:
+                digest.update(hashlib.sha256(f.read()).digest())
+    return digest.hexdigest()[:16]
+
+
+def mongo_fingerprint() -> str:
+    """
+    Summarise the authorities collection, so a store built from it can tell when it changed.
+
+    The collection is small, so dbHash is used where the server allows it. Otherwise the
+    count and newest _id are used, which catch added and removed authorities but not an
+    area edited in place; the change watcher rebuilds the store for those while running.
+
+    Returns:
+        str: The collection's hash, or its count and newest _id.
+    """
+    name = authorities_collection.name
+    try:
+        return authorities_collection.database.command("dbHash", collections=[name])["collections"][name]
+    except Exception:
+        newest = authorities_collection.find_one({}, {"_id": 1}, sort=[("_id", -1)])
+        return f"{authorities_collection.count_documents({})}:{newest['_id'] if newest else ''}"
+
+
+def stored_fingerprint(directory: str) -> Optional[str]:
+    """
+    Read the fingerprint of the source the current version was built from.
+
+    Args:
+        directory (str): The store directory.
+
+    Returns:
+        Optional[str]: The fingerprint, or None if none was saved.
+    """
+    try:
+        with open(os.path.join(directory, "SOURCE")) as f:
+            return f.read().strip() or None
+    except FileNotFoundError:
+        return None
+
+
+def _write_pointer(directory: str, name: str, value: str) -> None:
+    pointer = os.path.join(directory, f".{name}.{os.getpid()}")
+    with open(pointer, "w") as f:
+        f.write(value)
+    os.replace(pointer, os.path.join(directory, name))
+
+
+def save_boundary_set(boundaries: BoundarySet, directory: str) -> str:
+    """
+    Write a boundary set to <directory>/<version> and make it the current version.
+
+    The version directory is written under a temporary name and renamed into place, and
+    the CURRENT pointer is replaced atomically, so readers never see a partial store.
+
+    Args:
+        boundaries (BoundarySet): The boundary set.
+        directory (str): The store directory.
+
+    Returns:
+        str: The path of the version directory.
+    """
+    os.makedirs(directory, exist_ok=True)
+    path = os.path.join(directory, boundaries.version)
+    if not os.path.isdir(path):
+        staging = tempfile.mkdtemp(dir=directory, prefix=".staging-")
+        for name, array in boundaries.arrays.items():
+            np.save(os.path.join(staging, f"{name}.npy"), np.ascontiguousarray(array))
+        with open(os.path.join(staging, "authorities.json"), "w") as f:
+            json.dump(boundaries.authorities, f)
+        try:
+            os.rename(staging, path)
+        except OSError:
+            # another process saved the same version first
+            shutil.rmtree(staging, ignore_errors=True)
+
+    _write_pointer(directory, "CURRENT", boundaries.version)
+    _prune_versions(directory, keep=boundaries.version)
+    return path
+
+
+def _prune_versions(directory: str, keep: str) -> None:
+    versions = sorted(
+        (entry for entry in os.scandir(directory) if entry.is_dir() and not entry.name.startswith(".")),
+        key=lambda entry: entry.stat().st_mtime,
+        reverse=True,
+    )
+    for entry in [entry for entry in versions if entry.name != keep][KEEP_VERSIONS - 1:]:
+        shutil.rmtree(entry.path, ignore_errors=True)
+
+
+def load_boundary_set(path: str) -> BoundarySet:
+    """
+    Memory-map a saved boundary set.
+
+    Args:
+        path (str): The version directory.
+
+    Returns:
+        BoundarySet: The boundary set, backed by read-only memory maps.
+    """
+    arrays = {name: np.load(os.path.join(path, f"{name}.npy"), mmap_mode="r") for name in ARRAY_NAMES}
+    with open(os.path.join(path, "authorities.json")) as f:
+        authorities = json.load(f)
+    return BoundarySet(arrays, authorities, os.path.basename(os.path.normpath(path)))
+
+
+def current_version(directory: str) -> Optional[str]:
+    """
+    Read which version of the store is current.
+
+    Args:
+        directory (str): The store directory.
+
+    Returns:
+        Optional[str]: The version, or None if nothing has been saved.
+    """
+    try:
+        with open(os.path.join(directory, "CURRENT")) as f:
+            return f.read().strip() or None
+    except FileNotFoundError:
+        return None
+
+
+class BoundaryStore:
+    """
+    Process-wide access to the current boundary set.
+
+    The first use maps the current version from the store directory, building it from the
+    source if there is none or if the source's fingerprint differs from the one the
+    version was built from, e.g. after authorities changed while the service was down.
+    invalidate(), called by the change watcher when the authorities collection is written
+    to, makes the next use rebuild from the source and save a new version if the areas
+    changed.
+
+    A loader, if given, replaces the configured source, so other area layers can be held
+    in stores of their own; its fingerprint function, if any, is given with it.
+    """
+
+    def __init__(
+        self,
+        directory: str = BOUNDARY_STORE_DIR,
+        source: str = BOUNDARY_SOURCE,
+        loader: Optional[Callable[[], Iterable[Dict]]] = None,
+        fingerprint: Optional[Callable[[], str]] = None,
+    ):
+        self.directory = directory
+        self.source = source
+        self.loader = loader
+        self.fingerprint = fingerprint
+        self._lock = threading.Lock()
+        self._boundaries: Optional[BoundarySet] = None
+        self._rebuild = False
+
+    def get(self) -> BoundarySet:
+        """
+        Retrieve the boundary set, loading it on first use.
+
+        Returns:
+            BoundarySet: The current boundary set.
+        """
+        with self._lock:
+            if self._boundaries is None:
+                self._boundaries = self._load()
+            return self._boundaries
+
+    def invalidate(self) -> None:
+        """
+        Rebuild the boundary set from the source on next use.
+        """
+        with self._lock:
+            self._boundaries = None
+            self._rebuild = True
+
+    def rebuild(self) -> BoundarySet:
+        """
+        Build the boundary set from the source now and make it current.
+
+        Returns:
+            BoundarySet: The rebuilt boundary set.
+        """
+        self.invalidate()
+        return self.get()
+
+    def _source_fingerprint(self) -> Optional[str]:
+        if self.loader is not None:
+            fingerprint = self.fingerprint
+        elif self.source == "files":
+            fingerprint = partial(files_fingerprint, AUTHORITY_FILES)
+        else:
+            fingerprint = mongo_fingerprint
+        if fingerprint is None:
+            return None
+        try:
+            return fingerprint()
+        except Exception as e:
+            logger.warning(f"Could not fingerprint the boundary source {self.source}: {e}")
+            return None
+
+    def _load(self) -> BoundarySet:
+        fingerprint = self._source_fingerprint()
+        version = None if self._rebuild else current_version(self.directory)
+        if version is not None and fingerprint is not None and fingerprint != stored_fingerprint(self.directory):
+            logger.info(f"Boundary source changed since version {version} was built; rebuilding.")
+            version = None
+        if version is not None:
+            try:
+                return load_boundary_set(os.path.join(self.directory, version))
+            except (OSError, ValueError) as e:
+                logger.warning(f"Rebuilding unreadable boundary store version {version}: {e}")
+
+        if self.loader is not None:
+            authorities = self.loader()
+        elif self.source == "files":
+            authorities = load_authorities_from_files()
+        else:
+            authorities = load_authorities_from_mongo()
+        boundaries = build_boundary_set(authorities)
+        path = save_boundary_set(boundaries, self.directory)
+        if fingerprint is not None:
+            _write_pointer(self.directory, "SOURCE", fingerprint)
+        self._rebuild = False
+        logger.info(
+            f"Built boundary store version {boundaries.version} with {len(boundaries)} authorities "
+            f"and {len(boundaries.coords)} vertices from {self.source}."
+        )
+        return load_boundary_set(path)
+
+
+boundary_store = BoundaryStore()
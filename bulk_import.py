@@ -0,0 +1,373 @@
+"""
+File: bulk_import.py
+Author: Jack McArdle
+
+This file is part of CommunityEye.
+
+Email: mcardle-j9@ulster.ac.uk
+B-No: B00733578
+"""
+
+import asyncio
+import json
+import logging
+import time
+from typing import Any, AsyncIterable, AsyncIterator, Dict, Iterable, Iterator, List, Optional, Tuple
+from bson import ObjectId
+from pymongo import InsertOne
+from pymongo.errors import BulkWriteError
+from config import BULK_IMPORT_BATCH_SIZE, BULK_IMPORT_MAX_ITEMS
+from clients import get_container_client
+from duplicate_utils import recent_reports
+from events import publish_report_event
+from geocoding import find_localities
+from metrics import stage_timer
+from report_utils import determine_report_authorities, filter_within_boundaries
+from routing import routing_rules
+from stats_utils import record_reports_created
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+
+def _validate_item(item: Any) -> List[str]:
+    """
+    Check one imported report against the NDJSON item schema.
+
+    Args:
+        item (Any): The decoded line.
+
+    Returns:
+        List[str]: Validation errors, empty if the item is valid.
+    """
+    if not isinstance(item, dict):
+        return ["Line must be a JSON object"]
+
+    errors = []
+    for field in ("description", "category"):
+        if not isinstance(item.get(field), str) or not item[field].strip():
+            errors.append(f"Missing field: {field}")
+    if isinstance(item.get("category"), str) and item["category"] not in routing_rules.get():
+        errors.append(f"Unknown category: {item['category']}")
+
+    geolocation = item.get("geolocation")
+    if not isinstance(geolocation, dict) or not all(
+        isinstance(geolocation.get(key), (int, float)) and not isinstance(geolocation.get(key), bool)
+        for key in ("Lat", "Lon")
+    ):
+        errors.append("geolocation must contain numeric Lat and Lon")
+
+    image = item.get("image")
+    if not isinstance(image, dict) or not (image.get("url") or image.get("image_name")):
+        errors.append("image must contain a url or a pre-uploaded image_name")
+
+    for field in ("user_id", "created_at", "resolved_at", "upvote_count"):
+        if field in item and (not isinstance(item[field], int) or isinstance(item[field], bool)):
+            errors.append(f"{field} must be an integer")
+    if "resolved" in item and not isinstance(item["resolved"], bool):
+        errors.append("resolved must be a boolean")
+    if item.get("resolved_at") is not None and not item.get("resolved"):
+        errors.append("resolved_at requires resolved to be true")
+    return errors
+
+
+def _build_report(
+    item: Dict, authority: Optional[str], user_id: int, locality: Optional[Dict] = None
+) -> Dict:
+    """
+    Build the stored document for an imported report.
+
+    Args:
+        item (Dict): The validated item.
+        authority (Optional[str]): The authority the report is routed to.
+        user_id (int): The importing user, used when the item names no user.
+        locality (Optional[Dict]): The district and ward of the report, if known.
+
+    Returns:
+        Dict: The report document, shaped like one created through POST /api/v1/reports.
+    """
+    geolocation = {"Lat": item["geolocation"]["Lat"], "Lon": item["geolocation"]["Lon"]}
+    image_name = item["image"].get("image_name")
+    url = item["image"].get("url")
+    if url is None:
+        url = get_container_client().get_blob_client(image_name).url
+
+    report = {
+        "_id": ObjectId(),
+        "user_id": item.get("user_id", user_id),
+        "description": item["description"],
+        "category": item["category"],
+        "geolocation": {
+            "type": "Feature",
+            "geometry": {
+                "type": "Point",
+                "coordinates": [geolocation["Lat"], geolocation["Lon"]],
+            },
+        },
+        "authority": authority,
+        "image": {"url": url, "image_name": image_name, "geolocation": geolocation},
+        "similar_reports": [],
+        "resolved": item.get("resolved", False),
+        "upvote_count": item.get("upvote_count", 0),
+        "created_at": item.get("created_at", int(time.time())),
+        "source": "bulk_import",
+    }
+    if item.get("resolved_at") is not None:
+        report["resolved_at"] = item["resolved_at"]
+    if item.get("external_id") is not None:
+        report["external_id"] = str(item["external_id"])
+    if locality is not None:
+        report["locality"] = locality
+    return report
+
+
+class BulkImport:
+    """
+    State of one NDJSON bulk import.
+
+    Lines are validated as they arrive and collected into batches. Each batch is
+    boundary-checked and routed in one pass, then written with a single unordered
+    bulk_write by the caller. Every line produces exactly one result.
+    """
+
+    def __init__(
+        self,
+        user_id: int,
+        batch_size: int = BULK_IMPORT_BATCH_SIZE,
+        max_items: int = BULK_IMPORT_MAX_ITEMS,
+    ):
+        self.user_id = user_id
+        self.batch_size = batch_size
+        self.max_items = max_items
+        self.started = time.perf_counter()
+        self.line_number = 0
+        self.counts = {"processed": 0, "created": 0, "invalid": 0, "failed": 0}
+        self.truncated = False
+        self._pending: List[Tuple[int, Dict]] = []
+
+    @property
+    def batch_ready(self) -> bool:
+        return len(self._pending) >= self.batch_size
+
+    @property
+    def has_pending(self) -> bool:
+        return bool(self._pending)
+
+    @property
+    def accepting(self) -> bool:
+        return not self.truncated
+
+    def _result(self, line: int, status: str, **fields: Any) -> Dict:
+        self.counts["processed"] += 1
+        self.counts[status] += 1
+        return {"line": line, "status": status, **fields}
+
+    def add_line(self, raw: bytes) -> List[Dict]:
+        """
+        Validate one line and queue it for the next batch.
+
+        Args:
+            raw (bytes): The raw NDJSON line.
+
+        Returns:
+            List[Dict]: The result of the line if it was rejected straight away.
+        """
+        self.line_number += 1
+        if not raw.strip():
+            return []
+        if self.counts["processed"] + len(self._pending) >= self.max_items:
+            self.truncated = True
+            return []
+
+        try:
+            item = json.loads(raw)
+        except ValueError as e:
+            return [self._result(self.line_number, "invalid", errors=[f"Invalid JSON: {e}"])]
+
+        errors = _validate_item(item)
+        if errors:
+            return [self._result(self.line_number, "invalid", errors=errors)]
+        self._pending.append((self.line_number, item))
+        return []
+
+    def take_batch(self) -> Tuple[List[Tuple[int, Dict]], List[Dict]]:
+        """
+        Boundary-check and route the pending items.
+
+        Returns:
+            Tuple[List[Tuple[int, Dict]], List[Dict]]: The line numbers and documents to
+            write, and the results of items rejected for being outside NI.
+        """
+        batch, self._pending = self._pending, []
+        geolocations = [item["geolocation"] for _, item in batch]
+        with stage_timer("bulk_import.route"):
+            within = filter_within_boundaries(geolocations)
+            authorities = determine_report_authorities(
+                geolocations,
+                [item["category"] for _, item in batch],
+                [item.get("created_at") for _, item in batch],
+            )
+            localities = find_localities(geolocations)
+
+        documents, rejected = [], []
+        for (line, item), inside, authority, locality in zip(batch, within, authorities, localities):
+            if not inside:
+                rejected.append(
+                    self._result(line, "invalid", errors=["Geolocation is outside Northern Ireland"])
+                )
+                continue
+            documents.append((line, _build_report(item, authority, self.user_id, locality)))
+        return documents, rejected
+
+    def record_written(
+        self, documents: List[Tuple[int, Dict]], write_errors: Dict[int, str]
+    ) -> List[Dict]:
+        """
+        Produce the results of a written batch and update stats and indexes.
+
+        Args:
+            documents (List[Tuple[int, Dict]]): The line numbers and documents written.
+            write_errors (Dict[int, str]): Error messages keyed by the index of each
+                document that failed to insert.
+
+        Returns:
+            List[Dict]: One result per document.
+        """
+        results, created = [], []
+        for index, (line, document) in enumerate(documents):
+            if index in write_errors:
+                results.append(self._result(line, "failed", errors=[write_errors[index]]))
+                continue
+            created.append(document)
+            results.append(
+                self._result(
+                    line,
+                    "created",
+                    id=str(document["_id"]),
+                    authority=document["authority"],
+                    url=f"http://localhost:5000/api/v1/reports/{document['_id']}",
+                )
+            )
+
+        record_reports_created(created)
+        for document in created:
+            if not document["resolved"]:
+                recent_reports.add(document)
+            publish_report_event("created", document)
+        return results
+
+    def progress(self) -> Dict:
+        return {"progress": dict(self.counts)}
+
+    def summary(self) -> Dict:
+        summary = {
+            **self.counts,
+            "truncated": self.truncated,
+            "seconds": round(time.perf_counter() - self.started, 3),
+        }
+        if self.truncated:
+            summary["max_items"] = self.max_items
+        return {"summary": summary}
+
+
+def _write_errors(error: BulkWriteError) -> Dict[int, str]:
+    return {
+        write_error["index"]: write_error.get("errmsg", "Write failed")
+        for write_error in error.details.get("writeErrors", [])
+    }
+
+
+def _write_batch(importer: BulkImport, collection: Any) -> Iterator[Dict]:
+    documents, rejected = importer.take_batch()
+    yield from rejected
+    write_errors: Dict[int, str] = {}
+    if documents:
+        try:
+            with stage_timer("bulk_import.write"):
+                collection.bulk_write(
+                    [InsertOne(document) for _, document in documents], ordered=False
+                )
+        except BulkWriteError as e:
+            write_errors = _write_errors(e)
+    yield from importer.record_written(documents, write_errors)
+    yield importer.progress()
+
+
+def run_bulk_import(
+    lines: Iterable[bytes], importer: BulkImport, collection: Any
+) -> Iterator[Dict]:
+    """
+    Import NDJSON lines, yielding per-line results, progress after each batch and a summary.
+
+    Args:
+        lines (Iterable[bytes]): The request body, line by line.
+        importer (BulkImport): The import state.
+        collection (Any): The reports collection.
+
+    Yields:
+        Dict: Result, progress and summary events.
+    """
+    for raw in lines:
+        yield from importer.add_line(raw)
+        if not importer.accepting:
+            break
+        if importer.batch_ready:
+            yield from _write_batch(importer, collection)
+    if importer.has_pending:
+        yield from _write_batch(importer, collection)
+    logger.info(f"Bulk import finished: {importer.counts}")
+    yield importer.summary()
+
+
+async def _split_lines(chunks: AsyncIterable[bytes]) -> AsyncIterator[bytes]:
+    buffer = b""
+    async for chunk in chunks:
+        buffer += chunk
+        *lines, buffer = buffer.split(b"\n")
+        for line in lines:
+            yield line
+    if buffer:
+        yield buffer
+
+
+async def run_bulk_import_async(
+    chunks: AsyncIterable[bytes], importer: BulkImport, collection: Any
+) -> AsyncIterator[Dict]:
+    """
+    Import an NDJSON body with the asynchronous driver.
+
+    Args:
+        chunks (AsyncIterable[bytes]): The request body as it arrives.
+        importer (BulkImport): The import state.
+        collection (Any): The asynchronous reports collection.
+
+    Yields:
+        Dict: Result, progress and summary events.
+    """
+    async def write_batch() -> List[Dict]:
+        documents, rejected = await asyncio.to_thread(importer.take_batch)
+        write_errors: Dict[int, str] = {}
+        if documents:
+            try:
+                with stage_timer("bulk_import.write"):
+                    await collection.bulk_write(
+                        [InsertOne(document) for _, document in documents], ordered=False
+                    )
+            except BulkWriteError as e:
+                write_errors = _write_errors(e)
+        written = await asyncio.to_thread(importer.record_written, documents, write_errors)
+        return rejected + written + [importer.progress()]
+
+    async for raw in _split_lines(chunks):
+        for result in importer.add_line(raw):
+            yield result
+        if not importer.accepting:
+            break
+        if importer.batch_ready:
+            for result in await write_batch():
+                yield result
+    if importer.has_pending:
+        for result in await write_batch():
+            yield result
+    logger.info(f"Bulk import finished: {importer.counts}")
+    yield importer.summary()
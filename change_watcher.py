@@ -0,0 +1,394 @@
+"""
+File: change_watcher.py
+Author: Jack McArdle
+
+This file is part of CommunityEye.
+
+Email: mcardle-j9@ulster.ac.uk
+B-No: B00733578
+"""
+
+import logging
+import os
+import threading
+import time
+from collections import defaultdict
+from typing import Any, Callable, Dict, List, Optional
+from bson import json_util
+from pymongo.errors import OperationFailure, PyMongoError
+from config import (
+    CHANGE_WATCHER_ENABLED,
+    CHANGE_WATCHER_HASH_MAX_DOCUMENTS,
+    CHANGE_WATCHER_POLL_SECONDS,
+    CHANGE_WATCHER_RESUME_FILE,
+    MONGO_COLLECTION_AUTHORITIES,
+    MONGO_COLLECTION_REPORTS,
+    MONGO_COLLECTION_REPORTS_ARCHIVE,
+    MONGO_COLLECTION_ROUTING_RULES,
+    ROUTING_RULES_SOURCE,
+)
+from clients import get_db
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# server error codes meaning change streams are unavailable on this deployment
+CHANGE_STREAMS_UNSUPPORTED = {40573}
+# server error codes meaning the resume token can no longer be used
+RESUME_TOKEN_LOST = {260, 280, 286}
+# the resume token is written out at most this often
+RESUME_TOKEN_SAVE_SECONDS = 5
+RETRY_SECONDS = 5
+
+Subscriber = Callable[[Dict[str, Any]], None]
+
+
+class ChangeWatcher:
+    """
+    Dispatches writes made to MongoDB by any process to in-process subscribers.
+
+    A background thread follows a change stream over the subscribed collections and
+    passes each change to the subscribers of its collection as an event:
+
+        {"collection": str, "operation": "insert" | "update" | "replace" | "delete",
+         "id": str, "document": Optional[Dict], "updated_fields": Optional[Dict]}
+
+    The resume token of the last change is kept so the stream continues where it left
+    off after errors, and across restarts when a resume file is configured. If the token
+    has expired, or change streams are unsupported (a standalone mongod), subscribers
+    receive an event with operation "refresh" and no id, meaning they must drop
+    everything they hold for that collection. Without change streams the watcher polls
+    each collection for changes instead and sends "refresh" events.
+    """
+
+    def __init__(
+        self,
+        poll_seconds: float = CHANGE_WATCHER_POLL_SECONDS,
+        resume_file: Optional[str] = CHANGE_WATCHER_RESUME_FILE,
+    ):
+        self.poll_seconds = poll_seconds
+        self.resume_file = resume_file
+        self._subscribers: Dict[str, List[Subscriber]] = defaultdict(list)
+        self._lock = threading.Lock()
+        self._stopped = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._pid: Optional[int] = None
+        self._resume_token_saved_at = 0.0
+        self.resume_token: Optional[Dict] = self._load_resume_token()
+        self.mode: Optional[str] = None
+        self.events_dispatched = 0
+        self.errors = 0
+
+    def subscribe(self, collection: str, callback: Subscriber) -> None:
+        """
+        Register a callback for changes to a collection.
+
+        Subscribers must be registered before the watcher is started.
+
+        Args:
+            collection (str): The collection name.
+            callback (Subscriber): Called with each event from the watcher thread.
+        """
+        with self._lock:
+            self._subscribers[collection].append(callback)
+
+    def dispatch(self, event: Dict[str, Any]) -> None:
+        """
+        Pass an event to the subscribers of its collection.
+
+        Args:
+            event (Dict[str, Any]): The event.
+        """
+        for callback in self._subscribers.get(event["collection"], []):
+            try:
+                callback(event)
+            except Exception as e:
+                logger.error(f"Error handling {event['operation']} event for {event['collection']}: {e}")
+        self.events_dispatched += 1
+
+    def refresh_all(self) -> None:
+        """
+        Tell every subscriber to drop what it holds.
+        """
+        for collection in list(self._subscribers):
+            self.dispatch({"collection": collection, "operation": "refresh", "id": None})
+
+    def ensure_running(self) -> None:
+        """
+        Start the watcher thread in this process if it is not already running.
+
+        Threads do not survive a fork, so this is called per request rather than once
+        at startup; a forked worker starts its own watcher on its first request.
+        """
+        if self._pid == os.getpid() and self._thread is not None:
+            return
+        with self._lock:
+            if self._pid == os.getpid() and self._thread is not None:
+                return
+            self._stopped.clear()
+            self._pid = os.getpid()
+            self._thread = threading.Thread(target=self._run, name="change-watcher", daemon=True)
+            self._thread.start()
+
+    def stop(self) -> None:
+        """
+        Stop the watcher thread.
+        """
+        self._stopped.set()
+        if self._thread is not None and self._pid == os.getpid():
+            self._thread.join(timeout=self.poll_seconds + 2)
+        self._thread = None
+
+    def get_stats(self) -> Dict[str, Any]:
+        """
+        Retrieve the state of the watcher.
+
+        Returns:
+            Dict[str, Any]: The mode, subscribed collections and event and error counts.
+        """
+        return {
+            "enabled": CHANGE_WATCHER_ENABLED,
+            "running": self._thread is not None and self._thread.is_alive(),
+            "mode": self.mode,
+            "collections": sorted(self._subscribers),
+            "events_dispatched": self.events_dispatched,
+            "errors": self.errors,
+            "has_resume_token": self.resume_token is not None,
+        }
+
+    def _run(self) -> None:
+        while not self._stopped.is_set():
+            try:
+                self._watch()
+            except NotImplementedError:
+                self._poll()
+            except OperationFailure as e:
+                if e.code in CHANGE_STREAMS_UNSUPPORTED:
+                    logger.info("Change streams are not supported; polling for changes instead.")
+                    self._poll()
+                elif e.code in RESUME_TOKEN_LOST:
+                    logger.warning("Change stream resume token expired; refreshing all subscribers.")
+                    self._set_resume_token(None, force=True)
+                    self.refresh_all()
+                else:
+                    self._record_error(e)
+            except Exception as e:
+                # the thread must outlive any error, or every cache silently goes stale
+                self._record_error(e)
+
+    def _record_error(self, error: Exception) -> None:
+        self.errors += 1
+        logger.error(f"Change watcher error, retrying in {RETRY_SECONDS}s: {error}")
+        self._stopped.wait(RETRY_SECONDS)
+
+    def _watch(self) -> None:
+        """
+        Follow the change stream until stopped or an error is raised.
+        """
+        pipeline = [{"$match": {"ns.coll": {"$in": sorted(self._subscribers)}}}]
+        with get_db().watch(
+            pipeline, resume_after=self.resume_token, max_await_time_ms=1000
+        ) as stream:
+            if self.mode != "change_stream":
+                logger.info(f"Watching {sorted(self._subscribers)} for changes.")
+                # anything may have changed while the stream was not open
+                if self.mode is not None and self.resume_token is None:
+                    self.refresh_all()
+                self.mode = "change_stream"
+            while not self._stopped.is_set() and stream.alive:
+                change = stream.try_next()
+                if change is not None:
+                    self.dispatch(_to_event(change))
+                self._set_resume_token(stream.resume_token)
+        # keep the latest position when stopping, not just the last periodic save
+        self._set_resume_token(self.resume_token, force=True)
+
+    def _poll(self) -> None:
+        """
+        Detect changes by fingerprinting each collection on an interval.
+        """
+        self.mode = "polling"
+        fingerprints = {collection: self._fingerprint(collection) for collection in self._subscribers}
+        while not self._stopped.wait(self.poll_seconds):
+            for collection in list(self._subscribers):
+                try:
+                    fingerprint = self._fingerprint(collection)
+                except PyMongoError as e:
+                    self._record_error(e)
+                    continue
+                if fingerprint != fingerprints.get(collection):
+                    fingerprints[collection] = fingerprint
+                    self.dispatch({"collection": collection, "operation": "refresh", "id": None})
+
+    def _fingerprint(self, collection: str) -> Any:
+        """
+        Summarise a collection's contents cheaply, so that polling notices changes.
+
+        Collections of up to CHANGE_WATCHER_HASH_MAX_DOCUMENTS are hashed with dbHash, so
+        any write changes the result. Larger ones are summarised by their estimated count,
+        read from metadata, and newest ID. That sees inserts and deletes but not in-place
+        updates such as upvotes and resolves, which would otherwise make every poll scan
+        the collection and every upvote reload its caches.
+        """
+        db = get_db()
+        count = db[collection].estimated_document_count()
+        if count <= CHANGE_WATCHER_HASH_MAX_DOCUMENTS:
+            try:
+                return db.command("dbHash", collections=[collection])["collections"].get(collection)
+            except (OperationFailure, NotImplementedError):
+                pass
+        newest = db[collection].find_one({}, {"_id": 1}, sort=[("_id", -1)])
+        return count, newest and newest["_id"]
+
+    def _load_resume_token(self) -> Optional[Dict]:
+        if not self.resume_file or not os.path.exists(self.resume_file):
+            return None
+        try:
+            with open(self.resume_file) as f:
+                return json_util.loads(f.read())
+        except Exception as e:
+            logger.warning(f"Ignoring unreadable resume token file: {e}")
+            return None
+
+    def _set_resume_token(self, token: Optional[Dict], force: bool = False) -> None:
+        if token == self.resume_token and not force:
+            return
+        self.resume_token = token
+        now = time.monotonic()
+        if not self.resume_file or (not force and now - self._resume_token_saved_at < RESUME_TOKEN_SAVE_SECONDS):
+            return
+        self._resume_token_saved_at = now
+        try:
+            if token is None:
+                if os.path.exists(self.resume_file):
+                    os.remove(self.resume_file)
+                return
+            temporary_file = f"{self.resume_file}.tmp"
+            with open(temporary_file, "w") as f:
+                f.write(json_util.dumps(token))
+            os.replace(temporary_file, self.resume_file)
+        except OSError as e:
+            logger.warning(f"Could not save resume token: {e}")
+
+
+def _to_event(change: Dict) -> Dict[str, Any]:
+    """
+    Convert a change stream document into a watcher event.
+
+    Args:
+        change (Dict): The change stream document.
+
+    Returns:
+        Dict[str, Any]: The event.
+    """
+    document_key = change.get("documentKey") or {}
+    return {
+        "collection": change["ns"]["coll"],
+        "operation": change["operationType"],
+        "id": str(document_key["_id"]) if "_id" in document_key else None,
+        "document": change.get("fullDocument"),
+        "updated_fields": (change.get("updateDescription") or {}).get("updatedFields"),
+    }
+
+
+watcher = ChangeWatcher()
+
+
+def _invalidate_report_indexes(event: Dict[str, Any]) -> None:
+    """
+    Keep the duplicate and image similarity indexes in step with the reports collection.
+
+    Args:
+        event (Dict[str, Any]): A reports event.
+    """
+    from duplicate_utils import recent_reports
+    from image_index import similar_images
+
+    operation, report_id = event["operation"], event["id"]
+    if operation == "refresh":
+        recent_reports.invalidate()
+        similar_images.invalidate()
+    elif operation == "delete":
+        recent_reports.discard(report_id)
+        similar_images.discard(report_id)
+    elif operation in ("insert", "replace"):
+        document = event["document"]
+        recent_reports.discard(report_id)
+        if not document.get("resolved"):
+            recent_reports.add(document)
+        if document.get("image", {}).get("dhash"):
+            similar_images.add(document["image"]["dhash"], report_id)
+    elif operation == "update" and (event.get("updated_fields") or {}).get("resolved"):
+        recent_reports.discard(report_id)
+
+
+def _invalidate_archived_images(event: Dict[str, Any]) -> None:
+    """
+    Keep the archived image similarity index in step with the archive collection.
+
+    Args:
+        event (Dict[str, Any]): An archive collection event.
+    """
+    from image_index import archived_similar_images
+
+    operation, report_id = event["operation"], event["id"]
+    if operation == "refresh":
+        archived_similar_images.invalidate()
+    elif operation == "delete":
+        archived_similar_images.discard(report_id)
+    elif operation in ("insert", "replace") and event["document"].get("image", {}).get("dhash"):
+        archived_similar_images.discard(report_id)
+        archived_similar_images.add(event["document"]["image"]["dhash"], report_id)
+
+
+def _invalidate_authorities(event: Dict[str, Any]) -> None:
+    from boundary_store import boundary_store
+
+    boundary_store.invalidate()
+
+
+def _invalidate_routing_rules(event: Dict[str, Any]) -> None:
+    from routing import routing_rules
+
+    routing_rules.invalidate()
+
+
+DEFAULT_SUBSCRIBERS = {
+    MONGO_COLLECTION_REPORTS: _invalidate_report_indexes,
+    MONGO_COLLECTION_REPORTS_ARCHIVE: _invalidate_archived_images,
+    MONGO_COLLECTION_AUTHORITIES: _invalidate_authorities,
+}
+if ROUTING_RULES_SOURCE == "mongo":
+    DEFAULT_SUBSCRIBERS[MONGO_COLLECTION_ROUTING_RULES] = _invalidate_routing_rules
+
+
+def register_default_subscribers(change_watcher: ChangeWatcher) -> None:
+    """
+    Subscribe the service's in-process caches and indexes to the collections they mirror.
+
+    Safe to call more than once, e.g. when several apps are created in one process.
+
+    Args:
+        change_watcher (ChangeWatcher): The watcher to subscribe to.
+    """
+    for collection, callback in DEFAULT_SUBSCRIBERS.items():
+        if callback not in change_watcher._subscribers.get(collection, []):
+            change_watcher.subscribe(collection, callback)
+
+
+def init_app(app: Any) -> None:
+    """
+    Start the change watcher with a Flask or Quart app.
+
+    The watcher thread is started by the first request each process serves.
+
+    Args:
+        app (Any): The app.
+    """
+    if not CHANGE_WATCHER_ENABLED:
+        return
+    register_default_subscribers(watcher)
+
+    @app.before_request
+    def start_change_watcher() -> None:
+        watcher.ensure_running()
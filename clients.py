@@ -0,0 +1,246 @@
+"""
+File: clients.py
+Author: Jack McArdle
+
+This file is part of CommunityEye.
+
+Email: mcardle-j9@ulster.ac.uk
+B-No: B00733578
+"""
+
+import logging
+import os
+import threading
+import time
+from typing import Any, Callable, Dict, Optional
+from azure.storage.blob import BlobServiceClient, ContainerClient
+from azure.storage.blob.aio import (
+    BlobServiceClient as AsyncBlobServiceClient,
+    ContainerClient as AsyncContainerClient,
+)
+import httpx
+from pymongo import AsyncMongoClient, MongoClient
+from pymongo.asynchronous.database import AsyncDatabase
+from pymongo.database import Database
+import config
+from metrics import mongo_command_listener
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+
+class ClientRegistry:
+    """
+    Per-process registry of lazily created service clients.
+
+    Clients are built on first use rather than at import time, and the registry is
+    emptied in a forked child so that each worker process opens its own connections
+    instead of sharing sockets and monitor threads inherited from the parent.
+    """
+
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._clients: Dict[str, Any] = {}
+        self._pid = os.getpid()
+        self.init_timings: Dict[str, float] = {}
+
+    def get(self, name: str, factory: Callable[[], Any]) -> Any:
+        """
+        Retrieve a client, creating it with the factory on first use in this process.
+
+        Args:
+            name (str): The name the client is registered under.
+            factory (Callable[[], Any]): Builds the client.
+
+        Returns:
+            Any: The client.
+        """
+        if self._pid != os.getpid():
+            self.reset()
+
+        client = self._clients.get(name)
+        if client is not None:
+            return client
+
+        with self._lock:
+            client = self._clients.get(name)
+            if client is None:
+                started = time.perf_counter()
+                client = factory()
+                elapsed_ms = (time.perf_counter() - started) * 1000
+                self.init_timings[name] = elapsed_ms
+                self._clients[name] = client
+                logger.info(
+                    f"Created {name} client in process {os.getpid()} in {elapsed_ms:.1f} ms."
+                )
+        return client
+
+    def reset(self) -> None:
+        """
+        Forget all clients, e.g. in a freshly forked child process.
+
+        Inherited clients are dropped rather than closed, since closing them would also
+        tear down connections still in use by the parent.
+        """
+        self._lock = threading.RLock()
+        self._clients = {}
+        self._pid = os.getpid()
+        self.init_timings = {}
+
+
+registry = ClientRegistry()
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=registry.reset)
+
+
+def _mongo_options() -> Dict[str, Any]:
+    return {
+        "event_listeners": [mongo_command_listener],
+        "maxPoolSize": config.MONGO_MAX_POOL_SIZE,
+        "minPoolSize": config.MONGO_MIN_POOL_SIZE,
+        "maxIdleTimeMS": config.MONGO_MAX_IDLE_TIME_MS,
+        "connectTimeoutMS": config.MONGO_CONNECT_TIMEOUT_MS,
+        "serverSelectionTimeoutMS": config.MONGO_SERVER_SELECTION_TIMEOUT_MS,
+        "socketTimeoutMS": config.MONGO_SOCKET_TIMEOUT_MS,
+    }
+
+
+def _blob_options() -> Dict[str, Any]:
+    return {
+        "account_url": config.AZURE_STORAGE_ACCOUNT_URL
+        or f"https://{config.AZURE_STORAGE_ACCOUNT}.blob.core.windows.net/",
+        "credential": config.AZURE_STORAGE_SAS,
+        "connection_timeout": config.AZURE_STORAGE_CONNECTION_TIMEOUT,
+        "read_timeout": config.AZURE_STORAGE_READ_TIMEOUT,
+    }
+
+
+def _create_mongo_client() -> MongoClient:
+    return MongoClient(config.MONGO_URI, **_mongo_options())
+
+
+def _create_blob_service_client() -> BlobServiceClient:
+    return BlobServiceClient(**_blob_options())
+
+
+def get_mongo_client() -> MongoClient:
+    """
+    Retrieve this process's MongoDB client.
+
+    Returns:
+        MongoClient: The client, configured with the pool settings from the environment.
+    """
+    return registry.get("mongo", _create_mongo_client)
+
+
+def get_db() -> Database:
+    """
+    Retrieve the application database.
+
+    Returns:
+        Database: The database named by MONGO_DB_NAME.
+    """
+    return get_mongo_client()[config.MONGO_DB_NAME]
+
+
+def get_container_client() -> ContainerClient:
+    """
+    Retrieve the Azure Blob Storage container client for report images.
+
+    Returns:
+        ContainerClient: The client for AZURE_STORAGE_CONTAINER.
+    """
+    return registry.get(
+        "azure_container",
+        lambda: registry.get(
+            "azure_blob", _create_blob_service_client
+        ).get_container_client(config.AZURE_STORAGE_CONTAINER),
+    )
+
+
+def get_async_db() -> AsyncDatabase:
+    """
+    Retrieve the application database through the asynchronous driver.
+
+    Async clients are bound to the event loop that first uses them, so this must only
+    be called from the ASGI app's loop.
+
+    Returns:
+        AsyncDatabase: The database named by MONGO_DB_NAME.
+    """
+    client = registry.get(
+        "mongo_async", lambda: AsyncMongoClient(config.MONGO_URI, **_mongo_options())
+    )
+    return client[config.MONGO_DB_NAME]
+
+
+def get_async_container_client() -> AsyncContainerClient:
+    """
+    Retrieve the asynchronous Azure Blob Storage container client for report images.
+
+    Returns:
+        AsyncContainerClient: The client for AZURE_STORAGE_CONTAINER.
+    """
+    return registry.get(
+        "azure_container_async",
+        lambda: AsyncBlobServiceClient(**_blob_options()).get_container_client(
+            config.AZURE_STORAGE_CONTAINER
+        ),
+    )
+
+
+def get_async_http_client() -> httpx.AsyncClient:
+    """
+    Retrieve the shared asynchronous HTTP client used to call other services.
+
+    Returns:
+        httpx.AsyncClient: The client.
+    """
+    return registry.get("http_async", lambda: httpx.AsyncClient(timeout=5))
+
+
+class LazyCollection:
+    """
+    Stand-in for a pymongo Collection that resolves the real collection on each use.
+
+    This lets modules keep binding collections at import time without opening a
+    connection, and keeps them valid after a fork.
+    """
+
+    def __init__(self, name: str, resolver: Optional[Callable[[], Any]] = None):
+        self.name = name
+        self._resolver = resolver
+
+    def __getattr__(self, attribute: str) -> Any:
+        return getattr(self.resolve(), attribute)
+
+    def __repr__(self) -> str:
+        return f"LazyCollection({self.name!r})"
+
+    def resolve(self) -> Any:
+        """
+        Retrieve the underlying pymongo collection.
+
+        Returns:
+            Any: The collection in this process's database.
+        """
+        return (self._resolver or get_db)()[self.name]
+
+
+class LazyDatabase:
+    """
+    Stand-in for a pymongo Database whose collections are resolved lazily.
+    """
+
+    def __init__(self, resolver: Optional[Callable[[], Any]] = None):
+        self._resolver = resolver
+
+    def __getitem__(self, name: str) -> LazyCollection:
+        return LazyCollection(name, self._resolver)
+
+    def __getattr__(self, attribute: str) -> Any:
+        return getattr((self._resolver or get_db)(), attribute)
+
+
+DB = LazyDatabase()
+ASYNC_DB = LazyDatabase(get_async_db)
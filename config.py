@@ -9,7 +9,6 @@ B-No: B00733578
 """
 
 from dotenv import load_dotenv
-from pymongo import MongoClient
 import os
 
 
@@ -21,8 +20,31 @@ MONGO_DB_NAME = os.getenv("MONGO_DB_NAME")
 MONGO_COLLECTION_REPORTS = os.getenv("MONGO_COLLECTION_REPORTS")
 MONGO_COLLECTION_AUTHORITIES = os.getenv("MONGO_COLLECTION_AUTHORITIES")
 MONGO_COLLECTION_UPVOTES = os.getenv("MONGO_COLLECTION_UPVOTES")
-CLIENT = MongoClient(MONGO_URI)
-DB = CLIENT[MONGO_DB_NAME]
+MONGO_COLLECTION_STATS = os.getenv("MONGO_COLLECTION_STATS", "authority_stats")
+MONGO_COLLECTION_USER_STATS = os.getenv("MONGO_COLLECTION_USER_STATS", "user_stats")
+MONGO_COLLECTION_ROUTING_RULES = os.getenv("MONGO_COLLECTION_ROUTING_RULES", "routing_rules")
+MONGO_COLLECTION_HOTSPOTS = os.getenv("MONGO_COLLECTION_HOTSPOTS", "hotspots")
+MONGO_COLLECTION_HOTSPOT_BUCKETS = os.getenv("MONGO_COLLECTION_HOTSPOT_BUCKETS", "hotspot_buckets")
+MONGO_COLLECTION_JOB_STATE = os.getenv("MONGO_COLLECTION_JOB_STATE", "job_state")
+MONGO_COLLECTION_RATE_LIMITS = os.getenv("MONGO_COLLECTION_RATE_LIMITS", "rate_limits")
+MONGO_COLLECTION_IDEMPOTENCY_KEYS = os.getenv("MONGO_COLLECTION_IDEMPOTENCY_KEYS", "idempotency_keys")
+MONGO_COLLECTION_REPORTS_ARCHIVE = os.getenv("MONGO_COLLECTION_REPORTS_ARCHIVE", "reports_archive")
+MONGO_MAX_POOL_SIZE = int(os.getenv("MONGO_MAX_POOL_SIZE", "100"))
+MONGO_MIN_POOL_SIZE = int(os.getenv("MONGO_MIN_POOL_SIZE", "0"))
+MONGO_MAX_IDLE_TIME_MS = (
+    int(os.getenv("MONGO_MAX_IDLE_TIME_MS"))
+    if os.getenv("MONGO_MAX_IDLE_TIME_MS")
+    else None
+)
+MONGO_CONNECT_TIMEOUT_MS = int(os.getenv("MONGO_CONNECT_TIMEOUT_MS", "20000"))
+MONGO_SERVER_SELECTION_TIMEOUT_MS = int(
+    os.getenv("MONGO_SERVER_SELECTION_TIMEOUT_MS", "30000")
+)
+MONGO_SOCKET_TIMEOUT_MS = (
+    int(os.getenv("MONGO_SOCKET_TIMEOUT_MS"))
+    if os.getenv("MONGO_SOCKET_TIMEOUT_MS")
+    else None
+)
 
 
 FLASK_SECRET_KEY = os.getenv("FLASK_SECRET_KEY")
@@ -31,6 +53,164 @@ FLASK_HOST = os.getenv("FLASK_HOST")
 FLASK_PORT = int(os.getenv("FLASK_PORT"))
 
 
+AUTH_SERVICE_URL = os.getenv(
+    "AUTH_SERVICE_URL", "http://localhost:5001/api/v1/validate-token"
+)
+
+
 AZURE_STORAGE_ACCOUNT = os.getenv("AZURE_STORAGE_ACCOUNT")
 AZURE_STORAGE_CONTAINER = os.getenv("AZURE_STORAGE_CONTAINER")
 AZURE_STORAGE_SAS = os.getenv("AZURE_STORAGE_SAS")
+# overrides the account's public endpoint, e.g. to point at a local blob stand-in
+AZURE_STORAGE_ACCOUNT_URL = os.getenv("AZURE_STORAGE_ACCOUNT_URL")
+AZURE_STORAGE_CONNECTION_TIMEOUT = int(
+    os.getenv("AZURE_STORAGE_CONNECTION_TIMEOUT", "20")
+)
+AZURE_STORAGE_READ_TIMEOUT = int(os.getenv("AZURE_STORAGE_READ_TIMEOUT", "60"))
+
+
+STATS_TOP_UPVOTED_LIMIT = int(os.getenv("STATS_TOP_UPVOTED_LIMIT", "10"))
+
+
+DUPLICATE_DETECTION_ENABLED = (
+    os.getenv("DUPLICATE_DETECTION_ENABLED", "true").lower() == "true"
+)
+DUPLICATE_RADIUS_METRES = float(os.getenv("DUPLICATE_RADIUS_METRES", "25"))
+DUPLICATE_WINDOW_DAYS = float(os.getenv("DUPLICATE_WINDOW_DAYS", "14"))
+DUPLICATE_INDEX_REFRESH_SECONDS = int(
+    os.getenv("DUPLICATE_INDEX_REFRESH_SECONDS", "30")
+)
+IMAGE_SIMILARITY_MAX_DISTANCE = int(os.getenv("IMAGE_SIMILARITY_MAX_DISTANCE", "6"))
+
+
+ADMIN_TOKEN = os.getenv("ADMIN_TOKEN")
+
+
+PROFILE_SAMPLE_RATE = float(os.getenv("PROFILE_SAMPLE_RATE", "0"))
+PROFILE_SECRET = os.getenv("PROFILE_SECRET")
+PROFILE_MODE = os.getenv("PROFILE_MODE", "sampling")
+PROFILE_SAMPLE_INTERVAL_MS = float(os.getenv("PROFILE_SAMPLE_INTERVAL_MS", "5"))
+PROFILE_DIR = os.getenv("PROFILE_DIR", "profiles")
+PROFILE_MAX_FILES = int(os.getenv("PROFILE_MAX_FILES", "200"))
+
+
+BULK_IMPORT_BATCH_SIZE = int(os.getenv("BULK_IMPORT_BATCH_SIZE", "500"))
+BULK_IMPORT_MAX_ITEMS = int(os.getenv("BULK_IMPORT_MAX_ITEMS", "100000"))
+
+
+CHANGE_WATCHER_ENABLED = os.getenv("CHANGE_WATCHER_ENABLED", "true").lower() == "true"
+CHANGE_WATCHER_POLL_SECONDS = float(os.getenv("CHANGE_WATCHER_POLL_SECONDS", "5"))
+# when polling, collections up to this size are hashed so any write is seen; larger ones,
+# e.g. reports, are only checked for inserts and deletes, as hashing scans the collection
+CHANGE_WATCHER_HASH_MAX_DOCUMENTS = int(os.getenv("CHANGE_WATCHER_HASH_MAX_DOCUMENTS", "10000"))
+# where the last resume token is kept across restarts; unset keeps it in memory only
+CHANGE_WATCHER_RESUME_FILE = os.getenv("CHANGE_WATCHER_RESUME_FILE")
+
+
+# authority areas are flattened into memory-mapped arrays here, one directory per version
+BOUNDARY_STORE_DIR = os.getenv("BOUNDARY_STORE_DIR", os.path.join("data", "boundary-store"))
+# "mongo" builds the store from the authorities collection, "files" from data/geojsons
+BOUNDARY_SOURCE = os.getenv("BOUNDARY_SOURCE", "mongo")
+# "file" reads the category routing rules from ROUTING_RULES_FILE, "mongo" from their collection
+ROUTING_RULES_SOURCE = os.getenv("ROUTING_RULES_SOURCE", "file")
+ROUTING_RULES_FILE = os.getenv("ROUTING_RULES_FILE", os.path.join("data", "routing_rules.json"))
+
+
+BATCH_MAX_IDS = int(os.getenv("BATCH_MAX_IDS", "500"))
+BATCH_BLOB_DELETE_WORKERS = int(os.getenv("BATCH_BLOB_DELETE_WORKERS", "8"))
+# a batch delete claims its reports for this long, so other deletes leave them alone
+BATCH_DELETE_CLAIM_SECONDS = int(os.getenv("BATCH_DELETE_CLAIM_SECONDS", "300"))
+
+
+FEED_PAGE_SIZE = int(os.getenv("FEED_PAGE_SIZE", "20"))
+FEED_MAX_PAGE_SIZE = int(os.getenv("FEED_MAX_PAGE_SIZE", "100"))
+
+
+# a hotspot is a geohash cell with at least HOTSPOT_MIN_COUNT reports of a category in a
+# window and HOTSPOT_MIN_RATIO times the mean of the HOTSPOT_BASELINE_WINDOWS before it
+HOTSPOT_GEOHASH_PRECISION = int(os.getenv("HOTSPOT_GEOHASH_PRECISION", "6"))
+HOTSPOT_WINDOW_SECONDS = int(os.getenv("HOTSPOT_WINDOW_SECONDS", str(7 * 86400)))
+HOTSPOT_BASELINE_WINDOWS = int(os.getenv("HOTSPOT_BASELINE_WINDOWS", "4"))
+HOTSPOT_MIN_COUNT = int(os.getenv("HOTSPOT_MIN_COUNT", "3"))
+HOTSPOT_MIN_RATIO = float(os.getenv("HOTSPOT_MIN_RATIO", "2"))
+HOTSPOT_LAG_SECONDS = int(os.getenv("HOTSPOT_LAG_SECONDS", "60"))
+HOTSPOT_BATCH_SIZE = int(os.getenv("HOTSPOT_BATCH_SIZE", "50000"))
+
+
+RATE_LIMIT_ENABLED = os.getenv("RATE_LIMIT_ENABLED", "true").lower() == "true"
+# "memory" keeps buckets per process, "mongo" shares them between workers and hosts
+RATE_LIMIT_BACKEND = os.getenv("RATE_LIMIT_BACKEND", "memory")
+RATE_LIMIT_MAX_KEYS = int(os.getenv("RATE_LIMIT_MAX_KEYS", "100000"))
+# each user gets a burst of capacity requests, refilled at per_minute; an IP gets the multiple
+RATE_LIMITS = {
+    "create_report": {
+        "capacity": float(os.getenv("RATE_LIMIT_CREATE_CAPACITY", "5")),
+        "per_minute": float(os.getenv("RATE_LIMIT_CREATE_PER_MINUTE", "10")),
+    },
+    "upvote_report": {
+        "capacity": float(os.getenv("RATE_LIMIT_UPVOTE_CAPACITY", "20")),
+        "per_minute": float(os.getenv("RATE_LIMIT_UPVOTE_PER_MINUTE", "60")),
+    },
+}
+RATE_LIMIT_IP_MULTIPLIER = float(os.getenv("RATE_LIMIT_IP_MULTIPLIER", "5"))
+# only enable behind a proxy that appends to X-Forwarded-For, otherwise clients can spoof it;
+# the client is the entry added by the outermost of RATE_LIMIT_TRUSTED_PROXIES proxies,
+# counted from the right, as anything to its left came from the client
+RATE_LIMIT_TRUST_FORWARDED_FOR = os.getenv("RATE_LIMIT_TRUST_FORWARDED_FOR", "false").lower() == "true"
+RATE_LIMIT_TRUSTED_PROXIES = int(os.getenv("RATE_LIMIT_TRUSTED_PROXIES", "1"))
+# image conversions and boundary checks in progress at once per worker process
+IMAGE_PROCESSING_MAX_CONCURRENCY = int(os.getenv("IMAGE_PROCESSING_MAX_CONCURRENCY", "4"))
+IMAGE_PROCESSING_QUEUE_TIMEOUT = float(os.getenv("IMAGE_PROCESSING_QUEUE_TIMEOUT", "2"))
+
+
+# districts come from the bundled council areas; ward areas, in the same document format
+# with authority_type "Ward", are read from GEOCODING_WARD_FILES when present
+GEOCODING_STORE_DIR = os.getenv("GEOCODING_STORE_DIR", os.path.join("data", "locality-store"))
+GEOCODING_WARD_FILES = os.getenv("GEOCODING_WARD_FILES", os.path.join("data", "wards", "*.json"))
+# points are looked up and memoized by cell; 4 decimal places is about 11m by 7m in NI
+GEOCODING_CELL_DECIMALS = int(os.getenv("GEOCODING_CELL_DECIMALS", "4"))
+GEOCODING_CACHE_SIZE = int(os.getenv("GEOCODING_CACHE_SIZE", "100000"))
+GEOCODING_BATCH_SIZE = int(os.getenv("GEOCODING_BATCH_SIZE", "1000"))
+
+
+# responses to POST /api/v1/reports sent with an Idempotency-Key are replayed to retries
+# for this long; "memory" keeps keys per process, "mongo" shares them between workers
+IDEMPOTENCY_BACKEND = os.getenv("IDEMPOTENCY_BACKEND", "memory")
+IDEMPOTENCY_TTL_SECONDS = int(os.getenv("IDEMPOTENCY_TTL_SECONDS", "3600"))
+IDEMPOTENCY_MAX_KEYS = int(os.getenv("IDEMPOTENCY_MAX_KEYS", "100000"))
+# a request still holding its key after this long is presumed dead and its key may be retaken
+IDEMPOTENCY_LOCK_SECONDS = int(os.getenv("IDEMPOTENCY_LOCK_SECONDS", "60"))
+# how long a retry waits on the original request before getting a 409
+IDEMPOTENCY_WAIT_SECONDS = float(os.getenv("IDEMPOTENCY_WAIT_SECONDS", "10"))
+
+
+# resolved reports older than this are moved out of the reports collection, either into
+# MONGO_COLLECTION_REPORTS_ARCHIVE ("collection") or gzipped NDJSON files in ARCHIVE_DIR ("files")
+ARCHIVE_AFTER_DAYS = int(os.getenv("ARCHIVE_AFTER_DAYS", "180"))
+ARCHIVE_BATCH_SIZE = int(os.getenv("ARCHIVE_BATCH_SIZE", "500"))
+ARCHIVE_TARGET = os.getenv("ARCHIVE_TARGET", "collection")
+ARCHIVE_DIR = os.getenv("ARCHIVE_DIR", os.path.join("data", "archive"))
+# move each batch in a transaction; needs a replica set, so turn off for a standalone server
+ARCHIVE_TRANSACTIONS = os.getenv("ARCHIVE_TRANSACTIONS", "true").lower() == "true"
+
+
+# reports are exported for analytics as Parquet or Arrow IPC, a row group of
+# EXPORT_BATCH_SIZE reports at a time; reports created within EXPORT_LAG_SECONDS are left
+# for the next incremental export
+EXPORT_BATCH_SIZE = int(os.getenv("EXPORT_BATCH_SIZE", "50000"))
+EXPORT_LAG_SECONDS = int(os.getenv("EXPORT_LAG_SECONDS", "60"))
+# zstd or lz4 for both formats; snappy and gzip for Parquet only
+EXPORT_COMPRESSION = os.getenv("EXPORT_COMPRESSION", "zstd")
+
+
+# GET /api/v1/reports/stream pushes report changes as Server-Sent Events; a client that
+# falls STREAM_QUEUE_SIZE events behind is disconnected and catches up on reconnecting
+# from the last STREAM_HISTORY_SIZE events kept by its worker
+STREAM_QUEUE_SIZE = int(os.getenv("STREAM_QUEUE_SIZE", "100"))
+STREAM_HISTORY_SIZE = int(os.getenv("STREAM_HISTORY_SIZE", "1000"))
+# a comment is sent this often on an idle stream so proxies keep it open
+STREAM_HEARTBEAT_SECONDS = float(os.getenv("STREAM_HEARTBEAT_SECONDS", "15"))
+# clients are told to wait this long before reconnecting
+STREAM_RETRY_MILLISECONDS = int(os.getenv("STREAM_RETRY_MILLISECONDS", "3000"))
+# streams per worker process; more are refused with a 503
+STREAM_MAX_SUBSCRIBERS = int(os.getenv("STREAM_MAX_SUBSCRIBERS", "1000"))
@@ -8,19 +8,30 @@ Email: mcardle-j9@ulster.ac.uk
 B-No: B00733578
 """
 
+import hmac
 import logging
 import requests
 from functools import wraps
 from flask import request, jsonify, make_response, g
-from typing import Callable, Any
+from typing import Callable, Any, Dict, Optional
 import jwt
-from config import FLASK_SECRET_KEY
+from config import ADMIN_TOKEN, AUTH_SERVICE_URL, FLASK_SECRET_KEY
+from idempotency import (
+    COMPLETED,
+    IDEMPOTENCY_HEADER,
+    MAX_KEY_LENGTH,
+    claim,
+    finish,
+    release,
+    request_fingerprint,
+    scoped_key,
+)
+from metrics import REJECTED_REQUESTS, timed
+from rate_limit import check_rate_limit, client_ip
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-AUTH_SERVICE_URL = "http://localhost:5001/api/v1/validate-token"
-
 
 def auth_required(func: Callable) -> Callable:
     """
@@ -38,50 +49,214 @@ def auth_required(func: Callable) -> Callable:
     """
     @wraps(func)
     def auth_required_wrapper(*args: Any, **kwargs: Any) -> Any:
-        token = request.headers.get("x-access-token")
-        if not token:
-            logger.warning("Unauthorized access attempt: Token is missing.")
-            return make_response(
-                jsonify({"Unauthorized": "Token is missing."}), 401
-            )
-       
-        if not token:
-            logger.warning("Unauthorized access attempt: Token is missing.")
-            return make_response(
-                jsonify({"Unauthorized": "Token is missing."}), 401
-            )
-        
-        try:
-            data = jwt.decode(token, FLASK_SECRET_KEY, algorithms=["HS256"])
-            g.user_id = data["user_id"]
-        except jwt.InvalidTokenError as e:
-            logger.warning(
-                f"Unauthorized access attempt: Invalid token. Error: {str(e)}"
-            )
-            return make_response(
-                jsonify({"Unauthorized": "Token is invalid."}), 401
-            )
+        error_response = _validate_request_token()
+        if error_response is not None:
+            return error_response
+        return func(*args, **kwargs)
 
-        try:
-            response = requests.post(
-                AUTH_SERVICE_URL, json={"token": token}, timeout=5
-            )
-            response.raise_for_status() 
-        except requests.RequestException as e:
-            logger.error(f"Error validating token: {str(e)}")
+    return auth_required_wrapper
+
+
+def is_admin_token(token: str) -> bool:
+    """
+    Check an x-admin-token header against ADMIN_TOKEN.
+
+    Args:
+        token (str): The header's value, empty if it was not sent.
+
+    Returns:
+        bool: True if admin routes are enabled and the token matches.
+    """
+    return bool(ADMIN_TOKEN) and hmac.compare_digest(token, ADMIN_TOKEN)
+
+
+def admin_required(func: Callable) -> Callable:
+    """
+    Decorator to restrict Flask routes to operators holding the admin token.
+
+    The x-admin-token header must match ADMIN_TOKEN. Admin routes are disabled
+    entirely when ADMIN_TOKEN is not configured.
+
+    Args:
+        func (Callable): The Flask route function to be decorated.
+
+    Returns:
+        Callable: The decorated function with the admin token check.
+    """
+    @wraps(func)
+    def admin_required_wrapper(*args: Any, **kwargs: Any) -> Any:
+        if not ADMIN_TOKEN:
+            logger.warning("Admin access attempt while admin routes are disabled.")
             return make_response(
-                jsonify({"Unauthorized": "Error validating token."}), 500
+                jsonify({"Forbidden": "Admin routes are disabled."}), 403
             )
 
-        if response.status_code != 200:
-            logger.warning(
-                f"Unauthorized access attempt: {response.json().get('message', 'Unknown error')}"
-            )
+        if not is_admin_token(request.headers.get("x-admin-token", "")):
+            logger.warning("Unauthorized admin access attempt.")
             return make_response(
-                jsonify(response.json()), response.status_code
+                jsonify({"Unauthorized": "Admin token is invalid."}), 401
             )
-        
-        
+
         return func(*args, **kwargs)
 
-    return auth_required_wrapper
+    return admin_required_wrapper
+
+
+def rate_limited(scope: str) -> Callable[[Callable], Callable]:
+    """
+    Decorator to apply the token-bucket limits of a scope to a Flask route.
+
+    Placed below auth_required so that the limits apply to g.user_id as well as the
+    client's IP. Rejected requests get a 429 with a Retry-After header before the route
+    does any work.
+
+    Args:
+        scope (str): The limited scope, a key of RATE_LIMITS.
+
+    Returns:
+        Callable[[Callable], Callable]: The decorator.
+    """
+    def decorator(func: Callable) -> Callable:
+        @wraps(func)
+        def rate_limited_wrapper(*args: Any, **kwargs: Any) -> Any:
+            retry_after = check_rate_limit(
+                scope,
+                g.get("user_id"),
+                client_ip(request.remote_addr, request.headers.get("X-Forwarded-For")),
+            )
+            if retry_after is not None:
+                response = make_response(
+                    jsonify({"Too Many Requests": "Rate limit exceeded, try again later."}), 429
+                )
+                response.headers["Retry-After"] = str(retry_after)
+                return response
+            return func(*args, **kwargs)
+
+        return rate_limited_wrapper
+
+    return decorator
+
+
+def idempotent(scope: str) -> Callable[[Callable], Callable]:
+    """
+    Decorator making a Flask route safe to retry by sending an Idempotency-Key header.
+
+    The first request with a key runs the route and its response is stored; retries with
+    the same key get that response back without the route running again, and a retry
+    arriving while the first is still running waits for it. Placed below auth_required
+    so keys are scoped to g.user_id, and above rate_limited so that replays do not use up
+    the client's limit. Requests without the header are not affected.
+
+    Args:
+        scope (str): The route, qualifying its keys.
+
+    Returns:
+        Callable[[Callable], Callable]: The decorator.
+    """
+    def decorator(func: Callable) -> Callable:
+        @wraps(func)
+        def idempotent_wrapper(*args: Any, **kwargs: Any) -> Any:
+            client_key = request.headers.get(IDEMPOTENCY_HEADER)
+            if client_key is None:
+                return func(*args, **kwargs)
+            if not client_key or len(client_key) > MAX_KEY_LENGTH:
+                return make_response(
+                    jsonify({"Bad Request": f"{IDEMPOTENCY_HEADER} must be 1 to {MAX_KEY_LENGTH} characters."}),
+                    400,
+                )
+
+            key = scoped_key(scope, g.get("user_id"), client_key)
+            fingerprint = request_fingerprint(request.form, request.files)
+            record = claim(key, fingerprint)
+            if record is not None:
+                return _idempotent_replay(scope, record, fingerprint)
+
+            try:
+                response = make_response(func(*args, **kwargs))
+            except Exception:
+                release(key)
+                raise
+            finish(key, response.status_code, response.get_data(as_text=True), response.headers.items())
+            return response
+
+        return idempotent_wrapper
+
+    return decorator
+
+
+def _idempotent_replay(scope: str, record: Dict[str, Any], fingerprint: str) -> Any:
+    """
+    Respond to a request whose Idempotency-Key has already been used.
+
+    Returns:
+        Any: The stored response, or an error if the key belongs to a different request
+        or its request is still running.
+    """
+    if record["fingerprint"] != fingerprint:
+        logger.warning(f"{IDEMPOTENCY_HEADER} reused for a different {scope} request.")
+        return make_response(
+            jsonify({"Unprocessable Entity": f"{IDEMPOTENCY_HEADER} was already used for a different request."}),
+            422,
+        )
+    if record["state"] != COMPLETED:
+        REJECTED_REQUESTS.labels(scope=scope, reason="idempotency_conflict").inc()
+        response = make_response(
+            jsonify({"Conflict": f"A request with this {IDEMPOTENCY_HEADER} is still in progress."}), 409
+        )
+        response.headers["Retry-After"] = "1"
+        return response
+
+    stored = record["response"]
+    logger.info(f"Replaying {scope} response for a retried request.")
+    response = make_response(stored["body"], stored["status"])
+    response.headers.update(stored["headers"])
+    response.headers["Idempotent-Replayed"] = "true"
+    return response
+
+
+@timed("auth_required")
+def _validate_request_token() -> Optional[Any]:
+    """
+    Validate the JWT token of the current request locally and with the auth service.
+
+    Returns:
+        Optional[Any]: An error response if the token is missing or invalid, otherwise None.
+    """
+    token = request.headers.get("x-access-token")
+    if not token:
+        logger.warning("Unauthorized access attempt: Token is missing.")
+        return make_response(
+            jsonify({"Unauthorized": "Token is missing."}), 401
+        )
+
+    try:
+        data = jwt.decode(token, FLASK_SECRET_KEY, algorithms=["HS256"])
+        g.user_id = data["user_id"]
+    except jwt.InvalidTokenError as e:
+        logger.warning(
+            f"Unauthorized access attempt: Invalid token. Error: {str(e)}"
+        )
+        return make_response(
+            jsonify({"Unauthorized": "Token is invalid."}), 401
+        )
+
+    try:
+        response = requests.post(
+            AUTH_SERVICE_URL, json={"token": token}, timeout=5
+        )
+        response.raise_for_status()
+    except requests.RequestException as e:
+        logger.error(f"Error validating token: {str(e)}")
+        return make_response(
+            jsonify({"Unauthorized": "Error validating token."}), 500
+        )
+
+    if response.status_code != 200:
+        logger.warning(
+            f"Unauthorized access attempt: {response.json().get('message', 'Unknown error')}"
+        )
+        return make_response(
+            jsonify(response.json()), response.status_code
+        )
+
+    return None
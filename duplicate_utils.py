@@ -0,0 +1,322 @@
+"""
+File: duplicate_utils.py
+Author: Jack McArdle
+
+This file is part of CommunityEye.
+
+Email: mcardle-j9@ulster.ac.uk
+B-No: B00733578
+"""
+
+import logging
+import math
+import threading
+import time
+from typing import Dict, Optional, Set, Tuple
+from config import (
+    MONGO_COLLECTION_REPORTS,
+    DUPLICATE_DETECTION_ENABLED,
+    DUPLICATE_RADIUS_METRES,
+    DUPLICATE_WINDOW_DAYS,
+    DUPLICATE_INDEX_REFRESH_SECONDS,
+)
+from clients import DB
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+reports = DB[MONGO_COLLECTION_REPORTS]
+
+EARTH_RADIUS_METRES = 6371000
+METRES_PER_DEGREE_LAT = 111320
+# longitude step of the grid is sized at the northern edge of Northern Ireland,
+# which keeps every cell at least one radius wide across the whole province
+REFERENCE_LATITUDE = 55.5
+
+
+def haversine_metres(lat1: float, lon1: float, lat2: float, lon2: float) -> float:
+    """
+    Calculate the great-circle distance between two points.
+
+    Args:
+        lat1 (float): Latitude of the first point.
+        lon1 (float): Longitude of the first point.
+        lat2 (float): Latitude of the second point.
+        lon2 (float): Longitude of the second point.
+
+    Returns:
+        float: The distance in metres.
+    """
+    phi1, phi2 = math.radians(lat1), math.radians(lat2)
+    d_phi = phi2 - phi1
+    d_lambda = math.radians(lon2 - lon1)
+    a = (
+        math.sin(d_phi / 2) ** 2
+        + math.cos(phi1) * math.cos(phi2) * math.sin(d_lambda / 2) ** 2
+    )
+    return 2 * EARTH_RADIUS_METRES * math.asin(math.sqrt(a))
+
+
+class RecentReportIndex:
+    """
+    In-memory spatial hash of recent unresolved reports.
+
+    Reports are bucketed by category into a grid whose cells are as wide as the
+    duplicate radius, so a lookup only inspects the 3x3 block of cells around a
+    point. The index is loaded from the reports collection on first use and then
+    topped up incrementally from the newest created_at it has seen.
+    """
+
+    def __init__(
+        self, radius_metres: float, window_seconds: float, refresh_seconds: int
+    ):
+        self.radius_metres = radius_metres
+        self.window_seconds = window_seconds
+        self.refresh_seconds = refresh_seconds
+        self._lat_step = radius_metres / METRES_PER_DEGREE_LAT
+        self._lon_step = radius_metres / (
+            METRES_PER_DEGREE_LAT * math.cos(math.radians(REFERENCE_LATITUDE))
+        )
+        self._lock = threading.Lock()
+        self._cells: Dict[Tuple[str, int, int], Dict[str, Tuple[float, float, int]]] = {}
+        self._locations: Dict[str, Tuple[str, int, int]] = {}
+        self._loaded = False
+        self._watermark = 0
+        self._last_refresh = 0.0
+        self._refreshing = False
+        self._generation = 0
+        # reports discarded while a refresh is in flight, which it must not add back
+        self._discarded: Set[str] = set()
+        self.checks = 0
+        self.hits = 0
+        self.stale_hits = 0
+
+    def _cell(self, category: str, lat: float, lon: float) -> Tuple[str, int, int]:
+        return (
+            category,
+            math.floor(lat / self._lat_step),
+            math.floor(lon / self._lon_step),
+        )
+
+    def _insert(self, report_id: str, category: str, lat: float, lon: float, created_at: int) -> None:
+        cell = self._cell(category, lat, lon)
+        self._cells.setdefault(cell, {})[report_id] = (lat, lon, created_at)
+        self._locations[report_id] = cell
+        self._watermark = max(self._watermark, created_at)
+
+    def _remove(self, report_id: str) -> None:
+        cell = self._locations.pop(report_id, None)
+        if cell is None:
+            return
+        bucket = self._cells.get(cell)
+        if bucket is not None:
+            bucket.pop(report_id, None)
+            if not bucket:
+                del self._cells[cell]
+
+    def _start_refresh(self, now: float) -> Optional[Tuple[int, int, int]]:
+        """
+        Claim the next refresh if one is due and none is running.
+
+        Must be called with the lock held.
+
+        Args:
+            now (float): The current Unix timestamp.
+
+        Returns:
+            Optional[Tuple[int, int, int]]: The cutoff, the created_at to load from and the
+            generation of the index, or None if no refresh should run.
+        """
+        if self._refreshing or (self._loaded and now - self._last_refresh < self.refresh_seconds):
+            return None
+        self._refreshing = True
+        self._discarded.clear()
+        cutoff = int(now - self.window_seconds)
+        since = max(cutoff, self._watermark) if self._loaded else cutoff
+        return cutoff, since, self._generation
+
+    def _refresh(self, now: float, cutoff: int, since: int, generation: int) -> None:
+        """
+        Load reports created since the watermark and evict expired ones.
+
+        The query runs without the lock, so lookups carry on against the current index
+        while it is in flight; its results are applied under the lock.
+
+        Args:
+            now (float): The current Unix timestamp.
+            cutoff (int): The oldest created_at to keep.
+            since (int): The created_at to load from.
+            generation (int): The generation of the index when the refresh was claimed.
+        """
+        try:
+            loaded = list(reports.find(
+                {"resolved": False, "created_at": {"$gte": since}},
+                {"category": 1, "geolocation.geometry.coordinates": 1, "created_at": 1},
+            ))
+        except Exception:
+            with self._lock:
+                self._refreshing = False
+            raise
+
+        with self._lock:
+            self._refreshing = False
+            if generation != self._generation:
+                # invalidated meanwhile, so the next lookup loads it again
+                return
+            for report in loaded:
+                report_id = str(report["_id"])
+                # resolved or deleted while the query was in flight
+                if report_id in self._discarded:
+                    continue
+                lat, lon = report["geolocation"]["geometry"]["coordinates"]
+                self._insert(report_id, report["category"], lat, lon, report["created_at"])
+            self._discarded.clear()
+
+            expired = [
+                report_id
+                for report_id, cell in self._locations.items()
+                if self._cells[cell][report_id][2] < cutoff
+            ]
+            for report_id in expired:
+                self._remove(report_id)
+
+            self._loaded = True
+            self._last_refresh = now
+
+    def add(self, report: Dict) -> None:
+        """
+        Add a newly created report to the index.
+
+        Args:
+            report (Dict): The inserted report document.
+        """
+        lat, lon = report["geolocation"]["geometry"]["coordinates"]
+        with self._lock:
+            if self._loaded:
+                self._insert(
+                    str(report["_id"]), report["category"], lat, lon, report["created_at"]
+                )
+
+    def discard(self, report_id: str) -> None:
+        """
+        Remove a report that has been resolved or deleted.
+
+        Args:
+            report_id (str): The ID of the report.
+        """
+        with self._lock:
+            self._remove(report_id)
+            if self._refreshing:
+                self._discarded.add(report_id)
+
+    def invalidate(self) -> None:
+        """
+        Drop the index so that it is fully reloaded on the next lookup.
+        """
+        with self._lock:
+            self._cells.clear()
+            self._locations.clear()
+            self._loaded = False
+            self._watermark = 0
+            self._generation += 1
+
+    def find_nearby(self, category: str, lat: float, lon: float) -> Optional[str]:
+        """
+        Find the closest recent unresolved report of the same category.
+
+        Args:
+            category (str): The category of the new report.
+            lat (float): Latitude of the new report.
+            lon (float): Longitude of the new report.
+
+        Returns:
+            Optional[str]: The ID of the matching report, or None if there is none.
+        """
+        now = time.time()
+        cutoff = now - self.window_seconds
+        with self._lock:
+            refresh = self._start_refresh(now)
+        if refresh is not None:
+            self._refresh(now, *refresh)
+
+        with self._lock:
+            self.checks += 1
+            _, row, col = self._cell(category, lat, lon)
+            best_id, best_distance = None, self.radius_metres
+            for d_row in (-1, 0, 1):
+                for d_col in (-1, 0, 1):
+                    bucket = self._cells.get((category, row + d_row, col + d_col))
+                    if not bucket:
+                        continue
+                    for report_id, (other_lat, other_lon, created_at) in bucket.items():
+                        if created_at < cutoff:
+                            continue
+                        distance = haversine_metres(lat, lon, other_lat, other_lon)
+                        if distance <= best_distance:
+                            best_id, best_distance = report_id, distance
+
+            if best_id is not None:
+                self.hits += 1
+            return best_id
+
+    def record_stale_hit(self, report_id: str) -> None:
+        """
+        Record that a match turned out to be resolved or deleted, and drop it.
+
+        Args:
+            report_id (str): The ID of the stale report.
+        """
+        with self._lock:
+            self.stale_hits += 1
+            self.hits -= 1
+            self._remove(report_id)
+            if self._refreshing:
+                self._discarded.add(report_id)
+
+    def get_stats(self) -> Dict[str, float]:
+        """
+        Retrieve the configuration and hit rate of the index.
+
+        Returns:
+            Dict[str, float]: Thresholds, index size, and check/hit counters.
+        """
+        with self._lock:
+            return {
+                "enabled": DUPLICATE_DETECTION_ENABLED,
+                "radius_metres": self.radius_metres,
+                "window_days": self.window_seconds / 86400,
+                "indexed_reports": len(self._locations),
+                "checks": self.checks,
+                "hits": self.hits,
+                "stale_hits": self.stale_hits,
+                "hit_rate": round(self.hits / self.checks, 4) if self.checks else 0.0,
+            }
+
+
+recent_reports = RecentReportIndex(
+    radius_metres=DUPLICATE_RADIUS_METRES,
+    window_seconds=DUPLICATE_WINDOW_DAYS * 86400,
+    refresh_seconds=DUPLICATE_INDEX_REFRESH_SECONDS,
+)
+
+
+def find_duplicate_report(category: str, geolocation: Dict[str, float]) -> Optional[str]:
+    """
+    Check for an existing unresolved report of the same category nearby.
+
+    Args:
+        category (str): The category of the new report.
+        geolocation (Dict[str, float]): A dictionary containing 'Lon' and 'Lat' keys.
+
+    Returns:
+        Optional[str]: The ID of the existing report, or None if the report is not a duplicate.
+    """
+    if not DUPLICATE_DETECTION_ENABLED:
+        return None
+    try:
+        return recent_reports.find_nearby(
+            category, geolocation["Lat"], geolocation["Lon"]
+        )
+    except Exception as e:
+        logger.error(f"Error checking for duplicate reports: {e}")
+        return None
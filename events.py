@@ -0,0 +1,384 @@
+"""
+File: events.py
+Author: Jack McArdle
+
+This file is part of CommunityEye.
+
+Email: mcardle-j9@ulster.ac.uk
+B-No: B00733578
+"""
+
+import asyncio
+import json
+import logging
+import queue
+import threading
+import time
+import uuid
+from collections import deque
+from typing import Any, AsyncIterator, Dict, Iterator, List, Optional, Tuple
+from config import (
+    STREAM_HEARTBEAT_SECONDS,
+    STREAM_HISTORY_SIZE,
+    STREAM_MAX_SUBSCRIBERS,
+    STREAM_QUEUE_SIZE,
+    STREAM_RETRY_MILLISECONDS,
+)
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+EVENT_TYPES = ("created", "resolved", "upvoted", "deleted")
+# sent to a client that cannot be brought up to date from the history, so it fetches the reports again
+RESET_EVENT = "reset"
+HEARTBEAT = ": keepalive\n\n"
+
+
+def report_summary(report: Dict, **changes: Any) -> Dict[str, Any]:
+    """
+    Build the part of a report sent with its events, enough to update a dashboard.
+
+    Args:
+        report (Dict): The report, as read or written by the handler.
+        **changes: Fields that changed after the report was read, e.g. resolved.
+
+    Returns:
+        Dict[str, Any]: The report's summary.
+    """
+    coordinates = report.get("geolocation", {}).get("geometry", {}).get("coordinates")
+    if not coordinates or len(coordinates) != 2:
+        coordinates = (None, None)
+    return {
+        "id": str(report["_id"]),
+        "authority": report.get("authority"),
+        "category": report.get("category"),
+        # stored as [Lat, Lon]
+        "latitude": coordinates[0],
+        "longitude": coordinates[1],
+        "resolved": bool(report.get("resolved")),
+        "upvote_count": report.get("upvote_count", 0),
+        **changes,
+    }
+
+
+def parse_stream_args(args: Any) -> Tuple[Optional[str], Dict[str, Any]]:
+    """
+    Validate the stream endpoint's filters.
+
+    Args:
+        args (Any): The request's query parameters.
+
+    Returns:
+        Tuple[Optional[str], Dict[str, Any]]: An error message if they are unusable, and
+        the authority and bbox (min_lon, min_lat, max_lon, max_lat) to filter by.
+    """
+    filters: Dict[str, Any] = {"authority": args.get("authority") or None, "bbox": None}
+    if args.get("bbox"):
+        try:
+            min_lon, min_lat, max_lon, max_lat = (float(value) for value in args["bbox"].split(","))
+        except ValueError:
+            return "bbox must be min_lon,min_lat,max_lon,max_lat", {}
+        if min_lon > max_lon or min_lat > max_lat:
+            return "bbox minimums must not exceed its maximums", {}
+        filters["bbox"] = (min_lon, min_lat, max_lon, max_lat)
+    return None, filters
+
+
+def matches(event: Dict[str, Any], filters: Dict[str, Any]) -> bool:
+    """
+    Whether an event passes a subscriber's filters.
+
+    Args:
+        event (Dict[str, Any]): The event.
+        filters (Dict[str, Any]): The authority and bbox, either of which may be None.
+
+    Returns:
+        bool: True if the subscriber should receive it.
+    """
+    report = event["data"]
+    if filters.get("authority") and report["authority"] != filters["authority"]:
+        return False
+    if filters.get("bbox"):
+        if report["latitude"] is None:
+            return False
+        min_lon, min_lat, max_lon, max_lat = filters["bbox"]
+        return min_lon <= report["longitude"] <= max_lon and min_lat <= report["latitude"] <= max_lat
+    return True
+
+
+def format_event(event: Dict[str, Any]) -> str:
+    """
+    Encode an event as a Server-Sent Event.
+
+    Args:
+        event (Dict[str, Any]): The event.
+
+    Returns:
+        str: The event's id, type and JSON data lines.
+    """
+    return f"id: {event['id']}\nevent: {event['type']}\ndata: {json.dumps(event['data'])}\n\n"
+
+
+class Subscription:
+    """
+    A subscriber's bounded queue of events.
+
+    Synchronous subscribers block on a thread-safe queue. Asynchronous subscribers wait on
+    an asyncio queue, which events are handed to through the subscriber's event loop, so an
+    idle connection holds no thread. A subscriber that falls STREAM_QUEUE_SIZE events behind
+    is marked overflowed and drops every later event, so once it has sent what is queued
+    its client can reconnect and catch up from the history without a gap.
+    """
+
+    def __init__(
+        self,
+        filters: Dict[str, Any],
+        max_queued: int = STREAM_QUEUE_SIZE,
+        loop: Optional[asyncio.AbstractEventLoop] = None,
+    ):
+        self.filters = filters
+        self.overflowed = False
+        # events up to this sequence number were replayed from the history
+        self.replayed_to = 0
+        self._loop = loop
+        self._queue: Any = asyncio.Queue(max_queued) if loop is not None else queue.Queue(max_queued)
+
+    @property
+    def finished(self) -> bool:
+        """
+        Whether the subscriber overflowed and has taken every event queued before it did.
+        """
+        return self.overflowed and self._queue.empty()
+
+    def deliver(self, event: Dict[str, Any]) -> None:
+        """
+        Queue an event from the publishing thread.
+
+        Raises:
+            RuntimeError: If the subscriber's event loop has closed.
+        """
+        if self._loop is None:
+            self._put(event)
+        else:
+            self._loop.call_soon_threadsafe(self._put, event)
+
+    def _put(self, event: Dict[str, Any]) -> None:
+        if self.overflowed:
+            return
+        try:
+            self._queue.put_nowait(event)
+        except (queue.Full, asyncio.QueueFull):
+            self.overflowed = True
+
+    def get(self, timeout: float) -> Optional[Dict[str, Any]]:
+        """
+        Wait for the next event.
+
+        Args:
+            timeout (float): The most seconds to wait.
+
+        Returns:
+            Optional[Dict[str, Any]]: The event, or None if none arrived in time.
+        """
+        try:
+            event = self._queue.get(timeout=timeout)
+        except queue.Empty:
+            return None
+        return event if event["sequence"] > self.replayed_to else self.get(timeout)
+
+    async def get_async(self, timeout: float) -> Optional[Dict[str, Any]]:
+        """
+        Wait for the next event without blocking the event loop.
+
+        Args:
+            timeout (float): The most seconds to wait.
+
+        Returns:
+            Optional[Dict[str, Any]]: The event, or None if none arrived in time.
+        """
+        try:
+            event = await asyncio.wait_for(self._queue.get(), timeout)
+        except asyncio.TimeoutError:
+            return None
+        return event if event["sequence"] > self.replayed_to else await self.get_async(timeout)
+
+
+class EventBroker:
+    """
+    In-process publish/subscribe of report events.
+
+    Every event gets an ID made of this broker's epoch, unique to the process, and a
+    sequence number. The last STREAM_HISTORY_SIZE events are kept so that a client
+    reconnecting with the ID of the last event it saw is sent the ones it missed.
+    """
+
+    def __init__(self, history_size: int = STREAM_HISTORY_SIZE, max_subscribers: int = STREAM_MAX_SUBSCRIBERS):
+        self.epoch = uuid.uuid4().hex[:12]
+        self.max_subscribers = max_subscribers
+        self._lock = threading.Lock()
+        self._sequence = 0
+        self._history: "deque[Dict[str, Any]]" = deque(maxlen=history_size)
+        self._subscribers: List[Subscription] = []
+
+    def publish(self, event_type: str, report: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        Send an event to every subscriber whose filters it passes.
+
+        Args:
+            event_type (str): One of EVENT_TYPES.
+            report (Dict[str, Any]): The report's summary, from report_summary.
+
+        Returns:
+            Dict[str, Any]: The event.
+        """
+        with self._lock:
+            self._sequence += 1
+            event = {
+                "id": f"{self.epoch}-{self._sequence}",
+                "sequence": self._sequence,
+                "type": event_type,
+                "data": {**report, "at": int(time.time())},
+            }
+            self._history.append(event)
+            subscribers = list(self._subscribers)
+        for subscriber in subscribers:
+            if not matches(event, subscriber.filters):
+                continue
+            try:
+                subscriber.deliver(event)
+            except RuntimeError:
+                # the subscriber's event loop has gone without unsubscribing
+                self.unsubscribe(subscriber)
+        return event
+
+    def subscribe(
+        self, filters: Dict[str, Any], loop: Optional[asyncio.AbstractEventLoop] = None
+    ) -> Optional[Subscription]:
+        """
+        Start receiving events.
+
+        Args:
+            filters (Dict[str, Any]): The authority and bbox to filter by.
+            loop (Optional[asyncio.AbstractEventLoop]): The event loop of an asynchronous subscriber.
+
+        Returns:
+            Optional[Subscription]: The subscription, or None if STREAM_MAX_SUBSCRIBERS are connected.
+        """
+        subscription = Subscription(filters, loop=loop)
+        with self._lock:
+            if len(self._subscribers) >= self.max_subscribers:
+                return None
+            self._subscribers.append(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription: Subscription) -> None:
+        with self._lock:
+            if subscription in self._subscribers:
+                self._subscribers.remove(subscription)
+
+    def open(
+        self,
+        filters: Dict[str, Any],
+        last_event_id: Optional[str] = None,
+        loop: Optional[asyncio.AbstractEventLoop] = None,
+    ) -> Tuple[Optional[Subscription], List[str]]:
+        """
+        Subscribe a client, bringing it up to date if it is reconnecting.
+
+        Args:
+            filters (Dict[str, Any]): The authority and bbox to filter by.
+            last_event_id (Optional[str]): The Last-Event-ID the client sent, if any.
+            loop (Optional[asyncio.AbstractEventLoop]): The event loop of an asynchronous subscriber.
+
+        Returns:
+            Tuple[Optional[Subscription], List[str]]: The subscription, None if
+            STREAM_MAX_SUBSCRIBERS are connected, and what to send before its events: the
+            retry interval and either the events missed since last_event_id or, if they are
+            no longer all kept, e.g. because it came from another process, a reset event.
+        """
+        subscription = self.subscribe(filters, loop)
+        if subscription is None:
+            return None, []
+        opening = [f"retry: {STREAM_RETRY_MILLISECONDS}\n\n"]
+        if not last_event_id:
+            return subscription, opening
+
+        with self._lock:
+            history = list(self._history)
+            sequence = self._sequence
+        epoch, _, last = last_event_id.partition("-")
+        oldest = history[0]["sequence"] if history else sequence + 1
+        if epoch != self.epoch or not last.isdigit() or int(last) + 1 < oldest:
+            opening.append(f"id: {self.epoch}-{sequence}\nevent: {RESET_EVENT}\ndata: {{}}\n\n")
+        else:
+            opening.extend(
+                format_event(event) for event in history
+                if event["sequence"] > int(last) and matches(event, filters)
+            )
+        # anything published since subscribing is queued too, but was just sent
+        subscription.replayed_to = sequence
+        return subscription, opening
+
+    def subscriber_count(self) -> int:
+        with self._lock:
+            return len(self._subscribers)
+
+
+report_events = EventBroker()
+
+
+def publish_report_event(event_type: str, report: Dict, **changes: Any) -> None:
+    """
+    Tell stream subscribers about a change to a report.
+
+    Args:
+        event_type (str): One of EVENT_TYPES.
+        report (Dict): The report, as read or written by the handler.
+        **changes: Fields that changed after the report was read, e.g. resolved.
+    """
+    report_events.publish(event_type, report_summary(report, **changes))
+
+
+def event_stream(subscription: Subscription, opening: List[str], broker: EventBroker) -> Iterator[str]:
+    """
+    Produce a subscriber's Server-Sent Events, blocking the calling thread while idle.
+
+    Args:
+        subscription (Subscription): The subscription, from EventBroker.open.
+        opening (List[str]): What to send before its events.
+        broker (EventBroker): The broker it is subscribed to.
+
+    Yields:
+        str: Events, and a heartbeat every STREAM_HEARTBEAT_SECONDS without one.
+    """
+    try:
+        yield from opening
+        while not subscription.finished:
+            event = subscription.get(STREAM_HEARTBEAT_SECONDS)
+            yield format_event(event) if event is not None else HEARTBEAT
+    finally:
+        broker.unsubscribe(subscription)
+
+
+async def event_stream_async(
+    subscription: Subscription, opening: List[str], broker: EventBroker
+) -> AsyncIterator[str]:
+    """
+    Produce a subscriber's Server-Sent Events on the event loop, holding no thread while idle.
+
+    Args:
+        subscription (Subscription): The subscription, from EventBroker.open with the running loop.
+        opening (List[str]): What to send before its events.
+        broker (EventBroker): The broker it is subscribed to.
+
+    Yields:
+        str: Events, and a heartbeat every STREAM_HEARTBEAT_SECONDS without one.
+    """
+    try:
+        for line in opening:
+            yield line
+        while not subscription.finished:
+            event = await subscription.get_async(STREAM_HEARTBEAT_SECONDS)
+            yield format_event(event) if event is not None else HEARTBEAT
+    finally:
+        broker.unsubscribe(subscription)
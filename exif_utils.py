@@ -0,0 +1,376 @@
+"""
+File: exif_utils.py
+Author: Jack McArdle
+
+This file is part of CommunityEye.
+
+Email: mcardle-j9@ulster.ac.uk
+B-No: B00733578
+"""
+
+import logging
+import struct
+from typing import Any, BinaryIO, Dict, List, Optional, Tuple
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# EXIF blocks larger than this are not read; a JPEG APP1 segment is at most 64KB
+MAX_EXIF_BYTES = 4 * 1024 * 1024
+# HEIF metadata boxes larger than this are not read
+MAX_META_BYTES = 1024 * 1024
+
+EXIF_HEADER = b"Exif\x00\x00"
+GPSINFO_TAG = 0x8825
+GPS_TAGS = (1, 2, 3, 4)  # GPSLatitudeRef, GPSLatitude, GPSLongitudeRef, GPSLongitude
+HEIF_BRANDS = {b"heic", b"heix", b"heim", b"heis", b"hevc", b"hevx", b"mif1", b"msf1", b"avif"}
+
+TIFF_ASCII = 2
+TIFF_LONG = 4
+TIFF_RATIONAL = 5
+TIFF_IFD = 13
+
+
+class UnsupportedImageFormat(Exception):
+    """
+    Raised when an image is neither a JPEG nor a HEIF file, so the caller must fall back
+    to decoding it with Pillow.
+    """
+
+
+class _Malformed(Exception):
+    pass
+
+
+def read_gps_info(stream: BinaryIO) -> Optional[Dict[int, Any]]:
+    """
+    Read the GPS position tags of a JPEG or HEIF image without decoding any pixels.
+
+    Only the JPEG APP1 segment, or the HEIF metadata box and Exif item, are read from the
+    stream; everything else is skipped over. The stream is rewound before returning.
+
+    Args:
+        stream (BinaryIO): The seekable image stream.
+
+    Returns:
+        Optional[Dict[int, Any]]: GPSLatitudeRef, GPSLatitude, GPSLongitudeRef and
+        GPSLongitude keyed by tag as in Pillow's GPS IFD, or None if the image has no
+        valid GPS position.
+
+    Raises:
+        UnsupportedImageFormat: If the image is neither a JPEG nor a HEIF file.
+    """
+    stream.seek(0)
+    try:
+        head = stream.read(12)
+        if head[:2] == b"\xff\xd8":
+            tiff = _jpeg_exif(stream)
+        elif head[4:8] == b"ftyp" and _is_heif(stream, head):
+            tiff = _heif_exif(stream)
+        else:
+            raise UnsupportedImageFormat()
+        return None if tiff is None else _gps_ifd(tiff)
+    except (_Malformed, struct.error, IndexError, OverflowError, ValueError) as e:
+        logger.warning(f"Malformed EXIF data: {e}")
+        return None
+    finally:
+        stream.seek(0)
+
+
+def _read_exact(stream: BinaryIO, size: int) -> bytes:
+    data = stream.read(size)
+    if len(data) != size:
+        raise _Malformed("truncated")
+    return data
+
+
+def _jpeg_exif(stream: BinaryIO) -> Optional[bytes]:
+    """
+    Walk the JPEG marker segments up to the start of scan, returning the TIFF data of the
+    first EXIF APP1 segment.
+    """
+    stream.seek(2)
+    while True:
+        marker = stream.read(2)
+        if len(marker) < 2 or marker[0] != 0xFF:
+            return None
+        # fill bytes may pad a marker
+        while marker[1] == 0xFF:
+            marker = marker[1:] + _read_exact(stream, 1)
+        # start of scan or end of image: the metadata segments have all been passed
+        if marker[1] in (0xDA, 0xD9):
+            return None
+        # standalone markers carry no length
+        if 0xD0 <= marker[1] <= 0xD7 or marker[1] == 0x01:
+            continue
+        (length,) = struct.unpack(">H", _read_exact(stream, 2))
+        if length < 2:
+            raise _Malformed("segment length")
+        if marker[1] == 0xE1 and length >= 2 + len(EXIF_HEADER):
+            segment = _read_exact(stream, length - 2)
+            if segment.startswith(EXIF_HEADER):
+                return segment[len(EXIF_HEADER):]
+            continue
+        stream.seek(length - 2, 1)
+
+
+def _is_heif(stream: BinaryIO, head: bytes) -> bool:
+    (size,) = struct.unpack(">I", head[:4])
+    if size < 16 or size > 4096:
+        return False
+    ftyp = head[8:12] + _read_exact(stream, size - 12)
+    # major brand, minor version, then the compatible brands
+    brands = {ftyp[0:4]} | {ftyp[i:i + 4] for i in range(8, len(ftyp) - 3, 4)}
+    return bool(brands & HEIF_BRANDS)
+
+
+def _boxes(data: bytes, start: int = 0, end: Optional[int] = None) -> List[Tuple[bytes, int, int]]:
+    """
+    Split ISO base media boxes held in memory into (type, payload start, payload end).
+    """
+    end = len(data) if end is None else end
+    boxes = []
+    offset = start
+    while offset + 8 <= end:
+        size, kind = struct.unpack_from(">I4s", data, offset)
+        header = 8
+        if size == 1:
+            (size,) = struct.unpack_from(">Q", data, offset + 8)
+            header = 16
+        elif size == 0:
+            size = end - offset
+        if size < header or offset + size > end:
+            raise _Malformed(f"box {kind!r}")
+        boxes.append((kind, offset + header, offset + size))
+        offset += size
+    return boxes
+
+
+def _heif_exif(stream: BinaryIO) -> Optional[bytes]:
+    """
+    Find the HEIF metadata box, locate its Exif item and read it, returning its TIFF data.
+    """
+    meta = _find_meta(stream)
+    if meta is None:
+        return None
+    # meta is a full box: version and flags come before its children
+    children = {kind: (start, end) for kind, start, end in _boxes(meta, 4)}
+    if b"iinf" not in children or b"iloc" not in children:
+        return None
+    item_id = _exif_item_id(meta, *children[b"iinf"])
+    if item_id is None:
+        return None
+    location = _item_location(meta, *children[b"iloc"], item_id)
+    if location is None:
+        return None
+
+    construction_method, extents = location
+    if sum(length for _, length in extents) > MAX_EXIF_BYTES:
+        raise _Malformed("Exif item too large")
+    if construction_method == 1:
+        if b"idat" not in children:
+            raise _Malformed("missing idat")
+        idat_start, idat_end = children[b"idat"]
+        parts = []
+        for offset, length in extents:
+            if idat_start + offset + length > idat_end:
+                raise _Malformed("idat extent")
+            parts.append(meta[idat_start + offset:idat_start + offset + length])
+    elif construction_method == 0:
+        parts = []
+        for offset, length in extents:
+            stream.seek(offset)
+            parts.append(_read_exact(stream, length))
+    else:
+        return None
+    item = b"".join(parts)
+
+    # the Exif item starts with the offset of the TIFF header past any "Exif\0\0" prefix
+    (tiff_offset,) = struct.unpack_from(">I", item)
+    if 4 + tiff_offset >= len(item):
+        raise _Malformed("Exif item header")
+    tiff = item[4 + tiff_offset:]
+    # some writers leave the prefix in place with an offset of zero
+    return tiff[len(EXIF_HEADER):] if tiff.startswith(EXIF_HEADER) else tiff
+
+
+def _find_meta(stream: BinaryIO) -> Optional[bytes]:
+    """
+    Read the payload of the top-level meta box, skipping every other box.
+    """
+    stream.seek(0)
+    while True:
+        header = stream.read(8)
+        if len(header) < 8:
+            return None
+        size, kind = struct.unpack(">I4s", header)
+        header_size = 8
+        if size == 1:
+            (size,) = struct.unpack(">Q", _read_exact(stream, 8))
+            header_size = 16
+        if size != 0 and size < header_size:
+            raise _Malformed(f"box {kind!r}")
+        if kind == b"meta":
+            if size == 0 or size - header_size > MAX_META_BYTES:
+                raise _Malformed("meta box size")
+            return _read_exact(stream, size - header_size)
+        # a box running to the end of the file is the last one
+        if size == 0:
+            return None
+        stream.seek(size - header_size, 1)
+
+
+def _exif_item_id(meta: bytes, start: int, end: int) -> Optional[int]:
+    """
+    Find the ID of the Exif item in an item info (iinf) box.
+    """
+    version = meta[start]
+    count_size = 2 if version == 0 else 4
+    offset = start + 4 + count_size
+    for kind, entry_start, entry_end in _boxes(meta, offset, end):
+        if kind != b"infe":
+            continue
+        entry_version = meta[entry_start]
+        # item types were added to the item info entry in version 2
+        if entry_version < 2:
+            continue
+        layout = ">H2x4s" if entry_version == 2 else ">I2x4s"
+        if entry_start + 4 + struct.calcsize(layout) > entry_end:
+            raise _Malformed("infe")
+        item_id, item_type = struct.unpack_from(layout, meta, entry_start + 4)
+        if item_type == b"Exif":
+            return item_id
+    return None
+
+
+def _read_uint(data: bytes, offset: int, size: int) -> int:
+    if size == 0:
+        return 0
+    if size not in (4, 8):
+        raise _Malformed(f"field size {size}")
+    return struct.unpack_from(">I" if size == 4 else ">Q", data, offset)[0]
+
+
+def _item_location(
+    meta: bytes, start: int, end: int, item_id: int
+) -> Optional[Tuple[int, List[Tuple[int, int]]]]:
+    """
+    Find an item's construction method and its (offset, length) extents in an item
+    location (iloc) box.
+    """
+    version = meta[start]
+    if version > 2:
+        return None
+    sizes = meta[start + 4]
+    offset_size, length_size = sizes >> 4, sizes & 0x0F
+    sizes = meta[start + 5]
+    base_offset_size = sizes >> 4
+    index_size = sizes & 0x0F if version in (1, 2) else 0
+    offset = start + 6
+    if version < 2:
+        (item_count,) = struct.unpack_from(">H", meta, offset)
+        offset += 2
+    else:
+        (item_count,) = struct.unpack_from(">I", meta, offset)
+        offset += 4
+
+    for _ in range(item_count):
+        if offset >= end:
+            raise _Malformed("iloc")
+        if version < 2:
+            (current_id,) = struct.unpack_from(">H", meta, offset)
+            offset += 2
+        else:
+            (current_id,) = struct.unpack_from(">I", meta, offset)
+            offset += 4
+        construction_method = 0
+        if version in (1, 2):
+            construction_method = struct.unpack_from(">H", meta, offset)[0] & 0x0F
+            offset += 2
+        # data reference index
+        offset += 2
+        base_offset = _read_uint(meta, offset, base_offset_size)
+        offset += base_offset_size
+        (extent_count,) = struct.unpack_from(">H", meta, offset)
+        offset += 2
+        extents = []
+        for _ in range(extent_count):
+            offset += index_size
+            extent_offset = _read_uint(meta, offset, offset_size)
+            offset += offset_size
+            extent_length = _read_uint(meta, offset, length_size)
+            offset += length_size
+            extents.append((base_offset + extent_offset, extent_length))
+        if current_id == item_id:
+            return construction_method, extents
+    return None
+
+
+def _gps_ifd(tiff: bytes) -> Optional[Dict[int, Any]]:
+    """
+    Read the GPS position tags from TIFF-structured EXIF data.
+    """
+    if tiff[:2] == b"II":
+        order = "<"
+    elif tiff[:2] == b"MM":
+        order = ">"
+    else:
+        raise _Malformed("byte order")
+    magic, ifd0 = struct.unpack_from(order + "HI", tiff, 2)
+    if magic != 42:
+        raise _Malformed("TIFF magic")
+
+    gps_entry = _ifd_entries(tiff, order, ifd0, {GPSINFO_TAG}).get(GPSINFO_TAG)
+    if gps_entry is None:
+        return None
+    kind, count, value_offset = gps_entry
+    if kind not in (TIFF_LONG, TIFF_IFD) or count != 1:
+        raise _Malformed("GPSInfo tag")
+    (gps_offset,) = struct.unpack_from(order + "I", tiff, value_offset)
+
+    entries = _ifd_entries(tiff, order, gps_offset, set(GPS_TAGS))
+    if any(tag not in entries for tag in GPS_TAGS):
+        return None
+    gpsinfo = {}
+    for ref_tag, coords_tag in ((1, 2), (3, 4)):
+        kind, count, value_offset = entries[ref_tag]
+        if kind != TIFF_ASCII or count < 1:
+            raise _Malformed("GPS reference")
+        gpsinfo[ref_tag] = tiff[value_offset:value_offset + count].split(b"\x00")[0].decode("ascii")
+
+        kind, count, value_offset = entries[coords_tag]
+        if kind != TIFF_RATIONAL or count != 3:
+            raise _Malformed("GPS coordinates")
+        values = struct.unpack_from(order + "6I", tiff, value_offset)
+        if 0 in values[1::2]:
+            raise _Malformed("zero denominator")
+        gpsinfo[coords_tag] = tuple(values[i] / values[i + 1] for i in range(0, 6, 2))
+    return gpsinfo
+
+
+def _ifd_entries(tiff: bytes, order: str, offset: int, tags: set) -> Dict[int, Tuple[int, int, int]]:
+    """
+    Read the wanted tags of an IFD as (type, count, offset of the value).
+
+    A value of four bytes or fewer is held in the entry itself, otherwise the entry holds
+    the value's offset.
+    """
+    (count,) = struct.unpack_from(order + "H", tiff, offset)
+    if offset + 2 + count * 12 > len(tiff):
+        raise _Malformed("IFD")
+    type_sizes = {1: 1, 2: 1, 3: 2, 4: 4, 5: 8, 7: 1, 9: 4, 10: 8, 13: 4}
+    entries = {}
+    for i in range(count):
+        entry = offset + 2 + i * 12
+        tag, kind, value_count = struct.unpack_from(order + "HHI", tiff, entry)
+        if tag not in tags or tag in entries:
+            continue
+        size = type_sizes.get(kind, 1) * value_count
+        if size <= 4:
+            value_offset = entry + 8
+        else:
+            (value_offset,) = struct.unpack_from(order + "I", tiff, entry + 8)
+        if value_offset + size > len(tiff):
+            raise _Malformed(f"tag {tag} value")
+        entries[tag] = (kind, value_count, value_offset)
+    return entries
@@ -0,0 +1,367 @@
+"""
+File: export.py
+Author: Jack McArdle
+
+This file is part of CommunityEye.
+
+Email: mcardle-j9@ulster.ac.uk
+B-No: B00733578
+"""
+
+import asyncio
+import logging
+import time
+from typing import Any, AsyncIterator, Dict, Iterable, Iterator, List, Optional, Set, Tuple
+import pyarrow as pa
+import pyarrow.parquet as pq
+from bson import ObjectId
+from config import (
+    EXPORT_BATCH_SIZE,
+    EXPORT_COMPRESSION,
+    EXPORT_LAG_SECONDS,
+    MONGO_COLLECTION_REPORTS,
+)
+from clients import DB
+from metrics import stage_timer
+from watermarks import get_watermark, set_watermark
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+reports = DB[MONGO_COLLECTION_REPORTS]
+
+JOB_NAME = "reports_export"
+EXPORT_FORMATS = ("parquet", "arrow")
+MEDIA_TYPES = {
+    "parquet": "application/vnd.apache.parquet",
+    "arrow": "application/vnd.apache.arrow.stream",
+}
+FILE_EXTENSIONS = {"parquet": "parquet", "arrow": "arrows"}
+# Parquet has no seconds unit, so timestamps are written in milliseconds
+TIMESTAMP = pa.timestamp("ms", tz="UTC")
+EXPORT_SCHEMA = pa.schema([
+    ("id", pa.string()),
+    ("user_id", pa.int64()),
+    ("category", pa.string()),
+    ("authority", pa.string()),
+    ("district", pa.string()),
+    ("ward", pa.string()),
+    ("description", pa.string()),
+    ("latitude", pa.float64()),
+    ("longitude", pa.float64()),
+    ("created_at", TIMESTAMP),
+    ("resolved", pa.bool_()),
+    ("resolved_at", TIMESTAMP),
+    ("upvote_count", pa.int64()),
+])
+EXPORT_PROJECTION = {
+    "user_id": 1,
+    "category": 1,
+    "authority": 1,
+    "locality": 1,
+    "description": 1,
+    "geolocation.geometry.coordinates": 1,
+    "created_at": 1,
+    "resolved": 1,
+    "resolved_at": 1,
+    "upvote_count": 1,
+}
+
+
+def _milliseconds(timestamp: Optional[float]) -> Optional[int]:
+    return None if timestamp is None else int(timestamp * 1000)
+
+
+def to_record_batch(documents: List[Dict]) -> pa.RecordBatch:
+    """
+    Convert reports into one batch of typed columns.
+
+    Args:
+        documents (List[Dict]): The reports, read with EXPORT_PROJECTION.
+
+    Returns:
+        pa.RecordBatch: A row for each report in EXPORT_SCHEMA.
+    """
+    columns: Dict[str, List[Any]] = {name: [] for name in EXPORT_SCHEMA.names}
+    for document in documents:
+        locality = document.get("locality") or {}
+        coordinates = document.get("geolocation", {}).get("geometry", {}).get("coordinates")
+        if not coordinates or len(coordinates) != 2:
+            coordinates = (None, None)
+        columns["id"].append(str(document["_id"]))
+        columns["user_id"].append(document.get("user_id"))
+        columns["category"].append(document.get("category"))
+        columns["authority"].append(document.get("authority"))
+        columns["district"].append(locality.get("district"))
+        columns["ward"].append(locality.get("ward"))
+        columns["description"].append(document.get("description"))
+        # stored as [Lat, Lon]
+        columns["latitude"].append(coordinates[0])
+        columns["longitude"].append(coordinates[1])
+        columns["created_at"].append(_milliseconds(document.get("created_at")))
+        columns["resolved"].append(bool(document.get("resolved")))
+        columns["resolved_at"].append(_milliseconds(document.get("resolved_at")))
+        columns["upvote_count"].append(document.get("upvote_count", 0))
+    return pa.record_batch(
+        [pa.array(columns[field.name], type=field.type) for field in EXPORT_SCHEMA], schema=EXPORT_SCHEMA
+    )
+
+
+class _Chunks:
+    """
+    Write-only file that holds what the writer produced until it is taken.
+    """
+
+    closed = False
+
+    def __init__(self):
+        self._chunks: List[bytes] = []
+
+    def write(self, data: bytes) -> int:
+        self._chunks.append(bytes(data))
+        return len(data)
+
+    def flush(self) -> None:
+        pass
+
+    def take(self) -> bytes:
+        data = b"".join(self._chunks)
+        self._chunks = []
+        return data
+
+
+class ReportExporter:
+    """
+    Streams reports out as a Parquet file or an Arrow IPC stream, a batch at a time.
+
+    Each call to write adds one Parquet row group or Arrow record batch and returns the
+    bytes that are ready, so a response or file can be written while the cursor is read.
+    """
+
+    def __init__(self, format: str = "parquet", compression: str = EXPORT_COMPRESSION):
+        if format not in EXPORT_FORMATS:
+            raise ValueError(f"Unknown export format: {format}")
+        self.format = format
+        self.rows = 0
+        self._sink = _Chunks()
+        if format == "parquet":
+            self._writer = pq.ParquetWriter(self._sink, EXPORT_SCHEMA, compression=compression)
+        else:
+            self._writer = pa.ipc.new_stream(
+                self._sink, EXPORT_SCHEMA, options=pa.ipc.IpcWriteOptions(compression=compression)
+            )
+
+    def write(self, documents: List[Dict]) -> bytes:
+        """
+        Add a batch of reports.
+
+        Args:
+            documents (List[Dict]): The reports, read with EXPORT_PROJECTION.
+
+        Returns:
+            bytes: The output ready to be sent.
+        """
+        if documents:
+            with stage_timer("export.write"):
+                self._writer.write_batch(to_record_batch(documents))
+            self.rows += len(documents)
+        return self._sink.take()
+
+    def close(self) -> bytes:
+        """
+        Finish the file, e.g. with the Parquet footer.
+
+        Returns:
+            bytes: The rest of the output.
+        """
+        self._writer.close()
+        return self._sink.take()
+
+
+def export_query(since: int, until: int) -> Dict:
+    """
+    Build the query for the reports created in (since, until].
+
+    Args:
+        since (int): The created_at watermark of the previous export, 0 for everything.
+        until (int): The newest created_at to include.
+
+    Returns:
+        Dict: The query.
+    """
+    return {"created_at": {"$gt": since, "$lte": until}}
+
+
+def parse_export_args(args: Any) -> Tuple[Optional[str], Dict[str, Any]]:
+    """
+    Validate the export endpoint's query parameters.
+
+    Args:
+        args (Any): The request's query parameters.
+
+    Returns:
+        Tuple[Optional[str], Dict[str, Any]]: An error message if they are unusable, and
+        the format, since and until.
+    """
+    options: Dict[str, Any] = {"format": args.get("format", "parquet")}
+    if options["format"] not in EXPORT_FORMATS:
+        return f"format must be one of {', '.join(EXPORT_FORMATS)}", {}
+    try:
+        options["since"] = int(args.get("since", 0))
+        options["until"] = int(args.get("until", int(time.time()) - EXPORT_LAG_SECONDS))
+    except ValueError:
+        return "since and until must be Unix timestamps", {}
+    if options["until"] < options["since"]:
+        return "until must not be before since", {}
+    return None, options
+
+
+def _first_copy(document: Dict, seen: Set[ObjectId], remember: bool) -> bool:
+    """
+    Tell whether a report has not been exported from an earlier collection, as a report
+    being archived is in both. Only resolved reports can be archived, so only their IDs
+    are remembered.
+    """
+    if document["_id"] in seen:
+        return False
+    if remember and document.get("resolved"):
+        seen.add(document["_id"])
+    return True
+
+
+def _read_batches(
+    collections: Iterable[Any], since: int, until: int, batch_size: int
+) -> Iterator[List[Dict]]:
+    """
+    Read the reports created in (since, until] from each collection in turn, oldest first,
+    in batches of batch_size, skipping reports already read from an earlier collection.
+    """
+    collections = list(collections)
+    seen: Set[ObjectId] = set()
+    for index, collection in enumerate(collections):
+        remember = index < len(collections) - 1
+        cursor = collection.find(export_query(since, until), EXPORT_PROJECTION, batch_size=batch_size)
+        batch: List[Dict] = []
+        for document in cursor.sort("created_at", 1):
+            if not _first_copy(document, seen, remember):
+                continue
+            batch.append(document)
+            if len(batch) == batch_size:
+                yield batch
+                batch = []
+        if batch:
+            yield batch
+
+
+def stream_export(
+    collections: Iterable[Any],
+    format: str,
+    since: int,
+    until: int,
+    batch_size: int = EXPORT_BATCH_SIZE,
+) -> Iterator[bytes]:
+    """
+    Export the reports created in (since, until], for a response streamed while the
+    collections are read.
+
+    Args:
+        collections (Iterable[Any]): The reports collection, and the archive collection if included.
+        format (str): "parquet" or "arrow".
+        since (int): The created_at watermark of the previous export, 0 for everything.
+        until (int): The newest created_at to include.
+        batch_size (int): The reports in each row group.
+
+    Yields:
+        bytes: The output, a row group at a time.
+    """
+    exporter = ReportExporter(format)
+    for batch in _read_batches(collections, since, until, batch_size):
+        yield exporter.write(batch)
+    yield exporter.close()
+    logger.info(f"Exported {exporter.rows} reports created in ({since}, {until}] as {format}.")
+
+
+async def stream_export_async(
+    collections: Iterable[Any],
+    format: str,
+    since: int,
+    until: int,
+    batch_size: int = EXPORT_BATCH_SIZE,
+) -> AsyncIterator[bytes]:
+    """
+    Export the reports created in (since, until] using the asynchronous driver, encoding
+    each row group in a worker thread.
+
+    Args:
+        collections (Iterable[Any]): The asynchronous reports collection, and the archive collection if included.
+        format (str): "parquet" or "arrow".
+        since (int): The created_at watermark of the previous export, 0 for everything.
+        until (int): The newest created_at to include.
+        batch_size (int): The reports in each row group.
+
+    Yields:
+        bytes: The output, a row group at a time.
+    """
+    exporter = ReportExporter(format)
+    collections = list(collections)
+    seen: Set[ObjectId] = set()
+    for index, collection in enumerate(collections):
+        remember = index < len(collections) - 1
+        cursor = collection.find(export_query(since, until), EXPORT_PROJECTION, batch_size=batch_size)
+        batch: List[Dict] = []
+        async for document in cursor.sort("created_at", 1):
+            if not _first_copy(document, seen, remember):
+                continue
+            batch.append(document)
+            if len(batch) == batch_size:
+                yield await asyncio.to_thread(exporter.write, batch)
+                batch = []
+        if batch:
+            yield await asyncio.to_thread(exporter.write, batch)
+    yield exporter.close()
+    logger.info(f"Exported {exporter.rows} reports created in ({since}, {until}] as {format}.")
+
+
+def export_reports(
+    output: Any,
+    format: str = "parquet",
+    incremental: bool = False,
+    since: Optional[int] = None,
+    until: Optional[int] = None,
+    batch_size: int = EXPORT_BATCH_SIZE,
+    collections: Optional[Iterable[Any]] = None,
+) -> Dict[str, Any]:
+    """
+    Write reports to a file, either all of them or those created since the last
+    incremental export.
+
+    Reports are read up to EXPORT_LAG_SECONDS ago, so reports built but not yet inserted
+    in the last moments go in the next export. Reports imported with a created_at before
+    the watermark are only exported by a full export.
+
+    Args:
+        output (Any): A binary file to write to.
+        format (str): "parquet" or "arrow".
+        incremental (bool): Export from the watermark of the last incremental export, and
+            advance it once the file is written.
+        since (Optional[int]): Export reports created after this time instead.
+        until (Optional[int]): Export reports created up to this time instead.
+        batch_size (int): The reports in each row group.
+        collections (Optional[Iterable[Any]]): The collections to read, defaulting to the reports collection.
+
+    Returns:
+        Dict[str, Any]: The exported range and the number of reports.
+    """
+    if since is None:
+        since = get_watermark(JOB_NAME, 0) if incremental else 0
+    until = int(time.time()) - EXPORT_LAG_SECONDS if until is None else until
+    exporter = ReportExporter(format)
+    for batch in _read_batches(collections or [reports], since, until, batch_size):
+        output.write(exporter.write(batch))
+    output.write(exporter.close())
+    # only once the file is complete, so a failed export is repeated in full
+    if incremental:
+        set_watermark(JOB_NAME, until)
+    summary = {"since": since, "until": until, "reports": exporter.rows}
+    logger.info(f"Report export finished: {summary}")
+    return summary
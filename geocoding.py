@@ -0,0 +1,240 @@
+"""
+File: geocoding.py
+Author: Jack McArdle
+
+This file is part of CommunityEye.
+
+Email: mcardle-j9@ulster.ac.uk
+B-No: B00733578
+"""
+
+import logging
+import threading
+import time
+from collections import OrderedDict
+from functools import partial
+from typing import Dict, List, Optional, Sequence, Tuple
+from pymongo import UpdateOne
+from config import (
+    GEOCODING_BATCH_SIZE,
+    GEOCODING_CACHE_SIZE,
+    GEOCODING_CELL_DECIMALS,
+    GEOCODING_STORE_DIR,
+    GEOCODING_WARD_FILES,
+    MONGO_COLLECTION_REPORTS,
+)
+from boundary_store import AUTHORITY_FILES, BoundaryStore, files_fingerprint, load_authorities_from_files
+from clients import DB
+from metrics import stage_timer
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+reports = DB[MONGO_COLLECTION_REPORTS]
+
+# the area type held in the locality store for each field of a report's locality
+LOCALITY_LEVELS = {"district": "Council", "ward": "Ward"}
+
+
+def load_locality_areas(
+    authority_pattern: str = AUTHORITY_FILES, ward_pattern: str = GEOCODING_WARD_FILES
+) -> List[Dict]:
+    """
+    Read the areas reports are reverse-geocoded against from the bundled data.
+
+    Args:
+        authority_pattern (str): Glob matching the authority JSON files, whose councils
+            give each report's district.
+        ward_pattern (str): Glob matching ward JSON files in the authority document format.
+
+    Returns:
+        List[Dict]: The council and ward areas.
+    """
+    areas = [
+        area for area in load_authorities_from_files(authority_pattern)
+        if area["authority_type"] == LOCALITY_LEVELS["district"]
+    ]
+    wards = load_authorities_from_files(ward_pattern)
+    if not wards:
+        logger.warning(f"No ward areas found in {ward_pattern}; reports will have no ward.")
+    areas.extend({**ward, "authority_type": LOCALITY_LEVELS["ward"]} for ward in wards)
+    return areas
+
+
+class ReverseGeocoder:
+    """
+    Offline reverse geocoding of report positions to the district and ward containing them.
+
+    Areas are held in a BoundaryStore of their own, so lookups use the same memory-mapped
+    arrays and point-in-polygon tests as authority routing. Positions are rounded to a
+    cell of GEOCODING_CELL_DECIMALS decimal places and each cell's centre is looked up
+    once; results are memoized per cell, least recently used first, until the areas change.
+    """
+
+    def __init__(
+        self,
+        store: BoundaryStore,
+        decimals: int = GEOCODING_CELL_DECIMALS,
+        max_entries: int = GEOCODING_CACHE_SIZE,
+    ):
+        self.store = store
+        self.decimals = decimals
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._cells: "OrderedDict[Tuple[float, float], Dict[str, Optional[str]]]" = OrderedDict()
+        self._version: Optional[str] = None
+
+    def localities(self, geolocations: Sequence[Dict[str, float]]) -> List[Dict[str, Optional[str]]]:
+        """
+        Find the district and ward of each position.
+
+        Args:
+            geolocations (Sequence[Dict[str, float]]): Dictionaries containing 'Lon' and 'Lat' keys.
+
+        Returns:
+            List[Dict[str, Optional[str]]]: The 'district' and 'ward' of each position,
+            None where no area contains it.
+        """
+        boundaries = self.store.get()
+        cells = [
+            (round(geolocation["Lon"], self.decimals), round(geolocation["Lat"], self.decimals))
+            for geolocation in geolocations
+        ]
+        found: Dict[Tuple[float, float], Dict[str, Optional[str]]] = {}
+        with self._lock:
+            if boundaries.version != self._version:
+                self._cells.clear()
+                self._version = boundaries.version
+            for cell in cells:
+                if cell in self._cells:
+                    self._cells.move_to_end(cell)
+                    found[cell] = self._cells[cell]
+
+        missing = list(dict.fromkeys(cell for cell in cells if cell not in found))
+        if missing:
+            lons = [lon for lon, _ in missing]
+            lats = [lat for _, lat in missing]
+            with stage_timer("reverse_geocode"):
+                names = {
+                    field: boundaries.locate(lons, lats, [area_type] * len(missing))
+                    for field, area_type in LOCALITY_LEVELS.items()
+                }
+            with self._lock:
+                for index, cell in enumerate(missing):
+                    found[cell] = {field: names[field][index] for field in LOCALITY_LEVELS}
+                    if self._version == boundaries.version:
+                        self._cells[cell] = found[cell]
+                while len(self._cells) > self.max_entries:
+                    self._cells.popitem(last=False)
+
+        return [dict(found[cell]) for cell in cells]
+
+    def locality(self, geolocation: Dict[str, float]) -> Dict[str, Optional[str]]:
+        """
+        Find the district and ward of a position.
+
+        Args:
+            geolocation (Dict[str, float]): A dictionary containing 'Lon' and 'Lat' keys.
+
+        Returns:
+            Dict[str, Optional[str]]: The position's 'district' and 'ward'.
+        """
+        return self.localities([geolocation])[0]
+
+    def invalidate(self) -> None:
+        """
+        Rebuild the areas from the bundled data on next use, forgetting memoized cells.
+        """
+        self.store.invalidate()
+        with self._lock:
+            self._cells.clear()
+            self._version = None
+
+
+def find_localities(geolocations: Sequence[Dict[str, float]]) -> List[Optional[Dict[str, Optional[str]]]]:
+    """
+    Reverse-geocode the positions of new reports without letting a failure stop them.
+
+    Reports left without a locality are annotated by the next backfill.
+
+    Args:
+        geolocations (Sequence[Dict[str, float]]): Dictionaries containing 'Lon' and 'Lat' keys.
+
+    Returns:
+        List[Optional[Dict[str, Optional[str]]]]: The locality of each position, or None
+        for every position if the areas could not be searched.
+    """
+    try:
+        return reverse_geocoder.localities(geolocations)
+    except Exception as e:
+        logger.error(f"Error reverse geocoding {len(geolocations)} positions: {e}")
+        return [None] * len(geolocations)
+
+
+def backfill_localities(
+    batch_size: int = GEOCODING_BATCH_SIZE, recompute: bool = False, pause: float = 0.0
+) -> Dict[str, int]:
+    """
+    Annotate stored reports with their locality, one batch of reports at a time.
+
+    Reports are visited in _id order, so an interrupted pass resumes where it stopped by
+    skipping the reports it has already annotated.
+
+    Args:
+        batch_size (int): The reports read and updated at a time.
+        recompute (bool): Annotate every report again, e.g. after the ward data changes,
+            rather than only those without a locality.
+        pause (float): Seconds to sleep between batches, to leave capacity for requests.
+
+    Returns:
+        Dict[str, int]: The number of reports annotated and batches written.
+    """
+    query = {} if recompute else {"locality": {"$exists": False}}
+    summary = {"reports": 0, "batches": 0}
+    last_id = None
+    while True:
+        batch_query = dict(query)
+        if last_id is not None:
+            batch_query["_id"] = {"$gt": last_id}
+        batch = list(
+            reports.find(batch_query, {"geolocation.geometry.coordinates": 1})
+            .sort("_id", 1)
+            .limit(batch_size)
+        )
+        if not batch:
+            break
+
+        positioned, geolocations = [], []
+        for report in batch:
+            coordinates = report.get("geolocation", {}).get("geometry", {}).get("coordinates")
+            if coordinates and len(coordinates) == 2:
+                # stored as [Lat, Lon]
+                positioned.append(report["_id"])
+                geolocations.append({"Lat": coordinates[0], "Lon": coordinates[1]})
+        localities = dict(zip(positioned, reverse_geocoder.localities(geolocations)))
+        # reports without a usable position are marked so later passes skip them
+        empty = {field: None for field in LOCALITY_LEVELS}
+        reports.bulk_write(
+            [
+                UpdateOne({"_id": report["_id"]}, {"$set": {"locality": localities.get(report["_id"], empty)}})
+                for report in batch
+            ],
+            ordered=False,
+        )
+
+        last_id = batch[-1]["_id"]
+        summary["reports"] += len(batch)
+        summary["batches"] += 1
+        logger.info(f"Annotated {summary['reports']} reports with their locality.")
+        if pause:
+            time.sleep(pause)
+    return summary
+
+
+reverse_geocoder = ReverseGeocoder(
+    BoundaryStore(
+        GEOCODING_STORE_DIR,
+        loader=load_locality_areas,
+        fingerprint=partial(files_fingerprint, AUTHORITY_FILES, GEOCODING_WARD_FILES),
+    )
+)
@@ -0,0 +1,481 @@
+"""
+File: hotspots.py
+Author: Jack McArdle
+
+This file is part of CommunityEye.
+
+Email: mcardle-j9@ulster.ac.uk
+B-No: B00733578
+"""
+
+import logging
+import time
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Set, Tuple
+import numpy as np
+from pymongo import DESCENDING, DeleteOne, ReplaceOne, UpdateOne
+from config import (
+    HOTSPOT_BASELINE_WINDOWS,
+    HOTSPOT_BATCH_SIZE,
+    HOTSPOT_GEOHASH_PRECISION,
+    HOTSPOT_LAG_SECONDS,
+    HOTSPOT_MIN_COUNT,
+    HOTSPOT_MIN_RATIO,
+    HOTSPOT_WINDOW_SECONDS,
+    MONGO_COLLECTION_HOTSPOT_BUCKETS,
+    MONGO_COLLECTION_HOTSPOTS,
+    MONGO_COLLECTION_REPORTS,
+)
+from clients import DB
+from metrics import stage_timer
+from watermarks import get_watermark, reset_watermark, set_watermark
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+reports = DB[MONGO_COLLECTION_REPORTS]
+buckets = DB[MONGO_COLLECTION_HOTSPOT_BUCKETS]
+hotspots = DB[MONGO_COLLECTION_HOTSPOTS]
+
+JOB_NAME = "hotspots"
+BASE32 = np.array(list("0123456789bcdefghjkmnpqrstuvwxyz"))
+# Monday 5 January 1970, so weekly windows run Monday to Sunday (UTC)
+WINDOW_ORIGIN = 4 * 86400
+DEFAULT_LIMIT = 50
+MAX_LIMIT = 500
+REPORT_PROJECTION = {
+    "_id": 0,
+    "category": 1,
+    "authority": 1,
+    "created_at": 1,
+    "geolocation.geometry.coordinates": 1,
+}
+
+
+def geohash_codes(lons: np.ndarray, lats: np.ndarray, precision: int) -> np.ndarray:
+    """
+    Compute the geohash cell of each point as an integer of 5 * precision bits.
+
+    Args:
+        lons (np.ndarray): The longitude of each point.
+        lats (np.ndarray): The latitude of each point.
+        precision (int): The geohash length, at most 12.
+
+    Returns:
+        np.ndarray: The int64 code of each point's cell.
+    """
+    bits = 5 * precision
+    lon_bits, lat_bits = (bits + 1) // 2, bits // 2
+    lon_cells = np.clip(((np.asarray(lons) + 180) / 360 * (1 << lon_bits)).astype(np.int64), 0, (1 << lon_bits) - 1)
+    lat_cells = np.clip(((np.asarray(lats) + 90) / 180 * (1 << lat_bits)).astype(np.int64), 0, (1 << lat_bits) - 1)
+    codes = np.zeros(len(lon_cells), dtype=np.int64)
+    # geohash interleaves the bits, starting with the most significant longitude bit
+    for bit in range(bits):
+        if bit % 2 == 0:
+            codes = (codes << 1) | ((lon_cells >> (lon_bits - 1 - bit // 2)) & 1)
+        else:
+            codes = (codes << 1) | ((lat_cells >> (lat_bits - 1 - bit // 2)) & 1)
+    return codes
+
+
+def geohash_strings(codes: np.ndarray, precision: int) -> List[str]:
+    """
+    Convert geohash codes from geohash_codes to their base32 strings.
+    """
+    characters = np.stack(
+        [BASE32[(codes >> (5 * (precision - 1 - index))) & 31] for index in range(precision)], axis=1
+    )
+    return ["".join(row) for row in characters]
+
+
+def geohash_bounds(cell: str) -> Tuple[float, float, float, float]:
+    """
+    Find the area covered by a geohash cell.
+
+    Args:
+        cell (str): The geohash.
+
+    Returns:
+        Tuple[float, float, float, float]: min lon, min lat, max lon, max lat.
+    """
+    lon_range, lat_range = [-180.0, 180.0], [-90.0, 90.0]
+    even = True
+    for character in cell:
+        value = int(np.flatnonzero(BASE32 == character)[0])
+        for shift in range(4, -1, -1):
+            target = lon_range if even else lat_range
+            middle = (target[0] + target[1]) / 2
+            target[0 if (value >> shift) & 1 else 1] = middle
+            even = not even
+    return lon_range[0], lat_range[0], lon_range[1], lat_range[1]
+
+
+def window_starts(created_at: np.ndarray, window_seconds: int = HOTSPOT_WINDOW_SECONDS) -> np.ndarray:
+    """
+    Find the start of the time window each timestamp falls in.
+    """
+    return (np.asarray(created_at, dtype=np.int64) - WINDOW_ORIGIN) // window_seconds * window_seconds + WINDOW_ORIGIN
+
+
+def bucket_id(cell: str, category: str, window_start: int) -> str:
+    return f"{cell}|{category}|{window_start}"
+
+
+def bucket_reports(
+    documents: List[Dict],
+    precision: int = HOTSPOT_GEOHASH_PRECISION,
+    window_seconds: int = HOTSPOT_WINDOW_SECONDS,
+) -> Dict[Tuple[str, str, int], Dict]:
+    """
+    Count reports by geohash cell, category and time window.
+
+    Args:
+        documents (List[Dict]): Reports read with REPORT_PROJECTION. Coordinates are
+            stored as [Lat, Lon].
+        precision (int): The geohash length of a cell.
+        window_seconds (int): The length of a time window.
+
+    Returns:
+        Dict[Tuple[str, str, int], Dict]: The count and authorities of each (cell, category,
+        window start) with reports.
+    """
+    documents = [
+        document for document in documents
+        if len(document.get("geolocation", {}).get("geometry", {}).get("coordinates") or []) == 2
+        and document.get("created_at") is not None
+    ]
+    if not documents:
+        return {}
+    coordinates = np.array(
+        [document["geolocation"]["geometry"]["coordinates"] for document in documents], dtype=np.float64
+    )
+    names, category_indexes = np.unique([document["category"] for document in documents], return_inverse=True)
+    keys = np.stack(
+        [
+            geohash_codes(coordinates[:, 1], coordinates[:, 0], precision),
+            category_indexes.astype(np.int64),
+            window_starts([document["created_at"] for document in documents], window_seconds),
+        ],
+        axis=1,
+    )
+    unique_keys, inverse, counts = np.unique(keys, axis=0, return_inverse=True, return_counts=True)
+    cells = geohash_strings(unique_keys[:, 0], precision)
+
+    counted = [{"count": int(count), "authorities": set()} for count in counts]
+    for document, index in zip(documents, inverse.reshape(-1)):
+        if document.get("authority"):
+            counted[index]["authorities"].add(document["authority"])
+    return {
+        (cells[index], str(names[key[1]]), int(key[2])): counted[index]
+        for index, key in enumerate(unique_keys)
+    }
+
+
+def _read_batches(since: int, until: int, batch_size: int) -> Iterator[Tuple[List[Dict], int]]:
+    """
+    Read the reports created in (since, until] oldest first, in batches that never split
+    a second, so the watermark can advance after each batch.
+
+    Yields:
+        Tuple[List[Dict], int]: A batch and the created_at of its newest report.
+    """
+    batch: List[Dict] = []
+    cursor = reports.find(
+        {"created_at": {"$gt": since, "$lte": until}}, REPORT_PROJECTION, batch_size=batch_size
+    ).sort("created_at", 1)
+    for document in cursor:
+        if len(batch) >= batch_size and document["created_at"] != batch[-1]["created_at"]:
+            yield batch, batch[-1]["created_at"]
+            batch = []
+        batch.append(document)
+    if batch:
+        yield batch, until
+
+
+def _write_buckets(counted: Dict[Tuple[str, str, int], Dict], watermark: int) -> None:
+    """
+    Add a batch's counts to their buckets.
+
+    Each bucket records the watermark of the last batch counted into it, and a batch is
+    only added to buckets with an older one, so a batch replayed after a run failed
+    before advancing the watermark is not counted twice.
+
+    Args:
+        counted (Dict[Tuple[str, str, int], Dict]): The batch's buckets, as bucket_reports returns.
+        watermark (int): The created_at of the batch's newest report.
+    """
+    operations = []
+    for (cell, category, window_start), bucket in counted.items():
+        key = bucket_id(cell, category, window_start)
+        authorities = sorted(bucket["authorities"])
+        operations.append(
+            UpdateOne(
+                {"_id": key, "counted_through": {"$not": {"$gte": watermark}}},
+                {
+                    "$inc": {"count": bucket["count"]},
+                    "$addToSet": {"authorities": {"$each": authorities}},
+                    "$set": {"counted_through": watermark},
+                },
+            )
+        )
+        # creates the bucket counted through this batch, and does nothing to one that exists
+        operations.append(
+            UpdateOne(
+                {"_id": key},
+                {
+                    "$setOnInsert": {
+                        "cell": cell,
+                        "category": category,
+                        "window_start": window_start,
+                        "count": bucket["count"],
+                        "authorities": authorities,
+                        "counted_through": watermark,
+                    }
+                },
+                upsert=True,
+            )
+        )
+    if operations:
+        buckets.bulk_write(operations, ordered=False)
+
+
+def score_bucket(count: int, history: List[int]) -> Dict[str, Any]:
+    """
+    Compare a window's count with the mean of the windows before it.
+
+    Args:
+        count (int): The reports in the window.
+        history (List[int]): The reports in each of the baseline windows before it.
+
+    Returns:
+        Dict[str, Any]: The baseline, delta, ratio and whether the window is a hotspot.
+    """
+    baseline = sum(history) / len(history) if history else 0.0
+    return {
+        "baseline": baseline,
+        "delta": count - baseline,
+        "ratio": count / baseline if baseline else None,
+        "hotspot": count >= HOTSPOT_MIN_COUNT and count >= HOTSPOT_MIN_RATIO * baseline,
+    }
+
+
+def refresh_hotspots(
+    touched: Iterable[Tuple[str, str, int]],
+    window_seconds: int = HOTSPOT_WINDOW_SECONDS,
+    baseline_windows: int = HOTSPOT_BASELINE_WINDOWS,
+) -> Set[str]:
+    """
+    Rescore the given buckets against their baselines and write or remove their hotspots.
+
+    Args:
+        touched (Iterable[Tuple[str, str, int]]): The (cell, category, window start) of
+            each bucket whose count changed.
+        window_seconds (int): The length of a time window.
+        baseline_windows (int): How many earlier windows the baseline averages.
+
+    Returns:
+        Set[str]: The IDs of the touched buckets that are hotspots.
+    """
+    touched = list(touched)
+    wanted = {
+        bucket_id(cell, category, window_start - offset * window_seconds)
+        for cell, category, window_start in touched
+        for offset in range(baseline_windows + 1)
+    }
+    counts = {}
+    wanted_ids = list(wanted)
+    for start in range(0, len(wanted_ids), HOTSPOT_BATCH_SIZE):
+        for bucket in buckets.find({"_id": {"$in": wanted_ids[start:start + HOTSPOT_BATCH_SIZE]}}):
+            counts[bucket["_id"]] = bucket
+
+    now = int(time.time())
+    operations, found = [], set()
+    for cell, category, window_start in touched:
+        key = bucket_id(cell, category, window_start)
+        bucket = counts.get(key)
+        if bucket is None:
+            continue
+        history = [
+            counts.get(bucket_id(cell, category, window_start - offset * window_seconds), {}).get("count", 0)
+            for offset in range(1, baseline_windows + 1)
+        ]
+        score = score_bucket(bucket["count"], history)
+        if not score.pop("hotspot"):
+            operations.append(DeleteOne({"_id": key}))
+            continue
+        found.add(key)
+        min_lon, min_lat, max_lon, max_lat = geohash_bounds(cell)
+        operations.append(
+            ReplaceOne(
+                {"_id": key},
+                {
+                    "cell": cell,
+                    "category": category,
+                    "window_start": window_start,
+                    "window_end": window_start + window_seconds,
+                    "count": bucket["count"],
+                    **score,
+                    "authorities": bucket.get("authorities", []),
+                    "center": {"Lat": (min_lat + max_lat) / 2, "Lon": (min_lon + max_lon) / 2},
+                    "bounds": [min_lon, min_lat, max_lon, max_lat],
+                    "updated_at": now,
+                },
+                upsert=True,
+            )
+        )
+    if operations:
+        hotspots.bulk_write(operations, ordered=False)
+    return found
+
+
+def ensure_indexes() -> None:
+    """
+    Create the indexes the job and the hotspots endpoint rely on.
+    """
+    reports.create_index("created_at")
+    hotspots.create_index([("window_start", DESCENDING), ("delta", DESCENDING)], name="hotspots_by_window")
+
+
+def detect_hotspots(full: bool = False, until: Optional[int] = None) -> Dict[str, Any]:
+    """
+    Count the reports created since the last run into their buckets and rescore the
+    buckets that changed.
+
+    Reports are read up to HOTSPOT_LAG_SECONDS ago, so reports built but not yet inserted
+    in the last moments are picked up by the next run. Reports imported with a created_at
+    before the watermark are only counted by a full run.
+
+    Args:
+        full (bool): Discard the buckets, hotspots and watermark and start from the beginning.
+        until (Optional[int]): Process reports created up to this time instead.
+
+    Returns:
+        Dict[str, Any]: The processed range and the number of reports, buckets and hotspots.
+    """
+    if full:
+        buckets.delete_many({})
+        hotspots.delete_many({})
+        reset_watermark(JOB_NAME)
+    ensure_indexes()
+
+    since = get_watermark(JOB_NAME, 0)
+    until = int(time.time()) - HOTSPOT_LAG_SECONDS if until is None else until
+    summary = {"since": since, "until": until, "reports": 0, "buckets": 0, "hotspots": 0}
+    if until <= since:
+        return summary
+
+    touched: Set[Tuple[str, str, int]] = set()
+    found: Set[str] = set()
+    for batch, watermark in _read_batches(since, until, HOTSPOT_BATCH_SIZE):
+        with stage_timer("hotspots.bucket"):
+            counted = bucket_reports(batch)
+            _write_buckets(counted, watermark)
+        with stage_timer("hotspots.score"):
+            found |= refresh_hotspots(counted)
+        # a run that fails resumes after its last finished batch, and a batch it had
+        # already counted is skipped by the buckets
+        set_watermark(JOB_NAME, watermark)
+        touched.update(counted)
+        summary["reports"] += len(batch)
+    summary["buckets"] = len(touched)
+    summary["hotspots"] = len(found)
+    set_watermark(JOB_NAME, until)
+    logger.info(f"Hotspot detection finished: {summary}")
+    return summary
+
+
+def parse_hotspot_args(args: Any) -> Tuple[Optional[str], Dict[str, Any]]:
+    """
+    Validate the hotspots endpoint's query parameters.
+
+    Args:
+        args (Any): The request's query parameters.
+
+    Returns:
+        Tuple: An error message if they are unusable, and the parsed filters.
+    """
+    try:
+        limit = int(args.get("limit", DEFAULT_LIMIT))
+        window_start = int(args["window_start"]) if args.get("window_start") else None
+    except ValueError:
+        return "limit and window_start must be integers", {}
+    if not 1 <= limit <= MAX_LIMIT:
+        return f"limit must be between 1 and {MAX_LIMIT}", {}
+    return None, {
+        "limit": limit,
+        "window_start": window_start,
+        "authority": args.get("authority"),
+        "category": args.get("category"),
+    }
+
+
+def hotspot_query(window_start: int, authority: Optional[str], category: Optional[str]) -> Dict:
+    query: Dict[str, Any] = {"window_start": window_start}
+    if authority:
+        query["authorities"] = authority
+    if category:
+        query["category"] = category
+    return query
+
+
+def format_hotspots(window_start: Optional[int], documents: List[Dict]) -> Dict:
+    """
+    Build the hotspots endpoint's response.
+    """
+    for document in documents:
+        document["id"] = document.pop("_id")
+    return {
+        "window_start": window_start,
+        "window_end": None if window_start is None else window_start + HOTSPOT_WINDOW_SECONDS,
+        "hotspots": documents,
+    }
+
+
+def find_hotspots(collection: Any, filters: Dict[str, Any]) -> Dict:
+    """
+    Read the hotspots of a window, the latest with hotspots by default, largest rise first.
+
+    Args:
+        collection (Any): The hotspots collection.
+        filters (Dict[str, Any]): The filters from parse_hotspot_args.
+
+    Returns:
+        Dict: The window and its hotspots.
+    """
+    window_start = filters["window_start"]
+    if window_start is None:
+        latest = collection.find_one({}, {"window_start": 1}, sort=[("window_start", DESCENDING)])
+        if latest is None:
+            return format_hotspots(None, [])
+        window_start = latest["window_start"]
+    documents = list(
+        collection.find(hotspot_query(window_start, filters["authority"], filters["category"]))
+        .sort("delta", DESCENDING)
+        .limit(filters["limit"])
+    )
+    return format_hotspots(window_start, documents)
+
+
+async def find_hotspots_async(collection: Any, filters: Dict[str, Any]) -> Dict:
+    """
+    Read the hotspots of a window using the asynchronous driver.
+
+    Args:
+        collection (Any): The asynchronous hotspots collection.
+        filters (Dict[str, Any]): The filters from parse_hotspot_args.
+
+    Returns:
+        Dict: The window and its hotspots.
+    """
+    window_start = filters["window_start"]
+    if window_start is None:
+        latest = await collection.find_one({}, {"window_start": 1}, sort=[("window_start", DESCENDING)])
+        if latest is None:
+            return format_hotspots(None, [])
+        window_start = latest["window_start"]
+    documents = await (
+        collection.find(hotspot_query(window_start, filters["authority"], filters["category"]))
+        .sort("delta", DESCENDING)
+        .limit(filters["limit"])
+        .to_list(None)
+    )
+    return format_hotspots(window_start, documents)
@@ -0,0 +1,368 @@
+"""
+File: idempotency.py
+Author: Jack McArdle
+
+This file is part of CommunityEye.
+
+Email: mcardle-j9@ulster.ac.uk
+B-No: B00733578
+"""
+
+import datetime
+import hashlib
+import logging
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Iterable, Mapping, Optional, Tuple
+from pymongo.errors import DuplicateKeyError
+from config import (
+    IDEMPOTENCY_BACKEND,
+    IDEMPOTENCY_LOCK_SECONDS,
+    IDEMPOTENCY_MAX_KEYS,
+    IDEMPOTENCY_TTL_SECONDS,
+    IDEMPOTENCY_WAIT_SECONDS,
+    MONGO_COLLECTION_IDEMPOTENCY_KEYS,
+)
+from clients import DB
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+IDEMPOTENCY_HEADER = "Idempotency-Key"
+MAX_KEY_LENGTH = 255
+# response headers replayed along with the stored body
+REPLAYED_HEADERS = ("Content-Type", "Location")
+IN_PROGRESS = "in_progress"
+COMPLETED = "completed"
+# how often a request waiting on another with the same key checks for its result
+POLL_SECONDS = 0.1
+# how much of an upload is read at a time when fingerprinting it
+FINGERPRINT_CHUNK_BYTES = 64 * 1024
+
+
+def request_fingerprint(form: Mapping[str, str], files: Mapping[str, Any]) -> str:
+    """
+    Summarise a request so a key reused for a different request can be told apart.
+
+    Args:
+        form (Mapping[str, str]): The submitted form fields.
+        files (Mapping[str, Any]): The uploaded files, whose streams are rewound after hashing.
+
+    Returns:
+        str: A hash of the form fields and the uploads' names and contents.
+    """
+    digest = hashlib.sha256()
+    for name, value in sorted(form.items()):
+        digest.update(f"{name}={value}\n".encode())
+    for name, upload in sorted(files.items()):
+        digest.update(f"{name}@{getattr(upload, 'filename', '')}\n".encode())
+        # a different photo under a generic file name is a different request
+        stream = getattr(upload, "stream", None)
+        if stream is not None:
+            position = stream.tell()
+            for chunk in iter(lambda: stream.read(FINGERPRINT_CHUNK_BYTES), b""):
+                digest.update(chunk)
+            stream.seek(position)
+    return digest.hexdigest()
+
+
+def is_replayable(status_code: int) -> bool:
+    """
+    Whether a response may be stored and replayed for retries of the same request.
+
+    Server errors and rejections for load are transient, so a retry is allowed to run again.
+
+    Args:
+        status_code (int): The response's status code.
+
+    Returns:
+        bool: True if the response is kept.
+    """
+    return status_code < 500 and status_code != 429
+
+
+def _new_record(fingerprint: str, now: float) -> Dict[str, Any]:
+    return {
+        "state": IN_PROGRESS,
+        "fingerprint": fingerprint,
+        "locked_until": now + IDEMPOTENCY_LOCK_SECONDS,
+        "expires_at": now + IDEMPOTENCY_TTL_SECONDS,
+    }
+
+
+class MemoryStore:
+    """
+    Idempotency keys held in this process, least recently used first so the oldest can be
+    dropped once IDEMPOTENCY_MAX_KEYS are held. Requests waiting on a key in progress
+    are woken as soon as it completes.
+    """
+
+    def __init__(self, max_keys: int = IDEMPOTENCY_MAX_KEYS):
+        self.max_keys = max_keys
+        self._changed = threading.Condition()
+        self._records: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+
+    def _current(self, key: str, now: float) -> Optional[Dict[str, Any]]:
+        record = self._records.get(key)
+        if record is not None and record["expires_at"] <= now:
+            del self._records[key]
+            return None
+        return record
+
+    def begin(self, key: str, fingerprint: str) -> Optional[Dict[str, Any]]:
+        """
+        Claim a key for a request, unless another request holds or has completed it.
+
+        A claim whose request has not completed within IDEMPOTENCY_LOCK_SECONDS, e.g.
+        because its worker died, may be taken over.
+
+        Args:
+            key (str): The scoped idempotency key.
+            fingerprint (str): The request's fingerprint.
+
+        Returns:
+            Optional[Dict[str, Any]]: None if the key was claimed, otherwise its record.
+        """
+        now = time.time()
+        with self._changed:
+            record = self._current(key, now)
+            if record is not None and not (record["state"] == IN_PROGRESS and record["locked_until"] <= now):
+                self._records.move_to_end(key)
+                return dict(record)
+            self._records[key] = _new_record(fingerprint, now)
+            self._records.move_to_end(key)
+            while len(self._records) > self.max_keys:
+                self._records.popitem(last=False)
+        return None
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        with self._changed:
+            record = self._current(key, time.time())
+            return None if record is None else dict(record)
+
+    def wait(self, key: str, timeout: float) -> Optional[Dict[str, Any]]:
+        """
+        Wait for a key in progress to complete or be released.
+
+        Args:
+            key (str): The scoped idempotency key.
+            timeout (float): The most seconds to wait.
+
+        Returns:
+            Optional[Dict[str, Any]]: The key's record, still in progress if the wait timed out, or None if released.
+        """
+        deadline = time.monotonic() + timeout
+        with self._changed:
+            while True:
+                record = self._current(key, time.time())
+                remaining = deadline - time.monotonic()
+                if record is None or record["state"] != IN_PROGRESS or remaining <= 0:
+                    return None if record is None else dict(record)
+                self._changed.wait(remaining)
+
+    def complete(self, key: str, response: Dict[str, Any]) -> None:
+        """
+        Store the response of a claimed key for replay.
+
+        Args:
+            key (str): The scoped idempotency key.
+            response (Dict[str, Any]): The status, body and headers to replay.
+        """
+        with self._changed:
+            record = self._records.get(key)
+            if record is not None:
+                record.update(state=COMPLETED, response=response)
+            self._changed.notify_all()
+
+    def release(self, key: str) -> None:
+        """
+        Give up a claimed key so that a retry runs the request again.
+
+        Args:
+            key (str): The scoped idempotency key.
+        """
+        with self._changed:
+            self._records.pop(key, None)
+            self._changed.notify_all()
+
+    def clear(self) -> None:
+        with self._changed:
+            self._records.clear()
+
+
+class MongoStore:
+    """
+    Idempotency keys shared by every worker and host through a collection.
+
+    A key is claimed by inserting its document, so only one request can claim it; expired
+    keys are removed by a TTL index. Requests waiting on a key in progress poll for it.
+    """
+
+    def __init__(self, collection_name: str = MONGO_COLLECTION_IDEMPOTENCY_KEYS):
+        self.collection = DB[collection_name]
+        self._indexed = False
+
+    def _to_record(self, document: Optional[Dict[str, Any]]) -> Optional[Dict[str, Any]]:
+        if document is None:
+            return None
+        expires_at = document["expires_at"].replace(tzinfo=datetime.timezone.utc).timestamp()
+        # the TTL monitor only runs once a minute
+        if expires_at <= time.time():
+            return None
+        return {**{k: v for k, v in document.items() if k != "_id"}, "expires_at": expires_at}
+
+    def begin(self, key: str, fingerprint: str) -> Optional[Dict[str, Any]]:
+        """
+        Claim a key for a request, unless another request holds or has completed it.
+
+        A claim whose request has not completed within IDEMPOTENCY_LOCK_SECONDS, e.g.
+        because its worker died, may be taken over.
+
+        Args:
+            key (str): The scoped idempotency key.
+            fingerprint (str): The request's fingerprint.
+
+        Returns:
+            Optional[Dict[str, Any]]: None if the key was claimed, otherwise its record.
+        """
+        if not self._indexed:
+            self.collection.create_index("expires_at", expireAfterSeconds=0)
+            self._indexed = True
+        now = time.time()
+        document = _new_record(fingerprint, now)
+        document["expires_at"] = datetime.datetime.fromtimestamp(document["expires_at"], datetime.timezone.utc)
+        try:
+            self.collection.insert_one({"_id": key, **document})
+            return None
+        except DuplicateKeyError:
+            pass
+
+        existing = self.collection.find_one({"_id": key})
+        record = self._to_record(existing)
+        if record is not None and not (record["state"] == IN_PROGRESS and record["locked_until"] <= now):
+            return record
+        # the key expired or its request was abandoned; take it over unless another request just did
+        conditions = {"_id": key}
+        if existing is not None:
+            conditions.update(state=existing["state"], locked_until=existing["locked_until"])
+        try:
+            taken = self.collection.find_one_and_replace(conditions, document, upsert=existing is None)
+        except DuplicateKeyError:
+            return self.get(key)
+        if taken is None and existing is not None:
+            return self.get(key)
+        return None
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        return self._to_record(self.collection.find_one({"_id": key}))
+
+    def wait(self, key: str, timeout: float) -> Optional[Dict[str, Any]]:
+        """
+        Wait for a key in progress to complete or be released.
+
+        Args:
+            key (str): The scoped idempotency key.
+            timeout (float): The most seconds to wait.
+
+        Returns:
+            Optional[Dict[str, Any]]: The key's record, still in progress if the wait timed out, or None if released.
+        """
+        deadline = time.monotonic() + timeout
+        while True:
+            record = self.get(key)
+            if record is None or record["state"] != IN_PROGRESS or time.monotonic() >= deadline:
+                return record
+            time.sleep(POLL_SECONDS)
+
+    def complete(self, key: str, response: Dict[str, Any]) -> None:
+        """
+        Store the response of a claimed key for replay.
+
+        Args:
+            key (str): The scoped idempotency key.
+            response (Dict[str, Any]): The status, body and headers to replay.
+        """
+        self.collection.update_one({"_id": key}, {"$set": {"state": COMPLETED, "response": response}})
+
+    def release(self, key: str) -> None:
+        """
+        Give up a claimed key so that a retry runs the request again.
+
+        Args:
+            key (str): The scoped idempotency key.
+        """
+        self.collection.delete_one({"_id": key, "state": IN_PROGRESS})
+
+
+def claim(key: str, fingerprint: str, wait_seconds: float = IDEMPOTENCY_WAIT_SECONDS) -> Optional[Dict[str, Any]]:
+    """
+    Claim a key for the current request, coalescing it with a request already holding it.
+
+    A request whose key is in progress waits for that request to finish and shares its
+    result. If that request fails and releases the key, this one claims it and runs.
+
+    Args:
+        key (str): The scoped idempotency key.
+        fingerprint (str): The request's fingerprint.
+        wait_seconds (float): The most seconds to wait on a request in progress.
+
+    Returns:
+        Optional[Dict[str, Any]]: None if the request should run, otherwise the key's
+        record: completed, in progress after the wait ran out, or from a different request.
+    """
+    record = idempotency_store.begin(key, fingerprint)
+    if record is not None and record["state"] == IN_PROGRESS and record["fingerprint"] == fingerprint:
+        record = idempotency_store.wait(key, wait_seconds)
+        if record is None:
+            record = idempotency_store.begin(key, fingerprint)
+    return record
+
+
+def scoped_key(scope: str, user_id: Any, key: str) -> str:
+    """
+    Qualify a client's key by route and user, so clients cannot see each other's results.
+
+    Args:
+        scope (str): The route.
+        user_id (Any): The authenticated user.
+        key (str): The Idempotency-Key header.
+
+    Returns:
+        str: The key as stored.
+    """
+    return f"{scope}:{user_id}:{key}"
+
+
+def finish(key: str, status_code: int, body: str, headers: Iterable[Tuple[str, str]]) -> None:
+    """
+    Store a claimed key's response for replay, or release the key if the response is
+    transient so that a retry runs again.
+
+    Args:
+        key (str): The scoped idempotency key.
+        status_code (int): The response's status code.
+        body (str): The response body.
+        headers (Iterable[Tuple[str, str]]): The response headers.
+    """
+    if not is_replayable(status_code):
+        idempotency_store.release(key)
+        return
+    idempotency_store.complete(key, {
+        "status": status_code,
+        "body": body,
+        "headers": {name: value for name, value in headers if name in REPLAYED_HEADERS},
+    })
+
+
+def release(key: str) -> None:
+    """
+    Release a claimed key whose request failed, so that a retry runs again.
+
+    Args:
+        key (str): The scoped idempotency key.
+    """
+    idempotency_store.release(key)
+
+
+idempotency_store = MongoStore() if IDEMPOTENCY_BACKEND == "mongo" else MemoryStore()
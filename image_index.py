@@ -0,0 +1,227 @@
+"""
+File: image_index.py
+Author: Jack McArdle
+
+This file is part of CommunityEye.
+
+Email: mcardle-j9@ulster.ac.uk
+B-No: B00733578
+"""
+
+import logging
+import threading
+from typing import Any, Dict, List, Optional, Tuple
+from config import (
+    MONGO_COLLECTION_REPORTS,
+    MONGO_COLLECTION_REPORTS_ARCHIVE,
+    IMAGE_SIMILARITY_MAX_DISTANCE,
+)
+from clients import DB
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+reports = DB[MONGO_COLLECTION_REPORTS]
+
+# node layout: [hash, report IDs sharing that hash, {distance: child node}]
+HASH, REPORT_IDS, CHILDREN = 0, 1, 2
+
+
+def hamming_distance(first: int, second: int) -> int:
+    """
+    Count the differing bits between two hashes.
+
+    Args:
+        first (int): The first hash.
+        second (int): The second hash.
+
+    Returns:
+        int: The Hamming distance.
+    """
+    return (first ^ second).bit_count()
+
+
+class BKTree:
+    """
+    Burkhard-Keller tree of image hashes under the Hamming distance.
+
+    Each child edge is labelled with its distance from the parent, so the triangle
+    inequality lets a search with tolerance d skip every subtree whose edge label is
+    further than d from the query's distance to the parent.
+    """
+
+    def __init__(self):
+        self._root: Optional[list] = None
+        self._nodes_by_id: Dict[str, list] = {}
+
+    def __len__(self) -> int:
+        return len(self._nodes_by_id)
+
+    def add(self, image_hash: int, report_id: str) -> None:
+        """
+        Insert a report's image hash.
+
+        Args:
+            image_hash (int): The image hash.
+            report_id (str): The ID of the report the image belongs to.
+        """
+        if report_id in self._nodes_by_id:
+            return
+        if self._root is None:
+            self._root = [image_hash, [report_id], {}]
+            self._nodes_by_id[report_id] = self._root
+            return
+
+        node = self._root
+        while True:
+            distance = hamming_distance(image_hash, node[HASH])
+            if distance == 0:
+                node[REPORT_IDS].append(report_id)
+                self._nodes_by_id[report_id] = node
+                return
+            child = node[CHILDREN].get(distance)
+            if child is None:
+                child = [image_hash, [report_id], {}]
+                node[CHILDREN][distance] = child
+                self._nodes_by_id[report_id] = child
+                return
+            node = child
+
+    def discard(self, report_id: str) -> None:
+        """
+        Remove a report. Its node stays in place to route searches.
+
+        Args:
+            report_id (str): The ID of the report.
+        """
+        node = self._nodes_by_id.pop(report_id, None)
+        if node is not None:
+            node[REPORT_IDS].remove(report_id)
+
+    def search(self, image_hash: int, max_distance: int) -> List[Tuple[str, int]]:
+        """
+        Find all reports whose image hash is within a Hamming distance of the query.
+
+        Args:
+            image_hash (int): The query hash.
+            max_distance (int): The largest distance to include.
+
+        Returns:
+            List[Tuple[str, int]]: Report IDs and their distances, closest first.
+        """
+        matches = []
+        stack = [self._root] if self._root is not None else []
+        while stack:
+            node = stack.pop()
+            distance = hamming_distance(image_hash, node[HASH])
+            if distance <= max_distance:
+                matches.extend((report_id, distance) for report_id in node[REPORT_IDS])
+            for edge, child in node[CHILDREN].items():
+                if distance - max_distance <= edge <= distance + max_distance:
+                    stack.append(child)
+        matches.sort(key=lambda match: match[1])
+        return matches
+
+
+class ImageSimilarityIndex:
+    """
+    Thread-safe BK-tree of the image hashes of all reports, loaded on first use from the
+    reports collection, or from the given collection.
+    """
+
+    def __init__(self, collection: Any = None):
+        self.collection = collection
+        self._lock = threading.Lock()
+        self._tree = BKTree()
+        self._loaded = False
+
+    def _load(self) -> None:
+        """
+        Build the tree from its collection. Must be called with the lock held.
+        """
+        tree = BKTree()
+        collection = reports if self.collection is None else self.collection
+        cursor = collection.find(
+            {"image.dhash": {"$exists": True}}, {"image.dhash": 1}
+        )
+        for report in cursor:
+            tree.add(int(report["image"]["dhash"], 16), str(report["_id"]))
+        self._tree = tree
+        self._loaded = True
+        logger.info(f"Loaded {len(tree)} image hashes into the similarity index.")
+
+    def add(self, image_hash: str, report_id: str) -> None:
+        """
+        Add a newly created report's image hash.
+
+        Args:
+            image_hash (str): The hexadecimal image hash.
+            report_id (str): The ID of the report.
+        """
+        with self._lock:
+            if self._loaded:
+                self._tree.add(int(image_hash, 16), report_id)
+
+    def discard(self, report_id: str) -> None:
+        """
+        Remove a deleted report.
+
+        Args:
+            report_id (str): The ID of the report.
+        """
+        with self._lock:
+            self._tree.discard(report_id)
+
+    def invalidate(self) -> None:
+        """
+        Drop the tree so that it is fully reloaded on the next lookup.
+        """
+        with self._lock:
+            self._tree = BKTree()
+            self._loaded = False
+
+    def find_similar(
+        self, image_hash: str, max_distance: int = IMAGE_SIMILARITY_MAX_DISTANCE
+    ) -> List[Dict[str, object]]:
+        """
+        Find reports with visually near-identical images.
+
+        Args:
+            image_hash (str): The hexadecimal image hash to look up.
+            max_distance (int): The largest Hamming distance to treat as similar.
+
+        Returns:
+            List[Dict[str, object]]: Report IDs and distances, closest first.
+        """
+        with self._lock:
+            if not self._loaded:
+                self._load()
+            matches = self._tree.search(int(image_hash, 16), max_distance)
+        return [
+            {"report_id": report_id, "distance": distance}
+            for report_id, distance in matches
+        ]
+
+
+similar_images = ImageSimilarityIndex()
+# archived reports, searched only when a read asks for them
+archived_similar_images = ImageSimilarityIndex(DB[MONGO_COLLECTION_REPORTS_ARCHIVE])
+
+
+def find_similar_images(image_hash: Optional[str]) -> List[str]:
+    """
+    Look up the reports whose images are near-identical to a new image.
+
+    Args:
+        image_hash (Optional[str]): The hexadecimal hash of the new image.
+
+    Returns:
+        List[str]: The IDs of the matching reports, closest first.
+    """
+    if not image_hash:
+        return []
+    try:
+        return [match["report_id"] for match in similar_images.find_similar(image_hash)]
+    except Exception as e:
+        logger.error(f"Error looking up similar images: {e}")
+        return []
@@ -8,28 +8,23 @@ Email: mcardle-j9@ulster.ac.uk
 B-No: B00733578
 """
 
+import asyncio
 import logging
+from azure.core.exceptions import ResourceNotFoundError
 from PIL import Image, UnidentifiedImageError
-from PIL.ExifTags import TAGS
+from PIL.ExifTags import IFD
 from pillow_heif import register_heif_opener
 import io
-from azure.storage.blob import BlobServiceClient
-import config
+from clients import get_async_container_client, get_container_client
+from exif_utils import UnsupportedImageFormat, read_gps_info
+from metrics import stage_timer, timed
 from typing import Dict, Optional, Tuple, Union
 
 
 logging.basicConfig(level=logging.INFO)
 
 
-blob_service_client = BlobServiceClient(
-    account_url=f"https://{config.AZURE_STORAGE_ACCOUNT}.blob.core.windows.net/",
-    credential=config.AZURE_STORAGE_SAS,
-)
-container_client = blob_service_client.get_container_client(
-    config.AZURE_STORAGE_CONTAINER
-)
-
-
+@timed("upload_image")
 def upload_image(
     image,
 ) -> Union[
@@ -47,38 +42,135 @@ def upload_image(
         A dictionary containing image metadata including URL, name, dimensions, geolocation, and file size,
         or a tuple with an error message and status code.
     """
-    image_name = image.filename
+    # read from the upload itself, so a HEIC image's position does not depend on the transcode
+    geolocation = get_image_geolocation(image)
+    image, image_name = _convert_image(image)
 
-    # convert HEIC to JPEG if necessary, iphones capture HEIC images which can cause issues
-    if image.content_type == "image/heic":
-        logging.info("Converting HEIC image to JPEG.")
-        image_name = image_name.replace(".heic", ".jpg")
-        image = convert_image_heic(image)
+    try:
+        converted_image = _open_image(image)
+    except Exception as e:
+        logging.error(f"Error opening image: {e}")
+        return {"error": str(e)}, 500
+
+    blob_client = get_container_client().get_blob_client(image_name)
+    image.seek(0)
+    with stage_timer("blob_upload"):
+        blob_client.upload_blob(image, overwrite=True)
+    logging.info(
+        f"Image {image_name} uploaded successfully to Azure Blob Storage."
+    )
+
+    return _describe_image(image, image_name, blob_client.url, converted_image, geolocation)
+
+
+@timed("upload_image")
+async def upload_image_async(
+    image,
+) -> Union[
+    Dict[str, Union[str, Tuple[int, int], Optional[Dict[str, float]], int]],
+    Tuple[Dict[str, str], int],
+]:
+    """
+    Upload an image to Azure Blob Storage without blocking the event loop.
+
+    Decoding, conversion and hashing run in a worker thread, and the upload itself
+    uses the asynchronous blob client.
+
+    Args:
+        image: The image file to be uploaded.
+
+    Returns:
+        Union[Dict[str, Union[str, Tuple[int, int], Optional[Dict[str, float]], int]], Tuple[Dict[str, str], int]]:
+        The same image metadata as upload_image, or a tuple with an error message and status code.
+    """
+    geolocation = get_image_geolocation(image)
+    image, image_name = await asyncio.to_thread(_convert_image, image)
 
     try:
-        converted_image = Image.open(image)
-        converted_image.load()
+        converted_image = await asyncio.to_thread(_open_image, image)
     except Exception as e:
         logging.error(f"Error opening image: {e}")
         return {"error": str(e)}, 500
 
-    blob_client = container_client.get_blob_client(image_name)
+    blob_client = get_async_container_client().get_blob_client(image_name)
     image.seek(0)
-    blob_client.upload_blob(image, overwrite=True)
+    with stage_timer("blob_upload"):
+        await blob_client.upload_blob(image.read(), overwrite=True)
     logging.info(
         f"Image {image_name} uploaded successfully to Azure Blob Storage."
     )
 
-    image_data = {
-        "url": blob_client.url,
+    return await asyncio.to_thread(
+        _describe_image, image, image_name, blob_client.url, converted_image, geolocation
+    )
+
+
+def _convert_image(image) -> Tuple[object, str]:
+    """
+    Convert a HEIC upload to JPEG, leaving other formats untouched.
+
+    Args:
+        image: The uploaded image file.
+
+    Returns:
+        Tuple[object, str]: The image stream to store and its blob name.
+    """
+    image_name = image.filename
+
+    # convert HEIC to JPEG if necessary, iphones capture HEIC images which can cause issues
+    if image.content_type == "image/heic":
+        logging.info("Converting HEIC image to JPEG.")
+        image_name = image_name.replace(".heic", ".jpg")
+        image = convert_image_heic(image)
+
+    return image, image_name
+
+
+def _open_image(image) -> Image.Image:
+    """
+    Fully decode an image, raising if it is not a valid image.
+
+    Args:
+        image: The image stream.
+
+    Returns:
+        Image.Image: The decoded image.
+    """
+    converted_image = Image.open(image)
+    converted_image.load()
+    return converted_image
+
+
+def _describe_image(
+    image,
+    image_name: str,
+    url: str,
+    converted_image: Image.Image,
+    geolocation: Optional[Dict[str, float]],
+) -> Dict[str, Union[str, Tuple[int, int], Optional[Dict[str, float]], int]]:
+    """
+    Build the image subdocument stored on a report.
+
+    Args:
+        image: The uploaded image stream.
+        image_name (str): The blob name of the image.
+        url (str): The blob URL of the image.
+        converted_image (Image.Image): The decoded image.
+        geolocation (Optional[Dict[str, float]]): The position read from the upload's EXIF data.
+
+    Returns:
+        Dict[str, Union[str, Tuple[int, int], Optional[Dict[str, float]], int]]:
+        The URL, name, dimensions, geolocation, file size and perceptual hash of the image.
+    """
+    return {
+        "url": url,
         "image_name": image_name,
         "dimensions": converted_image.size,
-        "geolocation": get_image_geolocation(image),
+        "geolocation": geolocation,
         "file_size": image.tell(),
+        "dhash": compute_dhash(converted_image),
     }
 
-    return image_data
-
 
 def delete_image(image_name: str) -> bool:
     """
@@ -91,42 +183,66 @@ def delete_image(image_name: str) -> bool:
         bool: True if the image was deleted successfully, False otherwise.
     """
     try:
-        blob_client = container_client.get_blob_client(image_name)
-        if blob_client.exists():
-            blob_client.delete_blob()
-            logging.info(
-                f"Image {image_name} deleted successfully from Azure Blob Storage."
-            )
-            return True
-        else:
-            logging.warning(
-                f"Image {image_name} not found in Azure Blob Storage."
-            )
-            return False
+        # deleting straight away saves an exists() round trip; a missing blob is reported as such
+        get_container_client().get_blob_client(image_name).delete_blob()
+        logging.info(
+            f"Image {image_name} deleted successfully from Azure Blob Storage."
+        )
+        return True
+    except ResourceNotFoundError:
+        logging.warning(
+            f"Image {image_name} not found in Azure Blob Storage."
+        )
+        return False
     except Exception as e:
         logging.error(f"Error deleting image from Azure Blob Storage: {e}")
         return False
 
 
+async def delete_image_async(image_name: str) -> bool:
+    """
+    Delete an image from Azure Blob Storage using the asynchronous blob client.
+
+    Args:
+        image_name (str): The name of the image to be deleted.
+
+    Returns:
+        bool: True if the image was deleted successfully, False otherwise.
+    """
+    try:
+        await get_async_container_client().get_blob_client(image_name).delete_blob()
+        logging.info(
+            f"Image {image_name} deleted successfully from Azure Blob Storage."
+        )
+        return True
+    except ResourceNotFoundError:
+        logging.warning(
+            f"Image {image_name} not found in Azure Blob Storage."
+        )
+        return False
+    except Exception as e:
+        logging.error(f"Error deleting image from Azure Blob Storage: {e}")
+        return False
+
+
+@timed("image_geolocation")
 def get_image_geolocation(image) -> Optional[Dict[str, float]]:
     """
     Extract geolocation data from an image's EXIF metadata.
 
+    JPEG and HEIF images have only their EXIF bytes parsed; other formats are opened with
+    Pillow.
+
     Args:
         image: The image file from which to extract geolocation data.
 
     Returns:
         Optional[Dict[str, float]]: A dictionary containing latitude and longitude if available, otherwise None.
     """
-    GPSINFO_TAG = next(tag for tag, name in TAGS.items() if name == "GPSInfo")
-    image.seek(0)
-    image = Image.open(image)
-    exifdata = image.getexif()
-    if not exifdata:
-        logging.warning("No EXIF data found in the image.")
-        return None
-
-    gpsinfo = exifdata.get_ifd(GPSINFO_TAG)
+    try:
+        gpsinfo = read_gps_info(image)
+    except UnsupportedImageFormat:
+        gpsinfo = _read_gps_info_pil(image)
     if not gpsinfo:
         logging.warning("No GPS info found in the EXIF data.")
         return None
@@ -137,6 +253,52 @@ def get_image_geolocation(image) -> Optional[Dict[str, float]]:
     }
 
 
+def _read_gps_info_pil(image) -> Optional[Dict[int, object]]:
+    """
+    Read an image's GPS IFD by opening it with Pillow.
+
+    Args:
+        image: The image file.
+
+    Returns:
+        Optional[Dict[int, object]]: The GPS IFD keyed by tag, or None if the image has no EXIF data.
+    """
+    image.seek(0)
+    exifdata = Image.open(image).getexif()
+    image.seek(0)
+    if not exifdata:
+        logging.warning("No EXIF data found in the image.")
+        return None
+    return exifdata.get_ifd(IFD.GPSInfo)
+
+
+def compute_dhash(image: Image.Image, hash_size: int = 8) -> str:
+    """
+    Compute the difference hash (dHash) of an image.
+
+    The image is reduced to a (hash_size + 1) x hash_size greyscale thumbnail and each
+    bit records whether a pixel is brighter than its right-hand neighbour, so the hash
+    survives re-encoding, resizing and small crops.
+
+    Args:
+        image (Image.Image): The opened image.
+        hash_size (int): The number of bits per row of the hash.
+
+    Returns:
+        str: The hash as a hexadecimal string.
+    """
+    thumbnail = image.convert("L").resize(
+        (hash_size + 1, hash_size), Image.Resampling.LANCZOS
+    )
+    pixels = list(thumbnail.getdata())
+    value = 0
+    for row in range(hash_size):
+        offset = row * (hash_size + 1)
+        for col in range(hash_size):
+            value = (value << 1) | (pixels[offset + col] > pixels[offset + col + 1])
+    return f"{value:0{hash_size * hash_size // 4}x}"
+
+
 def decimal_coords(coords: Tuple[float, float, float], ref: str) -> float:
     """
     Convert GPS coordinates from degrees, minutes, seconds format to decimal degrees.
@@ -156,6 +318,7 @@ def decimal_coords(coords: Tuple[float, float, float], ref: str) -> float:
     return round(decimal_degrees, 6)
 
 
+@timed("convert_image_heic")
 def convert_image_heic(heic_image) -> Optional[io.BytesIO]:
     """
     Convert a HEIC image to JPEG format.
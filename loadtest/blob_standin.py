@@ -0,0 +1,194 @@
+"""
+File: blob_standin.py
+Author: Jack McArdle
+
+This file is part of CommunityEye.
+
+Email: mcardle-j9@ulster.ac.uk
+B-No: B00733578
+"""
+
+import argparse
+import base64
+import hashlib
+import logging
+import threading
+import time
+import uuid
+from email.utils import formatdate
+from typing import Dict, List, Tuple
+from urllib.parse import unquote, urlsplit
+from xml.sax.saxutils import escape
+from flask import Flask, Response, request
+
+logging.basicConfig(level=logging.WARNING)
+logger = logging.getLogger(__name__)
+
+
+def create_app(latency_ms: float = 0) -> Flask:
+    """
+    Build an in-memory stand-in for the Blob Storage operations the service uses.
+
+    It implements Put Blob, Get Blob Properties, Get Blob and Delete Blob on
+    http://host:port/<container>/<blob>, and List Blobs and batched Delete Blob on
+    http://host:port/<container>, which is enough for the Azure SDK when
+    AZURE_STORAGE_ACCOUNT_URL points at it. Blobs are kept in memory only.
+
+    Args:
+        latency_ms (float): Delay added to every request.
+
+    Returns:
+        Flask: The app.
+    """
+    app = Flask(__name__)
+    lock = threading.Lock()
+    blobs: Dict[Tuple[str, str], Dict] = {}
+
+    def headers(blob: Dict) -> Dict[str, str]:
+        return {
+            "ETag": blob["etag"],
+            "Last-Modified": blob["last_modified"],
+            "Content-MD5": blob["content_md5"],
+            "x-ms-blob-type": "BlockBlob",
+            "x-ms-request-server-encrypted": "false",
+            "x-ms-version": "2025-01-05",
+            "x-ms-request-id": str(uuid.uuid4()),
+        }
+
+    def not_found() -> Response:
+        return Response(
+            status=404,
+            headers={"x-ms-error-code": "BlobNotFound", "x-ms-version": "2025-01-05"},
+        )
+
+    def delete(container: str, blob_name: str) -> bool:
+        with lock:
+            return blobs.pop((container, blob_name), None) is not None
+
+    @app.route("/<container>", methods=["GET"])
+    def list_blobs(container: str) -> Response:
+        if request.args.get("comp") != "list":
+            return Response(status=400)
+        if latency_ms:
+            time.sleep(latency_ms / 1000)
+        prefix = request.args.get("prefix", "")
+        marker = request.args.get("marker", "")
+        max_results = int(request.args.get("maxresults", "5000"))
+        with lock:
+            names = sorted(
+                name for stored_container, name in blobs
+                if stored_container == container and name.startswith(prefix) and name > marker
+            )
+            page = [(name, blobs[(container, name)]) for name in names[:max_results]]
+        next_marker = page[-1][0] if len(names) > max_results else ""
+
+        entries = "".join(
+            f"<Blob><Name>{escape(name)}</Name><Properties>"
+            f"<Last-Modified>{stored['last_modified']}</Last-Modified><Etag>{stored['etag']}</Etag>"
+            f"<Content-Length>{len(stored['data'])}</Content-Length>"
+            f"<Content-Type>{escape(stored['content_type'])}</Content-Type>"
+            f"<BlobType>BlockBlob</BlobType></Properties></Blob>"
+            for name, stored in page
+        )
+        body = (
+            '<?xml version="1.0" encoding="utf-8"?>'
+            f'<EnumerationResults ContainerName="{escape(container)}">'
+            f"<Prefix>{escape(prefix)}</Prefix><MaxResults>{max_results}</MaxResults>"
+            f"<Blobs>{entries}</Blobs><NextMarker>{escape(next_marker)}</NextMarker></EnumerationResults>"
+        )
+        return Response(body, status=200, headers={"Content-Type": "application/xml", "x-ms-version": "2025-01-05"})
+
+    @app.route("/<container>", methods=["POST"])
+    def batch(container: str) -> Response:
+        if request.args.get("comp") != "batch":
+            return Response(status=400)
+        if latency_ms:
+            time.sleep(latency_ms / 1000)
+        boundary = request.mimetype_params["boundary"]
+        response_boundary = f"batchresponse_{uuid.uuid4()}"
+        parts: List[str] = []
+        for part in request.get_data().split(f"--{boundary}".encode())[1:]:
+            if part.startswith(b"--"):
+                break
+            # each part is an embedded HTTP request after its own MIME headers
+            mime_headers, _, http_request = part.strip().partition(b"\r\n\r\n")
+            content_id = next(
+                (line.split(b":", 1)[1].strip().decode() for line in mime_headers.split(b"\r\n")
+                 if line.lower().startswith(b"content-id:")),
+                "0",
+            )
+            method, target = http_request.split(b"\r\n", 1)[0].decode().split(" ")[:2]
+            path = unquote(urlsplit(target).path).lstrip("/")
+            blob_container, _, blob_name = path.partition("/")
+            if method == "DELETE" and delete(blob_container, blob_name):
+                status_line, error_code = "HTTP/1.1 202 Accepted", ""
+            else:
+                status_line, error_code = "HTTP/1.1 404 The specified blob does not exist.", "x-ms-error-code: BlobNotFound\r\n"
+            parts.append(
+                f"--{response_boundary}\r\nContent-Type: application/http\r\nContent-ID: {content_id}\r\n\r\n"
+                f"{status_line}\r\n{error_code}x-ms-request-id: {uuid.uuid4()}\r\nx-ms-version: 2025-01-05\r\n"
+                f"Content-Length: 0\r\n\r\n"
+            )
+        body = "".join(parts) + f"--{response_boundary}--\r\n"
+        return Response(
+            body,
+            status=202,
+            headers={
+                "Content-Type": f"multipart/mixed; boundary={response_boundary}",
+                "x-ms-version": "2025-01-05",
+                "x-ms-request-id": str(uuid.uuid4()),
+            },
+        )
+
+    @app.route("/<container>/<path:blob_name>", methods=["PUT", "HEAD", "GET", "DELETE"])
+    def blob(container: str, blob_name: str) -> Response:
+        if latency_ms:
+            time.sleep(latency_ms / 1000)
+        key = (container, blob_name)
+
+        if request.method == "PUT":
+            data = request.get_data()
+            stored = {
+                "data": data,
+                "etag": f'"0x{uuid.uuid4().hex[:16].upper()}"',
+                "last_modified": formatdate(usegmt=True),
+                "content_md5": base64.b64encode(hashlib.md5(data).digest()).decode(),
+                "content_type": request.headers.get("x-ms-blob-content-type", "application/octet-stream"),
+            }
+            with lock:
+                blobs[key] = stored
+            return Response(status=201, headers=headers(stored))
+
+        with lock:
+            stored = blobs.get(key)
+        if stored is None:
+            return not_found()
+
+        if request.method == "DELETE":
+            delete(container, blob_name)
+            return Response(status=202, headers={"x-ms-version": "2025-01-05", "x-ms-delete-type-permanent": "true"})
+
+        response_headers = headers(stored)
+        response_headers["Content-Type"] = stored["content_type"]
+        if request.method == "HEAD":
+            response_headers["Content-Length"] = str(len(stored["data"]))
+            return Response(status=200, headers=response_headers)
+
+        data = stored["data"]
+        byte_range = request.headers.get("x-ms-range") or request.headers.get("Range")
+        if not byte_range:
+            return Response(data, status=200, headers=response_headers)
+        start, _, end = byte_range.removeprefix("bytes=").partition("-")
+        start, end = int(start), min(int(end or len(data) - 1), len(data) - 1)
+        response_headers["Content-Range"] = f"bytes {start}-{end}/{len(data)}"
+        return Response(data[start:end + 1], status=206, headers=response_headers)
+
+    return app
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="In-memory Blob Storage stand-in for load tests.")
+    parser.add_argument("--port", type=int, default=10000)
+    parser.add_argument("--latency-ms", type=float, default=0)
+    args = parser.parse_args()
+    create_app(args.latency_ms).run(port=args.port, threaded=True)
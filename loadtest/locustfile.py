@@ -0,0 +1,207 @@
+"""
+File: locustfile.py
+Author: Jack McArdle
+
+This file is part of CommunityEye.
+
+Email: mcardle-j9@ulster.ac.uk
+B-No: B00733578
+"""
+
+import glob
+import io
+import json
+import os
+import random
+import sys
+import threading
+from locust import HttpUser, LoadTestShape, between, constant, events, task
+import numpy as np
+import piexif
+import jwt
+from shapely import contains_xy, prepare
+from shapely.geometry import shape
+
+# allow running from the loadtest directory as well as the repository root
+REPO_ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+sys.path.insert(0, REPO_ROOT)
+
+from config import FLASK_SECRET_KEY  # noqa: E402
+from benchmarks.photos import gps_exif, make_photo  # noqa: E402
+
+CATEGORIES = [
+    "Potholes",
+    "Street lighting fault",
+    "Obstructions",
+    "Spillages",
+    "Ironworks",
+    "Traffic lights",
+    "Crash barrier and guard-rail",
+    "Signs or road markings",
+    "Street cleaning issue",
+    "Missed bin collection",
+    "Abandoned vehicle",
+    "Dangerous structure or vacant building",
+    "Pavement issue",
+]
+PHOTO_POOL_SIZE = int(os.getenv("LOADTEST_PHOTO_POOL", "20"))
+PHOTO_SIZE = (1280, 960)
+LOCATION_POOL_SIZE = int(os.getenv("LOADTEST_LOCATION_POOL", "5000"))
+USER_ID_RANGE = int(os.getenv("LOADTEST_USERS", "100000"))
+
+photos = []
+locations = []
+
+
+def sample_locations(count, seed=0):
+    """
+    Draw uniformly distributed points inside the council areas shipped in data/geojsons.
+
+    Returns:
+        list: Dictionaries with 'Lat' and 'Lon' keys.
+    """
+    areas = []
+    for path in glob.glob(os.path.join(REPO_ROOT, "data", "geojsons", "Councils", "*.json")):
+        with open(path) as f:
+            areas.extend(shape(authority["area"]) for authority in json.load(f))
+    for area in areas:
+        prepare(area)
+    min_lon = min(area.bounds[0] for area in areas)
+    min_lat = min(area.bounds[1] for area in areas)
+    max_lon = max(area.bounds[2] for area in areas)
+    max_lat = max(area.bounds[3] for area in areas)
+
+    rng = np.random.default_rng(seed)
+    points = []
+    while len(points) < count:
+        lon = rng.uniform(min_lon, max_lon, count)
+        lat = rng.uniform(min_lat, max_lat, count)
+        inside = np.zeros(count, dtype=bool)
+        for area in areas:
+            inside |= contains_xy(area, lon, lat)
+        points.extend({"Lat": float(y), "Lon": float(x)} for x, y in zip(lon[inside], lat[inside]))
+    return points[:count]
+
+
+@events.init.add_listener
+def prepare_traffic(environment, **kwargs):
+    # photos are rendered once; every submission gets a fresh GPS block spliced in
+    for seed in range(PHOTO_POOL_SIZE):
+        photos.append(make_photo(seed=seed, size=PHOTO_SIZE))
+    locations.extend(sample_locations(LOCATION_POOL_SIZE))
+
+
+def make_token(user_id):
+    return jwt.encode({"user_id": user_id}, FLASK_SECRET_KEY, algorithm="HS256")
+
+
+def submission_photo():
+    """
+    Pick a pooled photo and tag it with a random location inside NI.
+
+    Returns:
+        bytes: The JPEG.
+    """
+    output = io.BytesIO()
+    piexif.insert(gps_exif(random.choice(locations)), random.choice(photos), output)
+    return output.getvalue()
+
+
+class CommunityEyeUser(HttpUser):
+    abstract = True
+
+    def on_start(self):
+        self.user_id = random.randrange(USER_ID_RANGE)
+        self.client.headers["x-access-token"] = make_token(self.user_id)
+
+    def submit_report(self, name="/api/v1/reports [submit]"):
+        return self.client.post(
+            "/api/v1/reports",
+            data={
+                "userID": str(self.user_id),
+                "description": "Reported during load testing",
+                "category": random.choice(CATEGORIES),
+            },
+            files={"image": ("photo.jpg", submission_photo(), "image/jpeg")},
+            name=name,
+        )
+
+
+class ReportSubmitter(CommunityEyeUser):
+    """
+    A member of the public submitting photos taken around NI.
+    """
+
+    weight = 2
+    wait_time = between(5, 15)
+
+    @task
+    def submit(self):
+        self.submit_report()
+
+
+class MapPoller(CommunityEyeUser):
+    """
+    A client with the map open, refreshing the reports shown on it.
+    """
+
+    weight = 8
+    wait_time = between(2, 5)
+
+    @task(5)
+    def poll_map(self):
+        self.client.get("/api/v1/reports", name="/api/v1/reports [map]")
+
+    @task(1)
+    def my_reports(self):
+        self.client.get(f"/api/v1/reports/user/{self.user_id}", name="/api/v1/reports/user/[id]")
+
+
+class UpvoteStorm(CommunityEyeUser):
+    """
+    Many distinct users upvoting one report at once, e.g. after it is shared online.
+    """
+
+    weight = 1
+    wait_time = constant(0.1)
+    target_report_id = None
+    target_lock = threading.Lock()
+
+    def on_start(self):
+        super().on_start()
+        with UpvoteStorm.target_lock:
+            if UpvoteStorm.target_report_id is None:
+                response = self.submit_report(name="/api/v1/reports [storm target]")
+                url = response.json().get("url") if response.ok else None
+                UpvoteStorm.target_report_id = url.rsplit("/", 1)[-1] if url else None
+
+    @task
+    def upvote(self):
+        if UpvoteStorm.target_report_id is None:
+            return
+        # each upvote comes from a new user, as a user can only upvote once
+        self.client.post(
+            f"/api/v1/reports/{UpvoteStorm.target_report_id}/upvote",
+            headers={"x-access-token": make_token(random.randrange(USER_ID_RANGE, 2 * USER_ID_RANGE))},
+            name="/api/v1/reports/[id]/upvote",
+        )
+
+
+if os.getenv("LOADTEST_STEP_USERS"):
+
+    class StepLoadShape(LoadTestShape):
+        """
+        Add LOADTEST_STEP_USERS users every LOADTEST_STEP_SECONDS up to LOADTEST_MAX_USERS,
+        so the report can show where throughput flattens and p99 latency degrades.
+        """
+
+        step_users = int(os.getenv("LOADTEST_STEP_USERS"))
+        step_seconds = int(os.getenv("LOADTEST_STEP_SECONDS", "60"))
+        max_users = int(os.getenv("LOADTEST_MAX_USERS", "500"))
+
+        def tick(self):
+            step = int(self.get_run_time() // self.step_seconds) + 1
+            users = step * self.step_users
+            if users > self.max_users:
+                return None
+            return users, self.step_users
@@ -0,0 +1,119 @@
+"""
+File: report.py
+Author: Jack McArdle
+
+This file is part of CommunityEye.
+
+Email: mcardle-j9@ulster.ac.uk
+B-No: B00733578
+"""
+
+import argparse
+import csv
+import json
+from collections import defaultdict
+
+
+def _number(value):
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def load_steps(history_path, name):
+    """
+    Summarise a locust stats history per user count.
+
+    Returns a list of steps with the user count, mean throughput, worst p99 and failure rate.
+    """
+    samples = defaultdict(list)
+    with open(history_path) as f:
+        for row in csv.DictReader(f):
+            if row["Name"] != name or row["User Count"] == "0":
+                continue
+            samples[int(row["User Count"])].append(row)
+
+    steps = []
+    for users, rows in sorted(samples.items()):
+        throughput = [_number(row["Requests/s"]) or 0 for row in rows]
+        failures = [_number(row["Failures/s"]) or 0 for row in rows]
+        p99 = [value for value in (_number(row["99%"]) for row in rows) if value is not None]
+        steps.append({
+            "users": users,
+            "requests_per_second": sum(throughput) / len(throughput),
+            "failures_per_second": sum(failures) / len(failures),
+            "p99_ms": max(p99) if p99 else None,
+        })
+    return steps
+
+
+def load_totals(stats_path):
+    """
+    Read the end-of-run throughput and latency of each request type.
+    """
+    totals = []
+    with open(stats_path) as f:
+        for row in csv.DictReader(f):
+            totals.append({
+                "name": row["Name"],
+                "requests": int(row["Request Count"]),
+                "failures": int(row["Failure Count"]),
+                "requests_per_second": _number(row["Requests/s"]),
+                "p50_ms": _number(row["50%"]),
+                "p95_ms": _number(row["95%"]),
+                "p99_ms": _number(row["99%"]),
+            })
+    return totals
+
+
+def find_capacity(steps, p99_limit_ms):
+    """
+    Find the busiest step whose p99 latency stayed within the limit.
+    """
+    capacity = None
+    for step in steps:
+        if step["p99_ms"] is None or step["p99_ms"] > p99_limit_ms:
+            break
+        capacity = step
+    return capacity
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Throughput and latency report for a locust run.")
+    parser.add_argument("prefix", help="the --csv prefix the locust run was started with")
+    parser.add_argument("--p99-limit-ms", type=float, default=1000)
+    parser.add_argument("--name", default="Aggregated", help="request name to track per step; needs --csv-full-history for anything but Aggregated")
+    parser.add_argument("--json", action="store_true", help="print the report as JSON")
+    args = parser.parse_args()
+
+    steps = load_steps(f"{args.prefix}_stats_history.csv", args.name)
+    totals = load_totals(f"{args.prefix}_stats.csv")
+    capacity = find_capacity(steps, args.p99_limit_ms)
+
+    if args.json:
+        print(json.dumps({"steps": steps, "totals": totals, "capacity": capacity}, indent=2))
+    else:
+        print(f"{'users':>8}{'req/s':>10}{'fail/s':>10}{'p99 ms':>10}  ({args.name})")
+        for step in steps:
+            p99 = f"{step['p99_ms']:.0f}" if step["p99_ms"] is not None else "-"
+            print(
+                f"{step['users']:>8}{step['requests_per_second']:>10.1f}"
+                f"{step['failures_per_second']:>10.2f}{p99:>10}"
+            )
+
+        print(f"\n{'request':<45}{'count':>8}{'fails':>8}{'req/s':>9}{'p50':>8}{'p95':>8}{'p99':>8}")
+        for total in totals:
+            print(
+                f"{total['name']:<45}{total['requests']:>8}{total['failures']:>8}"
+                f"{total['requests_per_second'] or 0:>9.2f}{total['p50_ms'] or 0:>8.0f}"
+                f"{total['p95_ms'] or 0:>8.0f}{total['p99_ms'] or 0:>8.0f}"
+            )
+
+        if capacity:
+            print(
+                f"\nSustained {capacity['requests_per_second']:.1f} req/s at {capacity['users']} users "
+                f"with p99 within {args.p99_limit_ms:.0f} ms"
+            )
+        else:
+            print(f"\np99 exceeded {args.p99_limit_ms:.0f} ms from the first step")
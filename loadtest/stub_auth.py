@@ -0,0 +1,62 @@
+"""
+File: stub_auth.py
+Author: Jack McArdle
+
+This file is part of CommunityEye.
+
+Email: mcardle-j9@ulster.ac.uk
+B-No: B00733578
+"""
+
+import argparse
+import logging
+import os
+import sys
+import time
+from flask import Flask, jsonify, make_response, request
+import jwt
+
+# allow running from the loadtest directory as well as the repository root
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from config import FLASK_SECRET_KEY  # noqa: E402
+
+logging.basicConfig(level=logging.WARNING)
+logger = logging.getLogger(__name__)
+
+
+def create_app(latency_ms: float = 0) -> Flask:
+    """
+    Build a stand-in for the auth service's token validation endpoint.
+
+    Tokens are accepted when they are signed with FLASK_SECRET_KEY, so load-test users
+    need no accounts. An optional delay approximates the real service's round trip.
+
+    Args:
+        latency_ms (float): Delay added to every validation.
+
+    Returns:
+        Flask: The app.
+    """
+    app = Flask(__name__)
+
+    @app.route("/api/v1/validate-token", methods=["POST"])
+    def validate_token():
+        if latency_ms:
+            time.sleep(latency_ms / 1000)
+        token = (request.get_json(silent=True) or {}).get("token", "")
+        try:
+            jwt.decode(token, FLASK_SECRET_KEY, algorithms=["HS256"])
+        except jwt.InvalidTokenError:
+            return make_response(jsonify({"message": "Token is invalid."}), 401)
+        return make_response(jsonify({"message": "Token is valid."}), 200)
+
+    return app
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Stub auth service for load tests.")
+    parser.add_argument("--port", type=int, default=5001)
+    parser.add_argument("--latency-ms", type=float, default=0)
+    args = parser.parse_args()
+    create_app(args.latency_ms).run(port=args.port, threaded=True)
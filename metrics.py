@@ -0,0 +1,239 @@
+"""
+File: metrics.py
+Author: Jack McArdle
+
+This file is part of CommunityEye.
+
+Email: mcardle-j9@ulster.ac.uk
+B-No: B00733578
+"""
+
+import asyncio
+import logging
+import os
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from functools import wraps
+from typing import Any, Callable, Dict, Iterator, Optional, Tuple
+from prometheus_client import (
+    CONTENT_TYPE_LATEST,
+    CollectorRegistry,
+    Counter,
+    Histogram,
+    generate_latest,
+    multiprocess,
+)
+from pymongo import monitoring
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+
+REQUEST_LATENCY = Histogram(
+    "communityeye_request_duration_seconds",
+    "Time spent handling HTTP requests.",
+    ["method", "route", "status"],
+)
+STAGE_LATENCY = Histogram(
+    "communityeye_stage_duration_seconds",
+    "Time spent in individual stages of request handling.",
+    ["stage"],
+)
+REJECTED_REQUESTS = Counter(
+    "communityeye_rejected_requests_total",
+    "Requests shed by rate limiting or admission control.",
+    ["scope", "reason"],
+)
+MONGO_COMMAND_LATENCY = Histogram(
+    "communityeye_mongo_command_duration_seconds",
+    "Time spent on MongoDB commands, as reported by the driver.",
+    ["collection", "command", "outcome"],
+)
+
+# set for the duration of a profiled request to collect the Mongo commands it issues
+request_mongo_stats: ContextVar[Optional[Dict[str, Any]]] = ContextVar(
+    "request_mongo_stats", default=None
+)
+
+
+@contextmanager
+def stage_timer(stage: str) -> Iterator[None]:
+    """
+    Record how long the enclosed block takes as a stage latency.
+
+    Args:
+        stage (str): The name of the stage.
+    """
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        STAGE_LATENCY.labels(stage=stage).observe(time.perf_counter() - started)
+
+
+def timed(stage: str) -> Callable[[Callable], Callable]:
+    """
+    Decorator recording each call of a function, or coroutine function, as a stage latency.
+
+    Args:
+        stage (str): The name of the stage.
+
+    Returns:
+        Callable[[Callable], Callable]: The decorator.
+    """
+    def decorator(func: Callable) -> Callable:
+        if asyncio.iscoroutinefunction(func):
+            @wraps(func)
+            async def async_timed_wrapper(*args: Any, **kwargs: Any) -> Any:
+                with stage_timer(stage):
+                    return await func(*args, **kwargs)
+
+            return async_timed_wrapper
+
+        @wraps(func)
+        def timed_wrapper(*args: Any, **kwargs: Any) -> Any:
+            with stage_timer(stage):
+                return func(*args, **kwargs)
+
+        return timed_wrapper
+
+    return decorator
+
+
+class MongoCommandListener(monitoring.CommandListener):
+    """
+    pymongo command listener that records command durations per collection and command.
+
+    The collection name is only present on the started event, so it is remembered
+    until the matching succeeded or failed event arrives.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._pending: Dict[Tuple[Any, int], str] = {}
+
+    def started(self, event: monitoring.CommandStartedEvent) -> None:
+        collection = event.command.get(event.command_name)
+        if not isinstance(collection, str):
+            collection = "none"
+        with self._lock:
+            self._pending[(event.connection_id, event.request_id)] = collection
+
+    def _finish(self, event: Any, outcome: str) -> None:
+        with self._lock:
+            collection = self._pending.pop(
+                (event.connection_id, event.request_id), "none"
+            )
+        seconds = event.duration_micros / 1_000_000
+        MONGO_COMMAND_LATENCY.labels(
+            collection=collection, command=event.command_name, outcome=outcome
+        ).observe(seconds)
+
+        # the synchronous driver publishes events on the thread that ran the command
+        stats = request_mongo_stats.get()
+        if stats is not None:
+            stats["count"] += 1
+            stats["total_seconds"] += seconds
+            stats["commands"].append(
+                {
+                    "collection": collection,
+                    "command": event.command_name,
+                    "outcome": outcome,
+                    "seconds": seconds,
+                }
+            )
+
+    def succeeded(self, event: monitoring.CommandSucceededEvent) -> None:
+        self._finish(event, "success")
+
+    def failed(self, event: monitoring.CommandFailedEvent) -> None:
+        self._finish(event, "failure")
+
+
+mongo_command_listener = MongoCommandListener()
+
+
+def render_metrics() -> Tuple[bytes, str]:
+    """
+    Render all metrics in the Prometheus text format.
+
+    When PROMETHEUS_MULTIPROC_DIR is set (e.g. under gunicorn), metrics from every
+    worker process are aggregated.
+
+    Returns:
+        Tuple[bytes, str]: The response body and its content type.
+    """
+    if os.getenv("PROMETHEUS_MULTIPROC_DIR"):
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+        return generate_latest(registry), CONTENT_TYPE_LATEST
+    return generate_latest(), CONTENT_TYPE_LATEST
+
+
+def _observe_request(method: str, rule: Any, status: int, started: Any) -> None:
+    if started is None:
+        return
+    route = rule.rule if rule is not None else "unmatched"
+    REQUEST_LATENCY.labels(method=method, route=route, status=str(status)).observe(
+        time.perf_counter() - started
+    )
+
+
+def init_app(app: Any) -> None:
+    """
+    Time every request of a Flask app and expose the metrics at /metrics.
+
+    Args:
+        app (Flask): The Flask app.
+    """
+    from flask import g, request
+
+    @app.before_request
+    def start_request_timer() -> None:
+        g.request_started = time.perf_counter()
+
+    @app.after_request
+    def record_request_latency(response: Any) -> Any:
+        _observe_request(
+            request.method,
+            request.url_rule,
+            response.status_code,
+            g.get("request_started"),
+        )
+        return response
+
+    @app.route("/metrics", methods=["GET"])
+    def metrics() -> Any:
+        body, content_type = render_metrics()
+        return body, 200, {"Content-Type": content_type}
+
+
+def init_async_app(app: Any) -> None:
+    """
+    Time every request of a Quart app and expose the metrics at /metrics.
+
+    Args:
+        app (Quart): The Quart app.
+    """
+    from quart import g, request
+
+    @app.before_request
+    async def start_request_timer() -> None:
+        g.request_started = time.perf_counter()
+
+    @app.after_request
+    async def record_request_latency(response: Any) -> Any:
+        _observe_request(
+            request.method,
+            request.url_rule,
+            response.status_code,
+            g.get("request_started"),
+        )
+        return response
+
+    @app.route("/metrics", methods=["GET"])
+    async def metrics() -> Any:
+        body, content_type = render_metrics()
+        return body, 200, {"Content-Type": content_type}
@@ -0,0 +1,244 @@
+"""
+File: profiling.py
+Author: Jack McArdle
+
+This file is part of CommunityEye.
+
+Email: mcardle-j9@ulster.ac.uk
+B-No: B00733578
+"""
+
+import cProfile
+import hashlib
+import hmac
+import json
+import logging
+import os
+import random
+import re
+import sys
+import threading
+import time
+import uuid
+from collections import Counter
+from typing import Any, Dict, List, Optional
+from flask import g, request
+from config import (
+    PROFILE_DIR,
+    PROFILE_MAX_FILES,
+    PROFILE_MODE,
+    PROFILE_SAMPLE_INTERVAL_MS,
+    PROFILE_SAMPLE_RATE,
+    PROFILE_SECRET,
+)
+from metrics import request_mongo_stats
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+PROFILE_HEADER = "x-profile"
+# signed profile requests are only honoured for this long after being signed
+PROFILE_SIGNATURE_MAX_AGE = 300
+
+
+def sign_profile_request(method: str, path: str, timestamp: int, secret: str) -> str:
+    """
+    Build the x-profile header value that requests a profile of a single request.
+
+    Args:
+        method (str): The HTTP method of the request.
+        path (str): The path of the request, without the query string.
+        timestamp (int): Unix timestamp at which the header was signed.
+        secret (str): The shared PROFILE_SECRET.
+
+    Returns:
+        str: The header value, "<timestamp>:<hex HMAC-SHA256>".
+    """
+    message = f"{timestamp}:{method.upper()}:{path}".encode()
+    signature = hmac.new(secret.encode(), message, hashlib.sha256).hexdigest()
+    return f"{timestamp}:{signature}"
+
+
+def _has_valid_signature(header: Optional[str]) -> bool:
+    """
+    Check the x-profile header of the current request.
+
+    Args:
+        header (Optional[str]): The header value.
+
+    Returns:
+        bool: True if the header was signed with PROFILE_SECRET recently.
+    """
+    if not header or not PROFILE_SECRET:
+        return False
+    try:
+        timestamp = int(header.split(":", 1)[0])
+    except ValueError:
+        return False
+    if abs(time.time() - timestamp) > PROFILE_SIGNATURE_MAX_AGE:
+        return False
+    expected = sign_profile_request(request.method, request.path, timestamp, PROFILE_SECRET)
+    return hmac.compare_digest(header, expected)
+
+
+class StackSampler:
+    """
+    Statistical profiler that periodically samples the stack of one thread.
+
+    Samples are aggregated into collapsed stacks ("frame;frame;frame count"), the
+    input format of flamegraph.pl and speedscope.
+    """
+
+    def __init__(self, thread_id: int, interval_seconds: float):
+        self.thread_id = thread_id
+        self.interval_seconds = interval_seconds
+        self.stacks: Counter = Counter()
+        self._stopped = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def _run(self) -> None:
+        while not self._stopped.wait(self.interval_seconds):
+            frame = sys._current_frames().get(self.thread_id)
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append(
+                    f"{code.co_name} ({os.path.basename(code.co_filename)}:{frame.f_lineno})"
+                )
+                frame = frame.f_back
+            if stack:
+                self.stacks[";".join(reversed(stack))] += 1
+
+    def start(self) -> None:
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stopped.set()
+        self._thread.join()
+
+    def write(self, path: str) -> None:
+        """
+        Write the collapsed stacks to a file.
+
+        Args:
+            path (str): The destination file.
+        """
+        with open(path, "w") as f:
+            for stack, count in self.stacks.most_common():
+                f.write(f"{stack} {count}\n")
+
+
+def _should_profile() -> bool:
+    if _has_valid_signature(request.headers.get(PROFILE_HEADER)):
+        return True
+    return PROFILE_SAMPLE_RATE > 0 and random.random() < PROFILE_SAMPLE_RATE
+
+
+def _prune_profiles() -> None:
+    """
+    Delete the oldest profiles beyond PROFILE_MAX_FILES.
+    """
+    summaries = sorted(
+        name for name in os.listdir(PROFILE_DIR) if name.endswith(".json")
+    )
+    for name in summaries[:-PROFILE_MAX_FILES] if PROFILE_MAX_FILES > 0 else []:
+        profile_id = name[: -len(".json")]
+        for file_name in os.listdir(PROFILE_DIR):
+            if file_name.startswith(profile_id):
+                os.remove(os.path.join(PROFILE_DIR, file_name))
+
+
+def list_profiles() -> List[Dict[str, Any]]:
+    """
+    Retrieve the summaries of all stored profiles, newest first.
+
+    Returns:
+        List[Dict[str, Any]]: The profile summaries.
+    """
+    if not os.path.isdir(PROFILE_DIR):
+        return []
+    summaries = []
+    for name in sorted(os.listdir(PROFILE_DIR), reverse=True):
+        if name.endswith(".json"):
+            with open(os.path.join(PROFILE_DIR, name)) as f:
+                summaries.append(json.load(f))
+    return summaries
+
+
+def init_app(app: Any) -> None:
+    """
+    Install the opt-in per-request profiler on a Flask app.
+
+    A request is profiled when it carries a valid signed x-profile header or is picked
+    by PROFILE_SAMPLE_RATE. The profile, together with the number and total time of
+    the Mongo commands the request issued, is stored in PROFILE_DIR.
+
+    Args:
+        app (Flask): The Flask app.
+    """
+
+    @app.before_request
+    def start_profile() -> None:
+        if not _should_profile():
+            return
+
+        g.profile_started = time.perf_counter()
+        g.profile_mongo_token = request_mongo_stats.set(
+            {"count": 0, "total_seconds": 0.0, "commands": []}
+        )
+        if PROFILE_MODE == "cprofile":
+            g.profiler = cProfile.Profile()
+            g.profiler.enable()
+        else:
+            g.profiler = StackSampler(
+                threading.get_ident(), PROFILE_SAMPLE_INTERVAL_MS / 1000
+            )
+            g.profiler.start()
+
+    @app.after_request
+    def finish_profile(response: Any) -> Any:
+        profiler = g.pop("profiler", None)
+        if profiler is None:
+            return response
+
+        duration = time.perf_counter() - g.pop("profile_started")
+        token = g.pop("profile_mongo_token")
+        mongo_stats = request_mongo_stats.get()
+        request_mongo_stats.reset(token)
+
+        if isinstance(profiler, cProfile.Profile):
+            profiler.disable()
+        else:
+            profiler.stop()
+
+        try:
+            os.makedirs(PROFILE_DIR, exist_ok=True)
+            route = request.url_rule.rule if request.url_rule else request.path
+            slug = re.sub(r"[^A-Za-z0-9]+", "-", route).strip("-")
+            profile_id = f"{int(time.time() * 1000)}-{request.method}-{slug}-{uuid.uuid4().hex[:8]}"
+
+            if isinstance(profiler, cProfile.Profile):
+                profile_file = f"{profile_id}.prof"
+                profiler.dump_stats(os.path.join(PROFILE_DIR, profile_file))
+            else:
+                profile_file = f"{profile_id}.folded"
+                profiler.write(os.path.join(PROFILE_DIR, profile_file))
+
+            summary = {
+                "id": profile_id,
+                "file": profile_file,
+                "method": request.method,
+                "path": request.path,
+                "route": route,
+                "status": response.status_code,
+                "duration_seconds": round(duration, 6),
+                "mongo": mongo_stats,
+                "created_at": int(time.time()),
+            }
+            with open(os.path.join(PROFILE_DIR, f"{profile_id}.json"), "w") as f:
+                json.dump(summary, f, indent=2)
+            _prune_profiles()
+            logger.info(f"Stored profile {profile_file} for {request.method} {request.path}")
+        except Exception as e:
+            logger.error(f"Error storing request profile: {e}")
+        return response
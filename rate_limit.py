@@ -0,0 +1,298 @@
+"""
+File: rate_limit.py
+Author: Jack McArdle
+
+This file is part of CommunityEye.
+
+Email: mcardle-j9@ulster.ac.uk
+B-No: B00733578
+"""
+
+import asyncio
+import logging
+import math
+import threading
+import time
+from collections import OrderedDict
+from contextlib import asynccontextmanager, contextmanager
+from typing import Any, AsyncIterator, Dict, Iterator, List, Optional, Tuple
+from pymongo import ReturnDocument
+from config import (
+    IMAGE_PROCESSING_MAX_CONCURRENCY,
+    IMAGE_PROCESSING_QUEUE_TIMEOUT,
+    MONGO_COLLECTION_RATE_LIMITS,
+    RATE_LIMIT_BACKEND,
+    RATE_LIMIT_ENABLED,
+    RATE_LIMIT_IP_MULTIPLIER,
+    RATE_LIMIT_MAX_KEYS,
+    RATE_LIMIT_TRUST_FORWARDED_FOR,
+    RATE_LIMIT_TRUSTED_PROXIES,
+    RATE_LIMITS,
+)
+from clients import DB
+from metrics import REJECTED_REQUESTS
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+
+class MemoryBackend:
+    """
+    Token buckets held in this process, least recently used first so the oldest can be
+    dropped once RATE_LIMIT_MAX_KEYS are held. A dropped bucket was idle the longest and
+    starts full again, which is what it would have refilled to anyway in most cases.
+    """
+
+    def __init__(self, max_keys: int = RATE_LIMIT_MAX_KEYS):
+        self.max_keys = max_keys
+        self._lock = threading.Lock()
+        self._buckets: "OrderedDict[str, Tuple[float, float]]" = OrderedDict()
+
+    def take(self, key: str, capacity: float, refill_per_second: float) -> Tuple[bool, float]:
+        """
+        Take a token from a bucket, refilling it for the time since it was last used.
+
+        Args:
+            key (str): The bucket.
+            capacity (float): The most tokens the bucket holds.
+            refill_per_second (float): The tokens added each second.
+
+        Returns:
+            Tuple[bool, float]: Whether a token was taken, and the tokens left.
+        """
+        now = time.monotonic()
+        with self._lock:
+            tokens, updated = self._buckets.pop(key, (capacity, now))
+            tokens = min(capacity, tokens + (now - updated) * refill_per_second)
+            allowed = tokens >= 1
+            if allowed:
+                tokens -= 1
+            self._buckets[key] = (tokens, now)
+            while len(self._buckets) > self.max_keys:
+                self._buckets.popitem(last=False)
+        return allowed, tokens
+
+    def clear(self) -> None:
+        with self._lock:
+            self._buckets.clear()
+
+
+class MongoBackend:
+    """
+    Token buckets shared by every worker and host through a collection. Each take is one
+    atomic find_one_and_update with a pipeline that refills and decrements the bucket on
+    the server; idle buckets expire through a TTL index.
+    """
+
+    def __init__(self, collection_name: str = MONGO_COLLECTION_RATE_LIMITS):
+        self.collection = DB[collection_name]
+        self._indexed = False
+
+    def take(self, key: str, capacity: float, refill_per_second: float) -> Tuple[bool, float]:
+        """
+        Take a token from a bucket, refilling it for the time since it was last used.
+
+        Args:
+            key (str): The bucket.
+            capacity (float): The most tokens the bucket holds.
+            refill_per_second (float): The tokens added each second.
+
+        Returns:
+            Tuple[bool, float]: Whether a token was taken, and the tokens left.
+        """
+        if not self._indexed:
+            self.collection.create_index("expires_at", expireAfterSeconds=0)
+            self._indexed = True
+        now = time.time()
+        refilled = {
+            "$min": [
+                capacity,
+                {
+                    "$add": [
+                        {"$ifNull": ["$tokens", capacity]},
+                        {"$multiply": [{"$subtract": [now, {"$ifNull": ["$updated_at", now]}]}, refill_per_second]},
+                    ]
+                },
+            ]
+        }
+        document = self.collection.find_one_and_update(
+            {"_id": key},
+            [
+                {"$set": {"tokens": refilled, "updated_at": now}},
+                {
+                    "$set": {
+                        "allowed": {"$gte": ["$tokens", 1]},
+                        "tokens": {"$cond": [{"$gte": ["$tokens", 1]}, {"$subtract": ["$tokens", 1]}, "$tokens"]},
+                        # a bucket left alone this long is full again and can be forgotten
+                        "expires_at": {"$toDate": (now + capacity / refill_per_second) * 1000},
+                    }
+                },
+            ],
+            upsert=True,
+            return_document=ReturnDocument.AFTER,
+        )
+        return document["allowed"], document["tokens"]
+
+
+class RateLimiter:
+    """
+    Token-bucket limits on a scope (an endpoint), applied per user and per client IP.
+
+    Each user may make `capacity` requests in a burst and `per_minute` a minute after
+    that. Clients sharing an IP, e.g. behind NAT, share RATE_LIMIT_IP_MULTIPLIER times
+    as many. A backend failure lets the request through rather than failing it.
+    """
+
+    def __init__(
+        self, limits: Dict[str, Dict[str, float]], backend: Any, ip_multiplier: float = RATE_LIMIT_IP_MULTIPLIER
+    ):
+        self.limits = limits
+        self.backend = backend
+        self.ip_multiplier = ip_multiplier
+
+    def check(self, scope: str, user_id: Any, ip: Optional[str]) -> Optional[int]:
+        """
+        Take a token from the user's and the IP's buckets for a scope.
+
+        Args:
+            scope (str): The limited scope, a key of RATE_LIMITS.
+            user_id (Any): The authenticated user, or None.
+            ip (Optional[str]): The client's IP address.
+
+        Returns:
+            Optional[int]: None if the request may proceed, otherwise the seconds to wait.
+        """
+        limit = self.limits.get(scope)
+        if limit is None:
+            return None
+        buckets: List[Tuple[str, float, float]] = []
+        refill = limit["per_minute"] / 60
+        if user_id is not None:
+            buckets.append((f"{scope}:user:{user_id}", limit["capacity"], refill))
+        if ip:
+            buckets.append((f"{scope}:ip:{ip}", limit["capacity"] * self.ip_multiplier, refill * self.ip_multiplier))
+
+        for key, capacity, refill_per_second in buckets:
+            try:
+                allowed, tokens = self.backend.take(key, capacity, refill_per_second)
+            except Exception as e:
+                logger.error(f"Rate limit backend failed for {key}: {e}")
+                continue
+            if not allowed:
+                REJECTED_REQUESTS.labels(scope=scope, reason="rate_limited").inc()
+                logger.warning(f"Rate limited {key}")
+                return max(1, math.ceil((1 - tokens) / refill_per_second))
+        return None
+
+
+class ConcurrencyLimiter:
+    """
+    Bounds how many requests run a stage at once in this process, for the threaded app.
+
+    A request that cannot get a slot within the queue timeout is shed instead of queueing
+    behind work the worker cannot keep up with.
+    """
+
+    def __init__(self, name: str, limit: int, queue_timeout: float):
+        self.name = name
+        self.limit = limit
+        self.queue_timeout = queue_timeout
+        self._slots = threading.BoundedSemaphore(limit)
+
+    @contextmanager
+    def admit(self) -> Iterator[bool]:
+        """
+        Hold a slot for the duration of the block.
+
+        Yields:
+            bool: Whether a slot was acquired; the caller sheds the request if not.
+        """
+        admitted = self._slots.acquire(timeout=self.queue_timeout)
+        if not admitted:
+            REJECTED_REQUESTS.labels(scope=self.name, reason="overloaded").inc()
+            logger.warning(f"Shedding {self.name}: {self.limit} already in progress")
+        try:
+            yield admitted
+        finally:
+            if admitted:
+                self._slots.release()
+
+
+class AsyncConcurrencyLimiter:
+    """
+    Counterpart of ConcurrencyLimiter for the asynchronous app.
+
+    The semaphore is created on first use so that it belongs to the serving event loop.
+    """
+
+    def __init__(self, name: str, limit: int, queue_timeout: float):
+        self.name = name
+        self.limit = limit
+        self.queue_timeout = queue_timeout
+        self._slots: Optional[asyncio.Semaphore] = None
+
+    @asynccontextmanager
+    async def admit(self) -> AsyncIterator[bool]:
+        """
+        Hold a slot for the duration of the block.
+
+        Yields:
+            bool: Whether a slot was acquired; the caller sheds the request if not.
+        """
+        if self._slots is None:
+            self._slots = asyncio.Semaphore(self.limit)
+        try:
+            await asyncio.wait_for(self._slots.acquire(), self.queue_timeout)
+            admitted = True
+        except asyncio.TimeoutError:
+            admitted = False
+            REJECTED_REQUESTS.labels(scope=self.name, reason="overloaded").inc()
+            logger.warning(f"Shedding {self.name}: {self.limit} already in progress")
+        try:
+            yield admitted
+        finally:
+            if admitted:
+                self._slots.release()
+
+
+def client_ip(remote_addr: Optional[str], forwarded_for: Optional[str]) -> Optional[str]:
+    """
+    Find the client's IP address, trusting X-Forwarded-For only when configured to.
+
+    Proxies append the address they received the request from, so only the last
+    RATE_LIMIT_TRUSTED_PROXIES entries were written by them. The leftmost of those is the
+    client; entries further left are whatever the client sent.
+
+    Args:
+        remote_addr (Optional[str]): The address of the connecting peer.
+        forwarded_for (Optional[str]): The X-Forwarded-For header.
+
+    Returns:
+        Optional[str]: The client's IP address.
+    """
+    if RATE_LIMIT_TRUST_FORWARDED_FOR and forwarded_for:
+        entries = [entry.strip() for entry in forwarded_for.split(",") if entry.strip()]
+        if entries:
+            return entries[-min(RATE_LIMIT_TRUSTED_PROXIES, len(entries))]
+    return remote_addr
+
+
+def check_rate_limit(scope: str, user_id: Any, ip: Optional[str]) -> Optional[int]:
+    """
+    Apply the configured limits of a scope to a request.
+
+    Returns:
+        Optional[int]: None if the request may proceed, otherwise the seconds to wait.
+    """
+    if not RATE_LIMIT_ENABLED:
+        return None
+    return rate_limiter.check(scope, user_id, ip)
+
+
+rate_limiter = RateLimiter(RATE_LIMITS, MongoBackend() if RATE_LIMIT_BACKEND == "mongo" else MemoryBackend())
+image_processing = ConcurrencyLimiter(
+    "image_processing", IMAGE_PROCESSING_MAX_CONCURRENCY, IMAGE_PROCESSING_QUEUE_TIMEOUT
+)
+async_image_processing = AsyncConcurrencyLimiter(
+    "image_processing", IMAGE_PROCESSING_MAX_CONCURRENCY, IMAGE_PROCESSING_QUEUE_TIMEOUT
+)
@@ -10,10 +10,16 @@ B-No: B00733578
 
 import json
 import logging
-from typing import List, Dict, Optional
+import time
+from typing import List, Dict, Mapping, Optional
 from geojson import Point, Polygon
-from config import MONGO_COLLECTION_AUTHORITIES, DB
-from shapely.geometry import Point, Polygon, MultiPolygon
+from config import MONGO_COLLECTION_AUTHORITIES
+from clients import DB
+from boundary_store import boundary_store
+from routing import routing_rules
+from shapely import contains_xy, prepare
+from shapely.geometry import Point, Polygon, MultiPolygon, shape
+from metrics import timed
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
@@ -21,6 +27,7 @@ logger = logging.getLogger(__name__)
 authorities = DB[MONGO_COLLECTION_AUTHORITIES]
 
 
+@timed("is_within_boundaries")
 def is_within_boundaries(geolocation: Dict[str, float]) -> bool:
     """
     Check if a given geolocation is within the boundaries defined in a GeoJSON file.
@@ -67,25 +74,41 @@ def is_within_boundaries(geolocation: Dict[str, float]) -> bool:
     return False
 
 
-def get_local_authorities() -> List[Dict]:
+def filter_within_boundaries(geolocations: List[Dict[str, float]]) -> List[bool]:
     """
-    Retrieve all local authorities from the database.
+    Check a batch of geolocations against the NI boundaries, reading the GeoJSON once.
+
+    Parameters:
+    - geolocations (List[Dict[str, float]]): Dictionaries containing 'Lon' and 'Lat' keys.
 
     Returns:
-    - List[Dict]: A list of dictionaries containing authority data.
+    - List[bool]: Whether each geolocation is within any boundary.
     """
-    authorities_data = []
+    if not geolocations:
+        return []
     try:
-        for authority in authorities.find():
-            authority["_id"] = str(authority["_id"])
-            authorities_data.append(authority)
+        with open(
+            "data/geojsons/OSNI_Open_Data_-_Largescale_Boundaries_-_NI_Outline.geojson"
+        ) as f:
+            geojson = json.load(f)
     except Exception as e:
-        logging.error(f"Error retrieving authorities: {e}")
-    return authorities_data
+        logging.error(f"Error loading GeoJSON file: {e}")
+        return [False] * len(geolocations)
+
+    lons = [geolocation["Lon"] for geolocation in geolocations]
+    lats = [geolocation["Lat"] for geolocation in geolocations]
+    within = [False] * len(geolocations)
+    for feature in geojson["features"]:
+        area = shape(feature["geometry"])
+        prepare(area)
+        for index, inside in enumerate(contains_xy(area, lons, lats)):
+            within[index] = within[index] or bool(inside)
+    return within
 
 
+@timed("determine_report_authority")
 def determine_report_authority(
-    geolocation: Dict[str, float], category: str
+    geolocation: Dict[str, float], category: str, created_at: Optional[float] = None
 ) -> Optional[str]:
     """
     Determine the relevant authority for a given report based on geolocation and category.
@@ -93,61 +116,66 @@ def determine_report_authority(
     Parameters:
     - geolocation (Dict[str, float]): A dictionary containing 'Lon' and 'Lat' keys for longitude and latitude.
     - category (str): The category of the report.
+    - created_at (Optional[float]): When the report was made, for time-windowed routing rules; now if not given.
 
     Returns:
     - Optional[str]: The name of the relevant authority, or None if no authority is found.
     """
-    authorities_data = get_local_authorities()
-    point = Point([geolocation["Lon"], geolocation["Lat"]])
-
-    infrastructure_categories = {
-        "Potholes",
-        "Street lighting fault",
-        "Obstructions",
-        "Spillages",
-        "Ironworks",
-        "Traffic lights",
-        "Crash barrier and guard-rail",
-        "Signs or road markings",
-    }
+    try:
+        relevant_authority_type = routing_rules.get().authority_type(
+            category, geolocation["Lon"], geolocation["Lat"], created_at
+        )
+    except Exception as e:
+        logging.error(f"Error loading routing rules: {e}")
+        return None
+    if relevant_authority_type is None:
+        logging.warning(f"Category not recognized: {category}")
+        return None
 
-    council_categories = {
-        "Street cleaning issue",
-        "Missed bin collection",
-        "Abandoned vehicle",
-        "Dangerous structure or vacant building",
-        "Pavement issue",
-    }
+    try:
+        boundaries = boundary_store.get()
+    except Exception as e:
+        logging.error(f"Error loading authority boundaries: {e}")
+        return None
 
-    if category in infrastructure_categories:
-        relevant_authority_type = "Department for Infrastructure"
-    elif category in council_categories:
-        relevant_authority_type = "Council"
+    authority_name = boundaries.locate(
+        [geolocation["Lon"]], [geolocation["Lat"]], [relevant_authority_type]
+    )[0]
+    if authority_name is None:
+        logging.info("No relevant authority found.")
     else:
-        logging.warning(f"Category not recognized: {category}")
-        return None
+        logging.info(f"Authority found: {authority_name}")
+    return authority_name
 
-    filtered_authorities = [
-        authority
-        for authority in authorities_data
-        if authority["authority_type"] == relevant_authority_type
-    ]
 
-    for authority in filtered_authorities:
-        coords = authority["area"]["coordinates"]
+def determine_report_authorities(
+    geolocations: List[Dict[str, float]],
+    categories: List[str],
+    created_at: Optional[List[Optional[float]]] = None,
+) -> List[Optional[str]]:
+    """
+    Determine the relevant authority for a batch of reports in one pass over the boundaries.
 
-        if authority["area"]["type"] == "MultiPolygon":
-            polygons = [Polygon(poly[0]) for poly in coords]
-        else:
-            polygons = [Polygon(coords[0])]
+    Parameters:
+    - geolocations (List[Dict[str, float]]): Dictionaries containing 'Lon' and 'Lat' keys.
+    - categories (List[str]): The category of each report.
+    - created_at (Optional[List[Optional[float]]]): When each report was made; now if not given.
 
-        for polygon in polygons:
-            if point.within(polygon):
-                logging.info(f"Authority found: {authority['authority_name']}")
-                return authority["authority_name"]
+    Returns:
+    - List[Optional[str]]: The name of each report's authority, or None if no authority is found.
+    """
+    if not geolocations:
+        return []
+    lons = [geolocation["Lon"] for geolocation in geolocations]
+    lats = [geolocation["Lat"] for geolocation in geolocations]
+    try:
+        authority_types = routing_rules.get().authority_types(categories, lons, lats, created_at)
+        boundaries = boundary_store.get()
+    except Exception as e:
+        logging.error(f"Error loading routing rules or authority boundaries: {e}")
+        return [None] * len(geolocations)
 
-    logging.info("No relevant authority found.")
-    return None
+    return boundaries.locate(lons, lats, authority_types)
 
 
 def send_email(
@@ -179,3 +207,44 @@ def send_email(
         logging.info(f"Body: {body}")
     except Exception as e:
         logging.error(f"Error sending email: {e}")
+
+
+def build_new_report(
+    form: Mapping[str, str],
+    image_data: Dict,
+    authority: Optional[str],
+    similar_reports: List[str],
+) -> Dict:
+    """
+    Build the document stored for a newly submitted report.
+
+    Parameters:
+    - form (Mapping[str, str]): The submitted form fields (userID, description, category).
+    - image_data (Dict): The metadata of the uploaded image, including its geolocation.
+    - authority (Optional[str]): The name of the authority the report is routed to.
+    - similar_reports (List[str]): IDs of reports with near-identical images.
+
+    Returns:
+    - Dict: The report document.
+    """
+    return {
+        "user_id": int(form["userID"]),
+        "description": form["description"],
+        "category": form["category"],
+        "geolocation": {
+            "type": "Feature",
+            "geometry": {
+                "type": "Point",
+                "coordinates": [
+                    image_data["geolocation"]["Lat"],
+                    image_data["geolocation"]["Lon"],
+                ],
+            },
+        },
+        "authority": authority,
+        "image": image_data,
+        "similar_reports": similar_reports,
+        "resolved": False,
+        "upvote_count": 0,
+        "created_at": int(time.time()),
+    }
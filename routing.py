@@ -0,0 +1,263 @@
+"""
+File: routing.py
+Author: Jack McArdle
+
+This file is part of CommunityEye.
+
+Email: mcardle-j9@ulster.ac.uk
+B-No: B00733578
+"""
+
+import json
+import logging
+import threading
+import time
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Tuple
+from config import (
+    MONGO_COLLECTION_ROUTING_RULES,
+    ROUTING_RULES_FILE,
+    ROUTING_RULES_SOURCE,
+)
+from clients import DB
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+routing_rules_collection = DB[MONGO_COLLECTION_ROUTING_RULES]
+
+
+class ConditionalRule:
+    """
+    A rule that only applies to reports inside a bounding box and/or inside a time window.
+    """
+
+    __slots__ = ("authority_type", "bbox", "hours", "days")
+
+    def __init__(
+        self,
+        authority_type: str,
+        bbox: Optional[Tuple[float, float, float, float]],
+        hours: Optional[Tuple[int, int]],
+        days: Optional[frozenset],
+    ):
+        self.authority_type = authority_type
+        self.bbox = bbox
+        self.hours = hours
+        self.days = days
+
+    def matches(self, lon: Optional[float], lat: Optional[float], timestamp: float) -> bool:
+        if self.bbox is not None:
+            min_lon, min_lat, max_lon, max_lat = self.bbox
+            if lon is None or lat is None or not (min_lon <= lon <= max_lon and min_lat <= lat <= max_lat):
+                return False
+        if self.hours is not None or self.days is not None:
+            moment = time.gmtime(timestamp)
+            if self.days is not None and moment.tm_wday not in self.days:
+                return False
+            if self.hours is not None:
+                start, end = self.hours
+                # a window such as [18, 8] runs overnight
+                inside = start <= moment.tm_hour < end if start < end else not end <= moment.tm_hour < start
+                if not inside:
+                    return False
+        return True
+
+
+class RoutingTable:
+    """
+    Routing rules compiled for lookup by category.
+
+    Each rule maps one or more categories to an authority type:
+
+        {"categories": [...] or "category": str, "authority_type": str,
+         "bbox": [min lon, min lat, max lon, max lat], "hours": [start, end],
+         "days": [0-6, Monday first], "priority": int}
+
+    bbox, hours (UTC, end exclusive, wrapping past midnight when start > end) and days are
+    optional conditions. A category's conditional rules are tried in priority order, lowest
+    first, and the first match wins; otherwise its unconditional rule applies. Categories
+    with no conditional rules are held in a plain dict, so routing them is one lookup.
+    """
+
+    def __init__(self, rules: Iterable[Dict], source: str = ""):
+        self.source = source
+        self.static: Dict[str, str] = {}
+        self.conditional: Dict[str, List[ConditionalRule]] = {}
+        self.defaults: Dict[str, str] = {}
+
+        compiled = []
+        for position, rule in enumerate(rules):
+            authority_type, categories = _validate_rule(rule, position)
+            condition = _compile_conditions(rule, authority_type, position)
+            compiled.append((rule.get("priority", 0), position, authority_type, categories, condition))
+        for _, position, authority_type, categories, condition in sorted(compiled, key=lambda entry: entry[:2]):
+            for category in categories:
+                if condition is not None:
+                    self.conditional.setdefault(category, []).append(condition)
+                elif category in self.defaults:
+                    raise ValueError(f"Routing rule {position}: {category} already has an unconditional rule")
+                else:
+                    self.defaults[category] = authority_type
+        for category, authority_type in self.defaults.items():
+            if category not in self.conditional:
+                self.static[category] = authority_type
+        self.categories = frozenset(self.defaults) | frozenset(self.conditional)
+
+    def __contains__(self, category: str) -> bool:
+        return category in self.categories
+
+    def __len__(self) -> int:
+        return len(self.categories)
+
+    def authority_type(
+        self,
+        category: str,
+        lon: Optional[float] = None,
+        lat: Optional[float] = None,
+        timestamp: Optional[float] = None,
+    ) -> Optional[str]:
+        """
+        Find the type of authority responsible for a report.
+
+        Args:
+            category (str): The category of the report.
+            lon (Optional[float]): The longitude of the report, for rules with a bbox.
+            lat (Optional[float]): The latitude of the report, for rules with a bbox.
+            timestamp (Optional[float]): When the report was made, for rules with hours or
+                days; now if not given.
+
+        Returns:
+            Optional[str]: The authority type, or None if the category is not routed.
+        """
+        authority_type = self.static.get(category)
+        if authority_type is not None:
+            return authority_type
+        for rule in self.conditional.get(category, ()):
+            if rule.matches(lon, lat, time.time() if timestamp is None else timestamp):
+                return rule.authority_type
+        return self.defaults.get(category)
+
+    def authority_types(
+        self,
+        categories: Sequence[str],
+        lons: Sequence[float],
+        lats: Sequence[float],
+        timestamps: Optional[Sequence[Optional[float]]] = None,
+    ) -> List[Optional[str]]:
+        """
+        Find the type of authority responsible for each of a batch of reports.
+
+        Returns:
+            List[Optional[str]]: The authority type of each report, or None.
+        """
+        if timestamps is None:
+            timestamps = [None] * len(categories)
+        return [
+            self.authority_type(category, lon, lat, timestamp)
+            for category, lon, lat, timestamp in zip(categories, lons, lats, timestamps)
+        ]
+
+
+def _validate_rule(rule: Any, position: int) -> Tuple[str, List[str]]:
+    if not isinstance(rule, dict):
+        raise ValueError(f"Routing rule {position} must be an object")
+    authority_type = rule.get("authority_type")
+    if not isinstance(authority_type, str) or not authority_type:
+        raise ValueError(f"Routing rule {position} has no authority_type")
+    categories = rule.get("categories", [rule["category"]] if "category" in rule else [])
+    # a string would otherwise be routed one character at a time
+    if not isinstance(categories, list) or not categories or not all(
+        isinstance(category, str) and category for category in categories
+    ):
+        raise ValueError(f"Routing rule {position} needs a category or a list of categories")
+    return authority_type, list(categories)
+
+
+def _compile_conditions(rule: Dict, authority_type: str, position: int) -> Optional[ConditionalRule]:
+    bbox = rule.get("bbox")
+    hours = rule.get("hours")
+    days = rule.get("days")
+    if bbox is None and hours is None and days is None:
+        return None
+    if bbox is not None and (len(bbox) != 4 or bbox[0] > bbox[2] or bbox[1] > bbox[3]):
+        raise ValueError(f"Routing rule {position}: bbox must be [min lon, min lat, max lon, max lat]")
+    if hours is not None and (
+        len(hours) != 2 or not all(isinstance(hour, int) and 0 <= hour <= 24 for hour in hours) or hours[0] == hours[1]
+    ):
+        raise ValueError(f"Routing rule {position}: hours must be two different hours between 0 and 24")
+    if days is not None and (not days or not all(isinstance(day, int) and 0 <= day <= 6 for day in days)):
+        raise ValueError(f"Routing rule {position}: days must be weekdays between 0 and 6")
+    return ConditionalRule(
+        authority_type,
+        tuple(float(value) for value in bbox) if bbox is not None else None,
+        tuple(hours) if hours is not None else None,
+        frozenset(days) if days is not None else None,
+    )
+
+
+def load_rules_from_file(path: str = ROUTING_RULES_FILE) -> List[Dict]:
+    """
+    Read routing rules from a JSON file holding {"rules": [...]}.
+
+    Args:
+        path (str): The path of the file.
+
+    Returns:
+        List[Dict]: The rules.
+    """
+    with open(path, "r", encoding="utf-8") as file:
+        return json.load(file)["rules"]
+
+
+def load_rules_from_mongo() -> List[Dict]:
+    """
+    Read routing rules from the routing rules collection, one rule per document.
+
+    Returns:
+        List[Dict]: The rules, in insertion order.
+    """
+    return list(routing_rules_collection.find({}, {"_id": 0}).sort("_id", 1))
+
+
+class RoutingRules:
+    """
+    Process-wide access to the compiled routing table.
+
+    The rules are loaded and compiled on first use. invalidate(), called by the change
+    watcher when the routing rules collection is written to, makes the next use reload them.
+    """
+
+    def __init__(self, source: str = ROUTING_RULES_SOURCE):
+        self.source = source
+        self._lock = threading.Lock()
+        self._table: Optional[RoutingTable] = None
+
+    def get(self) -> RoutingTable:
+        """
+        Retrieve the routing table, compiling it on first use.
+
+        Returns:
+            RoutingTable: The current routing table.
+        """
+        with self._lock:
+            if self._table is None:
+                self._table = self._load()
+            return self._table
+
+    def invalidate(self) -> None:
+        """
+        Reload the routing rules on next use.
+        """
+        with self._lock:
+            self._table = None
+
+    def _load(self) -> RoutingTable:
+        if self.source == "mongo":
+            table = RoutingTable(load_rules_from_mongo(), MONGO_COLLECTION_ROUTING_RULES)
+        else:
+            table = RoutingTable(load_rules_from_file(), ROUTING_RULES_FILE)
+        logger.info(f"Loaded {len(table)} routed categories from {table.source}.")
+        return table
+
+
+routing_rules = RoutingRules()
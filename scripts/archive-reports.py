@@ -0,0 +1,51 @@
+"""
+File: archive-reports.py
+Author: Jack McArdle
+
+This file is part of CommunityEye.
+
+Email: mcardle-j9@ulster.ac.uk
+B-No: B00733578
+"""
+
+import argparse
+import os
+import sys
+
+# allow running from the scripts directory as well as the repository root
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from config import (  # noqa: E402
+    ARCHIVE_AFTER_DAYS,
+    ARCHIVE_BATCH_SIZE,
+    ARCHIVE_DIR,
+    ARCHIVE_TARGET,
+    ARCHIVE_TRANSACTIONS,
+)
+from archive import ARCHIVE_TARGETS, archive_resolved_reports  # noqa: E402
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Move resolved reports out of the reports collection into the archive, in batches."
+    )
+    parser.add_argument("--older-than-days", type=int, default=ARCHIVE_AFTER_DAYS, help="archive reports resolved at least this long ago")
+    parser.add_argument("--batch-size", type=int, default=ARCHIVE_BATCH_SIZE, help="reports moved at a time")
+    parser.add_argument("--target", choices=ARCHIVE_TARGETS, default=ARCHIVE_TARGET, help="the archive collection or gzipped NDJSON files")
+    parser.add_argument("--directory", default=ARCHIVE_DIR, help="where archive files are written")
+    parser.add_argument(
+        "--no-transactions", action="store_true", default=not ARCHIVE_TRANSACTIONS,
+        help="move batches without transactions, e.g. on a standalone server",
+    )
+    parser.add_argument("--pause", type=float, default=0.0, help="seconds to sleep between batches")
+    options = parser.parse_args()
+
+    summary = archive_resolved_reports(
+        older_than_days=options.older_than_days,
+        batch_size=options.batch_size,
+        target=options.target,
+        directory=options.directory,
+        use_transactions=not options.no_transactions,
+        pause=options.pause,
+    )
+    print(f"Archived {summary['reports']} resolved reports in {summary['batches']} batches")
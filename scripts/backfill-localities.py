@@ -0,0 +1,36 @@
+"""
+File: backfill-localities.py
+Author: Jack McArdle
+
+This file is part of CommunityEye.
+
+Email: mcardle-j9@ulster.ac.uk
+B-No: B00733578
+"""
+
+import argparse
+import os
+import sys
+
+# allow running from the scripts directory as well as the repository root
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from config import GEOCODING_BATCH_SIZE  # noqa: E402
+from geocoding import backfill_localities, reverse_geocoder  # noqa: E402
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Annotate stored reports with the district and ward containing them, in batches."
+    )
+    parser.add_argument("--batch-size", type=int, default=GEOCODING_BATCH_SIZE, help="reports updated at a time")
+    parser.add_argument(
+        "--all", action="store_true", help="rebuild the locality store and annotate every report again, e.g. after new ward data"
+    )
+    parser.add_argument("--pause", type=float, default=0.0, help="seconds to sleep between batches")
+    options = parser.parse_args()
+
+    if options.all:
+        reverse_geocoder.invalidate()
+    summary = backfill_localities(batch_size=options.batch_size, recompute=options.all, pause=options.pause)
+    print(f"Annotated {summary['reports']} reports in {summary['batches']} batches")
@@ -0,0 +1,33 @@
+"""
+File: build-boundary-store.py
+Author: Jack McArdle
+
+This file is part of CommunityEye.
+
+Email: mcardle-j9@ulster.ac.uk
+B-No: B00733578
+"""
+
+import argparse
+import os
+import sys
+
+# allow running from the scripts directory as well as the repository root
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from config import BOUNDARY_SOURCE, BOUNDARY_STORE_DIR  # noqa: E402
+from boundary_store import BoundaryStore  # noqa: E402
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Build the authority boundary store and make it current.")
+    parser.add_argument("--source", choices=["mongo", "files"], default=BOUNDARY_SOURCE)
+    parser.add_argument("--directory", default=BOUNDARY_STORE_DIR)
+    options = parser.parse_args()
+
+    boundaries = BoundaryStore(options.directory, options.source).rebuild()
+    size = sum(array.nbytes for array in boundaries.arrays.values())
+    print(
+        f"Boundary store version {boundaries.version}: {len(boundaries)} authorities, "
+        f"{len(boundaries.coords)} vertices, {size / 1e6:.1f} MB in {options.directory}"
+    )
@@ -0,0 +1,66 @@
+"""
+File: compare-benchmarks.py
+Author: Jack McArdle
+
+This file is part of CommunityEye.
+
+Email: mcardle-j9@ulster.ac.uk
+B-No: B00733578
+"""
+
+import argparse
+import json
+import sys
+
+
+def load_medians(path):
+    """
+    Read the median time of each benchmark from a pytest-benchmark JSON report.
+    """
+    with open(path) as f:
+        report = json.load(f)
+    return {
+        benchmark["fullname"]: benchmark["stats"]["median"]
+        for benchmark in report["benchmarks"]
+    }
+
+
+def compare(baseline, current, threshold):
+    """
+    Print a comparison table and return the names of the benchmarks that regressed.
+    """
+    regressions = []
+    print(f"{'benchmark':<100}{'baseline ms':>14}{'current ms':>14}{'change':>10}")
+    for name in sorted(baseline.keys() | current.keys()):
+        if name not in current:
+            print(f"{name:<100}{baseline[name] * 1000:>14.3f}{'missing':>14}")
+            continue
+        if name not in baseline:
+            print(f"{name:<100}{'new':>14}{current[name] * 1000:>14.3f}")
+            continue
+        change = current[name] / baseline[name] - 1
+        flag = ""
+        if change > threshold:
+            regressions.append(name)
+            flag = "  REGRESSION"
+        print(
+            f"{name:<100}{baseline[name] * 1000:>14.3f}{current[name] * 1000:>14.3f}"
+            f"{change:>+10.1%}{flag}"
+        )
+    return regressions
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Fail if any benchmark's median is slower than the baseline by more than the threshold."
+    )
+    parser.add_argument("current", help="pytest-benchmark JSON report of the change under review")
+    parser.add_argument("--baseline", default="benchmarks/baseline.json")
+    parser.add_argument("--threshold", type=float, default=0.25, help="allowed slowdown, e.g. 0.25 for 25%%")
+    args = parser.parse_args()
+
+    regressions = compare(load_medians(args.baseline), load_medians(args.current), args.threshold)
+    if regressions:
+        print(f"\n{len(regressions)} benchmark(s) regressed by more than {args.threshold:.0%}")
+        sys.exit(1)
+    print("\nNo regressions")
@@ -0,0 +1,77 @@
+"""
+File: compare-sync-async.py
+Author: Jack McArdle
+
+This file is part of CommunityEye.
+
+Email: mcardle-j9@ulster.ac.uk
+B-No: B00733578
+"""
+
+import argparse
+import asyncio
+import statistics
+import time
+import httpx
+
+
+async def run_load(base_url, path, token, concurrency, total_requests):
+    """
+    Send requests to one deployment with a fixed number of concurrent clients.
+
+    Returns the wall-clock duration, the per-request latencies and the status counts.
+    """
+    latencies = []
+    statuses = {}
+    remaining = iter(range(total_requests))
+
+    async with httpx.AsyncClient(base_url=base_url, timeout=30) as client:
+        async def worker():
+            for _ in remaining:
+                started = time.perf_counter()
+                try:
+                    response = await client.get(path, headers={"x-access-token": token})
+                    status = response.status_code
+                except httpx.HTTPError:
+                    status = "error"
+                latencies.append(time.perf_counter() - started)
+                statuses[status] = statuses.get(status, 0) + 1
+
+        started = time.perf_counter()
+        await asyncio.gather(*(worker() for _ in range(concurrency)))
+        duration = time.perf_counter() - started
+
+    return duration, latencies, statuses
+
+
+def percentile(values, fraction):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+
+async def main(args):
+    targets = {"sync": args.sync_url, "async": args.async_url}
+    print(f"{'target':<8}{'clients':>8}{'req/s':>10}{'p50 ms':>10}{'p99 ms':>10}  statuses")
+    for concurrency in args.concurrency:
+        for name, base_url in targets.items():
+            duration, latencies, statuses = await run_load(
+                base_url, args.path, args.token, concurrency, args.requests
+            )
+            print(
+                f"{name:<8}{concurrency:>8}{len(latencies) / duration:>10.1f}"
+                f"{statistics.median(latencies) * 1000:>10.1f}"
+                f"{percentile(latencies, 0.99) * 1000:>10.1f}  {statuses}"
+            )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Compare throughput and latency of the sync (app.py) and async (asgi.py) deployments."
+    )
+    parser.add_argument("--sync-url", default="http://localhost:5000")
+    parser.add_argument("--async-url", default="http://localhost:5002")
+    parser.add_argument("--path", default="/api/v1/reports")
+    parser.add_argument("--token", required=True, help="JWT sent as x-access-token")
+    parser.add_argument("--requests", type=int, default=2000)
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 8, 32, 128])
+    asyncio.run(main(parser.parse_args()))
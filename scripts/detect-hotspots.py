@@ -0,0 +1,33 @@
+"""
+File: detect-hotspots.py
+Author: Jack McArdle
+
+This file is part of CommunityEye.
+
+Email: mcardle-j9@ulster.ac.uk
+B-No: B00733578
+"""
+
+import argparse
+import os
+import sys
+
+# allow running from the scripts directory as well as the repository root
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from hotspots import detect_hotspots  # noqa: E402
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Count new reports by geohash cell and time window and record hotspots. Meant to run from cron."
+    )
+    parser.add_argument("--full", action="store_true", help="discard previous results and process every report")
+    parser.add_argument("--until", type=int, help="process reports created up to this Unix timestamp")
+    options = parser.parse_args()
+
+    summary = detect_hotspots(full=options.full, until=options.until)
+    print(
+        f"Processed {summary['reports']} reports created in ({summary['since']}, {summary['until']}] "
+        f"into {summary['buckets']} buckets; {summary['hotspots']} hotspots"
+    )
@@ -0,0 +1,54 @@
+"""
+File: export-reports.py
+Author: Jack McArdle
+
+This file is part of CommunityEye.
+
+Email: mcardle-j9@ulster.ac.uk
+B-No: B00733578
+"""
+
+import argparse
+import os
+import sys
+
+# allow running from the scripts directory as well as the repository root
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from config import EXPORT_BATCH_SIZE, MONGO_COLLECTION_REPORTS, MONGO_COLLECTION_REPORTS_ARCHIVE  # noqa: E402
+from clients import get_db  # noqa: E402
+from export import EXPORT_FORMATS, export_reports  # noqa: E402
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Write reports to a Parquet file or Arrow IPC stream for analysis. Meant to run from cron with --incremental."
+    )
+    parser.add_argument("output", help="the file to write")
+    parser.add_argument("--format", choices=EXPORT_FORMATS, default="parquet", help="the file format")
+    parser.add_argument(
+        "--incremental", action="store_true", help="only export reports created since the last incremental export"
+    )
+    parser.add_argument("--since", type=int, help="export reports created after this Unix timestamp")
+    parser.add_argument("--until", type=int, help="export reports created up to this Unix timestamp")
+    parser.add_argument("--include-archived", action="store_true", help="also export the archive collection")
+    parser.add_argument("--batch-size", type=int, default=EXPORT_BATCH_SIZE, help="reports per row group")
+    options = parser.parse_args()
+
+    db = get_db()
+    collections = [db[MONGO_COLLECTION_REPORTS]]
+    if options.include_archived:
+        collections.append(db[MONGO_COLLECTION_REPORTS_ARCHIVE])
+    # write alongside and rename, so a failed export never leaves a partial file in place
+    with open(f"{options.output}.tmp", "wb") as output:
+        summary = export_reports(
+            output,
+            format=options.format,
+            incremental=options.incremental,
+            since=options.since,
+            until=options.until,
+            batch_size=options.batch_size,
+            collections=collections,
+        )
+    os.replace(f"{options.output}.tmp", options.output)
+    print(f"Exported {summary['reports']} reports created in ({summary['since']}, {summary['until']}] to {options.output}")
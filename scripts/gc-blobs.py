@@ -0,0 +1,62 @@
+"""
+File: gc-blobs.py
+Author: Jack McArdle
+
+This file is part of CommunityEye.
+
+Email: mcardle-j9@ulster.ac.uk
+B-No: B00733578
+"""
+
+import argparse
+import os
+import sys
+
+# allow running from the scripts directory as well as the repository root
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from config import MONGO_COLLECTION_REPORTS  # noqa: E402
+from archive import archived_image_names, count_archived_reports  # noqa: E402
+from blob_gc import MAX_BATCH_SIZE, collect_garbage, load_referenced_names  # noqa: E402
+from clients import get_container_client, get_db  # noqa: E402
+
+
+def print_orphan(orphan):
+    print(f"orphan {orphan['name']} {orphan['size']} {orphan['last_modified'].isoformat()}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Delete blobs that no report references.")
+    parser.add_argument("--dry-run", action="store_true", help="list the orphans without deleting them")
+    parser.add_argument("--min-age-hours", type=float, default=24, help="ignore blobs modified more recently than this")
+    parser.add_argument("--prefix", help="only consider blobs whose names start with this")
+    parser.add_argument("--page-size", type=int, default=5000, help="blobs listed per request")
+    parser.add_argument("--batch-size", type=int, default=MAX_BATCH_SIZE, help="blobs deleted per batch request")
+    parser.add_argument("--workers", type=int, default=4, help="batch requests in flight at once")
+    parser.add_argument("--bloom", action="store_true", help="hold referenced names in a bloom filter instead of a set")
+    parser.add_argument("--error-rate", type=float, default=0.001, help="bloom filter false positive rate")
+    parser.add_argument("--quiet", action="store_true", help="only print the summary")
+    options = parser.parse_args()
+
+    # archived reports keep their images; their names are streamed into the filter
+    referenced = load_referenced_names(
+        get_db()[MONGO_COLLECTION_REPORTS],
+        options.bloom,
+        options.error_rate,
+        archived_image_names(),
+        count_archived_reports() if options.bloom else None,
+    )
+    summary = collect_garbage(
+        get_container_client(),
+        referenced,
+        min_age_seconds=options.min_age_hours * 3600,
+        dry_run=options.dry_run,
+        page_size=options.page_size,
+        batch_size=options.batch_size,
+        workers=options.workers,
+        prefix=options.prefix,
+        on_orphan=None if options.quiet else print_orphan,
+    )
+    action = "would be deleted" if options.dry_run else f"deleted {summary['deleted']}, already gone {summary['missing']}, failed {summary['failed']}"
+    print(f"{summary['orphans']} orphaned blobs ({summary['orphan_bytes'] / 1e6:.1f} MB); {action}")
+    sys.exit(1 if summary["failed"] else 0)
@@ -0,0 +1,23 @@
+"""
+File: rebuild-stats.py
+Author: Jack McArdle
+
+This file is part of CommunityEye.
+
+Email: mcardle-j9@ulster.ac.uk
+B-No: B00733578
+"""
+
+import os
+import sys
+
+# allow running from the scripts directory as well as the repository root
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from stats_utils import rebuild_authority_stats, rebuild_user_stats  # noqa: E402
+
+
+if __name__ == "__main__":
+    count = rebuild_authority_stats()
+    print(f"Rebuilt stats for {count} authorities")
+    print(f"Rebuilt stats for {rebuild_user_stats()} users")
@@ -0,0 +1,245 @@
+"""
+File: seed-reports.py
+Author: Jack McArdle
+
+This file is part of CommunityEye.
+
+Email: mcardle-j9@ulster.ac.uk
+B-No: B00733578
+"""
+
+import argparse
+import glob
+import json
+import multiprocessing
+import os
+import sys
+import time
+import numpy as np
+from bson import ObjectId
+from shapely import contains_xy, prepare
+from shapely.geometry import shape
+
+# allow running from the scripts directory as well as the repository root
+REPO_ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+sys.path.insert(0, REPO_ROOT)
+
+from config import MONGO_COLLECTION_REPORTS, MONGO_COLLECTION_UPVOTES  # noqa: E402
+from boundary_store import boundary_store  # noqa: E402
+from clients import get_db  # noqa: E402
+from routing import routing_rules  # noqa: E402
+
+NI_OUTLINE = os.path.join(
+    REPO_ROOT, "data", "geojsons", "OSNI_Open_Data_-_Largescale_Boundaries_-_NI_Outline.geojson"
+)
+IMAGE_URL_BASE = "https://communityeyeblob.blob.core.windows.net/reportimagestore/"
+CATEGORIES = np.array(sorted(routing_rules.get().categories))
+DESCRIPTIONS = {
+    "Potholes": "Deep pothole in the carriageway",
+    "Street lighting fault": "Street light not working at night",
+    "Obstructions": "Obstruction blocking the road",
+    "Spillages": "Oil spilled across the road",
+    "Ironworks": "Loose manhole cover",
+    "Traffic lights": "Traffic lights stuck on red",
+    "Crash barrier and guard-rail": "Damaged crash barrier",
+    "Signs or road markings": "Faded road markings at the junction",
+    "Street cleaning issue": "Litter piling up on the footpath",
+    "Missed bin collection": "Bins not collected this week",
+    "Abandoned vehicle": "Car left untaxed for weeks",
+    "Dangerous structure or vacant building": "Vacant building with broken windows",
+    "Pavement issue": "Uneven paving slabs",
+}
+
+# set per worker process by _init_worker
+sampling_areas = []
+
+
+def load_sampling_areas(outline_path):
+    """
+    Load the polygons that seeded reports are placed in.
+
+    The NI outline is used when it is available; otherwise the union of the council
+    areas shipped in data/geojsons stands in for it.
+    """
+    if os.path.exists(outline_path):
+        with open(outline_path) as f:
+            geometries = [feature["geometry"] for feature in json.load(f)["features"]]
+    else:
+        geometries = []
+        for path in glob.glob(os.path.join(REPO_ROOT, "data", "geojsons", "Councils", "*.json")):
+            with open(path) as f:
+                geometries.extend(authority["area"] for authority in json.load(f))
+    areas = [shape(geometry) for geometry in geometries]
+    for area in areas:
+        prepare(area)
+    return areas
+
+
+def _init_worker(outline_path):
+    sampling_areas.extend(load_sampling_areas(outline_path))
+
+
+def sample_points(rng, count):
+    """
+    Draw points uniformly inside the sampling areas by vectorized rejection sampling.
+
+    Returns:
+        tuple: Arrays of longitudes and latitudes.
+    """
+    min_lon = min(area.bounds[0] for area in sampling_areas)
+    min_lat = min(area.bounds[1] for area in sampling_areas)
+    max_lon = max(area.bounds[2] for area in sampling_areas)
+    max_lat = max(area.bounds[3] for area in sampling_areas)
+
+    lons, lats, found = [], [], 0
+    while found < count:
+        # oversample, since roughly half of the bounding box is outside NI
+        lon = rng.uniform(min_lon, max_lon, count * 2)
+        lat = rng.uniform(min_lat, max_lat, count * 2)
+        inside = np.zeros(lon.shape, dtype=bool)
+        for area in sampling_areas:
+            inside |= contains_xy(area, lon, lat)
+        lons.append(lon[inside])
+        lats.append(lat[inside])
+        found += int(inside.sum())
+    return np.concatenate(lons)[:count], np.concatenate(lats)[:count]
+
+
+def assign_authorities(lon, lat, categories, created_at):
+    """
+    Route a batch of reports the way determine_report_authority routes one.
+
+    Workers map the same boundary store, so the authority areas are held once however
+    many workers there are.
+
+    Returns:
+        np.ndarray: The authority name of each report, or None.
+    """
+    authority_types = routing_rules.get().authority_types(categories, lon, lat, created_at.tolist())
+    return np.array(boundary_store.get().locate(lon, lat, authority_types), dtype=object)
+
+
+def generate_chunk(rng, count, options, now):
+    """
+    Generate one chunk of report documents, and the upvotes behind their counts.
+
+    Returns:
+        tuple: The report documents and the upvote documents.
+    """
+    lon, lat = sample_points(rng, count)
+    categories = CATEGORIES[rng.integers(0, len(CATEGORIES), count)]
+    user_ids = rng.integers(1, options.users + 1, count)
+    created_at = now - rng.integers(0, int(options.days * 86400) + 1, count)
+    authorities = assign_authorities(lon, lat, categories, created_at)
+    resolved = rng.random(count) < options.resolved_ratio
+    # resolution times are roughly exponential with a mean of a few days
+    resolved_at = np.minimum(
+        created_at + rng.exponential(options.mean_resolve_days * 86400, count).astype(np.int64), now
+    )
+    # most reports get a handful of upvotes and a few get many
+    upvote_counts = np.minimum(rng.zipf(2.0, count) - 1, options.max_upvotes)
+    dhashes = rng.integers(0, 2 ** 64, count, dtype=np.uint64)
+    file_sizes = rng.integers(500_000, 5_000_000, count)
+
+    reports, upvotes = [], []
+    for i in range(count):
+        report_id = ObjectId()
+        image_name = f"{report_id}.jpg"
+        geolocation = {"Lat": round(float(lat[i]), 6), "Lon": round(float(lon[i]), 6)}
+        report = {
+            "_id": report_id,
+            "user_id": int(user_ids[i]),
+            "description": DESCRIPTIONS.get(categories[i], str(categories[i])),
+            "category": str(categories[i]),
+            "geolocation": {
+                "type": "Feature",
+                "geometry": {"type": "Point", "coordinates": [geolocation["Lat"], geolocation["Lon"]]},
+            },
+            "authority": authorities[i],
+            "image": {
+                "url": IMAGE_URL_BASE + image_name,
+                "image_name": image_name,
+                "dimensions": [4032, 3024],
+                "geolocation": geolocation,
+                "file_size": int(file_sizes[i]),
+                "dhash": f"{int(dhashes[i]):016x}",
+            },
+            "similar_reports": [],
+            "resolved": bool(resolved[i]),
+            "upvote_count": int(upvote_counts[i]),
+            "created_at": int(created_at[i]),
+        }
+        if resolved[i]:
+            report["resolved_at"] = int(resolved_at[i])
+        reports.append(report)
+
+        if options.upvote_docs and upvote_counts[i]:
+            voters = rng.choice(options.users, size=min(int(upvote_counts[i]), options.users), replace=False) + 1
+            voted_at = rng.integers(created_at[i], now + 1, len(voters))
+            upvotes.extend(
+                {"user_id": int(voter), "report_id": str(report_id), "timestamp": int(timestamp)}
+                for voter, timestamp in zip(voters, voted_at)
+            )
+    return reports, upvotes
+
+
+def seed_worker(args):
+    """
+    Generate and insert one worker's share of the reports.
+
+    Returns:
+        tuple: The number of reports and upvotes inserted.
+    """
+    worker, count, options = args
+    rng = np.random.default_rng([options.seed, worker])
+    db = get_db()
+    now = int(time.time())
+    inserted_reports = inserted_upvotes = 0
+    while inserted_reports < count:
+        size = min(options.chunk_size, count - inserted_reports)
+        reports, upvotes = generate_chunk(rng, size, options, now)
+        db[MONGO_COLLECTION_REPORTS].insert_many(reports, ordered=False)
+        if upvotes:
+            db[MONGO_COLLECTION_UPVOTES].insert_many(upvotes, ordered=False)
+        inserted_reports += size
+        inserted_upvotes += len(upvotes)
+    return inserted_reports, inserted_upvotes
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Bulk-generate realistic reports for development and load testing.")
+    parser.add_argument("count", type=int, help="number of reports to generate")
+    parser.add_argument("--chunk-size", type=int, default=5000, help="reports per insert_many")
+    parser.add_argument("--workers", type=int, default=os.cpu_count())
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--users", type=int, default=10000, help="number of distinct submitting users")
+    parser.add_argument("--days", type=float, default=365, help="spread creation times over this many past days")
+    parser.add_argument("--resolved-ratio", type=float, default=0.4)
+    parser.add_argument("--mean-resolve-days", type=float, default=7)
+    parser.add_argument("--max-upvotes", type=int, default=500)
+    parser.add_argument("--upvote-docs", action="store_true", help="also insert the upvote documents behind each upvote_count")
+    parser.add_argument("--outline", default=NI_OUTLINE, help="GeoJSON FeatureCollection to place reports in")
+    parser.add_argument("--rebuild-stats", action="store_true", help="rebuild authority stats afterwards")
+    options = parser.parse_args()
+
+    workers = max(1, min(options.workers, options.count // options.chunk_size + 1))
+    shares = [options.count // workers + (worker < options.count % workers) for worker in range(workers)]
+
+    # build the store once up front rather than in every worker
+    boundary_store.get()
+    started = time.perf_counter()
+    with multiprocessing.Pool(workers, initializer=_init_worker, initargs=(options.outline,)) as pool:
+        results = pool.map(seed_worker, [(worker, share, options) for worker, share in enumerate(shares)])
+    elapsed = time.perf_counter() - started
+
+    reports_inserted = sum(result[0] for result in results)
+    upvotes_inserted = sum(result[1] for result in results)
+    print(
+        f"Inserted {reports_inserted} reports and {upvotes_inserted} upvotes with {workers} workers "
+        f"in {elapsed:.1f}s ({reports_inserted / elapsed:.0f} reports/s)"
+    )
+
+    if options.rebuild_stats:
+        from stats_utils import rebuild_authority_stats
+
+        print(f"Rebuilt stats for {rebuild_authority_stats()} authorities")
@@ -0,0 +1,730 @@
+"""
+File: stats_utils.py
+Author: Jack McArdle
+
+This file is part of CommunityEye.
+
+Email: mcardle-j9@ulster.ac.uk
+B-No: B00733578
+"""
+
+import logging
+import time
+import uuid
+from collections import defaultdict
+from typing import Dict, Iterator, List, Optional
+from urllib.parse import unquote
+from pymongo import UpdateOne
+from config import (
+    MONGO_COLLECTION_REPORTS,
+    MONGO_COLLECTION_REPORTS_ARCHIVE,
+    MONGO_COLLECTION_STATS,
+    MONGO_COLLECTION_USER_STATS,
+    STATS_TOP_UPVOTED_LIMIT,
+)
+from clients import DB
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+reports = DB[MONGO_COLLECTION_REPORTS]
+reports_archive = DB[MONGO_COLLECTION_REPORTS_ARCHIVE]
+stats = DB[MONGO_COLLECTION_STATS]
+user_stats = DB[MONGO_COLLECTION_USER_STATS]
+
+# counters kept for every (authority, category) pair in the stats collection
+COUNTER_FIELDS = (
+    "open",
+    "resolved",
+    "timed_resolutions",
+    "resolve_seconds_total",
+    "upvotes",
+)
+
+# counters kept for every user in the user stats collection
+USER_COUNTER_FIELDS = ("total", "resolved", "upvotes_received")
+# how many times a first read recomputes a user's counts while writes keep landing
+USER_STATS_BACKFILL_ATTEMPTS = 3
+
+
+def _user_counter_update(increments: Dict[str, int]) -> Dict:
+    """
+    Build the update adding to a user's counters.
+
+    The update also clears the backfill token of a first read computing the counts, so
+    it knows to compute them again.
+
+    Args:
+        increments (Dict[str, int]): Counter names mapped to the amount to add.
+
+    Returns:
+        Dict: The update.
+    """
+    return {"$inc": increments, "$set": {"updated_at": int(time.time())}, "$unset": {"backfill": ""}}
+
+
+def _category_key(category: str) -> str:
+    """
+    Encode a category as a field name of the categories object.
+
+    Categories come from the routing rules, so may contain "." or "$", which would split
+    the update path or be taken for an operator. Both are percent-encoded, as is "%".
+
+    Args:
+        category (str): The category of a report.
+
+    Returns:
+        str: The field name.
+    """
+    return category.replace("%", "%25").replace(".", "%2E").replace("$", "%24")
+
+
+def _apply_counters(
+    authority_name: Optional[str], category: str, deltas: Dict[str, int]
+) -> None:
+    """
+    Increment the per-category counters of an authority's stats document.
+
+    Args:
+        authority_name (Optional[str]): The authority the report is assigned to.
+        category (str): The category of the report.
+        deltas (Dict[str, int]): Counter names mapped to the amount to add.
+    """
+    if not authority_name:
+        return
+
+    update = {
+        "$inc": {
+            f"categories.{_category_key(category)}.{field}": amount
+            for field, amount in deltas.items()
+            if amount
+        },
+        "$set": {"updated_at": int(time.time())},
+    }
+    stats.update_one({"_id": authority_name}, update, upsert=True)
+
+
+def _user_contribution(report: Dict) -> Dict[str, int]:
+    """
+    The amount a report adds to its submitter's counters.
+
+    Args:
+        report (Dict): The report document.
+
+    Returns:
+        Dict[str, int]: Counter names mapped to the report's contribution.
+    """
+    return {
+        "total": 1,
+        "resolved": 1 if report.get("resolved") else 0,
+        "upvotes_received": report.get("upvote_count", 0),
+    }
+
+
+def _apply_user_counters(user_id: Optional[int], deltas: Dict[str, int]) -> None:
+    """
+    Increment the counters of a user's stats document, if they have one.
+
+    Args:
+        user_id (Optional[int]): The user who submitted the report.
+        deltas (Dict[str, int]): Counter names mapped to the amount to add.
+    """
+    increments = {field: amount for field, amount in deltas.items() if amount}
+    if user_id is None or not increments:
+        return
+    # a user without a stats document yet has their counts computed on first read instead
+    user_stats.update_one({"_id": user_id}, _user_counter_update(increments))
+
+
+def _bulk_apply_user_counters(counters: Dict[int, Dict[str, int]]) -> None:
+    """
+    Apply counter increments for many users with one bulk_write, skipping users without stats.
+
+    Args:
+        counters (Dict[int, Dict[str, int]]): User IDs mapped to counter names and the amount to add.
+    """
+    operations = []
+    for user_id, deltas in counters.items():
+        increments = {field: amount for field, amount in deltas.items() if amount}
+        if increments:
+            operations.append(UpdateOne({"_id": user_id}, _user_counter_update(increments)))
+    if operations:
+        user_stats.bulk_write(operations, ordered=False)
+
+
+def _summary_entry(report: Dict) -> Dict:
+    """
+    Build the entry stored in an authority's top-upvoted list.
+
+    Args:
+        report (Dict): The report document.
+
+    Returns:
+        Dict: The report ID, category and upvote count.
+    """
+    return {
+        "report_id": str(report["_id"]),
+        "category": report["category"],
+        "upvote_count": report.get("upvote_count", 0),
+    }
+
+
+def record_report_created(report: Dict) -> None:
+    """
+    Count a newly created report as open for its authority and category.
+
+    Args:
+        report (Dict): The inserted report document.
+    """
+    try:
+        _apply_counters(report.get("authority"), report["category"], {"open": 1})
+        _apply_user_counters(report.get("user_id"), {"total": 1})
+    except Exception as e:
+        logger.error(f"Error updating stats for created report: {e}")
+
+
+def record_reports_created(new_reports: List[Dict]) -> None:
+    """
+    Count a batch of imported reports with one update per authority.
+
+    Imported reports may already be resolved or upvoted, so each is counted in the
+    state it was imported in.
+
+    Args:
+        new_reports (List[Dict]): The inserted report documents.
+    """
+    counters: Dict[str, Dict[str, int]] = defaultdict(lambda: defaultdict(int))
+    user_counters: Dict[int, Dict[str, int]] = defaultdict(lambda: defaultdict(int))
+    top_upvoted: Dict[str, List[Dict]] = defaultdict(list)
+    for report in new_reports:
+        if report.get("user_id") is not None:
+            for field, amount in _user_contribution(report).items():
+                user_counters[report["user_id"]][field] += amount
+        authority_name = report.get("authority")
+        if not authority_name:
+            continue
+        prefix = f"categories.{_category_key(report['category'])}"
+        if report.get("resolved"):
+            counters[authority_name][f"{prefix}.resolved"] += 1
+            if report.get("resolved_at"):
+                counters[authority_name][f"{prefix}.timed_resolutions"] += 1
+                counters[authority_name][f"{prefix}.resolve_seconds_total"] += (
+                    report["resolved_at"] - report["created_at"]
+                )
+        else:
+            counters[authority_name][f"{prefix}.open"] += 1
+        if report.get("upvote_count"):
+            counters[authority_name][f"{prefix}.upvotes"] += report["upvote_count"]
+            top_upvoted[authority_name].append(_summary_entry(report))
+
+    operations = []
+    for authority_name, increments in counters.items():
+        update = {"$inc": dict(increments), "$set": {"updated_at": int(time.time())}}
+        if top_upvoted[authority_name]:
+            update["$push"] = {
+                "top_upvoted": {
+                    "$each": top_upvoted[authority_name],
+                    "$sort": {"upvote_count": -1},
+                    "$slice": STATS_TOP_UPVOTED_LIMIT,
+                }
+            }
+        operations.append(UpdateOne({"_id": authority_name}, update, upsert=True))
+
+    try:
+        if operations:
+            stats.bulk_write(operations, ordered=False)
+        _bulk_apply_user_counters(user_counters)
+    except Exception as e:
+        logger.error(f"Error updating stats for imported reports: {e}")
+
+
+def record_report_resolved(report: Dict, resolved_at: int) -> None:
+    """
+    Move a report from the open to the resolved counters and record how long it took.
+
+    Args:
+        report (Dict): The report document as it was before being resolved.
+        resolved_at (int): Unix timestamp at which the report was resolved.
+    """
+    try:
+        _apply_counters(
+            report.get("authority"),
+            report["category"],
+            {
+                "open": -1,
+                "resolved": 1,
+                "timed_resolutions": 1,
+                "resolve_seconds_total": resolved_at - report["created_at"],
+            },
+        )
+        _apply_user_counters(report.get("user_id"), {"resolved": 1})
+    except Exception as e:
+        logger.error(f"Error updating stats for resolved report: {e}")
+
+
+def record_report_deleted(report: Dict) -> None:
+    """
+    Remove a deleted report's contribution from its authority's and submitter's stats.
+
+    Args:
+        report (Dict): The report document as it was before being deleted.
+    """
+    try:
+        _apply_user_counters(
+            report.get("user_id"),
+            {field: -amount for field, amount in _user_contribution(report).items()},
+        )
+    except Exception as e:
+        logger.error(f"Error updating user stats for deleted report: {e}")
+
+    authority_name = report.get("authority")
+    if not authority_name:
+        return
+
+    if report.get("resolved"):
+        deltas = {"resolved": -1}
+        if report.get("resolved_at"):
+            deltas["timed_resolutions"] = -1
+            deltas["resolve_seconds_total"] = -(
+                report["resolved_at"] - report["created_at"]
+            )
+    else:
+        deltas = {"open": -1}
+    deltas["upvotes"] = -report.get("upvote_count", 0)
+
+    try:
+        _apply_counters(authority_name, report["category"], deltas)
+        stats.update_one(
+            {"_id": authority_name},
+            {"$pull": {"top_upvoted": {"report_id": str(report["_id"])}}},
+        )
+    except Exception as e:
+        logger.error(f"Error updating stats for deleted report: {e}")
+
+
+def _bulk_apply_counters(
+    counters: Dict[str, Dict[str, int]], pulled: Optional[Dict[str, List[str]]] = None
+) -> None:
+    """
+    Apply counter increments for many authorities with one bulk_write.
+
+    Args:
+        counters (Dict[str, Dict[str, int]]): Authority names mapped to field paths and
+            the amount to add.
+        pulled (Optional[Dict[str, List[str]]]): Authority names mapped to report IDs to
+            remove from their top-upvoted list.
+    """
+    pulled = pulled or {}
+    operations = []
+    for authority_name in counters.keys() | pulled.keys():
+        update = {"$set": {"updated_at": int(time.time())}}
+        increments = {field: amount for field, amount in counters.get(authority_name, {}).items() if amount}
+        if increments:
+            update["$inc"] = increments
+        if pulled.get(authority_name):
+            update["$pull"] = {"top_upvoted": {"report_id": {"$in": pulled[authority_name]}}}
+        operations.append(UpdateOne({"_id": authority_name}, update, upsert=True))
+    if operations:
+        stats.bulk_write(operations, ordered=False)
+
+
+def record_reports_resolved(resolved_reports: List[Dict], resolved_at: int) -> None:
+    """
+    Move a batch of reports from the open to the resolved counters with one update per authority.
+
+    Args:
+        resolved_reports (List[Dict]): The report documents as they were before being resolved.
+        resolved_at (int): Unix timestamp at which the reports were resolved.
+    """
+    counters: Dict[str, Dict[str, int]] = defaultdict(lambda: defaultdict(int))
+    user_counters: Dict[int, Dict[str, int]] = defaultdict(lambda: defaultdict(int))
+    for report in resolved_reports:
+        if report.get("user_id") is not None:
+            user_counters[report["user_id"]]["resolved"] += 1
+        authority_name = report.get("authority")
+        if not authority_name:
+            continue
+        prefix = f"categories.{_category_key(report['category'])}"
+        counters[authority_name][f"{prefix}.open"] -= 1
+        counters[authority_name][f"{prefix}.resolved"] += 1
+        counters[authority_name][f"{prefix}.timed_resolutions"] += 1
+        counters[authority_name][f"{prefix}.resolve_seconds_total"] += resolved_at - report["created_at"]
+
+    try:
+        _bulk_apply_counters(counters)
+        _bulk_apply_user_counters(user_counters)
+    except Exception as e:
+        logger.error(f"Error updating stats for resolved reports: {e}")
+
+
+def record_reports_deleted(deleted_reports: List[Dict]) -> None:
+    """
+    Remove a batch of deleted reports from their authorities' stats with one update per authority.
+
+    Args:
+        deleted_reports (List[Dict]): The report documents as they were before being deleted.
+    """
+    counters: Dict[str, Dict[str, int]] = defaultdict(lambda: defaultdict(int))
+    pulled: Dict[str, List[str]] = defaultdict(list)
+    user_counters: Dict[int, Dict[str, int]] = defaultdict(lambda: defaultdict(int))
+    for report in deleted_reports:
+        if report.get("user_id") is not None:
+            for field, amount in _user_contribution(report).items():
+                user_counters[report["user_id"]][field] -= amount
+        authority_name = report.get("authority")
+        if not authority_name:
+            continue
+        prefix = f"categories.{_category_key(report['category'])}"
+        if report.get("resolved"):
+            counters[authority_name][f"{prefix}.resolved"] -= 1
+            if report.get("resolved_at"):
+                counters[authority_name][f"{prefix}.timed_resolutions"] -= 1
+                counters[authority_name][f"{prefix}.resolve_seconds_total"] -= (
+                    report["resolved_at"] - report["created_at"]
+                )
+        else:
+            counters[authority_name][f"{prefix}.open"] -= 1
+        counters[authority_name][f"{prefix}.upvotes"] -= report.get("upvote_count", 0)
+        pulled[authority_name].append(str(report["_id"]))
+
+    try:
+        _bulk_apply_counters(counters, pulled)
+        _bulk_apply_user_counters(user_counters)
+    except Exception as e:
+        logger.error(f"Error updating stats for deleted reports: {e}")
+
+
+def record_report_upvoted(report: Dict) -> None:
+    """
+    Count an upvote for the submitter and the authority, and refresh the report's place
+    in the top-upvoted list.
+
+    Args:
+        report (Dict): The report document after its upvote count was incremented.
+    """
+    try:
+        _apply_user_counters(report.get("user_id"), {"upvotes_received": 1})
+    except Exception as e:
+        logger.error(f"Error updating user stats for upvoted report: {e}")
+
+    authority_name = report.get("authority")
+    if not authority_name:
+        return
+
+    try:
+        _apply_counters(authority_name, report["category"], {"upvotes": 1})
+        # $pull and $push cannot target the same field in one update
+        stats.update_one(
+            {"_id": authority_name},
+            {"$pull": {"top_upvoted": {"report_id": str(report["_id"])}}},
+        )
+        stats.update_one(
+            {"_id": authority_name},
+            {
+                "$push": {
+                    "top_upvoted": {
+                        "$each": [_summary_entry(report)],
+                        "$sort": {"upvote_count": -1},
+                        "$slice": STATS_TOP_UPVOTED_LIMIT,
+                    }
+                }
+            },
+        )
+    except Exception as e:
+        logger.error(f"Error updating stats for upvoted report: {e}")
+
+
+def get_authority_stats(authority_name: str) -> Optional[Dict]:
+    """
+    Retrieve the precomputed stats for an authority.
+
+    Args:
+        authority_name (str): The name of the authority.
+
+    Returns:
+        Optional[Dict]: The formatted stats, or None if no stats have been recorded.
+    """
+    document = stats.find_one({"_id": authority_name})
+    if document is None:
+        return None
+    return format_authority_stats(authority_name, document)
+
+
+def format_authority_stats(authority_name: str, document: Dict) -> Dict:
+    """
+    Convert an authority's stats document into the response served by the API.
+
+    Args:
+        authority_name (str): The name of the authority.
+        document (Dict): The raw stats document, empty if none has been recorded.
+
+    Returns:
+        Dict: Per-category and total counts, mean time-to-resolve and the
+        top-upvoted reports.
+    """
+    totals = {field: 0 for field in COUNTER_FIELDS}
+    categories = {}
+    for key, counters in document.get("categories", {}).items():
+        for field in COUNTER_FIELDS:
+            totals[field] += counters.get(field, 0)
+        categories[unquote(key)] = _format_counters(counters)
+
+    return {
+        "authority": authority_name,
+        "categories": categories,
+        "totals": _format_counters(totals),
+        "top_upvoted": document.get("top_upvoted", []),
+        "updated_at": document.get("updated_at"),
+    }
+
+
+def _format_counters(counters: Dict[str, int]) -> Dict[str, Optional[float]]:
+    """
+    Convert raw counters into the values served by the stats endpoint.
+
+    Args:
+        counters (Dict[str, int]): The raw counters of a category or of all categories.
+
+    Returns:
+        Dict[str, Optional[float]]: Open, resolved and upvote counts with the mean
+        time-to-resolve in seconds (None if no timed resolutions exist).
+    """
+    timed_resolutions = counters.get("timed_resolutions", 0)
+    mean_time_to_resolve = None
+    if timed_resolutions > 0:
+        mean_time_to_resolve = round(
+            counters.get("resolve_seconds_total", 0) / timed_resolutions, 1
+        )
+
+    return {
+        "open": counters.get("open", 0),
+        "resolved": counters.get("resolved", 0),
+        "upvotes": counters.get("upvotes", 0),
+        "mean_time_to_resolve": mean_time_to_resolve,
+    }
+
+
+def _aggregate_all_reports(pipeline: List[Dict]) -> Iterator[Dict]:
+    """
+    Run an aggregation over the reports collection and then the archive collection.
+
+    Counters are kept for archived reports too, so rebuilds must count both. Reports
+    archived to files are not counted.
+
+    Args:
+        pipeline (List[Dict]): The pipeline.
+
+    Yields:
+        Dict: The rows of each collection's result, which the caller combines.
+    """
+    for collection in (reports, reports_archive):
+        yield from collection.aggregate(pipeline, allowDiskUse=True)
+
+
+def rebuild_authority_stats() -> int:
+    """
+    Recompute the stats collection from scratch using aggregation pipelines.
+
+    Reports without an authority are ignored. Authorities that no longer have any
+    reports have their stats document removed.
+
+    Returns:
+        int: The number of authorities with stats after the rebuild.
+    """
+    # reports resolved before resolved_at was recorded have no resolution time
+    timed = {"$and": ["$resolved", {"$ifNull": ["$resolved_at", False]}]}
+    counters_pipeline = [
+        {"$match": {"authority": {"$ne": None}}},
+        {
+            "$group": {
+                "_id": {"authority": "$authority", "category": "$category"},
+                "open": {"$sum": {"$cond": ["$resolved", 0, 1]}},
+                "resolved": {"$sum": {"$cond": ["$resolved", 1, 0]}},
+                "timed_resolutions": {"$sum": {"$cond": [timed, 1, 0]}},
+                "resolve_seconds_total": {
+                    "$sum": {
+                        "$cond": [
+                            timed,
+                            {"$subtract": ["$resolved_at", "$created_at"]},
+                            0,
+                        ]
+                    }
+                },
+                "upvotes": {"$sum": {"$ifNull": ["$upvote_count", 0]}},
+            }
+        },
+        {
+            "$group": {
+                "_id": "$_id.authority",
+                "categories": {
+                    "$push": {
+                        "category": "$_id.category",
+                        "counters": {field: f"${field}" for field in COUNTER_FIELDS},
+                    }
+                },
+            }
+        },
+    ]
+
+    top_upvoted_pipeline = [
+        {"$match": {"authority": {"$ne": None}, "upvote_count": {"$gt": 0}}},
+        {
+            "$group": {
+                "_id": "$authority",
+                "top_upvoted": {
+                    "$topN": {
+                        "n": STATS_TOP_UPVOTED_LIMIT,
+                        "sortBy": {"upvote_count": -1},
+                        "output": {
+                            "report_id": {"$toString": "$_id"},
+                            "category": "$category",
+                            "upvote_count": "$upvote_count",
+                        },
+                    }
+                },
+            }
+        },
+    ]
+
+    now = int(time.time())
+    documents: Dict[str, Dict] = {}
+    for row in _aggregate_all_reports(counters_pipeline):
+        document = documents.setdefault(row["_id"], {"categories": {}, "top_upvoted": [], "updated_at": now})
+        for entry in row["categories"]:
+            totals = document["categories"].setdefault(
+                _category_key(entry["category"]), dict.fromkeys(COUNTER_FIELDS, 0)
+            )
+            for field in COUNTER_FIELDS:
+                totals[field] += entry["counters"][field]
+    for row in _aggregate_all_reports(top_upvoted_pipeline):
+        if row["_id"] in documents:
+            top_upvoted = documents[row["_id"]]["top_upvoted"] + row["top_upvoted"]
+            top_upvoted.sort(key=lambda entry: entry["upvote_count"], reverse=True)
+            documents[row["_id"]]["top_upvoted"] = top_upvoted[:STATS_TOP_UPVOTED_LIMIT]
+
+    for authority_name, document in documents.items():
+        stats.replace_one({"_id": authority_name}, document, upsert=True)
+    # every authority counted was just replaced, so older documents have no reports left
+    stats.delete_many({"updated_at": {"$lt": now}})
+
+    logger.info(f"Rebuilt stats for {len(documents)} authorities.")
+    return len(documents)
+
+
+def _count_user_reports(user_id: int) -> Dict[str, int]:
+    """
+    Count a user's reports in the reports and archive collections.
+
+    Args:
+        user_id (int): The ID of the user.
+
+    Returns:
+        Dict[str, int]: The user's counters.
+    """
+    counters = dict.fromkeys(USER_COUNTER_FIELDS, 0)
+    for collection in (reports, reports_archive):
+        for row in collection.aggregate([{"$match": {"user_id": user_id}}, *_user_counters_stages()]):
+            for field in USER_COUNTER_FIELDS:
+                counters[field] += row[field]
+    return counters
+
+
+def _backfill_user_stats(user_id: int) -> Dict[str, int]:
+    """
+    Compute and store the counts of a user without a stats document.
+
+    A placeholder holding a backfill token is upserted before counting, so that counter
+    updates from writes made meanwhile land on it. They also clear the token, and the
+    counts are only stored while it is still in place; otherwise they are counted again,
+    as the aggregation may or may not have seen those writes.
+
+    Args:
+        user_id (int): The ID of the user.
+
+    Returns:
+        Dict[str, int]: The user's counters.
+    """
+    for _ in range(USER_STATS_BACKFILL_ATTEMPTS):
+        token = uuid.uuid4().hex
+        user_stats.update_one(
+            {"_id": user_id},
+            {"$set": {"backfill": token}, "$setOnInsert": dict.fromkeys(USER_COUNTER_FIELDS, 0)},
+            upsert=True,
+        )
+        counters = _count_user_reports(user_id)
+        result = user_stats.update_one(
+            {"_id": user_id, "backfill": token},
+            {"$set": {**counters, "updated_at": int(time.time())}, "$unset": {"backfill": ""}},
+        )
+        if result.modified_count == 1:
+            return counters
+    # leave the document marked, so the next read counts again
+    user_stats.update_one({"_id": user_id}, {"$set": {"backfill": None}})
+    logger.warning(f"Stats of user {user_id} kept changing while being backfilled.")
+    return counters
+
+
+def get_user_stats(user_id: int) -> Dict[str, int]:
+    """
+    Retrieve a user's report counts, computing and storing them if none are recorded yet.
+
+    Users whose reports predate the user stats collection are backfilled on first read.
+
+    Args:
+        user_id (int): The ID of the user.
+
+    Returns:
+        Dict[str, int]: The user's total and resolved report counts and upvotes received.
+    """
+    document = user_stats.find_one({"_id": user_id})
+    if document is None or "backfill" in document:
+        document = _backfill_user_stats(user_id)
+    return {field: document.get(field, 0) for field in USER_COUNTER_FIELDS}
+
+
+def _user_counters_stages() -> List[Dict]:
+    """
+    The aggregation stages that total the counters of each user's reports.
+
+    Returns:
+        List[Dict]: A $group stage keyed by user_id.
+    """
+    return [
+        {
+            "$group": {
+                "_id": "$user_id",
+                "total": {"$sum": 1},
+                "resolved": {"$sum": {"$cond": ["$resolved", 1, 0]}},
+                "upvotes_received": {"$sum": {"$ifNull": ["$upvote_count", 0]}},
+            }
+        }
+    ]
+
+
+def rebuild_user_stats() -> int:
+    """
+    Recompute the user stats collection from scratch.
+
+    Returns:
+        int: The number of users with stats after the rebuild.
+    """
+    now = int(time.time())
+    counters: Dict[int, Dict[str, int]] = defaultdict(lambda: dict.fromkeys(USER_COUNTER_FIELDS, 0))
+    for row in _aggregate_all_reports([{"$match": {"user_id": {"$ne": None}}}, *_user_counters_stages()]):
+        for field in USER_COUNTER_FIELDS:
+            counters[row["_id"]][field] += row[field]
+
+    operations = []
+    for user_id, document in counters.items():
+        update = {"$set": {**document, "updated_at": now}, "$unset": {"backfill": ""}}
+        operations.append(UpdateOne({"_id": user_id}, update, upsert=True))
+        if len(operations) == 1000:
+            user_stats.bulk_write(operations, ordered=False)
+            operations = []
+    if operations:
+        user_stats.bulk_write(operations, ordered=False)
+    # every user counted was just written, so older documents belong to users without reports
+    user_stats.delete_many({"updated_at": {"$lt": now}})
+
+    logger.info(f"Rebuilt stats for {len(counters)} users.")
+    return len(counters)
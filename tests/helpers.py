@@ -0,0 +1,33 @@
+"""
+File: helpers.py
+Author: Jack McArdle
+
+This file is part of CommunityEye.
+
+Email: mcardle-j9@ulster.ac.uk
+B-No: B00733578
+"""
+
+from pymongo import DeleteOne, ReplaceOne, UpdateOne
+
+
+class BulkWriteCollection:
+    """
+    A mongomock collection whose bulk_write applies each operation in turn, as mongomock's
+    own bulk_write does not accept the operations of this pymongo version.
+    """
+
+    def __init__(self, collection):
+        self.collection = collection
+
+    def __getattr__(self, name):
+        return getattr(self.collection, name)
+
+    def bulk_write(self, operations, ordered=True, session=None):
+        for operation in operations:
+            if isinstance(operation, UpdateOne):
+                self.collection.update_one(operation._filter, operation._doc, upsert=operation._upsert)
+            elif isinstance(operation, ReplaceOne):
+                self.collection.replace_one(operation._filter, operation._doc, upsert=operation._upsert)
+            elif isinstance(operation, DeleteOne):
+                self.collection.delete_one(operation._filter)
@@ -0,0 +1,164 @@
+"""
+File: test_archive.py
+Author: Jack McArdle
+
+This file is part of CommunityEye.
+
+Email: mcardle-j9@ulster.ac.uk
+B-No: B00733578
+"""
+
+import os
+import shutil
+import tempfile
+import time
+import unittest
+from unittest.mock import patch, MagicMock
+from bson import ObjectId
+from flask import Flask
+import jwt
+import mongomock
+import stats_utils
+from archive import archive_resolved_reports, archived_image_names, count_archived_reports, read_archive_files
+from blueprints.reports.reports import reports_bp
+from config import FLASK_SECRET_KEY
+from tests.helpers import BulkWriteCollection
+
+MOCK_JWT_TOKEN = jwt.encode({'user_id': 999}, FLASK_SECRET_KEY, algorithm='HS256')
+DAY = 86400
+
+
+def make_report(user_id, created_days_ago, resolved_days_ago=None, image_name=None):
+    now = int(time.time())
+    report = {
+        '_id': ObjectId(),
+        'user_id': user_id,
+        'authority': 'Belfast City Council',
+        'category': 'Potholes',
+        'created_at': now - created_days_ago * DAY,
+        'resolved': resolved_days_ago is not None,
+        'upvote_count': 1,
+        'image': {'image_name': image_name or f'{ObjectId()}.jpg'},
+    }
+    if resolved_days_ago is not None and resolved_days_ago >= 0:
+        report['resolved_at'] = now - resolved_days_ago * DAY
+    return report
+
+
+class ArchiveTestCase(unittest.TestCase):
+    def setUp(self):
+        db = mongomock.MongoClient()['communityeye']
+        self.reports = db['reports']
+        self.archive = db['reports_archive']
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+        self.old = [
+            make_report(1, 400, 300, 'old-1.jpg'),
+            make_report(2, 500, 200, 'old-2.jpg'),
+            # resolved before resolved_at was recorded
+            make_report(1, 400, -1, 'old-3.jpg'),
+        ]
+        self.kept = [make_report(1, 400), make_report(1, 300, 10), make_report(2, 20, -1)]
+        self.reports.insert_many(self.old + self.kept)
+        for target, value in (
+            ('archive.reports', self.reports),
+            ('archive.reports_archive', BulkWriteCollection(self.archive)),
+        ):
+            patcher = patch(target, value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def test_archive_to_collection(self):
+        summary = archive_resolved_reports(older_than_days=180, batch_size=2, use_transactions=False)
+
+        self.assertEqual(summary, {'reports': 3, 'batches': 2})
+        self.assertEqual({r['_id'] for r in self.archive.find()}, {r['_id'] for r in self.old})
+        self.assertEqual({r['_id'] for r in self.reports.find()}, {r['_id'] for r in self.kept})
+        self.assertEqual(self.archive.find_one({'_id': self.old[0]['_id']}), self.old[0])
+        self.assertIn('user_feed', self.archive.index_information())
+        self.assertEqual(archive_resolved_reports(older_than_days=180, use_transactions=False)['reports'], 0)
+
+    def test_archive_to_files(self):
+        summary = archive_resolved_reports(older_than_days=180, batch_size=2, target='files', directory=self.directory)
+
+        self.assertEqual(summary['batches'], 2)
+        self.assertEqual(len(os.listdir(self.directory)), 2)
+        self.assertEqual(list(read_archive_files(self.directory)), self.old)
+        self.assertEqual(self.reports.count_documents({}), len(self.kept))
+        self.assertEqual(
+            sorted(archived_image_names(self.directory, self.archive)), ['old-1.jpg', 'old-2.jpg', 'old-3.jpg']
+        )
+        self.assertEqual(count_archived_reports(self.directory, self.archive), 3)
+
+    def test_unknown_target(self):
+        with self.assertRaises(ValueError):
+            archive_resolved_reports(target='tape')
+
+    def test_stats_rebuild_counts_archived_reports(self):
+        archive_resolved_reports(older_than_days=180, use_transactions=False)
+        user_stats = mongomock.MongoClient()['communityeye']['user_stats']
+        user_stats.insert_one({'_id': 42, 'total': 1, 'resolved': 0, 'upvotes_received': 0, 'updated_at': 1})
+        with patch('stats_utils.reports', self.reports), patch('stats_utils.reports_archive', self.archive), \
+                patch('stats_utils.user_stats', BulkWriteCollection(user_stats)):
+            self.assertEqual(stats_utils.rebuild_user_stats(), 2)
+        self.assertEqual(user_stats.find_one({'_id': 1})['total'], 4)
+        self.assertEqual(user_stats.find_one({'_id': 1})['resolved'], 3)
+        self.assertIsNone(user_stats.find_one({'_id': 42}))
+
+
+class IncludeArchivedEndpointTestCase(unittest.TestCase):
+    def setUp(self):
+        self.app = Flask(__name__)
+        self.app.register_blueprint(reports_bp)
+        self.client = self.app.test_client()
+        self.headers = {'x-access-token': MOCK_JWT_TOKEN}
+
+        # a database of its own, so the feed index is created on these collections
+        db = mongomock.MongoClient()['archive_test']
+        self.reports = db['reports']
+        self.archive = db['reports_archive']
+        self.hot = [make_report(7, days) for days in (1, 3, 5)]
+        self.archived = [make_report(7, days, days - 1) for days in (2, 4, 6)]
+        self.reports.insert_many(self.hot)
+        self.archive.insert_many(self.archived)
+        # caught between the copy and the delete of an archival batch
+        self.reports.insert_one(dict(self.archived[0]))
+
+        mock_post = MagicMock()
+        mock_post.return_value.status_code = 200
+        for target, value in (
+            ('decorators.requests.post', mock_post),
+            ('blueprints.reports.reports.reports', self.reports),
+            ('blueprints.reports.reports.reports_archive', self.archive),
+            ('blueprints.reports.reports.get_user_stats', MagicMock(return_value={})),
+        ):
+            patcher = patch(target, value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    # /api/v1/reports/user/<user_id> [GET]
+    def test_reports_by_user(self):
+        hot = self.client.get('/api/v1/reports/user/7', headers=self.headers).json
+        both = self.client.get('/api/v1/reports/user/7?include_archived=true', headers=self.headers).json
+
+        self.assertEqual(len(hot), 4)
+        self.assertEqual(len(both), 6)
+        self.assertEqual(len({report['_id'] for report in both}), 6)
+
+    # /api/v1/reports/user/<user_id>/feed [GET]
+    def test_feed_pages_through_both_collections(self):
+        seen, cursor = [], None
+        while True:
+            url = '/api/v1/reports/user/7/feed?include_archived=true&limit=2'
+            page = self.client.get(url + (f'&cursor={cursor}' if cursor else ''), headers=self.headers).json
+            seen.extend(page['reports'])
+            cursor = page['next_cursor']
+            if not cursor:
+                break
+
+        expected = sorted(self.hot + self.archived, key=lambda report: report['created_at'], reverse=True)
+        self.assertEqual([report['id'] for report in seen], [str(report['_id']) for report in expected])
+
+
+if __name__ == '__main__':
+    unittest.main()
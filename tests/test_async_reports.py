@@ -0,0 +1,160 @@
+"""
+File: test_async_reports.py
+Author: Jack McArdle
+
+This file is part of CommunityEye.
+
+Email: mcardle-j9@ulster.ac.uk
+B-No: B00733578
+"""
+
+import unittest
+from unittest.mock import patch, MagicMock, AsyncMock
+from quart import Quart
+from bson import ObjectId
+import jwt
+from blueprints.reports.async_reports import async_reports_bp
+from config import FLASK_SECRET_KEY
+from idempotency import MemoryStore
+
+MOCK_USER_ID = 999
+MOCK_JWT_TOKEN = jwt.encode({'user_id': MOCK_USER_ID}, FLASK_SECRET_KEY, algorithm='HS256')
+MOCK_REPORT_ID = ObjectId('60b8d2a4b8d2a4bad2a4b8d2')
+MOCK_REPORT_DATA = {
+    '_id': MOCK_REPORT_ID,
+    'authority': 'Department for Infrastructure - Eastern Division',
+    'category': 'Potholes',
+    'created_at': 1700000000,
+    'description': 'Sample Report',
+    'user_id': MOCK_USER_ID,
+    'image': {'image_name': 'test_img.jpg'},
+    'resolved': False,
+    'upvote_count': 0
+}
+
+
+class AsyncCursor:
+    def __init__(self, documents):
+        self._documents = iter(documents)
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        try:
+            return next(self._documents)
+        except StopIteration:
+            raise StopAsyncIteration
+
+
+class AsyncReportsTestCase(unittest.IsolatedAsyncioTestCase):
+    def setUp(self):
+        self.app = Quart(__name__)
+        self.app.register_blueprint(async_reports_bp)
+        self.client = self.app.test_client()
+        self.headers = {'x-access-token': MOCK_JWT_TOKEN}
+
+        http_patcher = patch('async_decorators.get_async_http_client')
+        http_client = http_patcher.start().return_value
+        http_client.post = AsyncMock(return_value=MagicMock(status_code=200))
+        self.addCleanup(http_patcher.stop)
+
+        reports_patcher = patch('blueprints.reports.async_reports.reports')
+        self.mock_reports = reports_patcher.start()
+        self.addCleanup(reports_patcher.stop)
+        upvotes_patcher = patch('blueprints.reports.async_reports.upvotes')
+        self.mock_upvotes = upvotes_patcher.start()
+        self.addCleanup(upvotes_patcher.stop)
+
+    # /api/v1/reports [GET]
+    async def test_get_reports_success(self):
+        self.mock_reports.find.return_value = AsyncCursor([dict(MOCK_REPORT_DATA)])
+
+        response = await self.client.get('/api/v1/reports', headers=self.headers)
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('description', (await response.get_json())[0])
+
+    @patch('blueprints.reports.async_reports.reports_archive')
+    async def test_get_reports_include_archived(self, mock_archive):
+        archived = {**MOCK_REPORT_DATA, '_id': ObjectId(), 'resolved': True}
+        self.mock_reports.find.side_effect = lambda: AsyncCursor([dict(MOCK_REPORT_DATA)])
+        mock_archive.find.side_effect = lambda: AsyncCursor([dict(archived), dict(MOCK_REPORT_DATA)])
+
+        hot = await self.client.get('/api/v1/reports', headers=self.headers)
+        both = await self.client.get('/api/v1/reports?include_archived=true', headers=self.headers)
+        self.assertEqual(len(await hot.get_json()), 1)
+        self.assertEqual(
+            [report['_id'] for report in await both.get_json()], [str(MOCK_REPORT_ID), str(archived['_id'])]
+        )
+        mock_archive.find.assert_called_once()
+
+    async def test_get_reports_missing_token(self):
+        response = await self.client.get('/api/v1/reports')
+        self.assertEqual(response.status_code, 401)
+
+    # /api/v1/reports [POST]
+    async def test_create_report_missing_fields(self):
+        response = await self.client.post('/api/v1/reports', form={'category': 'Potholes', 'userID': '123'}, headers=self.headers)
+        self.assertEqual(response.status_code, 422)
+
+    @patch('idempotency.idempotency_store', new_callable=MemoryStore)
+    async def test_create_report_replayed(self, _):
+        headers = {**self.headers, 'Idempotency-Key': 'retry-1'}
+
+        first = await self.client.post('/api/v1/reports', form={'category': 'Potholes', 'userID': '123'}, headers=headers)
+        second = await self.client.post('/api/v1/reports', form={'category': 'Potholes', 'userID': '123'}, headers=headers)
+        self.assertEqual((first.status_code, second.status_code), (422, 422))
+        self.assertEqual(await second.get_json(), await first.get_json())
+        self.assertEqual(second.headers['Idempotent-Replayed'], 'true')
+        self.assertNotIn('Idempotent-Replayed', first.headers)
+
+    # /api/v1/reports/<report_id>/resolve [POST]
+    @patch('blueprints.reports.async_reports.record_report_resolved')
+    async def test_resolve_report_success(self, mock_record_resolved):
+        self.mock_reports.find_one = AsyncMock(return_value=MOCK_REPORT_DATA)
+        self.mock_reports.update_one = AsyncMock(return_value=MagicMock(modified_count=1))
+
+        response = await self.client.post(f'/api/v1/reports/{MOCK_REPORT_ID}/resolve')
+        self.assertEqual(response.status_code, 200)
+        mock_record_resolved.assert_called_once()
+
+    async def test_resolve_report_not_found(self):
+        self.mock_reports.find_one = AsyncMock(return_value=None)
+
+        response = await self.client.post(f'/api/v1/reports/{MOCK_REPORT_ID}/resolve')
+        self.assertEqual(response.status_code, 404)
+
+    # /api/v1/reports/batch/delete [POST]
+    @patch('batch_operations.record_reports_deleted')
+    @patch('batch_operations.delete_image_async', new_callable=AsyncMock, return_value=True)
+    async def test_batch_delete_reports(self, mock_delete_image, mock_record_deleted):
+        missing_id = ObjectId()
+        self.mock_reports.find.return_value.to_list = AsyncMock(return_value=[dict(MOCK_REPORT_DATA)])
+        self.mock_reports.update_many = AsyncMock()
+        self.mock_reports.delete_many = AsyncMock(return_value=MagicMock(deleted_count=1))
+
+        response = await self.client.post(
+            '/api/v1/reports/batch/delete',
+            json={'report_ids': [str(MOCK_REPORT_ID), str(missing_id)]},
+            headers=self.headers,
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual((await response.get_json())['summary'], {'deleted': 1, 'not_found': 1})
+        mock_delete_image.assert_awaited_once_with('test_img.jpg')
+        mock_record_deleted.assert_called_once()
+
+    # /api/v1/reports/<report_id>/upvote [POST]
+    @patch('blueprints.reports.async_reports.record_report_upvoted')
+    async def test_upvote_report_success(self, _):
+        self.mock_upvotes.find_one = AsyncMock(return_value=None)
+        self.mock_upvotes.insert_one = AsyncMock()
+        self.mock_reports.find_one_and_update = AsyncMock(return_value=MOCK_REPORT_DATA)
+
+        response = await self.client.post(f'/api/v1/reports/{MOCK_REPORT_ID}/upvote', headers=self.headers)
+        self.assertEqual(response.status_code, 200)
+
+    async def test_upvote_report_conflict(self):
+        self.mock_upvotes.find_one = AsyncMock(return_value={'_id': ObjectId()})
+
+        response = await self.client.post(f'/api/v1/reports/{MOCK_REPORT_ID}/upvote', headers=self.headers)
+        self.assertEqual(response.status_code, 409)
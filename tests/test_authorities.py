@@ -0,0 +1,130 @@
+"""
+File: test_authorities.py
+Author: Jack McArdle
+
+This file is part of CommunityEye.
+
+Email: mcardle-j9@ulster.ac.uk
+B-No: B00733578
+"""
+
+import unittest
+from unittest.mock import patch
+from flask import Flask
+import mongomock
+from blueprints.authorities.authorities import authorities_bp
+import jwt
+from config import FLASK_SECRET_KEY
+from bson import ObjectId
+import stats_utils
+
+MOCK_USER_ID = 999
+MOCK_JWT_TOKEN = jwt.encode({'user_id': MOCK_USER_ID}, FLASK_SECRET_KEY, algorithm='HS256')
+MOCK_AUTHORITY = 'Belfast City Council'
+
+MOCK_STATS_DOCUMENT = {
+    '_id': MOCK_AUTHORITY,
+    'categories': {
+        'Missed bin collection': {
+            'open': 3, 'resolved': 2, 'timed_resolutions': 2,
+            'resolve_seconds_total': 7200, 'upvotes': 4
+        },
+        'Pavement issue': {'open': 1, 'resolved': 1, 'upvotes': 1}
+    },
+    'top_upvoted': [{'report_id': '60b8d2a4b8d2a4bad2a4b8d2', 'category': 'Missed bin collection', 'upvote_count': 4}],
+    'updated_at': 1700000000
+}
+
+MOCK_REPORT_DATA = {
+    '_id': ObjectId('60b8d2a4b8d2a4bad2a4b8d2'),
+    'authority': MOCK_AUTHORITY,
+    'category': 'Missed bin collection',
+    'created_at': 1700000000,
+    'resolved': False,
+    'upvote_count': 2
+}
+
+
+class AuthoritiesTestCase(unittest.TestCase):
+    def setUp(self):
+        self.app = Flask(__name__)
+        self.app.register_blueprint(authorities_bp)
+        self.client = self.app.test_client()
+        auth_patcher = patch('decorators.requests.post')
+        auth_patcher.start().return_value.status_code = 200
+        self.addCleanup(auth_patcher.stop)
+
+    # /api/v1/authorities/<name>/stats [GET]
+    @patch('stats_utils.stats')
+    def test_get_stats_success(self, mock_stats):
+        mock_stats.find_one.return_value = MOCK_STATS_DOCUMENT
+
+        response = self.client.get(f'/api/v1/authorities/{MOCK_AUTHORITY}/stats', headers={'x-access-token': MOCK_JWT_TOKEN})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json['totals']['open'], 4)
+        self.assertEqual(response.json['totals']['resolved'], 3)
+        self.assertEqual(response.json['categories']['Missed bin collection']['mean_time_to_resolve'], 3600)
+        self.assertIsNone(response.json['categories']['Pavement issue']['mean_time_to_resolve'])
+        self.assertEqual(len(response.json['top_upvoted']), 1)
+
+    @patch('blueprints.authorities.authorities.authorities')
+    @patch('stats_utils.stats')
+    def test_get_stats_no_reports(self, mock_stats, mock_authorities):
+        mock_stats.find_one.return_value = None
+        mock_authorities.find_one.return_value = {'_id': ObjectId()}
+
+        response = self.client.get(f'/api/v1/authorities/{MOCK_AUTHORITY}/stats', headers={'x-access-token': MOCK_JWT_TOKEN})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json['totals']['open'], 0)
+
+    @patch('blueprints.authorities.authorities.authorities')
+    @patch('stats_utils.stats')
+    def test_get_stats_unknown_authority(self, mock_stats, mock_authorities):
+        mock_stats.find_one.return_value = None
+        mock_authorities.find_one.return_value = None
+
+        response = self.client.get('/api/v1/authorities/Nowhere/stats', headers={'x-access-token': MOCK_JWT_TOKEN})
+        self.assertEqual(response.status_code, 404)
+
+    @patch('stats_utils.stats')
+    def test_get_stats_db_error(self, mock_stats):
+        mock_stats.find_one.side_effect = Exception("DB error")
+
+        response = self.client.get(f'/api/v1/authorities/{MOCK_AUTHORITY}/stats', headers={'x-access-token': MOCK_JWT_TOKEN})
+        self.assertEqual(response.status_code, 500)
+
+    # incremental updates
+    @patch('stats_utils.stats')
+    def test_record_report_resolved(self, mock_stats):
+        stats_utils.record_report_resolved(MOCK_REPORT_DATA, 1700003600)
+
+        update = mock_stats.update_one.call_args[0][1]
+        self.assertEqual(update['$inc']['categories.Missed bin collection.open'], -1)
+        self.assertEqual(update['$inc']['categories.Missed bin collection.resolved'], 1)
+        self.assertEqual(update['$inc']['categories.Missed bin collection.resolve_seconds_total'], 3600)
+
+    @patch('stats_utils.stats')
+    def test_record_report_deleted(self, mock_stats):
+        stats_utils.record_report_deleted(MOCK_REPORT_DATA)
+
+        update = mock_stats.update_one.call_args_list[0][0][1]
+        self.assertEqual(update['$inc']['categories.Missed bin collection.open'], -1)
+        self.assertEqual(update['$inc']['categories.Missed bin collection.upvotes'], -2)
+
+    def test_category_with_dots_and_dollar(self):
+        stats = mongomock.MongoClient()['communityeye']['authority_stats']
+        category = 'St. lights $ 100%'
+        with patch('stats_utils.stats', stats):
+            stats_utils.record_report_created({**MOCK_REPORT_DATA, 'category': category})
+            stats_utils.record_report_resolved({**MOCK_REPORT_DATA, 'category': category}, 1700003600)
+            result = stats_utils.get_authority_stats(MOCK_AUTHORITY)
+
+        self.assertEqual(list(result['categories']), [category])
+        self.assertEqual(result['categories'][category]['resolved'], 1)
+        self.assertEqual(result['categories'][category]['open'], 0)
+
+    @patch('stats_utils.stats')
+    def test_record_report_without_authority(self, mock_stats):
+        stats_utils.record_report_created({**MOCK_REPORT_DATA, 'authority': None})
+
+        mock_stats.update_one.assert_not_called()
@@ -0,0 +1,202 @@
+"""
+File: test_batch_operations.py
+Author: Jack McArdle
+
+This file is part of CommunityEye.
+
+Email: mcardle-j9@ulster.ac.uk
+B-No: B00733578
+"""
+
+import unittest
+from unittest.mock import patch, MagicMock
+from flask import Flask
+from bson import ObjectId
+import jwt
+import mongomock
+from blueprints.reports.reports import reports_bp
+from config import FLASK_SECRET_KEY
+import stats_utils
+
+MOCK_USER_ID = 999
+MOCK_JWT_TOKEN = jwt.encode({'user_id': MOCK_USER_ID}, FLASK_SECRET_KEY, algorithm='HS256')
+OPEN_ID = ObjectId('60b8d2a4b8d2a4bad2a4b8d1')
+RESOLVED_ID = ObjectId('60b8d2a4b8d2a4bad2a4b8d2')
+IMPORTED_ID = ObjectId('60b8d2a4b8d2a4bad2a4b8d3')
+MISSING_ID = ObjectId('60b8d2a4b8d2a4bad2a4b8d4')
+
+
+def make_report(report_id, resolved=False, image_name='test_img.jpg'):
+    report = {
+        '_id': report_id,
+        'authority': 'Belfast City Council',
+        'category': 'Missed bin collection',
+        'created_at': 1700000000,
+        'resolved': resolved,
+        'upvote_count': 2,
+        'image': {'image_name': image_name},
+    }
+    if resolved:
+        report['resolved_at'] = 1700003600
+    return report
+
+
+class BatchOperationsTestCase(unittest.TestCase):
+    def setUp(self):
+        self.app = Flask(__name__)
+        self.app.register_blueprint(reports_bp)
+        self.client = self.app.test_client()
+
+        auth_patcher = patch('decorators.requests.post')
+        auth_patcher.start().return_value.status_code = 200
+        self.addCleanup(auth_patcher.stop)
+
+        self.mock_reports = MagicMock()
+        self.mock_reports.find.return_value = [
+            make_report(OPEN_ID), make_report(RESOLVED_ID, resolved=True), make_report(IMPORTED_ID, image_name=None)
+        ]
+        self.mock_delete_image = MagicMock(return_value=True)
+        self.mock_resolved = MagicMock()
+        self.mock_deleted = MagicMock()
+        for target, value in (
+            ('blueprints.reports.reports.reports', self.mock_reports),
+            ('batch_operations.delete_image', self.mock_delete_image),
+            ('batch_operations.record_reports_resolved', self.mock_resolved),
+            ('batch_operations.record_reports_deleted', self.mock_deleted),
+            ('batch_operations.recent_reports', MagicMock()),
+            ('batch_operations.similar_images', MagicMock()),
+        ):
+            patcher = patch(target, value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def post(self, action, report_ids):
+        return self.client.post(
+            f'/api/v1/reports/batch/{action}',
+            json={'report_ids': report_ids},
+            headers={'x-access-token': MOCK_JWT_TOKEN},
+        )
+
+    # /api/v1/reports/batch/resolve [POST]
+    def test_batch_resolve(self):
+        self.mock_reports.update_many.return_value.modified_count = 2
+
+        response = self.post('resolve', [str(OPEN_ID), str(RESOLVED_ID), str(IMPORTED_ID), str(MISSING_ID), 'bad'])
+
+        self.assertEqual(response.status_code, 200)
+        statuses = {report_id: result['status'] for report_id, result in response.json['results'].items()}
+        self.assertEqual(statuses, {
+            str(OPEN_ID): 'resolved',
+            str(RESOLVED_ID): 'already_resolved',
+            str(IMPORTED_ID): 'resolved',
+            str(MISSING_ID): 'not_found',
+            'bad': 'invalid_id',
+        })
+        self.assertEqual(response.json['summary']['resolved'], 2)
+        self.mock_reports.update_many.assert_called_once()
+        query, update = self.mock_reports.update_many.call_args.args
+        self.assertEqual(query['_id']['$in'], [OPEN_ID, IMPORTED_ID])
+        resolved_at = update['$set']['resolved_at']
+        self.assertEqual(response.json['results'][str(OPEN_ID)]['resolved_at'], resolved_at)
+        self.assertEqual(len(self.mock_resolved.call_args.args[0]), 2)
+        self.assertEqual(self.mock_resolved.call_args.args[1], resolved_at)
+
+    def test_batch_resolve_concurrently_resolved(self):
+        # another request resolved IMPORTED_ID between the read and the update
+        self.mock_reports.update_many.return_value.modified_count = 1
+        self.mock_reports.find.side_effect = [self.mock_reports.find.return_value, [{'_id': OPEN_ID}]]
+
+        response = self.post('resolve', [str(OPEN_ID), str(IMPORTED_ID)])
+
+        self.assertEqual(response.json['results'][str(OPEN_ID)]['status'], 'resolved')
+        self.assertEqual(response.json['results'][str(IMPORTED_ID)]['status'], 'already_resolved')
+        self.assertEqual([report['_id'] for report in self.mock_resolved.call_args.args[0]], [OPEN_ID])
+
+    # /api/v1/reports/batch/delete [POST]
+    def test_batch_delete(self):
+        self.mock_reports.delete_many.return_value.deleted_count = 3
+
+        response = self.post('delete', [str(OPEN_ID), str(RESOLVED_ID), str(IMPORTED_ID), str(MISSING_ID)])
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json['summary'], {'deleted': 3, 'not_found': 1})
+        # the imported report has no blob of its own
+        self.assertEqual(self.mock_delete_image.call_count, 2)
+        claim_filter, claim_update = self.mock_reports.update_many.call_args.args
+        token = claim_update['$set']['deleting']
+        self.assertEqual(claim_filter['_id'], {'$in': [OPEN_ID, RESOLVED_ID, IMPORTED_ID, MISSING_ID]})
+        self.assertEqual(self.mock_reports.find.call_args_list[0].args[0]['deleting'], token)
+        # only the IDs this batch did not claim are looked up again
+        self.assertEqual(self.mock_reports.find.call_args.args[0], {'_id': {'$in': [MISSING_ID]}})
+        self.mock_reports.delete_many.assert_called_once_with(
+            {'_id': {'$in': [OPEN_ID, RESOLVED_ID, IMPORTED_ID]}, 'deleting': token}
+        )
+        self.assertEqual(len(self.mock_deleted.call_args.args[0]), 3)
+
+    def test_batch_delete_skips_reports_claimed_by_another_delete(self):
+        reports = mongomock.MongoClient()['communityeye']['reports']
+        reports.insert_many([
+            {**make_report(OPEN_ID, image_name=None), 'deleting': 'other', 'deleting_until': 2 ** 40},
+            make_report(IMPORTED_ID, image_name=None),
+        ])
+
+        with patch('blueprints.reports.reports.reports', reports):
+            response = self.post('delete', [str(OPEN_ID), str(IMPORTED_ID), str(MISSING_ID)])
+            single = self.client.delete(f'/api/v1/reports/{OPEN_ID}', headers={'x-access-token': MOCK_JWT_TOKEN})
+
+        self.assertEqual(response.json['summary'], {'deleted': 1, 'in_progress': 1, 'not_found': 1})
+        self.assertEqual(response.json['results'][str(OPEN_ID)], {'status': 'in_progress'})
+        self.assertEqual([report['_id'] for report in self.mock_deleted.call_args.args[0]], [IMPORTED_ID])
+        # left for the batch delete that claimed it to remove and count
+        self.assertEqual(single.status_code, 204)
+        self.assertIsNotNone(reports.find_one({'_id': OPEN_ID}))
+
+    def test_batch_delete_keeps_report_when_blob_delete_fails(self):
+        self.mock_delete_image.side_effect = lambda image_name: False
+        self.mock_reports.delete_many.return_value.deleted_count = 1
+
+        response = self.post('delete', [str(OPEN_ID), str(IMPORTED_ID)])
+
+        self.assertEqual(response.json['results'][str(OPEN_ID)]['status'], 'error')
+        self.assertEqual(response.json['results'][str(IMPORTED_ID)]['status'], 'deleted')
+        token = self.mock_reports.update_many.call_args_list[0].args[1]['$set']['deleting']
+        self.mock_reports.delete_many.assert_called_once_with({'_id': {'$in': [IMPORTED_ID]}, 'deleting': token})
+        # the kept report is released for later deletes
+        self.assertEqual(
+            self.mock_reports.update_many.call_args.args,
+            ({'_id': {'$in': [OPEN_ID]}, 'deleting': token}, {'$unset': {'deleting': '', 'deleting_until': ''}}),
+        )
+
+    def test_batch_invalid_body(self):
+        for body in ([], ['a', 1], 'not a list'):
+            response = self.post('delete', body)
+            self.assertEqual(response.status_code, 400)
+        with patch('batch_operations.BATCH_MAX_IDS', 1):
+            response = self.post('resolve', [str(OPEN_ID), str(IMPORTED_ID)])
+        self.assertEqual(response.status_code, 400)
+        self.mock_reports.find.assert_not_called()
+
+    def test_batch_requires_auth(self):
+        response = self.client.post('/api/v1/reports/batch/resolve', json={'report_ids': [str(OPEN_ID)]})
+        self.assertEqual(response.status_code, 401)
+
+    @patch('stats_utils.stats')
+    def test_record_reports_deleted(self, mock_stats):
+        stats_utils.record_reports_deleted([make_report(OPEN_ID), make_report(RESOLVED_ID, resolved=True)])
+
+        operations = mock_stats.bulk_write.call_args.args[0]
+        self.assertEqual(len(operations), 1)
+        update = operations[0]._doc
+        prefix = 'categories.Missed bin collection'
+        self.assertEqual(update['$inc'], {
+            f'{prefix}.open': -1,
+            f'{prefix}.resolved': -1,
+            f'{prefix}.timed_resolutions': -1,
+            f'{prefix}.resolve_seconds_total': -3600,
+            f'{prefix}.upvotes': -4,
+        })
+        self.assertEqual(update['$pull'], {'top_upvoted': {'report_id': {'$in': [str(OPEN_ID), str(RESOLVED_ID)]}}})
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,112 @@
+"""
+File: test_blob_gc.py
+Author: Jack McArdle
+
+This file is part of CommunityEye.
+
+Email: mcardle-j9@ulster.ac.uk
+B-No: B00733578
+"""
+
+import logging
+import threading
+import unittest
+from unittest.mock import MagicMock, patch
+from azure.storage.blob import ContainerClient
+from werkzeug.serving import make_server
+from blob_gc import BloomFilter, collect_garbage, load_referenced_names
+from image_utils import delete_image
+from loadtest.blob_standin import create_app
+
+REFERENCED = [f'report-{index}.jpg' for index in range(10)]
+ORPHANED = [f'orphan-{index}.jpg' for index in range(7)]
+
+
+class BlobGarbageCollectionTestCase(unittest.TestCase):
+    """
+    Runs against the in-memory Blob Storage stand-in through the Azure SDK.
+    """
+
+    @classmethod
+    def setUpClass(cls):
+        logging.getLogger('werkzeug').setLevel(logging.ERROR)
+        cls.server = make_server('127.0.0.1', 0, create_app(), threaded=True)
+        threading.Thread(target=cls.server.serve_forever, daemon=True).start()
+        cls.account_url = f'http://127.0.0.1:{cls.server.server_port}/'
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.shutdown()
+
+    def setUp(self):
+        self.container = ContainerClient(self.account_url, f'images-{self.id().rsplit(".", 1)[-1]}'.replace('_', '-'))
+        for name in REFERENCED + ORPHANED:
+            self.container.upload_blob(name, b'jpeg')
+        self.reports = MagicMock()
+        self.reports.find.return_value = [{'image': {'image_name': name}} for name in REFERENCED]
+        self.reports.count_documents.return_value = len(REFERENCED)
+
+    def blob_names(self):
+        return {blob.name for blob in self.container.list_blobs()}
+
+    def test_dry_run_lists_orphans_only(self):
+        found = []
+        summary = collect_garbage(
+            self.container, load_referenced_names(self.reports), min_age_seconds=0,
+            dry_run=True, page_size=4, on_orphan=found.append,
+        )
+
+        self.assertEqual(sorted(orphan['name'] for orphan in found), sorted(ORPHANED))
+        self.assertEqual(summary['orphans'], len(ORPHANED))
+        self.assertEqual(summary['deleted'], 0)
+        self.assertEqual(len(self.blob_names()), len(REFERENCED + ORPHANED))
+
+    def test_deletes_orphans_in_batches(self):
+        with patch.object(self.container, 'delete_blobs', wraps=self.container.delete_blobs) as delete_blobs:
+            summary = collect_garbage(
+                self.container, load_referenced_names(self.reports, use_bloom=True), min_age_seconds=0,
+                dry_run=False, page_size=4, batch_size=3, workers=2,
+            )
+
+        self.assertEqual(summary['deleted'], len(ORPHANED))
+        self.assertEqual(summary['failed'], 0)
+        self.assertEqual(self.blob_names(), set(REFERENCED))
+        self.assertEqual(delete_blobs.call_count, 3)
+
+    def test_archived_names_streamed_into_bloom_filter(self):
+        archived = (name for name in ORPHANED[:3])
+        referenced = load_referenced_names(self.reports, use_bloom=True, extra_names=archived, extra_count=3)
+        summary = collect_garbage(self.container, referenced, min_age_seconds=0, dry_run=False)
+
+        self.assertEqual(summary['deleted'], len(ORPHANED) - 3)
+        self.assertEqual(self.blob_names(), set(REFERENCED + ORPHANED[:3]))
+
+    def test_recent_blobs_are_kept(self):
+        summary = collect_garbage(
+            self.container, load_referenced_names(self.reports), min_age_seconds=3600, dry_run=False,
+        )
+
+        self.assertEqual(summary['orphans'], 0)
+        self.assertEqual(len(self.blob_names()), len(REFERENCED + ORPHANED))
+
+    def test_delete_image_single_request(self):
+        with patch('image_utils.get_container_client', return_value=self.container):
+            self.assertTrue(delete_image(ORPHANED[0]))
+            self.assertFalse(delete_image(ORPHANED[0]))
+        self.assertNotIn(ORPHANED[0], self.blob_names())
+
+
+class BloomFilterTestCase(unittest.TestCase):
+    def test_no_false_negatives(self):
+        bloom = BloomFilter(5000, error_rate=0.01)
+        names = [f'report-{index}.jpg' for index in range(5000)]
+        for name in names:
+            bloom.add(name)
+
+        self.assertTrue(all(name in bloom for name in names))
+        false_positives = sum(f'orphan-{index}.jpg' in bloom for index in range(5000))
+        self.assertLess(false_positives, 150)
+
+
+if __name__ == '__main__':
+    unittest.main()
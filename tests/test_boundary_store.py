@@ -0,0 +1,162 @@
+"""
+File: test_boundary_store.py
+Author: Jack McArdle
+
+This file is part of CommunityEye.
+
+Email: mcardle-j9@ulster.ac.uk
+B-No: B00733578
+"""
+
+import os
+import tempfile
+import unittest
+from unittest.mock import patch
+import numpy as np
+from boundary_store import (
+    BoundaryStore,
+    build_boundary_set,
+    current_version,
+    files_fingerprint,
+    load_authorities_from_files,
+    load_boundary_set,
+    save_boundary_set,
+)
+
+BELFAST = {'Lat': 54.597285, 'Lon': -5.930120}
+DUBLIN = {'Lat': 53.349805, 'Lon': -6.26031}
+SQUARE_WITH_HOLE = {
+    'authority_name': 'Square',
+    'authority_type': 'Council',
+    'area': {
+        'type': 'Polygon',
+        'coordinates': [
+            [[0, 0], [10, 0], [10, 10], [0, 10], [0, 0]],
+            [[4, 4], [6, 4], [6, 6], [4, 6], [4, 4]],
+        ],
+    },
+}
+TWO_ISLANDS = {
+    'authority_name': 'Islands',
+    'authority_type': 'Department for Infrastructure',
+    'area': {
+        'type': 'MultiPolygon',
+        'coordinates': [
+            [[[20, 0], [22, 0], [22, 2], [20, 2], [20, 0]]],
+            [[[30, 0], [32, 0], [32, 2], [30, 2], [30, 0]]],
+        ],
+    },
+}
+
+
+class BoundarySetTestCase(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.authorities = load_authorities_from_files()
+        cls.boundaries = build_boundary_set(cls.authorities)
+
+    def test_locate_shipped_authorities(self):
+        assigned = self.boundaries.locate(
+            [BELFAST['Lon'], BELFAST['Lon'], DUBLIN['Lon']],
+            [BELFAST['Lat'], BELFAST['Lat'], DUBLIN['Lat']],
+            ['Council', 'Department for Infrastructure', 'Council'],
+        )
+        self.assertEqual(assigned, [
+            'Belfast City Council', 'Department for Infrastructure - Eastern Division', None
+        ])
+
+    def test_unknown_type_is_unassigned(self):
+        self.assertEqual(self.boundaries.locate([BELFAST['Lon']], [BELFAST['Lat']], [None]), [None])
+
+    def test_holes_and_multipolygons(self):
+        boundaries = build_boundary_set([SQUARE_WITH_HOLE, TWO_ISLANDS])
+        assigned = boundaries.locate(
+            [1, 5, 21, 31, 25],
+            [1, 5, 1, 1, 1],
+            ['Council', 'Council', 'Department for Infrastructure',
+             'Department for Infrastructure', 'Department for Infrastructure'],
+        )
+        self.assertEqual(assigned, ['Square', None, 'Islands', 'Islands', None])
+
+    def test_version_depends_on_content_only(self):
+        self.assertEqual(build_boundary_set(reversed(self.authorities)).version, self.boundaries.version)
+        moved = dict(SQUARE_WITH_HOLE, area={
+            'type': 'Polygon', 'coordinates': [[[0, 0], [11, 0], [11, 10], [0, 10], [0, 0]]]
+        })
+        self.assertNotEqual(
+            build_boundary_set([SQUARE_WITH_HOLE]).version, build_boundary_set([moved]).version
+        )
+
+    def test_save_and_memory_map(self):
+        directory = tempfile.mkdtemp()
+        path = save_boundary_set(self.boundaries, directory)
+
+        loaded = load_boundary_set(path)
+
+        self.assertEqual(current_version(directory), self.boundaries.version)
+        self.assertEqual(loaded.version, self.boundaries.version)
+        self.assertIsInstance(loaded.coords, np.memmap)
+        np.testing.assert_array_equal(loaded.coords, self.boundaries.coords)
+        self.assertEqual(loaded.locate([BELFAST['Lon']], [BELFAST['Lat']], ['Council']), ['Belfast City Council'])
+
+
+class BoundaryStoreTestCase(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        patcher = patch('boundary_store.load_authorities_from_mongo', return_value=[SQUARE_WITH_HOLE])
+        self.load_from_mongo = patcher.start()
+        self.addCleanup(patcher.stop)
+        fingerprint_patcher = patch('boundary_store.mongo_fingerprint', return_value='1:a')
+        self.mongo_fingerprint = fingerprint_patcher.start()
+        self.addCleanup(fingerprint_patcher.stop)
+
+    def test_builds_when_no_store_exists(self):
+        boundaries = BoundaryStore(self.directory, 'mongo').get()
+        self.assertEqual(boundaries.names, ['Square'])
+        self.assertTrue(os.path.isdir(os.path.join(self.directory, boundaries.version)))
+
+    def test_reuses_current_version(self):
+        BoundaryStore(self.directory, 'mongo').get()
+        self.load_from_mongo.reset_mock()
+
+        BoundaryStore(self.directory, 'mongo').get()
+
+        self.load_from_mongo.assert_not_called()
+
+    def test_rebuilds_when_source_changed_while_stopped(self):
+        first = BoundaryStore(self.directory, 'mongo').get()
+        self.load_from_mongo.return_value = [SQUARE_WITH_HOLE, TWO_ISLANDS]
+        self.mongo_fingerprint.return_value = '2:b'
+
+        second = BoundaryStore(self.directory, 'mongo').get()
+
+        self.assertNotEqual(first.version, second.version)
+        self.assertEqual(second.names, ['Islands', 'Square'])
+        self.load_from_mongo.reset_mock()
+        BoundaryStore(self.directory, 'mongo').get()
+        self.load_from_mongo.assert_not_called()
+
+    def test_files_fingerprint_follows_content(self):
+        path = os.path.join(self.directory, 'areas.json')
+        with open(path, 'w') as f:
+            f.write('[]')
+        before = files_fingerprint(os.path.join(self.directory, '*.json'))
+        with open(path, 'w') as f:
+            f.write('[{}]')
+        self.assertNotEqual(files_fingerprint(os.path.join(self.directory, '*.json')), before)
+
+    def test_invalidate_rebuilds_from_source(self):
+        store = BoundaryStore(self.directory, 'mongo')
+        first = store.get()
+        self.load_from_mongo.return_value = [SQUARE_WITH_HOLE, TWO_ISLANDS]
+
+        store.invalidate()
+        second = store.get()
+
+        self.assertNotEqual(first.version, second.version)
+        self.assertEqual(current_version(self.directory), second.version)
+        self.assertEqual(second.names, ['Islands', 'Square'])
+
+
+if __name__ == '__main__':
+    unittest.main()
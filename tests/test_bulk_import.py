@@ -0,0 +1,180 @@
+"""
+File: test_bulk_import.py
+Author: Jack McArdle
+
+This file is part of CommunityEye.
+
+Email: mcardle-j9@ulster.ac.uk
+B-No: B00733578
+"""
+
+import json
+import unittest
+from unittest.mock import patch, MagicMock
+from flask import Flask
+from pymongo.errors import BulkWriteError
+from blueprints.reports.reports import reports_bp
+from boundary_store import build_boundary_set, load_authorities_from_files
+from bulk_import import BulkImport
+import jwt
+from config import FLASK_SECRET_KEY
+import report_utils
+import stats_utils
+
+MOCK_USER_ID = 999
+MOCK_JWT_TOKEN = jwt.encode({'user_id': MOCK_USER_ID}, FLASK_SECRET_KEY, algorithm='HS256')
+BELFAST = {'Lat': 54.597285, 'Lon': -5.930120}
+DUBLIN = {'Lat': 53.349805, 'Lon': -6.26031}
+
+
+def make_line(**overrides):
+    item = {
+        'description': 'Imported pothole',
+        'category': 'Potholes',
+        'geolocation': BELFAST,
+        'image': {'url': 'https://legacy.example.com/photo.jpg'},
+    }
+    item.update(overrides)
+    return json.dumps(item)
+
+
+class BulkImportTestCase(unittest.TestCase):
+    def setUp(self):
+        self.app = Flask(__name__)
+        self.app.register_blueprint(reports_bp)
+        self.client = self.app.test_client()
+
+        auth_patcher = patch('decorators.requests.post')
+        auth_patcher.start().return_value.status_code = 200
+        self.addCleanup(auth_patcher.stop)
+
+        self.mock_reports = MagicMock()
+        self.mock_record = MagicMock()
+        for target, value in (
+            ('decorators.ADMIN_TOKEN', 'admin-secret'),
+            ('blueprints.reports.reports.reports', self.mock_reports),
+            ('bulk_import.record_reports_created', self.mock_record),
+            ('bulk_import.recent_reports', MagicMock()),
+            ('bulk_import.filter_within_boundaries',
+             lambda geolocations: [geolocation['Lat'] > 54 for geolocation in geolocations]),
+            ('bulk_import.determine_report_authorities',
+             lambda geolocations, categories, created_at: ['Department for Infrastructure - Eastern Division'] * len(geolocations)),
+            ('bulk_import.find_localities',
+             lambda geolocations: [{'district': 'Belfast City Council', 'ward': None}] * len(geolocations)),
+        ):
+            patcher = patch(target, value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def post(self, lines, query='', admin_token='admin-secret'):
+        return self.client.post(
+            f'/api/v1/reports/bulk{query}',
+            data='\n'.join(lines) + '\n',
+            content_type='application/x-ndjson',
+            headers={'x-access-token': MOCK_JWT_TOKEN, 'x-admin-token': admin_token},
+        )
+
+    # /api/v1/reports/bulk [POST]
+    def test_bulk_import_mixed_results(self):
+        response = self.post([
+            make_line(),
+            '{not json',
+            make_line(category='Unknown'),
+            make_line(geolocation=DUBLIN),
+            '',
+            make_line(user_id=5, resolved=True, resolved_at=1700003600, created_at=1700000000),
+        ])
+
+        self.assertEqual(response.status_code, 200)
+        statuses = {result['line']: result['status'] for result in response.json['results']}
+        self.assertEqual(statuses, {1: 'created', 2: 'invalid', 3: 'invalid', 4: 'invalid', 6: 'created'})
+        self.assertEqual(response.json['summary']['created'], 2)
+        self.assertEqual(response.json['summary']['invalid'], 3)
+
+        operations = self.mock_reports.bulk_write.call_args.args[0]
+        self.assertEqual(len(operations), 2)
+        self.assertFalse(self.mock_reports.bulk_write.call_args.kwargs['ordered'])
+        imported = operations[1]._doc
+        self.assertEqual(imported['user_id'], 5)
+        self.assertEqual(imported['resolved_at'], 1700003600)
+        self.assertEqual(imported['locality']['district'], 'Belfast City Council')
+        self.assertEqual(operations[0]._doc['user_id'], MOCK_USER_ID)
+        self.assertEqual(len(self.mock_record.call_args.args[0]), 2)
+
+    def test_bulk_import_requires_admin_token(self):
+        response = self.post([make_line()], admin_token='wrong')
+
+        self.assertEqual(response.status_code, 401)
+        self.mock_reports.bulk_write.assert_not_called()
+
+    def test_bulk_import_write_errors(self):
+        self.mock_reports.bulk_write.side_effect = BulkWriteError(
+            {'writeErrors': [{'index': 1, 'errmsg': 'duplicate key'}]}
+        )
+
+        response = self.post([make_line(), make_line()])
+
+        statuses = [result['status'] for result in response.json['results']]
+        self.assertEqual(statuses, ['created', 'failed'])
+        self.assertEqual(response.json['results'][1]['errors'], ['duplicate key'])
+        self.assertEqual(len(self.mock_record.call_args.args[0]), 1)
+
+    def test_bulk_import_stream(self):
+        with patch('blueprints.reports.reports.BulkImport', lambda user_id: BulkImport(user_id, batch_size=2)):
+            response = self.post([make_line() for _ in range(5)], '?stream=true')
+
+        self.assertEqual(response.mimetype, 'application/x-ndjson')
+        events = [json.loads(line) for line in response.data.decode().splitlines()]
+        self.assertEqual(sum('progress' in event for event in events), 3)
+        self.assertEqual(self.mock_reports.bulk_write.call_count, 3)
+        self.assertEqual(events[-1]['summary']['created'], 5)
+
+    def test_bulk_import_max_items(self):
+        with patch('blueprints.reports.reports.BulkImport', lambda user_id: BulkImport(user_id, max_items=2)):
+            response = self.post([make_line() for _ in range(4)])
+
+        self.assertEqual(len(response.json['results']), 2)
+        self.assertTrue(response.json['summary']['truncated'])
+
+    def test_bulk_import_wrong_content_type(self):
+        response = self.client.post(
+            '/api/v1/reports/bulk',
+            json=[],
+            headers={'x-access-token': MOCK_JWT_TOKEN, 'x-admin-token': 'admin-secret'},
+        )
+        self.assertEqual(response.status_code, 415)
+
+
+class BatchRoutingTestCase(unittest.TestCase):
+    def test_determine_report_authorities(self):
+        boundaries = build_boundary_set(load_authorities_from_files())
+
+        with patch('report_utils.boundary_store.get', return_value=boundaries):
+            assigned = report_utils.determine_report_authorities(
+                [BELFAST, BELFAST, DUBLIN], ['Potholes', 'Missed bin collection', 'Potholes']
+            )
+
+        self.assertEqual(assigned, [
+            'Department for Infrastructure - Eastern Division', 'Belfast City Council', None
+        ])
+
+    @patch('stats_utils.stats')
+    def test_record_reports_created(self, mock_stats):
+        stats_utils.record_reports_created([
+            {'_id': 1, 'authority': 'Belfast City Council', 'category': 'Potholes', 'resolved': False, 'upvote_count': 3},
+            {'_id': 2, 'authority': 'Belfast City Council', 'category': 'Potholes', 'resolved': True,
+             'created_at': 100, 'resolved_at': 400, 'upvote_count': 0},
+            {'_id': 3, 'authority': None, 'category': 'Potholes', 'resolved': False},
+        ])
+
+        operations = mock_stats.bulk_write.call_args.args[0]
+        self.assertEqual(len(operations), 1)
+        update = operations[0]._doc
+        self.assertEqual(update['$inc'], {
+            'categories.Potholes.open': 1,
+            'categories.Potholes.upvotes': 3,
+            'categories.Potholes.resolved': 1,
+            'categories.Potholes.timed_resolutions': 1,
+            'categories.Potholes.resolve_seconds_total': 300,
+        })
+        self.assertEqual(update['$push']['top_upvoted']['$each'][0]['report_id'], '1')
@@ -0,0 +1,194 @@
+"""
+File: test_change_watcher.py
+Author: Jack McArdle
+
+This file is part of CommunityEye.
+
+Email: mcardle-j9@ulster.ac.uk
+B-No: B00733578
+"""
+
+import os
+import tempfile
+import unittest
+from unittest.mock import MagicMock, patch
+from bson import ObjectId
+from pymongo.errors import OperationFailure
+import change_watcher
+from change_watcher import ChangeWatcher, _invalidate_report_indexes, _to_event
+from config import MONGO_COLLECTION_AUTHORITIES, MONGO_COLLECTION_REPORTS
+
+MOCK_REPORT_ID = ObjectId('60b8d2a4b8d2a4bad2a4b8d2')
+
+
+def make_change(operation, document=None, updated_fields=None):
+    change = {
+        '_id': {'_data': f'token-{operation}'},
+        'operationType': operation,
+        'ns': {'db': 'communityeye', 'coll': MONGO_COLLECTION_REPORTS},
+        'documentKey': {'_id': MOCK_REPORT_ID},
+    }
+    if document is not None:
+        change['fullDocument'] = document
+    if updated_fields is not None:
+        change['updateDescription'] = {'updatedFields': updated_fields, 'removedFields': []}
+    return change
+
+
+class FakeStream:
+    """
+    Stands in for a change stream, returning the given changes then stopping the watcher.
+    """
+
+    def __init__(self, changes, watcher):
+        self.changes = list(changes)
+        self.watcher = watcher
+        self.alive = True
+        self.resume_token = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        return False
+
+    def try_next(self):
+        if not self.changes:
+            self.watcher._stopped.set()
+            return None
+        change = self.changes.pop(0)
+        self.resume_token = change['_id']
+        return change
+
+
+class ChangeWatcherTestCase(unittest.TestCase):
+    def setUp(self):
+        self.watcher = ChangeWatcher(poll_seconds=0.01, resume_file=None)
+        self.events = []
+        self.watcher.subscribe(MONGO_COLLECTION_REPORTS, self.events.append)
+
+        patcher = patch('change_watcher.get_db')
+        self.mock_db = patcher.start().return_value
+        self.addCleanup(patcher.stop)
+
+    def test_to_event(self):
+        event = _to_event(make_change('update', updated_fields={'resolved': True}))
+        self.assertEqual(event['collection'], MONGO_COLLECTION_REPORTS)
+        self.assertEqual(event['operation'], 'update')
+        self.assertEqual(event['id'], str(MOCK_REPORT_ID))
+        self.assertEqual(event['updated_fields'], {'resolved': True})
+
+    def test_dispatch_only_to_collection_subscribers(self):
+        authority_events = []
+        self.watcher.subscribe(MONGO_COLLECTION_AUTHORITIES, authority_events.append)
+        self.watcher.dispatch({'collection': MONGO_COLLECTION_AUTHORITIES, 'operation': 'refresh', 'id': None})
+        self.assertEqual(len(authority_events), 1)
+        self.assertEqual(self.events, [])
+
+    def test_failing_subscriber_does_not_stop_others(self):
+        self.watcher._subscribers[MONGO_COLLECTION_REPORTS].insert(0, MagicMock(side_effect=ValueError))
+        self.watcher.dispatch({'collection': MONGO_COLLECTION_REPORTS, 'operation': 'delete', 'id': 'x'})
+        self.assertEqual(len(self.events), 1)
+
+    def test_watch_dispatches_changes_and_keeps_resume_token(self):
+        changes = [make_change('insert', document={'_id': MOCK_REPORT_ID}), make_change('delete')]
+        self.mock_db.watch.return_value = FakeStream(changes, self.watcher)
+
+        self.watcher._run()
+
+        self.assertEqual([event['operation'] for event in self.events], ['insert', 'delete'])
+        self.assertEqual(self.watcher.resume_token, {'_data': 'token-delete'})
+        self.assertEqual(self.watcher.mode, 'change_stream')
+
+    def test_resume_token_saved_and_reloaded(self):
+        resume_file = os.path.join(tempfile.mkdtemp(), 'resume.json')
+        watcher = ChangeWatcher(resume_file=resume_file)
+        watcher.subscribe(MONGO_COLLECTION_REPORTS, self.events.append)
+        self.mock_db.watch.return_value = FakeStream([make_change('delete')], watcher)
+
+        watcher._run()
+
+        restarted = ChangeWatcher(resume_file=resume_file)
+        self.assertEqual(restarted.resume_token, {'_data': 'token-delete'})
+        restarted.subscribe(MONGO_COLLECTION_REPORTS, self.events.append)
+        self.mock_db.watch.return_value = FakeStream([], restarted)
+        restarted._run()
+        self.assertEqual(self.mock_db.watch.call_args.kwargs['resume_after'], {'_data': 'token-delete'})
+
+    def test_lost_resume_token_refreshes_subscribers(self):
+        self.watcher.resume_token = {'_data': 'expired'}
+        self.mock_db.watch.side_effect = [
+            OperationFailure('resume point may no longer be in the oplog', code=286),
+            FakeStream([], self.watcher),
+        ]
+
+        self.watcher._run()
+
+        self.assertEqual(self.events[0]['operation'], 'refresh')
+        self.assertIsNone(self.mock_db.watch.call_args.kwargs['resume_after'])
+
+    def test_polls_when_change_streams_unsupported(self):
+        self.mock_db.watch.side_effect = OperationFailure(
+            'The $changeStream stage is only supported on replica sets', code=40573
+        )
+        # unchanged on the first poll, changed on the second
+        hashes = iter(['a', 'a', 'b'])
+
+        def db_hash(command, collections):
+            if next(hashes, None) == 'b':
+                self.watcher._stopped.set()
+                return {'collections': {collections[0]: 'b'}}
+            return {'collections': {collections[0]: 'a'}}
+
+        self.mock_db.command.side_effect = db_hash
+        self.mock_db.__getitem__.return_value.estimated_document_count.return_value = 10
+
+        self.watcher._run()
+
+        self.assertEqual(self.watcher.mode, 'polling')
+        self.assertEqual([event['operation'] for event in self.events], ['refresh'])
+
+    def test_large_collections_polled_without_hashing(self):
+        collection = self.mock_db.__getitem__.return_value
+        collection.estimated_document_count.return_value = 50000
+        collection.find_one.return_value = {'_id': MOCK_REPORT_ID}
+
+        self.assertEqual(self.watcher._fingerprint('reports'), (50000, MOCK_REPORT_ID))
+        self.mock_db.command.assert_not_called()
+
+
+class ReportIndexSubscriberTestCase(unittest.TestCase):
+    def setUp(self):
+        recent_patcher = patch('duplicate_utils.recent_reports')
+        similar_patcher = patch('image_index.similar_images')
+        self.recent_reports = recent_patcher.start()
+        self.similar_images = similar_patcher.start()
+        self.addCleanup(recent_patcher.stop)
+        self.addCleanup(similar_patcher.stop)
+
+    def test_insert_adds_to_indexes(self):
+        document = {'_id': MOCK_REPORT_ID, 'resolved': False, 'image': {'dhash': 'ff00ff00ff00ff00'}}
+        _invalidate_report_indexes(_to_event(make_change('insert', document=document)))
+        self.recent_reports.add.assert_called_once_with(document)
+        self.similar_images.add.assert_called_once_with('ff00ff00ff00ff00', str(MOCK_REPORT_ID))
+
+    def test_resolve_removes_from_recent_reports(self):
+        _invalidate_report_indexes(_to_event(make_change('update', updated_fields={'resolved': True})))
+        self.recent_reports.discard.assert_called_once_with(str(MOCK_REPORT_ID))
+        self.similar_images.discard.assert_not_called()
+
+    def test_delete_removes_from_indexes(self):
+        _invalidate_report_indexes(_to_event(make_change('delete')))
+        self.recent_reports.discard.assert_called_once_with(str(MOCK_REPORT_ID))
+        self.similar_images.discard.assert_called_once_with(str(MOCK_REPORT_ID))
+
+    def test_authority_change_invalidates_boundary_store(self):
+        with patch('boundary_store.boundary_store') as boundary_store:
+            change_watcher._invalidate_authorities(
+                {'collection': MONGO_COLLECTION_AUTHORITIES, 'operation': 'update', 'id': 'x'}
+            )
+        boundary_store.invalidate.assert_called_once()
+
+
+if __name__ == '__main__':
+    unittest.main()
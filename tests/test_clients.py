@@ -0,0 +1,55 @@
+"""
+File: test_clients.py
+Author: Jack McArdle
+
+This file is part of CommunityEye.
+
+Email: mcardle-j9@ulster.ac.uk
+B-No: B00733578
+"""
+
+import os
+import unittest
+from unittest.mock import patch, MagicMock
+from clients import ClientRegistry, LazyDatabase
+
+
+class ClientRegistryTestCase(unittest.TestCase):
+    def test_client_created_once(self):
+        registry = ClientRegistry()
+        factory = MagicMock(return_value=object())
+
+        first = registry.get('mongo', factory)
+        second = registry.get('mongo', factory)
+        self.assertIs(first, second)
+        factory.assert_called_once()
+        self.assertIn('mongo', registry.init_timings)
+
+    def test_client_recreated_in_new_process(self):
+        registry = ClientRegistry()
+        factory = MagicMock(side_effect=[object(), object()])
+
+        first = registry.get('mongo', factory)
+        # simulate running in a forked child
+        registry._pid = os.getpid() + 1
+        second = registry.get('mongo', factory)
+        self.assertIsNot(first, second)
+        self.assertEqual(factory.call_count, 2)
+
+    def test_nested_clients(self):
+        registry = ClientRegistry()
+        service = MagicMock()
+
+        container = registry.get('container', lambda: registry.get('service', lambda: service).get_container_client('images'))
+        self.assertIs(container, service.get_container_client.return_value)
+
+
+class LazyDatabaseTestCase(unittest.TestCase):
+    def test_collection_not_resolved_until_used(self):
+        with patch('clients.get_db') as mock_get_db:
+            collection = LazyDatabase()['reports']
+            mock_get_db.assert_not_called()
+
+            collection.find_one({'_id': 1})
+            mock_get_db.return_value.__getitem__.assert_called_with('reports')
+            mock_get_db.return_value.__getitem__.return_value.find_one.assert_called_once_with({'_id': 1})
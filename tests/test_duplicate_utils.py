@@ -0,0 +1,149 @@
+"""
+File: test_duplicate_utils.py
+Author: Jack McArdle
+
+This file is part of CommunityEye.
+
+Email: mcardle-j9@ulster.ac.uk
+B-No: B00733578
+"""
+
+import io
+import time
+import unittest
+from unittest.mock import patch
+from flask import Flask
+from bson import ObjectId
+import jwt
+from blueprints.reports.reports import reports_bp
+from config import FLASK_SECRET_KEY
+from duplicate_utils import RecentReportIndex, haversine_metres
+
+MOCK_USER_ID = 999
+MOCK_JWT_TOKEN = jwt.encode({'user_id': MOCK_USER_ID}, FLASK_SECRET_KEY, algorithm='HS256')
+MOCK_REPORT_ID = ObjectId('60b8d2a4b8d2a4bad2a4b8d2')
+
+
+def make_report(report_id, category, lat, lon, created_at=None):
+    return {
+        '_id': report_id,
+        'category': category,
+        'geolocation': {'type': 'Feature', 'geometry': {'type': 'Point', 'coordinates': [lat, lon]}},
+        'created_at': created_at if created_at is not None else int(time.time()),
+    }
+
+
+class RecentReportIndexTestCase(unittest.TestCase):
+    def setUp(self):
+        patcher = patch('duplicate_utils.reports')
+        self.mock_reports = patcher.start()
+        self.addCleanup(patcher.stop)
+        self.mock_reports.find.return_value = [
+            make_report(MOCK_REPORT_ID, 'Potholes', 54.597, -5.930)
+        ]
+        self.index = RecentReportIndex(radius_metres=25, window_seconds=86400, refresh_seconds=60)
+
+    def test_haversine_metres(self):
+        # one thousandth of a degree of latitude is roughly 111 metres
+        self.assertAlmostEqual(haversine_metres(54.0, -6.0, 54.001, -6.0), 111.2, delta=0.5)
+
+    def test_find_nearby_match(self):
+        self.assertEqual(self.index.find_nearby('Potholes', 54.5971, -5.9301), str(MOCK_REPORT_ID))
+        self.assertEqual(self.index.get_stats()['hits'], 1)
+
+    def test_find_nearby_across_cell_boundary(self):
+        # 20 metres east lands in a neighbouring cell but is still within the radius
+        self.assertEqual(self.index.find_nearby('Potholes', 54.597, -5.92969), str(MOCK_REPORT_ID))
+
+    def test_find_nearby_too_far(self):
+        self.assertIsNone(self.index.find_nearby('Potholes', 54.598, -5.930))
+
+    def test_find_nearby_other_category(self):
+        self.assertIsNone(self.index.find_nearby('Spillages', 54.597, -5.930))
+
+    def test_find_nearby_expired(self):
+        self.mock_reports.find.return_value = [
+            make_report(MOCK_REPORT_ID, 'Potholes', 54.597, -5.930, created_at=int(time.time()) - 2 * 86400)
+        ]
+        self.assertIsNone(self.index.find_nearby('Potholes', 54.597, -5.930))
+
+    def test_discard(self):
+        self.index.find_nearby('Potholes', 54.597, -5.930)
+        self.index.discard(str(MOCK_REPORT_ID))
+        self.assertIsNone(self.index.find_nearby('Potholes', 54.597, -5.930))
+
+    def test_add_after_load(self):
+        self.mock_reports.find.return_value = []
+        self.index.find_nearby('Potholes', 54.0, -6.0)
+        self.index.add(make_report(MOCK_REPORT_ID, 'Potholes', 54.0, -6.0))
+        self.assertEqual(self.index.find_nearby('Potholes', 54.0, -6.0), str(MOCK_REPORT_ID))
+        self.assertEqual(self.index.get_stats()['hit_rate'], 0.5)
+
+
+    def test_refresh_queries_without_lock(self):
+        def find(*args):
+            # lookups and discards are not blocked while the query is in flight
+            self.assertFalse(self.index._lock.locked())
+            self.index.discard(str(MOCK_REPORT_ID))
+            return [make_report(MOCK_REPORT_ID, 'Potholes', 54.597, -5.930)]
+
+        self.mock_reports.find.side_effect = find
+        self.assertIsNone(self.index.find_nearby('Potholes', 54.597, -5.930))
+
+
+class CreateDuplicateReportTestCase(unittest.TestCase):
+    def setUp(self):
+        self.app = Flask(__name__)
+        self.app.register_blueprint(reports_bp)
+        self.client = self.app.test_client()
+        auth_patcher = patch('decorators.requests.post')
+        auth_patcher.start().return_value.status_code = 200
+        self.addCleanup(auth_patcher.stop)
+
+    def post_report(self):
+        mock_image = io.BytesIO(b"fake image bytes")
+        data = {
+            'description': 'Sample Report',
+            'category': 'Potholes',
+            'userID': '123',
+            'image': (mock_image, 'test_image.jpg')
+        }
+        return self.client.post('/api/v1/reports', data=data, headers={'x-access-token': MOCK_JWT_TOKEN}, content_type='multipart/form-data')
+
+    @patch('blueprints.reports.reports.delete_image')
+    @patch('blueprints.reports.reports.upvotes')
+    @patch('blueprints.reports.reports.reports')
+    @patch('blueprints.reports.reports.find_duplicate_report', return_value=str(MOCK_REPORT_ID))
+    @patch('blueprints.reports.reports.is_within_boundaries', return_value=True)
+    @patch('blueprints.reports.reports.upload_image')
+    def test_create_report_merges_duplicate(self, mock_upload_image, _, __, mock_reports, mock_upvotes, mock_delete_image):
+        mock_upload_image.return_value = {"geolocation": {"Lat": 54.6, "Lon": -5.9}, "image_name": "test_image"}
+        mock_upvotes.find_one.return_value = None
+        mock_reports.find_one_and_update.return_value = {'_id': MOCK_REPORT_ID, 'authority': None, 'category': 'Potholes', 'upvote_count': 2}
+
+        response = self.post_report()
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json['duplicate_of'], str(MOCK_REPORT_ID))
+        mock_reports.insert_one.assert_not_called()
+        mock_upvotes.insert_one.assert_called_once()
+        mock_delete_image.assert_called_once_with("test_image")
+
+    @patch('blueprints.reports.reports.find_localities', return_value=[None])
+    @patch('blueprints.reports.reports.send_email')
+    @patch('blueprints.reports.reports.recent_reports')
+    @patch('blueprints.reports.reports.record_report_created')
+    @patch('blueprints.reports.reports.determine_report_authority', return_value=None)
+    @patch('blueprints.reports.reports.upvotes')
+    @patch('blueprints.reports.reports.reports')
+    @patch('blueprints.reports.reports.find_duplicate_report', return_value=str(MOCK_REPORT_ID))
+    @patch('blueprints.reports.reports.is_within_boundaries', return_value=True)
+    @patch('blueprints.reports.reports.upload_image')
+    def test_create_report_stale_duplicate(self, mock_upload_image, _, __, mock_reports, mock_upvotes, *mocks):
+        mock_upload_image.return_value = {"geolocation": {"Lat": 54.6, "Lon": -5.9}, "image_name": "test_image"}
+        mock_upvotes.find_one.return_value = None
+        mock_reports.find_one_and_update.return_value = None
+        mock_reports.insert_one.return_value.inserted_id = ObjectId()
+
+        response = self.post_report()
+        self.assertEqual(response.status_code, 201)
+        mock_reports.insert_one.assert_called_once()
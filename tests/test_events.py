@@ -0,0 +1,202 @@
+"""
+File: test_events.py
+Author: Jack McArdle
+
+This file is part of CommunityEye.
+
+Email: mcardle-j9@ulster.ac.uk
+B-No: B00733578
+"""
+
+import asyncio
+import json
+import unittest
+from unittest.mock import patch, MagicMock, AsyncMock
+from bson import ObjectId
+from flask import Flask
+from quart import Quart
+import jwt
+import mongomock
+from blueprints.reports.async_reports import async_reports_bp
+from blueprints.reports.reports import reports_bp
+from config import FLASK_SECRET_KEY
+from events import (
+    HEARTBEAT,
+    EventBroker,
+    event_stream,
+    event_stream_async,
+    parse_stream_args,
+    report_summary,
+)
+
+MOCK_JWT_TOKEN = jwt.encode({'user_id': 999}, FLASK_SECRET_KEY, algorithm='HS256')
+BELFAST = 'Belfast City Council'
+
+
+def make_report(authority=BELFAST, latitude=54.6, longitude=-5.93):
+    return {
+        '_id': ObjectId(),
+        'authority': authority,
+        'category': 'Potholes',
+        'geolocation': {'geometry': {'type': 'Point', 'coordinates': [latitude, longitude]}},
+        'resolved': False,
+        'upvote_count': 0,
+    }
+
+
+def parse_events(chunks):
+    events = []
+    for chunk in chunks:
+        fields = dict(line.split(': ', 1) for line in chunk.strip().split('\n') if not line.startswith(':'))
+        if 'event' in fields:
+            events.append((fields['event'], json.loads(fields['data'])))
+    return events
+
+
+class EventBrokerTestCase(unittest.TestCase):
+    def setUp(self):
+        self.broker = EventBroker(history_size=3, max_subscribers=2)
+
+    def test_filters_by_authority_and_bbox(self):
+        _, belfast = parse_stream_args({'authority': BELFAST})
+        _, north_down = parse_stream_args({'bbox': '-5.8,54.6,-5.6,54.7'})
+        by_authority = self.broker.subscribe(belfast)
+        by_bbox = self.broker.subscribe(north_down)
+
+        self.broker.publish('created', report_summary(make_report()))
+        self.broker.publish('created', report_summary(make_report('Ards and North Down', 54.65, -5.7)))
+
+        self.assertEqual(by_authority.get(0)['data']['authority'], BELFAST)
+        self.assertIsNone(by_authority.get(0))
+        self.assertEqual(by_bbox.get(0)['data']['longitude'], -5.7)
+        self.assertIsNone(by_bbox.get(0))
+
+    def test_bad_bbox(self):
+        for bbox in ('1,2,3', '-5.6,54.6,-5.8,54.7', 'a,b,c,d'):
+            error, _ = parse_stream_args({'bbox': bbox})
+            self.assertIsNotNone(error)
+
+    def test_reconnect_replays_missed_events(self):
+        first = self.broker.publish('created', report_summary(make_report()))
+        self.broker.publish('upvoted', report_summary(make_report()))
+        self.broker.publish('deleted', report_summary(make_report('Ards and North Down')))
+
+        subscription, opening = self.broker.open({'authority': BELFAST}, first['id'])
+        self.assertEqual([event for event, _ in parse_events(opening)], ['upvoted'])
+        # the events replayed are not sent again from the queue
+        self.assertIsNone(subscription.get(0))
+
+    def test_reconnect_after_history_resets(self):
+        first = self.broker.publish('created', report_summary(make_report()))
+        for _ in range(4):
+            self.broker.publish('upvoted', report_summary(make_report()))
+
+        _, opening = self.broker.open({}, first['id'])
+        _, from_other_process = self.broker.open({}, 'abc-1')
+        self.assertEqual([event for event, _ in parse_events(opening)], ['reset'])
+        self.assertEqual([event for event, _ in parse_events(from_other_process)], ['reset'])
+
+    def test_subscriber_limit(self):
+        self.broker.subscribe({})
+        self.broker.subscribe({})
+        subscription, _ = self.broker.open({})
+        self.assertIsNone(subscription)
+
+    def test_overflowed_subscriber_finishes_after_queued_events(self):
+        subscription, opening = self.broker.open({})
+        subscription._queue.maxsize = 2
+        for _ in range(4):
+            self.broker.publish('created', report_summary(make_report()))
+
+        chunks = list(event_stream(subscription, opening, self.broker))
+        self.assertEqual(len(parse_events(chunks)), 2)
+        self.assertEqual(self.broker.subscriber_count(), 0)
+
+
+class AsyncEventStreamTestCase(unittest.IsolatedAsyncioTestCase):
+    async def test_published_from_another_thread(self):
+        broker = EventBroker()
+        subscription, opening = broker.open({}, loop=asyncio.get_running_loop())
+        stream = event_stream_async(subscription, opening, broker)
+
+        self.assertTrue((await stream.__anext__()).startswith('retry:'))
+        with patch('events.STREAM_HEARTBEAT_SECONDS', 0.01):
+            self.assertEqual(await stream.__anext__(), HEARTBEAT)
+        await asyncio.to_thread(broker.publish, 'resolved', report_summary(make_report(), resolved=True))
+        self.assertEqual(parse_events([await stream.__anext__()])[0][1]['resolved'], True)
+        await stream.aclose()
+        self.assertEqual(broker.subscriber_count(), 0)
+
+
+class StreamEndpointTestCase(unittest.TestCase):
+    def setUp(self):
+        self.app = Flask(__name__)
+        self.app.register_blueprint(reports_bp)
+        self.client = self.app.test_client()
+        self.headers = {'x-access-token': MOCK_JWT_TOKEN}
+
+        db = mongomock.MongoClient()['communityeye']
+        self.reports, self.upvotes = db['reports'], db['upvotes']
+        self.broker = EventBroker()
+        mock_post = MagicMock()
+        mock_post.return_value.status_code = 200
+        for target, value in (
+            ('decorators.requests.post', mock_post),
+            ('blueprints.reports.reports.reports', self.reports),
+            ('blueprints.reports.reports.upvotes', self.upvotes),
+            ('blueprints.reports.reports.report_events', self.broker),
+            ('events.report_events', self.broker),
+            ('blueprints.reports.reports.record_report_upvoted', MagicMock()),
+            ('blueprints.reports.reports.record_report_resolved', MagicMock()),
+        ):
+            patcher = patch(target, value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    # /api/v1/reports/stream [GET]
+    def test_stream_sends_handler_events(self):
+        report = make_report()
+        self.reports.insert_one(report)
+        first = self.broker.publish('created', report_summary(report))
+
+        self.client.post(f'/api/v1/reports/{report["_id"]}/upvote', headers=self.headers)
+        self.client.post(f'/api/v1/reports/{report["_id"]}/resolve')
+        response = self.client.get(
+            f'/api/v1/reports/stream?authority={BELFAST}',
+            headers={**self.headers, 'Last-Event-ID': first['id']},
+            buffered=False,
+        )
+        chunks = response.response
+        opening = [next(chunks).decode() for _ in range(3)]
+        chunks.close()
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.mimetype, 'text/event-stream')
+        events = parse_events(opening)
+        self.assertEqual([event for event, _ in events], ['upvoted', 'resolved'])
+        self.assertEqual(events[0][1]['upvote_count'], 1)
+        self.assertEqual(events[1][1]['id'], str(report['_id']))
+        self.assertEqual(self.broker.subscriber_count(), 0)
+
+    def test_stream_bad_bbox(self):
+        response = self.client.get('/api/v1/reports/stream?bbox=1,2', headers=self.headers)
+        self.assertEqual(response.status_code, 400)
+
+
+class AsyncStreamEndpointTestCase(unittest.IsolatedAsyncioTestCase):
+    async def test_stream_refused_when_full(self):
+        app = Quart(__name__)
+        app.register_blueprint(async_reports_bp)
+        http_patcher = patch('async_decorators.get_async_http_client')
+        http_patcher.start().return_value.post = AsyncMock(return_value=MagicMock(status_code=200))
+        self.addCleanup(http_patcher.stop)
+
+        with patch('blueprints.reports.async_reports.report_events', EventBroker(max_subscribers=0)):
+            response = await app.test_client().get(
+                '/api/v1/reports/stream', headers={'x-access-token': MOCK_JWT_TOKEN}
+            )
+        self.assertEqual(response.status_code, 503)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,145 @@
+"""
+File: test_exif_utils.py
+Author: Jack McArdle
+
+This file is part of CommunityEye.
+
+Email: mcardle-j9@ulster.ac.uk
+B-No: B00733578
+"""
+
+import io
+import random
+import unittest
+import piexif
+from PIL import Image
+from PIL.ExifTags import IFD
+from pillow_heif import register_heif_opener
+from exif_utils import UnsupportedImageFormat, read_gps_info
+from image_utils import _read_gps_info_pil, get_image_geolocation
+
+BELFAST = {'Lat': 54.597285, 'Lon': -5.930120}
+SYDNEY = {'Lat': -33.856784, 'Lon': 151.215297}
+XMP = b'http://ns.adobe.com/xap/1.0/\x00<x:xmpmeta/>'
+
+
+def dms(value):
+    value = abs(value)
+    degrees = int(value)
+    minutes = int((value - degrees) * 60)
+    seconds = round(((value - degrees) * 60 - minutes) * 60 * 10000)
+    return ((degrees, 1), (minutes, 1), (seconds, 10000))
+
+
+def gps_exif(geolocation):
+    # piexif writes big-endian EXIF
+    return piexif.dump({'GPS': {
+        piexif.GPSIFD.GPSLatitudeRef: 'N' if geolocation['Lat'] >= 0 else 'S',
+        piexif.GPSIFD.GPSLatitude: dms(geolocation['Lat']),
+        piexif.GPSIFD.GPSLongitudeRef: 'E' if geolocation['Lon'] >= 0 else 'W',
+        piexif.GPSIFD.GPSLongitude: dms(geolocation['Lon']),
+        piexif.GPSIFD.GPSAltitude: (12, 1),
+    }, '0th': {piexif.ImageIFD.Make: 'Apple'}})
+
+
+def pillow_gps_exif(geolocation):
+    # Pillow, writing little-endian EXIF
+    exif = Image.Exif()
+    exif.endian = '<'
+    exif[0x010F] = 'Google'
+    exif.get_ifd(IFD.GPSInfo).update({
+        1: 'N' if geolocation['Lat'] >= 0 else 'S',
+        2: tuple(n / d for n, d in dms(geolocation['Lat'])),
+        3: 'E' if geolocation['Lon'] >= 0 else 'W',
+        4: tuple(n / d for n, d in dms(geolocation['Lon'])),
+    })
+    return exif.tobytes()
+
+
+def encode(format, exif=None, size=(48, 32)):
+    register_heif_opener()
+    output = io.BytesIO()
+    image = Image.new('RGB', size, (90, 120, 30))
+    if exif is None:
+        image.save(output, format)
+    else:
+        image.save(output, format, exif=exif)
+    return output.getvalue()
+
+
+def with_segment(jpeg, marker, payload):
+    # insert a segment straight after the start of image marker
+    return jpeg[:2] + marker + (len(payload) + 2).to_bytes(2, 'big') + payload + jpeg[2:]
+
+
+def build_corpus():
+    return {
+        'jpeg big-endian': encode('JPEG', gps_exif(BELFAST)),
+        'jpeg little-endian': encode('JPEG', pillow_gps_exif(BELFAST)),
+        'jpeg southern and eastern': encode('JPEG', gps_exif(SYDNEY)),
+        'jpeg after xmp': with_segment(encode('JPEG', gps_exif(BELFAST)), b'\xff\xe1', XMP),
+        'jpeg without gps': encode('JPEG', piexif.dump({'0th': {piexif.ImageIFD.Make: 'Apple'}})),
+        'jpeg without exif': encode('JPEG'),
+        'heif': encode('HEIF', gps_exif(BELFAST)),
+        'heif little-endian': encode('HEIF', pillow_gps_exif(SYDNEY)),
+        'heif without exif': encode('HEIF'),
+    }
+
+
+class ExifUtilsTestCase(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.corpus = build_corpus()
+
+    def test_matches_pillow(self):
+        for name, data in self.corpus.items():
+            with self.subTest(name):
+                expected = _read_gps_info_pil(io.BytesIO(data)) or None
+                gpsinfo = read_gps_info(io.BytesIO(data))
+                if expected is None or 2 not in expected:
+                    self.assertIsNone(gpsinfo)
+                else:
+                    self.assertEqual(gpsinfo, {tag: expected[tag] for tag in (1, 2, 3, 4)})
+
+    def test_get_image_geolocation(self):
+        self.assertEqual(get_image_geolocation(io.BytesIO(self.corpus['heif'])), BELFAST)
+        self.assertEqual(get_image_geolocation(io.BytesIO(self.corpus['jpeg southern and eastern'])), SYDNEY)
+        self.assertIsNone(get_image_geolocation(io.BytesIO(self.corpus['jpeg without gps'])))
+        # other formats are still read through Pillow
+        png = encode('PNG', gps_exif(BELFAST))
+        with self.assertRaises(UnsupportedImageFormat):
+            read_gps_info(io.BytesIO(png))
+        self.assertEqual(get_image_geolocation(io.BytesIO(png)), BELFAST)
+
+    def test_stream_is_rewound(self):
+        stream = io.BytesIO(self.corpus['heif'])
+        stream.seek(100)
+        read_gps_info(stream)
+        self.assertEqual(stream.tell(), 0)
+
+    def test_fuzzed_inputs_never_raise(self):
+        rng = random.Random(0)
+        samples = list(self.corpus.values())
+        for _ in range(2000):
+            data = bytearray(rng.choice(samples))
+            mutation = rng.randrange(3)
+            if mutation == 0:
+                # corrupt bytes within the metadata at the start of the file
+                for _ in range(rng.randint(1, 8)):
+                    data[rng.randrange(min(len(data), 1024))] = rng.randrange(256)
+            elif mutation == 1:
+                del data[rng.randrange(len(data)):]
+            else:
+                position = rng.randrange(min(len(data), 1024))
+                data[position:position] = bytes(rng.randrange(256) for _ in range(rng.randint(1, 16)))
+            try:
+                gpsinfo = read_gps_info(io.BytesIO(bytes(data)))
+            except UnsupportedImageFormat:
+                continue
+            if gpsinfo is not None:
+                self.assertEqual(set(gpsinfo), {1, 2, 3, 4})
+                self.assertTrue(all(len(gpsinfo[tag]) == 3 for tag in (2, 4)))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,141 @@
+"""
+File: test_export.py
+Author: Jack McArdle
+
+This file is part of CommunityEye.
+
+Email: mcardle-j9@ulster.ac.uk
+B-No: B00733578
+"""
+
+import datetime
+import io
+import unittest
+from unittest.mock import patch, MagicMock
+from flask import Flask
+import jwt
+import mongomock
+import pyarrow as pa
+import pyarrow.parquet as pq
+import export
+from blueprints.reports.reports import reports_bp
+from config import FLASK_SECRET_KEY
+from export import EXPORT_SCHEMA, export_reports, to_record_batch
+
+MOCK_JWT_TOKEN = jwt.encode({'user_id': 999}, FLASK_SECRET_KEY, algorithm='HS256')
+START = 1700000000
+
+
+def make_report(index):
+    return {
+        'user_id': index % 3,
+        'category': 'Potholes' if index % 2 else 'Graffiti',
+        'authority': 'Belfast City Council',
+        'locality': {'district': 'Belfast City Council', 'ward': None},
+        'description': f'Report {index}',
+        'geolocation': {'geometry': {'type': 'Point', 'coordinates': [54.6 + index / 1000, -5.9]}},
+        'created_at': START + index * 10,
+        'resolved': index % 4 == 0,
+        'resolved_at': START + index * 10 + 5 if index % 4 == 0 else None,
+        'upvote_count': index,
+    }
+
+
+class ExportTestCase(unittest.TestCase):
+    def setUp(self):
+        db = mongomock.MongoClient()['communityeye']
+        self.reports = db['reports']
+        self.reports.insert_many([make_report(index) for index in range(10)])
+        patcher = patch('watermarks.job_state', db['job_state'])
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_typed_columns(self):
+        batch = to_record_batch([self.reports.find_one({'upvote_count': 4}), {'_id': 'x', 'description': 'no position'}])
+
+        self.assertEqual(batch.schema, EXPORT_SCHEMA)
+        first, second = batch.to_pylist()
+        self.assertEqual((first['latitude'], first['longitude']), (54.604, -5.9))
+        self.assertEqual(first['created_at'], datetime.datetime.fromtimestamp(START + 40, datetime.timezone.utc))
+        self.assertTrue(first['resolved'])
+        self.assertEqual(first['district'], 'Belfast City Council')
+        self.assertEqual((second['latitude'], second['created_at'], second['resolved'], second['upvote_count']), (None, None, False, 0))
+
+    def test_parquet_written_in_row_groups(self):
+        output = io.BytesIO()
+        summary = export_reports(output, batch_size=4, until=START + 1000, collections=[self.reports])
+
+        parquet = pq.ParquetFile(io.BytesIO(output.getvalue()))
+        self.assertEqual(summary['reports'], 10)
+        self.assertEqual(parquet.metadata.num_row_groups, 3)
+        table = parquet.read()
+        self.assertEqual(table.column('upvote_count').to_pylist(), list(range(10)))
+        self.assertEqual(table.schema, EXPORT_SCHEMA)
+
+    def test_incremental_exports_resume_from_watermark(self):
+        with patch('export.reports', self.reports):
+            first = export_reports(io.BytesIO(), incremental=True, until=START + 45)
+            self.reports.insert_one(make_report(10))
+            output = io.BytesIO()
+            second = export_reports(output, format='arrow', incremental=True, until=START + 1000)
+
+        self.assertEqual((first['reports'], second['reports']), (5, 6))
+        self.assertEqual(second['since'], START + 45)
+        table = pa.ipc.open_stream(output.getvalue()).read_all()
+        self.assertEqual(table.column('description').to_pylist(), [f'Report {index}' for index in range(5, 11)])
+
+    def test_report_being_archived_is_exported_once(self):
+        archive = mongomock.MongoClient()['communityeye']['reports_archive']
+        # caught between the copy and the delete of an archival batch
+        archive.insert_many([self.reports.find_one({'upvote_count': 0}), make_report(10)])
+
+        output = io.BytesIO()
+        summary = export_reports(output, until=START + 1000, collections=[self.reports, archive])
+
+        self.assertEqual(summary['reports'], 11)
+        table = pq.read_table(io.BytesIO(output.getvalue()))
+        self.assertEqual(sorted(table.column('upvote_count').to_pylist()), list(range(11)))
+
+
+class ExportEndpointTestCase(unittest.TestCase):
+    def setUp(self):
+        self.app = Flask(__name__)
+        self.app.register_blueprint(reports_bp)
+        self.client = self.app.test_client()
+        self.headers = {'x-access-token': MOCK_JWT_TOKEN}
+
+        self.reports = mongomock.MongoClient()['communityeye']['reports']
+        self.reports.insert_many([make_report(index) for index in range(10)])
+        mock_post = MagicMock()
+        mock_post.return_value.status_code = 200
+        for target, value in (
+            ('decorators.requests.post', mock_post),
+            ('blueprints.reports.reports.reports', self.reports),
+        ):
+            patcher = patch(target, value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    # /api/v1/reports/export [GET]
+    def test_export_parquet(self):
+        response = self.client.get(f'/api/v1/reports/export?since={START + 50}', headers=self.headers)
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.mimetype, 'application/vnd.apache.parquet')
+        table = pq.read_table(io.BytesIO(response.data))
+        self.assertEqual(table.column('upvote_count').to_pylist(), [6, 7, 8, 9])
+        self.assertGreater(int(response.headers['X-Export-Watermark']), START)
+
+    def test_export_bad_arguments(self):
+        for query in ('format=csv', 'since=yesterday', f'since={START}&until={START - 1}'):
+            response = self.client.get(f'/api/v1/reports/export?{query}', headers=self.headers)
+            self.assertEqual(response.status_code, 400)
+
+    def test_export_query_failure(self):
+        with patch.object(export, 'ReportExporter', side_effect=OSError('disk full')):
+            response = self.client.get('/api/v1/reports/export', headers=self.headers)
+        self.assertEqual(response.status_code, 500)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,99 @@
+"""
+File: test_geocoding.py
+Author: Jack McArdle
+
+This file is part of CommunityEye.
+
+Email: mcardle-j9@ulster.ac.uk
+B-No: B00733578
+"""
+
+import json
+import os
+import shutil
+import tempfile
+import unittest
+from unittest.mock import patch
+import mongomock
+from boundary_store import BoundarySet, BoundaryStore
+import geocoding
+from geocoding import ReverseGeocoder, load_locality_areas
+from tests.helpers import BulkWriteCollection
+
+BELFAST = {'Lat': 54.597285, 'Lon': -5.930120}
+DERRY = {'Lat': 54.996612, 'Lon': -7.308575}
+DUBLIN = {'Lat': 53.349805, 'Lon': -6.26031}
+BOTANIC = {
+    'authority_name': 'Botanic',
+    'area': {'type': 'Polygon', 'coordinates': [[[-6.0, 54.55], [-5.85, 54.55], [-5.85, 54.65], [-6.0, 54.65], [-6.0, 54.55]]]},
+}
+
+
+class GeocodingTestCase(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.directory = tempfile.mkdtemp()
+        ward_file = os.path.join(cls.directory, 'wards.json')
+        with open(ward_file, 'w') as f:
+            json.dump([BOTANIC], f)
+        cls.store = BoundaryStore(
+            os.path.join(cls.directory, 'store'), loader=lambda: load_locality_areas(ward_pattern=ward_file)
+        )
+        cls.store.get()
+
+    @classmethod
+    def tearDownClass(cls):
+        shutil.rmtree(cls.directory)
+
+    def test_localities(self):
+        geocoder = ReverseGeocoder(self.store)
+
+        self.assertEqual(geocoder.localities([BELFAST, DERRY, DUBLIN]), [
+            {'district': 'Belfast City Council', 'ward': 'Botanic'},
+            {'district': 'Derry & Strabane Council', 'ward': None},
+            {'district': None, 'ward': None},
+        ])
+
+    def test_results_are_memoized_by_cell(self):
+        geocoder = ReverseGeocoder(self.store, decimals=3, max_entries=2)
+        geocoder.locality(BELFAST)
+
+        with patch.object(BoundarySet, 'locate') as locate:
+            # about 20 metres away, in the same cell
+            nearby = geocoder.locality({'Lat': BELFAST['Lat'] + 0.0002, 'Lon': BELFAST['Lon']})
+        locate.assert_not_called()
+        self.assertEqual(nearby['ward'], 'Botanic')
+
+        geocoder.localities([DERRY, DUBLIN])
+        self.assertEqual(len(geocoder._cells), 2)
+        self.assertNotIn((round(BELFAST['Lon'], 3), round(BELFAST['Lat'], 3)), geocoder._cells)
+
+    def test_find_localities_failure(self):
+        with patch.object(geocoding.reverse_geocoder, 'localities', side_effect=OSError('unreadable')):
+            self.assertEqual(geocoding.find_localities([BELFAST, DERRY]), [None, None])
+
+    def test_backfill_localities(self):
+        reports = mongomock.MongoClient()['communityeye']['reports']
+        for geolocation in (BELFAST, DERRY, DUBLIN):
+            reports.insert_one({'geolocation': {'geometry': {'coordinates': [geolocation['Lat'], geolocation['Lon']]}}})
+        reports.insert_one({'description': 'no position'})
+        reports.insert_one({
+            'geolocation': {'geometry': {'coordinates': [BELFAST['Lat'], BELFAST['Lon']]}},
+            'locality': {'district': 'Stale', 'ward': None},
+        })
+
+        with patch('geocoding.reports', BulkWriteCollection(reports)), \
+                patch('geocoding.reverse_geocoder', ReverseGeocoder(self.store)):
+            self.assertEqual(geocoding.backfill_localities(batch_size=2), {'reports': 4, 'batches': 2})
+            self.assertEqual(geocoding.backfill_localities(batch_size=2)['reports'], 0)
+            districts = [report['locality']['district'] for report in reports.find()]
+            self.assertEqual(districts, [
+                'Belfast City Council', 'Derry & Strabane Council', None, None, 'Stale',
+            ])
+
+            geocoding.backfill_localities(recompute=True)
+            self.assertEqual(reports.find_one({'locality.district': 'Stale'}), None)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,123 @@
+"""
+File: test_hotspots.py
+Author: Jack McArdle
+
+This file is part of CommunityEye.
+
+Email: mcardle-j9@ulster.ac.uk
+B-No: B00733578
+"""
+
+import unittest
+from unittest.mock import patch
+from flask import Flask
+import jwt
+import mongomock
+import numpy as np
+from blueprints.reports.reports import reports_bp
+from config import FLASK_SECRET_KEY
+import hotspots
+from tests.helpers import BulkWriteCollection
+
+MOCK_JWT_TOKEN = jwt.encode({'user_id': 999}, FLASK_SECRET_KEY, algorithm='HS256')
+WEEK = 7 * 86400
+# Monday 1 January 2024
+WEEK_START = 1704067200
+BELFAST = [54.597, -5.930]
+DERRY = [54.996, -7.308]
+
+
+def make_report(created_at, coordinates=BELFAST, category='Potholes'):
+    return {
+        'category': category,
+        'authority': 'Department for Infrastructure - Eastern Division',
+        'created_at': created_at,
+        'geolocation': {'type': 'Feature', 'geometry': {'type': 'Point', 'coordinates': coordinates}},
+    }
+
+
+class HotspotsTestCase(unittest.TestCase):
+    def setUp(self):
+        db = mongomock.MongoClient()['communityeye']
+        self.reports = db['reports']
+        self.hotspots = BulkWriteCollection(db['hotspots'])
+        for target, value in (
+            ('hotspots.reports', self.reports),
+            ('hotspots.buckets', BulkWriteCollection(db['hotspot_buckets'])),
+            ('hotspots.hotspots', self.hotspots),
+            ('watermarks.job_state', db['job_state']),
+        ):
+            patcher = patch(target, value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+        # one pothole a week in Belfast for four weeks, then a burst
+        for week in range(1, 5):
+            self.reports.insert_one(make_report(WEEK_START - week * WEEK + 3600))
+        for hour in range(5):
+            self.reports.insert_one(make_report(WEEK_START + hour * 3600))
+        self.reports.insert_one(make_report(WEEK_START + 3600, coordinates=DERRY))
+
+    def test_geohash(self):
+        codes = hotspots.geohash_codes(np.array([10.40744]), np.array([57.64911]), 11)
+        self.assertEqual(hotspots.geohash_strings(codes, 11), ['u4pruydqqvj'])
+        min_lon, min_lat, max_lon, max_lat = hotspots.geohash_bounds('gcey95')
+        self.assertTrue(min_lon <= BELFAST[1] <= max_lon and min_lat <= BELFAST[0] <= max_lat)
+        self.assertEqual(hotspots.window_starts([WEEK_START, WEEK_START + WEEK - 1], WEEK).tolist(),
+                         [WEEK_START, WEEK_START])
+
+    def test_detect_hotspots(self):
+        summary = hotspots.detect_hotspots(until=WEEK_START + WEEK)
+
+        self.assertEqual(summary['reports'], 10)
+        self.assertEqual(summary['hotspots'], 1)
+        hotspot = self.hotspots.find_one()
+        self.assertEqual(hotspot['cell'], 'gcey95')
+        self.assertEqual(hotspot['window_start'], WEEK_START)
+        self.assertEqual((hotspot['count'], hotspot['baseline'], hotspot['delta']), (5, 1.0, 4.0))
+        self.assertEqual(hotspot['authorities'], ['Department for Infrastructure - Eastern Division'])
+
+    def test_incremental_runs_match_a_full_run(self):
+        self.assertEqual(hotspots.detect_hotspots(until=WEEK_START + 3600)['hotspots'], 0)
+        summary = hotspots.detect_hotspots(until=WEEK_START + WEEK)
+        self.assertEqual((summary['reports'], summary['hotspots']), (3, 1))
+        incremental = list(self.hotspots.find({}, {'updated_at': 0}))
+
+        with patch('hotspots.HOTSPOT_BATCH_SIZE', 2):
+            hotspots.detect_hotspots(full=True, until=WEEK_START + WEEK)
+        self.assertEqual(list(self.hotspots.find({}, {'updated_at': 0})), incremental)
+        self.assertEqual(hotspots.detect_hotspots(until=WEEK_START + WEEK)['reports'], 0)
+
+    def test_failed_run_is_not_counted_twice(self):
+        with patch('hotspots.refresh_hotspots', side_effect=RuntimeError), self.assertRaises(RuntimeError):
+            hotspots.detect_hotspots(until=WEEK_START + WEEK)
+        hotspots.detect_hotspots(until=WEEK_START + WEEK)
+        resumed = list(self.hotspots.find({}, {'updated_at': 0}))
+
+        hotspots.detect_hotspots(full=True, until=WEEK_START + WEEK)
+        self.assertEqual(list(self.hotspots.find({}, {'updated_at': 0})), resumed)
+        self.assertEqual(resumed[0]['count'], 5)
+
+    def test_get_hotspots_endpoint(self):
+        hotspots.detect_hotspots(until=WEEK_START + WEEK)
+        app = Flask(__name__)
+        app.register_blueprint(reports_bp)
+        client = app.test_client()
+
+        with patch('decorators.requests.post') as mock_post, \
+                patch('blueprints.reports.reports.hotspots', self.hotspots):
+            mock_post.return_value.status_code = 200
+            response = client.get('/api/v1/reports/hotspots', headers={'x-access-token': MOCK_JWT_TOKEN})
+            filtered = client.get('/api/v1/reports/hotspots?category=Pavement issue',
+                                  headers={'x-access-token': MOCK_JWT_TOKEN})
+            invalid = client.get('/api/v1/reports/hotspots?limit=0', headers={'x-access-token': MOCK_JWT_TOKEN})
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json['window_start'], WEEK_START)
+        self.assertEqual([hotspot['cell'] for hotspot in response.json['hotspots']], ['gcey95'])
+        self.assertEqual(filtered.json['hotspots'], [])
+        self.assertEqual(invalid.status_code, 400)
+
+
+if __name__ == '__main__':
+    unittest.main()
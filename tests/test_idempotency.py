@@ -0,0 +1,160 @@
+"""
+File: test_idempotency.py
+Author: Jack McArdle
+
+This file is part of CommunityEye.
+
+Email: mcardle-j9@ulster.ac.uk
+B-No: B00733578
+"""
+
+import io
+import threading
+import time
+import unittest
+from unittest.mock import patch, MagicMock
+from bson import ObjectId
+from flask import Flask
+import jwt
+import mongomock
+from blueprints.reports.reports import reports_bp
+from config import FLASK_SECRET_KEY
+from idempotency import COMPLETED, IN_PROGRESS, MemoryStore, MongoStore
+from rate_limit import ConcurrencyLimiter
+
+MOCK_JWT_TOKEN = jwt.encode({'user_id': 999}, FLASK_SECRET_KEY, algorithm='HS256')
+IMAGE_DATA = {'geolocation': {'Lat': 54.6, 'Lon': -5.9}, 'image_name': 'test_image'}
+RESPONSE = {'status': 201, 'body': '{"url": "x"}', 'headers': {'Content-Type': 'application/json'}}
+
+
+class IdempotencyStoreTestCase(unittest.TestCase):
+    def check_store(self, store):
+        self.assertIsNone(store.begin('key', 'a'))
+        self.assertEqual(store.begin('key', 'a')['state'], IN_PROGRESS)
+        store.complete('key', RESPONSE)
+        record = store.begin('key', 'a')
+        self.assertEqual((record['state'], record['response']), (COMPLETED, RESPONSE))
+
+        self.assertIsNone(store.begin('other', 'a'))
+        store.release('other')
+        self.assertIsNone(store.get('other'))
+        self.assertIsNone(store.begin('other', 'b'))
+
+        # a claim held past the lock is taken over, a completed key is not
+        with patch('idempotency.time.time', return_value=time.time() + 120):
+            self.assertIsNone(store.begin('other', 'b'))
+            self.assertEqual(store.begin('key', 'a')['state'], COMPLETED)
+        with patch('idempotency.time.time', return_value=time.time() + 7200):
+            self.assertIsNone(store.begin('key', 'a'))
+
+    def test_memory_store(self):
+        self.check_store(MemoryStore())
+
+    def test_mongo_store(self):
+        store = MongoStore()
+        store.collection = mongomock.MongoClient()['communityeye']['idempotency_keys']
+        self.check_store(store)
+
+    def test_memory_store_wakes_waiters(self):
+        store = MemoryStore()
+        store.begin('key', 'a')
+        threading.Timer(0.05, store.complete, ('key', RESPONSE)).start()
+        self.assertEqual(store.wait('key', 5)['state'], COMPLETED)
+        store.begin('other', 'a')
+        self.assertEqual(store.wait('other', 0.01)['state'], IN_PROGRESS)
+
+
+class IdempotentCreateReportTestCase(unittest.TestCase):
+    def setUp(self):
+        self.app = Flask(__name__)
+        self.app.register_blueprint(reports_bp)
+
+        self.mock_reports = MagicMock()
+        self.mock_reports.insert_one.return_value.inserted_id = ObjectId()
+        self.mock_upload_image = MagicMock(return_value=IMAGE_DATA)
+        self.mock_post = MagicMock()
+        self.mock_post.return_value.status_code = 200
+        for target, value in (
+            ('decorators.requests.post', self.mock_post),
+            ('idempotency.idempotency_store', MemoryStore()),
+            ('rate_limit.RATE_LIMIT_ENABLED', False),
+            ('blueprints.reports.reports.reports', self.mock_reports),
+            ('blueprints.reports.reports.upload_image', self.mock_upload_image),
+            ('blueprints.reports.reports.is_within_boundaries', MagicMock(return_value=True)),
+            ('blueprints.reports.reports.find_duplicate_report', MagicMock(return_value=None)),
+            ('blueprints.reports.reports.determine_report_authority', MagicMock(return_value=None)),
+            ('blueprints.reports.reports.find_similar_images', MagicMock(return_value=[])),
+            ('blueprints.reports.reports.find_localities', MagicMock(return_value=[None])),
+            ('blueprints.reports.reports.record_report_created', MagicMock()),
+            ('blueprints.reports.reports.recent_reports', MagicMock()),
+            ('blueprints.reports.reports.send_email', MagicMock()),
+        ):
+            patcher = patch(target, value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def post_report(self, key='retry-1', description='Sample Report', image=b'fake image bytes'):
+        data = {
+            'description': description,
+            'category': 'Potholes',
+            'userID': '123',
+            'image': (io.BytesIO(image), 'test_image.jpg'),
+        }
+        headers = {'x-access-token': MOCK_JWT_TOKEN, 'Idempotency-Key': key}
+        return self.app.test_client().post(
+            '/api/v1/reports', data=data, headers=headers, content_type='multipart/form-data'
+        )
+
+    # /api/v1/reports [POST]
+    def test_retry_replays_response(self):
+        first = self.post_report()
+        second = self.post_report()
+
+        self.assertEqual(first.status_code, 201)
+        self.assertEqual(second.status_code, 201)
+        self.assertEqual(second.json, first.json)
+        self.assertEqual(second.headers['Idempotent-Replayed'], 'true')
+        self.mock_upload_image.assert_called_once()
+        self.mock_reports.insert_one.assert_called_once()
+        self.assertEqual(self.post_report(key='retry-2').status_code, 201)
+        self.assertEqual(self.mock_upload_image.call_count, 2)
+
+    def test_key_reused_for_different_request(self):
+        self.post_report()
+        self.assertEqual(self.post_report(description='Another report').status_code, 422)
+        self.assertEqual(self.post_report(image=b'another photo').status_code, 422)
+        self.assertEqual(self.post_report(key='x' * 256).status_code, 400)
+
+    def test_transient_failure_is_not_replayed(self):
+        busy = ConcurrencyLimiter('image_processing', 1, queue_timeout=0.01)
+        with patch('blueprints.reports.reports.image_processing', busy), busy.admit():
+            self.assertEqual(self.post_report().status_code, 503)
+        self.assertEqual(self.post_report().status_code, 201)
+        self.mock_upload_image.assert_called_once()
+
+    def test_concurrent_retries_are_coalesced(self):
+        started, proceed = threading.Event(), threading.Event()
+
+        def slow_upload(image):
+            started.set()
+            proceed.wait(5)
+            return IMAGE_DATA
+
+        self.mock_upload_image.side_effect = slow_upload
+        responses = []
+        first = threading.Thread(target=lambda: responses.append(self.post_report()))
+        first.start()
+        started.wait(5)
+        second = threading.Thread(target=lambda: responses.append(self.post_report()))
+        second.start()
+        threading.Timer(0.1, proceed.set).start()
+        first.join(5)
+        second.join(5)
+
+        self.assertEqual([response.status_code for response in responses], [201, 201])
+        self.assertEqual(responses[0].json, responses[1].json)
+        self.mock_upload_image.assert_called_once()
+
+
+if __name__ == '__main__':
+    unittest.main()
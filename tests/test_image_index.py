@@ -0,0 +1,114 @@
+"""
+File: test_image_index.py
+Author: Jack McArdle
+
+This file is part of CommunityEye.
+
+Email: mcardle-j9@ulster.ac.uk
+B-No: B00733578
+"""
+
+import io
+import random
+import unittest
+from unittest.mock import patch
+from flask import Flask
+from bson import ObjectId
+from PIL import Image, ImageDraw
+import jwt
+from blueprints.reports.reports import reports_bp
+from config import FLASK_SECRET_KEY
+from image_index import BKTree, ImageSimilarityIndex, hamming_distance
+from image_utils import compute_dhash
+
+MOCK_USER_ID = 999
+MOCK_JWT_TOKEN = jwt.encode({'user_id': MOCK_USER_ID}, FLASK_SECRET_KEY, algorithm='HS256')
+MOCK_REPORT_ID = ObjectId('60b8d2a4b8d2a4bad2a4b8d2')
+
+
+def make_image(seed):
+    rng = random.Random(seed)
+    image = Image.new("RGB", (640, 480), (rng.randint(0, 255), rng.randint(0, 255), rng.randint(0, 255)))
+    draw = ImageDraw.Draw(image)
+    for _ in range(12):
+        x, y = rng.randint(0, 600), rng.randint(0, 440)
+        draw.ellipse((x, y, x + rng.randint(20, 200), y + rng.randint(20, 200)), fill=(rng.randint(0, 255),) * 3)
+    return image
+
+
+class DHashTestCase(unittest.TestCase):
+    def test_reencoded_image_is_similar(self):
+        original = make_image(1)
+        buffer = io.BytesIO()
+        original.resize((320, 240)).save(buffer, "JPEG", quality=40)
+        buffer.seek(0)
+        reencoded = Image.open(buffer)
+
+        distance = hamming_distance(int(compute_dhash(original), 16), int(compute_dhash(reencoded), 16))
+        self.assertLessEqual(distance, 6)
+
+    def test_different_images_are_not_similar(self):
+        distance = hamming_distance(int(compute_dhash(make_image(1)), 16), int(compute_dhash(make_image(2)), 16))
+        self.assertGreater(distance, 6)
+
+    def test_hash_length(self):
+        self.assertEqual(len(compute_dhash(make_image(3))), 16)
+
+
+class BKTreeTestCase(unittest.TestCase):
+    def test_search_matches_brute_force(self):
+        rng = random.Random(42)
+        hashes = {str(i): rng.getrandbits(64) for i in range(500)}
+        tree = BKTree()
+        for report_id, image_hash in hashes.items():
+            tree.add(image_hash, report_id)
+
+        for _ in range(20):
+            query = rng.getrandbits(64)
+            expected = sorted(
+                report_id for report_id, image_hash in hashes.items()
+                if hamming_distance(query, image_hash) <= 24
+            )
+            found = sorted(report_id for report_id, _ in tree.search(query, 24))
+            self.assertEqual(found, expected)
+
+    def test_discard(self):
+        tree = BKTree()
+        tree.add(0b1010, 'a')
+        tree.add(0b1010, 'b')
+        tree.discard('a')
+        self.assertEqual(tree.search(0b1010, 0), [('b', 0)])
+        self.assertEqual(len(tree), 1)
+
+
+class SimilarImagesEndpointTestCase(unittest.TestCase):
+    def setUp(self):
+        self.app = Flask(__name__)
+        self.app.register_blueprint(reports_bp)
+        self.client = self.app.test_client()
+        auth_patcher = patch('decorators.requests.post')
+        auth_patcher.start().return_value.status_code = 200
+        self.addCleanup(auth_patcher.stop)
+
+    @patch('blueprints.reports.reports.similar_images', new_callable=ImageSimilarityIndex)
+    @patch('blueprints.reports.reports.reports')
+    @patch('image_index.reports')
+    def test_get_similar_images(self, mock_index_reports, mock_reports, _):
+        other_id = ObjectId()
+        mock_index_reports.find.return_value = [
+            {'_id': MOCK_REPORT_ID, 'image': {'dhash': 'ffff0000ffff0000'}},
+            {'_id': other_id, 'image': {'dhash': 'ffff0000ffff0001'}},
+            {'_id': ObjectId(), 'image': {'dhash': '0000ffff0000ffff'}},
+        ]
+        mock_reports.find_one.return_value = {'_id': MOCK_REPORT_ID, 'image': {'dhash': 'ffff0000ffff0000'}}
+
+        response = self.client.get(f'/api/v1/reports/{MOCK_REPORT_ID}/similar-images', headers={'x-access-token': MOCK_JWT_TOKEN})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json, [{'report_id': str(other_id), 'distance': 1}])
+
+    @patch('blueprints.reports.reports.reports')
+    def test_get_similar_images_not_found(self, mock_reports):
+        mock_reports.find_one.return_value = None
+
+        response = self.client.get(f'/api/v1/reports/{MOCK_REPORT_ID}/similar-images', headers={'x-access-token': MOCK_JWT_TOKEN})
+        self.assertEqual(response.status_code, 404)
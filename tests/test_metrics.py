@@ -0,0 +1,67 @@
+"""
+File: test_metrics.py
+Author: Jack McArdle
+
+This file is part of CommunityEye.
+
+Email: mcardle-j9@ulster.ac.uk
+B-No: B00733578
+"""
+
+import asyncio
+import unittest
+from types import SimpleNamespace
+from flask import Flask
+from prometheus_client import REGISTRY
+import metrics
+
+
+def sample_count(name, labels):
+    return REGISTRY.get_sample_value(f"{name}_count", labels) or 0
+
+
+class MetricsTestCase(unittest.TestCase):
+    def test_timed_sync_function(self):
+        before = sample_count("communityeye_stage_duration_seconds", {"stage": "test_sync"})
+
+        @metrics.timed("test_sync")
+        def work():
+            return 42
+
+        self.assertEqual(work(), 42)
+        self.assertEqual(sample_count("communityeye_stage_duration_seconds", {"stage": "test_sync"}), before + 1)
+
+    def test_timed_coroutine_function(self):
+        @metrics.timed("test_async")
+        async def work():
+            return 7
+
+        self.assertEqual(asyncio.run(work()), 7)
+        self.assertEqual(sample_count("communityeye_stage_duration_seconds", {"stage": "test_async"}), 1)
+
+    def test_mongo_command_listener(self):
+        listener = metrics.MongoCommandListener()
+        listener.started(SimpleNamespace(command={"find": "reports", "filter": {}}, command_name="find", connection_id=("localhost", 27017), request_id=1))
+        listener.succeeded(SimpleNamespace(command_name="find", connection_id=("localhost", 27017), request_id=1, duration_micros=1500))
+
+        labels = {"collection": "reports", "command": "find", "outcome": "success"}
+        self.assertEqual(sample_count("communityeye_mongo_command_duration_seconds", labels), 1)
+
+    def test_request_latency_and_metrics_endpoint(self):
+        app = Flask(__name__)
+        metrics.init_app(app)
+
+        @app.route("/api/v1/ping/<int:value>")
+        def ping(value):
+            return "pong", 200
+
+        client = app.test_client()
+        client.get("/api/v1/ping/1")
+        client.get("/api/v1/ping/2")
+
+        response = client.get("/metrics")
+        self.assertEqual(response.status_code, 200)
+        self.assertIn(
+            'communityeye_request_duration_seconds_count{method="GET",route="/api/v1/ping/<int:value>",status="200"} 2.0',
+            response.data.decode()
+        )
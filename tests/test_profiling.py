@@ -0,0 +1,102 @@
+"""
+File: test_profiling.py
+Author: Jack McArdle
+
+This file is part of CommunityEye.
+
+Email: mcardle-j9@ulster.ac.uk
+B-No: B00733578
+"""
+
+import os
+import tempfile
+import time
+import unittest
+from types import SimpleNamespace
+from unittest.mock import patch
+from flask import Flask
+from blueprints.admin.admin import admin_bp
+import metrics
+import profiling
+
+MOCK_SECRET = 'profile-secret'
+MOCK_ADMIN_TOKEN = 'admin-token'
+
+
+class ProfilingTestCase(unittest.TestCase):
+    def setUp(self):
+        self.profile_dir = tempfile.mkdtemp()
+        for target in ('profiling.PROFILE_DIR', 'blueprints.admin.admin.PROFILE_DIR'):
+            patcher = patch(target, self.profile_dir)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        for target, value in (('profiling.PROFILE_SECRET', MOCK_SECRET), ('decorators.ADMIN_TOKEN', MOCK_ADMIN_TOKEN)):
+            patcher = patch(target, value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+        self.app = Flask(__name__)
+        self.app.register_blueprint(admin_bp)
+        profiling.init_app(self.app)
+
+        @self.app.route('/api/v1/slow')
+        def slow():
+            listener = metrics.MongoCommandListener()
+            listener.started(SimpleNamespace(command={'find': 'reports'}, command_name='find', connection_id=1, request_id=1))
+            listener.succeeded(SimpleNamespace(command_name='find', connection_id=1, request_id=1, duration_micros=2000))
+            time.sleep(0.05)
+            return 'done', 200
+
+        self.client = self.app.test_client()
+
+    def signed_header(self, path='/api/v1/slow'):
+        return {'x-profile': profiling.sign_profile_request('GET', path, int(time.time()), MOCK_SECRET)}
+
+    def test_signed_request_is_profiled(self):
+        response = self.client.get('/api/v1/slow', headers=self.signed_header())
+        self.assertEqual(response.status_code, 200)
+
+        profiles = profiling.list_profiles()
+        self.assertEqual(len(profiles), 1)
+        self.assertEqual(profiles[0]['mongo']['count'], 1)
+        self.assertTrue(os.path.exists(os.path.join(self.profile_dir, profiles[0]['file'])))
+        self.assertTrue(profiles[0]['file'].endswith('.folded'))
+
+    def test_cprofile_mode(self):
+        with patch('profiling.PROFILE_MODE', 'cprofile'):
+            self.client.get('/api/v1/slow', headers=self.signed_header())
+        self.assertTrue(profiling.list_profiles()[0]['file'].endswith('.prof'))
+
+    def test_unsigned_request_is_not_profiled(self):
+        self.client.get('/api/v1/slow')
+        self.client.get('/api/v1/slow', headers={'x-profile': f'{int(time.time())}:bad'})
+        self.client.get('/api/v1/slow', headers=self.signed_header('/api/v1/other'))
+        self.assertEqual(profiling.list_profiles(), [])
+
+    def test_sampled_request_is_profiled(self):
+        with patch('profiling.PROFILE_SAMPLE_RATE', 1.0):
+            self.client.get('/api/v1/slow')
+        self.assertEqual(len(profiling.list_profiles()), 1)
+
+    # /api/v1/admin/profiles [GET]
+    def test_admin_profiles(self):
+        self.client.get('/api/v1/slow', headers=self.signed_header())
+        profile = profiling.list_profiles()[0]
+
+        response = self.client.get('/api/v1/admin/profiles', headers={'x-admin-token': MOCK_ADMIN_TOKEN})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json[0]['id'], profile['id'])
+
+        response = self.client.get(f"/api/v1/admin/profiles/{profile['file']}", headers={'x-admin-token': MOCK_ADMIN_TOKEN})
+        self.assertEqual(response.status_code, 200)
+        self.assertIn(b'slow', response.data)
+        response.close()
+
+    def test_admin_profiles_invalid_token(self):
+        response = self.client.get('/api/v1/admin/profiles', headers={'x-admin-token': 'wrong'})
+        self.assertEqual(response.status_code, 401)
+
+    def test_admin_profiles_disabled(self):
+        with patch('decorators.ADMIN_TOKEN', None):
+            response = self.client.get('/api/v1/admin/profiles', headers={'x-admin-token': MOCK_ADMIN_TOKEN})
+        self.assertEqual(response.status_code, 403)
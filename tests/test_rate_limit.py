@@ -0,0 +1,128 @@
+"""
+File: test_rate_limit.py
+Author: Jack McArdle
+
+This file is part of CommunityEye.
+
+Email: mcardle-j9@ulster.ac.uk
+B-No: B00733578
+"""
+
+import io
+import unittest
+from unittest.mock import patch, MagicMock
+from flask import Flask
+import jwt
+from blueprints.reports.reports import reports_bp
+from config import FLASK_SECRET_KEY
+from rate_limit import ConcurrencyLimiter, MemoryBackend, RateLimiter, client_ip
+
+MOCK_USER_ID = 999
+MOCK_JWT_TOKEN = jwt.encode({'user_id': MOCK_USER_ID}, FLASK_SECRET_KEY, algorithm='HS256')
+LIMITS = {'upvote_report': {'capacity': 2, 'per_minute': 60}}
+
+
+class RateLimiterTestCase(unittest.TestCase):
+    def test_token_bucket_refills(self):
+        backend = MemoryBackend()
+        with patch('rate_limit.time.monotonic', return_value=100.0) as monotonic:
+            self.assertEqual([backend.take('key', 2, 1)[0] for _ in range(3)], [True, True, False])
+            monotonic.return_value = 101.5
+            self.assertTrue(backend.take('key', 2, 1)[0])
+            self.assertFalse(backend.take('key', 2, 1)[0])
+
+    def test_memory_backend_drops_least_recently_used(self):
+        backend = MemoryBackend(max_keys=2)
+        for key in ('a', 'b', 'a', 'c'):
+            backend.take(key, 5, 1)
+        self.assertEqual(list(backend._buckets), ['a', 'c'])
+
+    def test_user_and_ip_limits(self):
+        limiter = RateLimiter(LIMITS, MemoryBackend(), ip_multiplier=2)
+
+        self.assertIsNone(limiter.check('upvote_report', 1, '10.0.0.1'))
+        self.assertIsNone(limiter.check('upvote_report', 1, '10.0.0.1'))
+        self.assertEqual(limiter.check('upvote_report', 1, '10.0.0.1'), 1)
+        # other users behind the same IP share its larger bucket
+        self.assertIsNone(limiter.check('upvote_report', 2, '10.0.0.1'))
+        self.assertIsNone(limiter.check('upvote_report', 2, '10.0.0.1'))
+        self.assertIsNotNone(limiter.check('upvote_report', 3, '10.0.0.1'))
+        self.assertIsNone(limiter.check('create_report', 1, '10.0.0.1'))
+
+    def test_backend_failure_lets_requests_through(self):
+        backend = MagicMock()
+        backend.take.side_effect = ConnectionError('down')
+        self.assertIsNone(RateLimiter(LIMITS, backend).check('upvote_report', 1, '10.0.0.1'))
+
+    @patch('rate_limit.RATE_LIMIT_TRUST_FORWARDED_FOR', True)
+    def test_client_ip_ignores_spoofed_forwarded_for(self):
+        # the client sent 1.2.3.4, the proxy appended the address it saw
+        self.assertEqual(client_ip('10.0.0.2', '1.2.3.4, 203.0.113.7'), '203.0.113.7')
+        with patch('rate_limit.RATE_LIMIT_TRUSTED_PROXIES', 2):
+            self.assertEqual(client_ip('10.0.0.2', '1.2.3.4, 203.0.113.7, 10.0.0.9'), '203.0.113.7')
+            self.assertEqual(client_ip('10.0.0.2', '203.0.113.7'), '203.0.113.7')
+        self.assertEqual(client_ip('10.0.0.2', None), '10.0.0.2')
+
+    def test_concurrency_limiter_sheds_load(self):
+        limiter = ConcurrencyLimiter('test', 1, queue_timeout=0.01)
+
+        with limiter.admit() as first:
+            with limiter.admit() as second:
+                pass
+        with limiter.admit() as third:
+            pass
+
+        self.assertEqual((first, second, third), (True, False, True))
+
+
+class RateLimitedRoutesTestCase(unittest.TestCase):
+    def setUp(self):
+        self.app = Flask(__name__)
+        self.app.register_blueprint(reports_bp)
+        self.client = self.app.test_client()
+
+        auth_patcher = patch('decorators.requests.post')
+        auth_patcher.start().return_value.status_code = 200
+        self.addCleanup(auth_patcher.stop)
+        limiter_patcher = patch('rate_limit.rate_limiter', RateLimiter(LIMITS, MemoryBackend()))
+        limiter_patcher.start()
+        self.addCleanup(limiter_patcher.stop)
+
+    # /api/v1/reports/<report_id>/upvote [POST]
+    @patch('blueprints.reports.reports.upvotes')
+    @patch('blueprints.reports.reports.reports')
+    def test_upvote_rate_limited(self, mock_reports, mock_upvotes):
+        mock_reports.find_one.return_value = None
+
+        statuses = [
+            self.client.post('/api/v1/reports/60b8d2a4b8d2a4bad2a4b8d1/upvote',
+                             headers={'x-access-token': MOCK_JWT_TOKEN}).status_code
+            for _ in range(3)
+        ]
+
+        self.assertNotIn(429, statuses[:2])
+        self.assertEqual(statuses[2], 429)
+        response = self.client.post('/api/v1/reports/60b8d2a4b8d2a4bad2a4b8d1/upvote',
+                                     headers={'x-access-token': MOCK_JWT_TOKEN})
+        self.assertEqual(response.headers['Retry-After'], '1')
+
+    # /api/v1/reports [POST]
+    @patch('blueprints.reports.reports.upload_image')
+    def test_create_report_sheds_load(self, mock_upload_image):
+        busy = ConcurrencyLimiter('image_processing', 1, queue_timeout=0.01)
+
+        with patch('blueprints.reports.reports.image_processing', busy), busy.admit():
+            response = self.client.post(
+                '/api/v1/reports',
+                data={'description': 'Pothole', 'category': 'Potholes', 'image': (io.BytesIO(b'jpeg'), 'a.jpg')},
+                headers={'x-access-token': MOCK_JWT_TOKEN},
+                content_type='multipart/form-data',
+            )
+
+        self.assertEqual(response.status_code, 503)
+        self.assertEqual(response.headers['Retry-After'], '1')
+        mock_upload_image.assert_not_called()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -227,7 +227,7 @@ class ReportsTestCase(unittest.TestCase):
         mock_reports = MagicMock()
         mock_upvotes.find_one.return_value = None
         mock_upvotes.insert_one.return_value = MagicMock()
-        mock_reports.update_one.return_value.modified_count = 1
+        mock_reports.find_one_and_update.return_value = MOCK_REPORT_DATA
 
         mock_db[MONGO_COLLECTION_UPVOTES] = mock_upvotes
         mock_db[MONGO_COLLECTION_REPORTS] = mock_reports
@@ -251,7 +251,7 @@ class ReportsTestCase(unittest.TestCase):
         mock_reports = MagicMock()
         mock_upvotes.find_one.return_value = None
         mock_upvotes.insert_one.return_value = MagicMock()
-        mock_reports.update_one.return_value.modified_count = 0
+        mock_reports.find_one_and_update.return_value = None
 
         mock_db[MONGO_COLLECTION_UPVOTES] = mock_upvotes
         mock_db[MONGO_COLLECTION_REPORTS] = mock_reports
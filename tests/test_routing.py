@@ -0,0 +1,92 @@
+"""
+File: test_routing.py
+Author: Jack McArdle
+
+This file is part of CommunityEye.
+
+Email: mcardle-j9@ulster.ac.uk
+B-No: B00733578
+"""
+
+import calendar
+import unittest
+from unittest.mock import patch
+from boundary_store import build_boundary_set, load_authorities_from_files
+from routing import RoutingTable, load_rules_from_file
+import report_utils
+
+BELFAST = {'Lat': 54.597, 'Lon': -5.930}
+# a Monday
+NOON = calendar.timegm((2024, 1, 1, 12, 0, 0))
+MIDNIGHT = calendar.timegm((2024, 1, 1, 23, 30, 0))
+
+RULES = [
+    {'authority_type': 'Department for Infrastructure', 'categories': ['Potholes', 'Street lighting fault']},
+    {'authority_type': 'Council', 'category': 'Missed bin collection'},
+    # out of hours street lighting goes to the council inside the Belfast box
+    {'authority_type': 'Council', 'category': 'Street lighting fault',
+     'bbox': [-6.1, 54.5, -5.8, 54.7], 'hours': [18, 8], 'priority': 1},
+    {'authority_type': 'Council', 'category': 'Street lighting fault', 'days': [5, 6], 'priority': 0},
+]
+
+
+class RoutingTableTestCase(unittest.TestCase):
+    def test_shipped_rules(self):
+        table = RoutingTable(load_rules_from_file())
+
+        self.assertEqual(len(table), 13)
+        self.assertEqual(table.authority_type('Potholes'), 'Department for Infrastructure')
+        self.assertEqual(table.authority_type('Pavement issue'), 'Council')
+        self.assertIsNone(table.authority_type('Unknown'))
+        self.assertEqual(table.conditional, {})
+
+    def test_conditional_rules(self):
+        table = RoutingTable(RULES)
+
+        self.assertIn('Missed bin collection', table.static)
+        self.assertNotIn('Street lighting fault', table.static)
+        lighting = ('Street lighting fault', BELFAST['Lon'], BELFAST['Lat'])
+        self.assertEqual(table.authority_type(*lighting, NOON), 'Department for Infrastructure')
+        self.assertEqual(table.authority_type(*lighting, MIDNIGHT), 'Council')
+        self.assertEqual(table.authority_type('Street lighting fault', -7.3, 54.6, MIDNIGHT),
+                         'Department for Infrastructure')
+        # Saturday at noon, matched by the weekend rule
+        self.assertEqual(table.authority_type(*lighting, NOON + 5 * 86400), 'Council')
+        self.assertEqual(
+            table.authority_types(['Potholes', 'Street lighting fault'], [0, BELFAST['Lon']],
+                                  [0, BELFAST['Lat']], [NOON, MIDNIGHT]),
+            ['Department for Infrastructure', 'Council'],
+        )
+
+    def test_invalid_rules(self):
+        for rules in (
+            ['not a rule'],
+            [{'category': 'Potholes'}],
+            [{'authority_type': 'Council'}],
+            [{'authority_type': 'Council', 'categories': 'Potholes'}],
+            [{'authority_type': 'Council', 'category': 'Potholes', 'hours': [8, 8]}],
+            [{'authority_type': 'Council', 'category': 'Potholes', 'bbox': [1, 1, 0, 0]}],
+            [{'authority_type': 'Council', 'category': 'Potholes'},
+             {'authority_type': 'Council', 'category': 'Potholes'}],
+        ):
+            with self.assertRaises(ValueError):
+                RoutingTable(rules)
+
+    def test_determine_report_authority(self):
+        boundaries = build_boundary_set(load_authorities_from_files())
+
+        with patch('report_utils.boundary_store.get', return_value=boundaries), \
+                patch('report_utils.routing_rules.get', return_value=RoutingTable(RULES)):
+            self.assertEqual(
+                report_utils.determine_report_authority(BELFAST, 'Street lighting fault', NOON),
+                'Department for Infrastructure - Eastern Division',
+            )
+            self.assertEqual(
+                report_utils.determine_report_authority(BELFAST, 'Street lighting fault', MIDNIGHT),
+                'Belfast City Council',
+            )
+            self.assertIsNone(report_utils.determine_report_authority(BELFAST, 'Abandoned vehicle'))
+
+
+if __name__ == '__main__':
+    unittest.main()
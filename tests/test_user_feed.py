@@ -0,0 +1,179 @@
+"""
+File: test_user_feed.py
+Author: Jack McArdle
+
+This file is part of CommunityEye.
+
+Email: mcardle-j9@ulster.ac.uk
+B-No: B00733578
+"""
+
+import unittest
+from unittest.mock import patch
+from flask import Flask
+from bson import ObjectId
+import jwt
+import mongomock
+from blueprints.reports.reports import reports_bp
+from config import FLASK_SECRET_KEY
+import stats_utils
+import user_feed
+
+MOCK_USER_ID = 999
+MOCK_JWT_TOKEN = jwt.encode({'user_id': MOCK_USER_ID}, FLASK_SECRET_KEY, algorithm='HS256')
+
+
+class UserFeedTestCase(unittest.TestCase):
+    def setUp(self):
+        self.reports = mongomock.MongoClient()['communityeye']['reports']
+        # three reports share a created_at so pages must break ties on the ID
+        for index in range(7):
+            self.reports.insert_one({
+                'user_id': MOCK_USER_ID,
+                'category': 'Pothole',
+                'description': f'Report {index}',
+                'created_at': 1700000000 + min(index, 4),
+                'resolved': index % 2 == 0,
+                'upvote_count': index,
+                'image': {'url': f'https://blob/{index}.jpg', 'image_name': f'{index}.jpg'},
+            })
+        self.reports.insert_one({'user_id': 1, 'category': 'Pothole', 'created_at': 1800000000})
+
+    def test_cursor_round_trip(self):
+        report = {'_id': ObjectId(), 'created_at': 1700000000}
+        self.assertEqual(user_feed.decode_cursor(user_feed.encode_cursor(report)), (1700000000, report['_id']))
+        for cursor in ('not-a-cursor', 'MTIz', user_feed.encode_cursor({'_id': 'x', 'created_at': 1})):
+            with self.assertRaises(ValueError):
+                user_feed.decode_cursor(cursor)
+
+    def test_pages_cover_every_report_once_newest_first(self):
+        seen, cursor = [], None
+        while True:
+            documents = user_feed.fetch_feed_page(self.reports, MOCK_USER_ID, 3, cursor)
+            page = user_feed.build_page(documents, 3, {})
+            seen.extend(page['reports'])
+            if page['next_cursor'] is None:
+                break
+            cursor = user_feed.decode_cursor(page['next_cursor'])
+
+        self.assertEqual(len(seen), 7)
+        self.assertEqual(len({report['id'] for report in seen}), 7)
+        keys = [(report['created_at'], ObjectId(report['id'])) for report in seen]
+        self.assertEqual(keys, sorted(keys, reverse=True))
+        self.assertIn('user_feed', self.reports.index_information())
+
+    def test_summary_shape(self):
+        documents = user_feed.fetch_feed_page(self.reports, MOCK_USER_ID, 1, None)
+        summary = user_feed.build_page(documents, 1, {})['reports'][0]
+
+        self.assertEqual(set(summary), {
+            'id', 'category', 'description', 'authority', 'locality', 'status',
+            'created_at', 'resolved_at', 'upvote_count', 'thumbnail_url',
+        })
+        self.assertEqual(summary['status'], 'resolved')
+        self.assertEqual(summary['thumbnail_url'], 'https://blob/6.jpg')
+
+    def test_user_stats_backfilled_then_maintained(self):
+        user_stats = mongomock.MongoClient()['communityeye']['user_stats']
+        archive = mongomock.MongoClient()['communityeye']['reports_archive']
+        with patch('stats_utils.reports', self.reports), patch('stats_utils.reports_archive', archive), \
+                patch('stats_utils.user_stats', user_stats):
+            # no stats document yet, so writes leave the counts to the first read
+            stats_utils.record_report_upvoted({'user_id': MOCK_USER_ID, 'category': 'Pothole'})
+            self.assertEqual(
+                stats_utils.get_user_stats(MOCK_USER_ID), {'total': 7, 'resolved': 4, 'upvotes_received': 21}
+            )
+
+            stats_utils.record_report_created({'user_id': MOCK_USER_ID, 'category': 'Pothole'})
+            stats_utils.record_report_resolved(
+                {'user_id': MOCK_USER_ID, 'category': 'Pothole', 'created_at': 1700000000}, 1700000100
+            )
+            stats_utils.record_report_deleted({'user_id': MOCK_USER_ID, 'category': 'Pothole', 'upvote_count': 3})
+
+            self.assertEqual(
+                stats_utils.get_user_stats(MOCK_USER_ID), {'total': 7, 'resolved': 5, 'upvotes_received': 18}
+            )
+
+    def test_user_stats_backfill_keeps_concurrent_writes(self):
+        user_stats = mongomock.MongoClient()['communityeye']['user_stats']
+        archive = mongomock.MongoClient()['communityeye']['reports_archive']
+        count_user_reports = stats_utils._count_user_reports
+
+        def count_during_create(user_id):
+            counters = count_user_reports(user_id)
+            if not self.reports.find_one({'description': 'Created mid-backfill'}):
+                # a report created after the aggregation read the collection
+                self.reports.insert_one({'user_id': MOCK_USER_ID, 'description': 'Created mid-backfill'})
+                stats_utils.record_report_created({'user_id': MOCK_USER_ID, 'category': 'Pothole'})
+            return counters
+
+        with patch('stats_utils.reports', self.reports), patch('stats_utils.reports_archive', archive), \
+                patch('stats_utils.user_stats', user_stats), \
+                patch('stats_utils._count_user_reports', count_during_create):
+            self.assertEqual(stats_utils.get_user_stats(MOCK_USER_ID)['total'], 8)
+            self.assertNotIn('backfill', user_stats.find_one({'_id': MOCK_USER_ID}))
+
+
+class UserFeedEndpointTestCase(unittest.TestCase):
+    def setUp(self):
+        self.app = Flask(__name__)
+        self.app.register_blueprint(reports_bp)
+        self.client = self.app.test_client()
+
+        auth_patcher = patch('decorators.requests.post')
+        auth_patcher.start().return_value.status_code = 200
+        self.addCleanup(auth_patcher.stop)
+
+    # /api/v1/reports/user/<user_id>/feed [GET]
+    @patch('blueprints.reports.reports.get_user_stats')
+    @patch('blueprints.reports.reports.fetch_feed_page')
+    def test_get_user_feed(self, mock_fetch, mock_get_user_stats):
+        report_ids = [ObjectId() for _ in range(3)]
+        mock_fetch.return_value = [
+            {'_id': report_id, 'created_at': 1700000000, 'resolved': False} for report_id in report_ids
+        ]
+        mock_get_user_stats.return_value = {'total': 3, 'resolved': 0, 'upvotes_received': 0}
+
+        response = self.client.get(
+            f'/api/v1/reports/user/{MOCK_USER_ID}/feed?limit=2', headers={'x-access-token': MOCK_JWT_TOKEN}
+        )
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json['counts']['total'], 3)
+        self.assertEqual([report['id'] for report in response.json['reports']], [str(i) for i in report_ids[:2]])
+        self.assertEqual(user_feed.decode_cursor(response.json['next_cursor']), (1700000000, report_ids[1]))
+        self.assertEqual(mock_fetch.call_args.args[1:], (MOCK_USER_ID, 2, None))
+
+    # /api/v1/reports/<report_id>/upvote [POST]
+    def test_upvote_counts_towards_user_stats(self):
+        db = mongomock.MongoClient()['upvote_test']
+        report_id = db['reports'].insert_one({
+            'user_id': MOCK_USER_ID,
+            'authority': 'Belfast City Council',
+            'category': 'Pothole',
+            'created_at': 1700000000,
+            'resolved': False,
+            'upvote_count': 0,
+        }).inserted_id
+
+        with patch('blueprints.reports.reports.reports', db['reports']), \
+                patch('blueprints.reports.reports.upvotes', db['upvotes']), \
+                patch('stats_utils.reports', db['reports']), patch('stats_utils.reports_archive', db['reports_archive']), \
+                patch('stats_utils.user_stats', db['user_stats']), patch('stats_utils.stats', db['stats']):
+            self.assertEqual(stats_utils.get_user_stats(MOCK_USER_ID)['upvotes_received'], 0)
+            response = self.client.post(
+                f'/api/v1/reports/{report_id}/upvote', headers={'x-access-token': MOCK_JWT_TOKEN}
+            )
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(stats_utils.get_user_stats(MOCK_USER_ID)['upvotes_received'], 1)
+
+    def test_get_user_feed_bad_params(self):
+        for query in ('limit=0', 'limit=abc', 'limit=1000', 'cursor=bad'):
+            response = self.client.get(
+                f'/api/v1/reports/user/{MOCK_USER_ID}/feed?{query}', headers={'x-access-token': MOCK_JWT_TOKEN}
+            )
+            self.assertEqual(response.status_code, 400)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,234 @@
+"""
+File: user_feed.py
+Author: Jack McArdle
+
+This file is part of CommunityEye.
+
+Email: mcardle-j9@ulster.ac.uk
+B-No: B00733578
+"""
+
+import base64
+import logging
+import threading
+from typing import Any, Dict, List, Optional, Set, Tuple
+from bson import ObjectId
+from bson.errors import InvalidId
+from pymongo import DESCENDING
+from config import FEED_MAX_PAGE_SIZE, FEED_PAGE_SIZE
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# newest first, with the ID breaking ties between reports created in the same second
+FEED_SORT = [("created_at", DESCENDING), ("_id", DESCENDING)]
+FEED_INDEX = [("user_id", 1), *FEED_SORT]
+FEED_PROJECTION = {
+    "category": 1,
+    "description": 1,
+    "authority": 1,
+    "locality": 1,
+    "created_at": 1,
+    "resolved": 1,
+    "resolved_at": 1,
+    "upvote_count": 1,
+    "image.url": 1,
+    "image.thumbnail_url": 1,
+}
+
+_index_lock = threading.Lock()
+# collections whose feed index this process has created
+_indexed_collections: Set[Any] = set()
+
+
+def encode_cursor(report: Dict) -> str:
+    """
+    Build the opaque cursor pointing just past a report.
+
+    Args:
+        report (Dict): The last report on a page.
+
+    Returns:
+        str: The cursor.
+    """
+    return base64.urlsafe_b64encode(f"{report['created_at']}:{report['_id']}".encode()).decode()
+
+
+def decode_cursor(cursor: str) -> Tuple[int, ObjectId]:
+    """
+    Read a cursor produced by encode_cursor.
+
+    Args:
+        cursor (str): The cursor.
+
+    Returns:
+        Tuple[int, ObjectId]: The created_at and ID of the last report seen.
+
+    Raises:
+        ValueError: If the cursor is malformed.
+    """
+    try:
+        created_at, _, report_id = base64.urlsafe_b64decode(cursor.encode()).decode().partition(":")
+        return int(created_at), ObjectId(report_id)
+    except (InvalidId, UnicodeDecodeError, ValueError, TypeError) as e:
+        raise ValueError(f"Invalid cursor: {cursor}") from e
+
+
+def parse_feed_args(args: Any) -> Tuple[Optional[str], int, Optional[Tuple[int, ObjectId]]]:
+    """
+    Validate the limit and cursor query parameters.
+
+    Args:
+        args (Any): The request's query parameters.
+
+    Returns:
+        Tuple: An error message if they are unusable, the page size and the decoded cursor.
+    """
+    try:
+        limit = int(args.get("limit", FEED_PAGE_SIZE))
+    except ValueError:
+        return "limit must be an integer", 0, None
+    if not 1 <= limit <= FEED_MAX_PAGE_SIZE:
+        return f"limit must be between 1 and {FEED_MAX_PAGE_SIZE}", 0, None
+
+    cursor = None
+    if args.get("cursor"):
+        try:
+            cursor = decode_cursor(args["cursor"])
+        except ValueError as e:
+            return str(e), 0, None
+    return None, limit, cursor
+
+
+def feed_query(user_id: int, cursor: Optional[Tuple[int, ObjectId]]) -> Dict:
+    """
+    Build the query for the page of a user's feed after the cursor.
+
+    Args:
+        user_id (int): The ID of the user.
+        cursor (Optional[Tuple[int, ObjectId]]): The created_at and ID of the last report seen.
+
+    Returns:
+        Dict: The query, answered from the (user_id, created_at, _id) index.
+    """
+    query: Dict[str, Any] = {"user_id": user_id}
+    if cursor is not None:
+        created_at, report_id = cursor
+        query["$or"] = [
+            {"created_at": {"$lt": created_at}},
+            {"created_at": created_at, "_id": {"$lt": report_id}},
+        ]
+    return query
+
+
+def summarise_report(report: Dict) -> Dict:
+    """
+    Build the lightweight entry shown in a user's feed.
+
+    Reports have no separate thumbnail yet, so the image URL stands in for one when none
+    is stored.
+
+    Args:
+        report (Dict): The report, read with FEED_PROJECTION.
+
+    Returns:
+        Dict: The report's summary.
+    """
+    image = report.get("image", {})
+    return {
+        "id": str(report["_id"]),
+        "category": report.get("category"),
+        "description": report.get("description"),
+        "authority": report.get("authority"),
+        "locality": report.get("locality"),
+        "status": "resolved" if report.get("resolved") else "open",
+        "created_at": report.get("created_at"),
+        "resolved_at": report.get("resolved_at"),
+        "upvote_count": report.get("upvote_count", 0),
+        "thumbnail_url": image.get("thumbnail_url") or image.get("url"),
+    }
+
+
+def build_page(documents: List[Dict], limit: int, counts: Dict[str, int]) -> Dict:
+    """
+    Build a feed response from up to limit + 1 documents.
+
+    Args:
+        documents (List[Dict]): The documents read, one more than the page size if
+            there is a further page.
+        limit (int): The page size.
+        counts (Dict[str, int]): The user's report counts.
+
+    Returns:
+        Dict: The counts, the page of summaries and the cursor of the next page.
+    """
+    page = documents[:limit]
+    return {
+        "counts": counts,
+        "reports": [summarise_report(report) for report in page],
+        "next_cursor": encode_cursor(page[-1]) if len(documents) > limit else None,
+    }
+
+
+def ensure_feed_index(collection: Any) -> None:
+    """
+    Create the feed index once per process; create_index is a no-op when it exists.
+
+    Args:
+        collection (Any): The reports or archive collection.
+    """
+    if collection in _indexed_collections:
+        return
+    with _index_lock:
+        if collection not in _indexed_collections:
+            try:
+                collection.create_index(FEED_INDEX, name="user_feed")
+                _indexed_collections.add(collection)
+            except Exception as e:
+                logger.error(f"Error creating the user feed index: {e}")
+
+
+def fetch_feed_page(
+    collection: Any, user_id: int, limit: int, cursor: Optional[Tuple[int, ObjectId]]
+) -> List[Dict]:
+    """
+    Read one page of a user's reports, newest first.
+
+    Args:
+        collection (Any): The reports collection.
+        user_id (int): The ID of the user.
+        limit (int): The page size.
+        cursor (Optional[Tuple[int, ObjectId]]): The created_at and ID of the last report seen.
+
+    Returns:
+        List[Dict]: Up to limit + 1 reports, so the caller can tell if another page follows.
+    """
+    ensure_feed_index(collection)
+    return list(
+        collection.find(feed_query(user_id, cursor), FEED_PROJECTION).sort(FEED_SORT).limit(limit + 1)
+    )
+
+
+async def fetch_feed_page_async(
+    collection: Any, user_id: int, limit: int, cursor: Optional[Tuple[int, ObjectId]]
+) -> List[Dict]:
+    """
+    Read one page of a user's reports, newest first, using the asynchronous driver.
+
+    Args:
+        collection (Any): The asynchronous reports collection.
+        user_id (int): The ID of the user.
+        limit (int): The page size.
+        cursor (Optional[Tuple[int, ObjectId]]): The created_at and ID of the last report seen.
+
+    Returns:
+        List[Dict]: Up to limit + 1 reports, so the caller can tell if another page follows.
+    """
+    if collection not in _indexed_collections:
+        try:
+            await collection.create_index(FEED_INDEX, name="user_feed")
+            _indexed_collections.add(collection)
+        except Exception as e:
+            logger.error(f"Error creating the user feed index: {e}")
+    documents = collection.find(feed_query(user_id, cursor), FEED_PROJECTION).sort(FEED_SORT).limit(limit + 1)
+    return await documents.to_list(None)
@@ -0,0 +1,64 @@
+"""
+File: watermarks.py
+Author: Jack McArdle
+
+This file is part of CommunityEye.
+
+Email: mcardle-j9@ulster.ac.uk
+B-No: B00733578
+"""
+
+import logging
+import time
+from typing import Any, Optional
+from config import MONGO_COLLECTION_JOB_STATE
+from clients import DB
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+job_state = DB[MONGO_COLLECTION_JOB_STATE]
+
+
+def get_watermark(job: str, default: Any = None) -> Any:
+    """
+    Retrieve how far an incremental job has processed.
+
+    Args:
+        job (str): The name of the job.
+        default (Any): Returned if the job has not run yet.
+
+    Returns:
+        Any: The job's watermark.
+    """
+    document = job_state.find_one({"_id": job}, {"watermark": 1})
+    return default if document is None else document["watermark"]
+
+
+def set_watermark(job: str, watermark: Any) -> None:
+    """
+    Record how far an incremental job has processed.
+
+    Args:
+        job (str): The name of the job.
+        watermark (Any): The new watermark.
+    """
+    job_state.update_one(
+        {"_id": job},
+        {"$set": {"watermark": watermark, "updated_at": int(time.time())}},
+        upsert=True,
+    )
+
+
+def reset_watermark(job: str) -> Optional[Any]:
+    """
+    Forget an incremental job's progress so that its next run starts from the beginning.
+
+    Args:
+        job (str): The name of the job.
+
+    Returns:
+        Optional[Any]: The watermark that was removed.
+    """
+    document = job_state.find_one_and_delete({"_id": job})
+    return None if document is None else document.get("watermark")